@@ -0,0 +1,187 @@
+"""Time per user event spent on the attendees of a meeting, by its size.
+
+The lookups of `Attendees`, keyed by `internal_user_id`, are compared with the
+linear scans of the JSON list they replaced, for a camera toggle, a join and a
+leave in meetings of 10 to 5000 attendees. The time of a whole camera toggle
+handled on a cached meeting (without the database) is reported as well, and
+the bytes of attendees sent to the database for it, as the whole JSON list by
+the ORM and as a partial update:
+
+    python -m benchmarks.attendees
+    python -m benchmarks.attendees --sizes 10 100 1000 5000 --rounds 200
+"""
+import argparse
+import json
+import logging
+import statistics
+import sys
+import time
+import unittest.mock as mock
+
+from mconf_aggr.webhook import partial_update
+from mconf_aggr.webhook.attendees import Attendees
+from mconf_aggr.webhook.database_handler import UserCamBroadcastStartHandler
+from mconf_aggr.webhook.database_model import Meetings
+from mconf_aggr.webhook.event_mapper import UserEvent, WebhookEvent
+from mconf_aggr.webhook.meeting_cache import MeetingCache
+
+SIZES = [10, 100, 1000, 5000]
+
+
+def attendee(user_id):
+    return {
+        "external_user_id": user_id,
+        "internal_user_id": user_id,
+        "full_name": user_id,
+        "role": "VIEWER",
+        "is_presenter": False,
+        "is_listening_only": False,
+        "has_joined_voice": False,
+        "has_video": False,
+        "user_data": {},
+    }
+
+
+def attendees_list(size):
+    return [attendee(f"user-{i}") for i in range(size)]
+
+
+def toggle_baseline(attendees, user_id):
+    for attendee in attendees:
+        if attendee["internal_user_id"] == user_id:
+            attendee["has_video"] = not attendee["has_video"]
+
+
+def toggle_indexed(attendees, user_id):
+    attendees.change(
+        user_id, lambda attendee: attendee.update(has_video=not attendee["has_video"])
+    )
+
+
+def join_leave_baseline(attendees, user_id):
+    new = attendee(user_id)
+    for elem in attendees:
+        if elem["internal_user_id"] == new["internal_user_id"]:
+            break
+    else:
+        attendees.append(new)
+
+    for idx, elem in enumerate(attendees):
+        if elem["internal_user_id"] == user_id:
+            del attendees[idx]
+
+
+def join_leave_indexed(attendees, user_id):
+    attendees.add(attendee(user_id))
+    attendees.remove(user_id)
+
+
+def _time(operation, attendees, user_id, rounds, repeat=20):
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            operation(attendees, user_id)
+        timings.append((time.perf_counter() - start) / repeat)
+
+    return statistics.median(timings) * 1e6
+
+
+def _time_handler(size, rounds):
+    """Time of a camera toggle handled on a cached meeting of `size` attendees."""
+    session = mock.MagicMock()
+    session.query().filter().first.return_value = Meetings(
+        id=1, int_meeting_id="benchmark", attendees=attendees_list(size)
+    )
+    handler = UserCamBroadcastStartHandler(session, meeting_cache=MeetingCache())
+    event = WebhookEvent(
+        "user-cam-broadcast-start",
+        UserEvent(
+            f"user-{size - 1}",
+            "external",
+            "external",
+            "benchmark",
+            "user-cam-broadcast-start",
+        ),
+        "https://benchmark",
+    )
+
+    def handle(_attendees, _user_id):
+        handler.handle(event)
+
+    return _time(handle, None, None, rounds)
+
+
+def _update_bytes(size):
+    """Bytes of attendees sent for a camera toggle, by the ORM and partially."""
+    session = mock.MagicMock()
+    session.execute.return_value.rowcount = 1
+    session.identity_map.values.return_value = []
+    partial_update.patch_attendee(
+        session, "benchmark", f"user-{size - 1}", {"has_video": True}
+    )
+    params = session.execute.call_args[0][1]
+
+    return (
+        len(json.dumps(attendees_list(size))),
+        sum(len(str(value)) for value in params.values()),
+    )
+
+
+def run(sizes=None, rounds=200):
+    """Measure the time per event at each size of meeting.
+
+    The attendee looked up is the last one, the worst case of a scan.
+
+    Returns
+    -------
+    results : dict
+        Median time (in microseconds) per event of each operation, scanning
+        the list and with `Attendees`, and bytes of attendees sent per event,
+        by size of meeting.
+    """
+    sizes = sizes or SIZES
+
+    logging.disable(logging.CRITICAL)
+    try:
+        results = {}
+        for size in sizes:
+            user_id = f"user-{size - 1}"
+            orm_bytes, partial_bytes = _update_bytes(size)
+            results[size] = {
+                "toggle_baseline_us": _time(
+                    toggle_baseline, attendees_list(size), user_id, rounds
+                ),
+                "toggle_indexed_us": _time(
+                    toggle_indexed, Attendees(attendees_list(size)), user_id, rounds
+                ),
+                "join_leave_baseline_us": _time(
+                    join_leave_baseline, attendees_list(size), "new-user", rounds
+                ),
+                "join_leave_indexed_us": _time(
+                    join_leave_indexed,
+                    Attendees(attendees_list(size)),
+                    "new-user",
+                    rounds,
+                ),
+                "handler_us": _time_handler(size, rounds),
+                "update_bytes_orm": orm_bytes,
+                "update_bytes_partial": partial_bytes,
+            }
+    finally:
+        logging.disable(logging.NOTSET)
+
+    return {"rounds": rounds, "sizes": results}
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    print(json.dumps(run(args.sizes, args.rounds)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
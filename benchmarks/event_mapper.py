@@ -0,0 +1,187 @@
+"""Time spent by `map_webhook_event` mapping each event.
+
+The mappers compiled from `_MAPPING_SPEC` are compared with the mapping they
+replaced: events checked against each type of event in turn and every field
+looked up from the root of the payload with `_get_nested`. The time of the
+whole `map_webhook_event`, which also validates and logs the event, is
+reported as well. All run over the same corpus of payloads, which is either a
+sample of each type of event or a file with a JSON list of payloads recorded
+from webhooks:
+
+    python -m benchmarks.event_mapper
+    python -m benchmarks.event_mapper --corpus recorded-events.json
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+
+from mconf_aggr.webhook.event_mapper import (
+    _EVENT_TYPE,
+    _MAPPERS,
+    _MAPPING_SPEC,
+    WebhookEvent,
+    map_webhook_event,
+)
+
+MEETING = {
+    "internal-meeting-id": "benchmark-internal-meeting-id",
+    "external-meeting-id": "benchmark-external-meeting-id",
+}
+
+USER = {
+    "internal-user-id": "benchmark-internal-user-id",
+    "external-user-id": "benchmark-external-user-id",
+    "name": "benchmark",
+    "role": "VIEWER",
+    "presenter": False,
+    "sharing-mic": True,
+    "listening-only": False,
+    "userdata": {"bbb_client_title": "benchmark"},
+}
+
+RECORDING = {
+    "name": "benchmark",
+    "isBreakout": False,
+    "start-time": 1532718316938,
+    "end-time": 1532718335208,
+    "size": 1000,
+    "raw-size": 2000,
+    "metadata": {"isBreakout": "false"},
+    "playback": {"format": "presentation", "link": "https://benchmark"},
+    "download": {},
+}
+
+# Share of each type of event in a typical meeting: mostly user events.
+SAMPLES = [
+    ("meeting-created", {"meeting": dict(MEETING, name="benchmark", duration=0)}, 1),
+    ("user-joined", {"meeting": MEETING, "user": USER}, 10),
+    ("user-audio-voice-enabled", {"meeting": MEETING, "user": USER}, 10),
+    ("user-audio-voice-disabled", {"meeting": MEETING, "user": USER}, 10),
+    ("user-cam-broadcast-start", {"meeting": MEETING, "user": USER}, 5),
+    ("user-presenter-assigned", {"meeting": MEETING, "user": USER}, 2),
+    ("user-left", {"meeting": MEETING, "user": USER}, 10),
+    ("meeting-ended", {"meeting": MEETING}, 1),
+    ("rap-archive-ended", {"meeting": MEETING, "recorded": True}, 1),
+    ("rap-process-started", {"meeting": MEETING, "workflow": "presentation"}, 1),
+    ("rap-publish-ended", {"meeting": MEETING, "recording": RECORDING}, 1),
+]
+
+
+def sample_corpus():
+    """Payloads of each type of event as posted by webhooks."""
+    return [
+        {
+            "server_url": "https://benchmark",
+            "data": {
+                "type": "event",
+                "id": event_type,
+                "attributes": attributes,
+                "event": {"ts": 1502810164922},
+            },
+        }
+        for event_type, attributes, weight in SAMPLES
+        for _ in range(weight)
+    ]
+
+
+def _get_nested(d, keys, default):
+    """Value of nested dictionaries at a list of keys, or `default` if any is missing.
+
+    It is how fields were looked up before the spec was compiled.
+    """
+    for k in keys:
+        if k not in d:
+            return default
+        d = d[k]
+
+    return d
+
+
+def map_webhook_event_baseline(event):
+    """Map an event the way it was done before the spec was compiled."""
+    event_type = event["data"]["id"]
+    for event_types, event_class, fields in _MAPPING_SPEC:
+        if event_type in event_types:
+            break
+    else:
+        raise ValueError(event_type)
+
+    values = {
+        field: (
+            event_type
+            if fields[field] is _EVENT_TYPE
+            else _get_nested(event, list(fields[field][0]), fields[field][1])
+        )
+        for field in event_class._fields
+    }
+
+    return WebhookEvent(event_type, event_class(**values), event["server_url"])
+
+
+def map_webhook_event_compiled(event):
+    """Map an event with the extractor compiled for its type."""
+    event_type = event["data"]["id"]
+
+    return WebhookEvent(
+        event_type, _MAPPERS[event_type](event, event_type), event["server_url"]
+    )
+
+
+def _time(mapper, corpus, rounds):
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for event in corpus:
+            mapper(event)
+        timings.append((time.perf_counter() - start) / len(corpus))
+
+    return statistics.median(timings) * 1e6
+
+
+def run(corpus=None, rounds=200):
+    """Measure the time to map each event of the corpus.
+
+    Returns
+    -------
+    results : dict
+        Median time (in microseconds) per event of each mapper, the speedup
+        of the compiled one and the time of the whole `map_webhook_event`.
+    """
+    corpus = corpus or sample_corpus()
+
+    for event in corpus:
+        assert map_webhook_event(event) == map_webhook_event_baseline(event)
+
+    baseline_us = _time(map_webhook_event_baseline, corpus, rounds)
+    compiled_us = _time(map_webhook_event_compiled, corpus, rounds)
+
+    return {
+        "events": len(corpus),
+        "rounds": rounds,
+        "baseline_us": baseline_us,
+        "compiled_us": compiled_us,
+        "speedup": baseline_us / compiled_us,
+        "map_webhook_event_us": _time(map_webhook_event, corpus, rounds),
+    }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--corpus", help="file with a JSON list of payloads received by webhooks"
+    )
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    corpus = None
+    if args.corpus:
+        with open(args.corpus) as corpus_file:
+            corpus = json.load(corpus_file)
+
+    print(json.dumps(run(corpus, args.rounds)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,153 @@
+"""Latency of `WebhookEventListener.on_post` while the writer waits on Postgres.
+
+A subscriber thread (a greenlet, since gevent monkey patches threading) runs
+a slow query for each event it receives, simulating a writer stuck on the
+database. Meanwhile, requests are sent to the webhook listener from their own
+greenlets on a fixed schedule, and each latency is measured from the time the
+request was due, so the time the hub is blocked counts as latency even if the
+request could not be sent yet. With the cooperative wait callback installed,
+the latency stays flat; without it (`--no-green`), requests wait for the slow
+query to finish.
+
+It needs a Postgres server, configured with the usual MCONF_WEBHOOK_DATABASE_*
+environment variables:
+
+    python -m benchmarks.on_post_latency
+    python -m benchmarks.on_post_latency --no-green
+"""
+import gevent
+import gevent.pool
+from gevent import monkey
+
+monkey.patch_all()
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+os.environ.setdefault("MCONF_WEBHOOK_AUTH_REQUIRED", "false")
+
+import falcon
+import falcon.testing
+
+from mconf_aggr.aggregator.aggregator import Aggregator, AggregatorCallback
+from mconf_aggr.webhook.database import DatabaseConnector, make_psycopg_green
+from mconf_aggr.webhook.event_listener import WebhookEventHandler, WebhookEventListener
+
+EVENT = {
+    "data": {
+        "type": "event",
+        "id": "user-joined",
+        "attributes": {
+            "meeting": {
+                "internal-meeting-id": "benchmark-internal-meeting-id",
+                "external-meeting-id": "benchmark-external-meeting-id",
+            },
+            "user": {
+                "internal-user-id": "benchmark-internal-user-id",
+                "external-user-id": "benchmark-external-user-id",
+                "name": "benchmark",
+                "role": "VIEWER",
+                "presenter": False,
+            },
+        },
+        "event": {"ts": 1502810164922},
+    }
+}
+
+
+class SlowWriter(AggregatorCallback):
+    """Writer that spends `delay` seconds in the database for each event."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.session_scope = DatabaseConnector.get_session_scope()
+
+    def setup(self):
+        pass
+
+    def teardown(self):
+        pass
+
+    def run(self, data):
+        with self.session_scope() as session:
+            session.execute("SELECT pg_sleep(:delay)", {"delay": self.delay})
+
+
+def run(requests=200, interval=0.01, delay=0.5, green=True):
+    """Measure the latency of requests while the writer runs slow queries.
+
+    Returns
+    -------
+    results : dict
+        Latency percentiles (in milliseconds) of the requests.
+    """
+    if green:
+        make_psycopg_green()
+
+    DatabaseConnector.connect()
+
+    aggregator = Aggregator()
+    aggregator.register_callback(SlowWriter(delay), channel="benchmark")
+    aggregator.setup()
+    aggregator.start()
+
+    app = falcon.App()
+    handler = WebhookEventHandler(aggregator.publisher, "benchmark")
+    app.add_route("/", WebhookEventListener(handler))
+    client = falcon.testing.TestClient(app)
+
+    params = {"domain": "benchmark", "event": json.dumps([EVENT])}
+    latencies = []
+
+    def send(due):
+        client.simulate_post("/", params=params)
+        latencies.append((time.perf_counter() - due) * 1000)
+
+    senders = gevent.pool.Group()
+    try:
+        start = time.perf_counter()
+        for i in range(requests):
+            due = start + i * interval
+            gevent.sleep(max(0, due - time.perf_counter()))
+            senders.spawn(send, due)
+        senders.join()
+    finally:
+        aggregator.stop()
+
+    latencies.sort()
+
+    return {
+        "green": green,
+        "requests": requests,
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1],
+        "max_ms": latencies[-1],
+    }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument(
+        "--interval", type=float, default=0.01, help="seconds between requests"
+    )
+    parser.add_argument(
+        "--delay", type=float, default=0.5, help="seconds of each slow query"
+    )
+    parser.add_argument(
+        "--no-green",
+        dest="green",
+        action="store_false",
+        help="do not install the cooperative wait callback",
+    )
+    args = parser.parse_args(argv)
+
+    print(json.dumps(run(args.requests, args.interval, args.delay, args.green)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
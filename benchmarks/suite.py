@@ -0,0 +1,524 @@
+"""Events per second, latency and allocations of each stage of the ingest pipeline.
+
+The stages are timed separately, so a regression points at its stage:
+
+* mapping: decoding the JSON of a request and `map_webhook_event`, by type
+  of event;
+* channel: publishing an event to a `Channel` and popping it;
+* handlers: each `DataProcessor` handler writing an event in a transaction of
+  its own, along the lifecycle of meetings, on a local database;
+* app: the whole Falcon app in-process, through a WSGI test client, with the
+  aggregator writing the events to the local database. Its events per second
+  include the time to write all events, its latency is the one of requests.
+
+For each case, the best events per second and p50 and p99 latency of
+`--repeats` runs and the median of the memory allocated per event (peak
+traced by `tracemalloc`, in a pass of its own as tracing slows everything
+down) are printed as JSON. With
+`--baseline`, they are compared with results saved by `--save`, and it exits
+with status 1 if any case is slower or allocates more than tolerated:
+
+    python -m benchmarks.suite --save benchmarks/baseline.json
+    python -m benchmarks.suite --baseline benchmarks/baseline.json
+    python -m benchmarks.suite --stages mapping channel --rounds 2000
+
+The local database is an in-memory SQLite database unless `--url` is given
+(see `local_database`), e.g. `--url temporary-postgresql`.
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+os.environ.setdefault("MCONF_WEBHOOK_AUTH_REQUIRED", "false")
+
+import falcon
+import falcon.testing
+
+from benchmarks.event_mapper import RECORDING, SAMPLES
+from mconf_aggr.aggregator.aggregator import Aggregator, Channel
+from mconf_aggr.webhook.database import DatabaseConnector
+from mconf_aggr.webhook.database_handler import DataProcessor, WebhookDataWriter
+from mconf_aggr.webhook.event_listener import WebhookEventHandler, WebhookEventListener
+from mconf_aggr.webhook.event_mapper import map_webhook_event
+from mconf_aggr.webhook.local_database import LocalDatabase
+
+STAGES = ["mapping", "channel", "handlers", "app"]
+
+# Below this number of events, the p99 latency of a case is its maximum.
+P99_MIN_EVENTS = 100
+
+# Server of the seed of local databases (see `local_database.LOCAL_SEED`).
+SERVER_URL = "https://localhost"
+
+# Events of each user of a meeting, in order, between meeting-created and
+# the user-left of its users.
+USER_EVENTS = [
+    "user-joined",
+    "user-audio-voice-enabled",
+    "user-audio-voice-disabled",
+    "user-audio-listen-only-enabled",
+    "user-audio-listen-only-disabled",
+    "user-cam-broadcast-start",
+    "user-cam-broadcast-end",
+    "user-presenter-assigned",
+    "user-presenter-unassigned",
+]
+
+# Events of a meeting after its users left.
+RECORDING_EVENTS = [
+    ("rap-archive-ended", {"recorded": True}),
+    ("rap-process-started", {"workflow": "presentation"}),
+    ("rap-process-ended", {"workflow": "presentation", "success": True}),
+    ("rap-publish-ended", {"recording": RECORDING, "success": True}),
+]
+
+
+def payload(event_type, meeting, ts, user=None, **attributes):
+    """Event as posted by webhooks of the server of local databases."""
+    attributes["meeting"] = {
+        "internal-meeting-id": meeting,
+        "external-meeting-id": f"{meeting}-external",
+    }
+    if event_type == "meeting-created":
+        attributes["meeting"].update(
+            {
+                "name": meeting,
+                "create-time": ts,
+                "parent-id": "bbb-none",
+                "metadata": {"mconflb-institution-name": "local"},
+            }
+        )
+    if user is not None:
+        attributes["user"] = {
+            "internal-user-id": user,
+            "external-user-id": user,
+            "name": user,
+            "role": "VIEWER",
+            "presenter": False,
+        }
+
+    return {
+        "data": {
+            "type": "event",
+            "id": event_type,
+            "attributes": attributes,
+            "event": {"ts": ts},
+        }
+    }
+
+
+def lifecycle(meeting, users):
+    """Payloads of a meeting of `users` users, from its creation to its recording."""
+    payloads = [payload("meeting-created", meeting, 0)]
+    for event_type in USER_EVENTS:
+        for i in range(users):
+            payloads.append(payload(event_type, meeting, 0, user=f"{meeting}-user-{i}"))
+    for i in range(users):
+        payloads.append(payload("user-left", meeting, 0, user=f"{meeting}-user-{i}"))
+    payloads.append(payload("meeting-ended", meeting, 0))
+    for event_type, attributes in RECORDING_EVENTS:
+        payloads.append(payload(event_type, meeting, 0, **attributes))
+
+    for ts, event in enumerate(payloads, 1):
+        event["data"]["event"]["ts"] = ts
+
+    return payloads
+
+
+def mapping_operations(rounds, prefix):
+    """Decode and map a request body of a single event, of each type of event."""
+
+    def operation(body):
+        for event in json.loads(body):
+            event["server_url"] = SERVER_URL
+            map_webhook_event(event)
+
+    bodies = []
+    for event_type, attributes, _ in SAMPLES:
+        attributes = dict(attributes)
+        del attributes["meeting"]
+        user = "user" if attributes.pop("user", None) else None
+        bodies.append(
+            (
+                event_type,
+                json.dumps([payload(event_type, prefix, 1, user=user, **attributes)]),
+            )
+        )
+
+    return [
+        (f"mapping.{event_type}", lambda body=body: operation(body))
+        for _ in range(rounds)
+        for event_type, body in bodies
+    ]
+
+
+def channel_operations(rounds, prefix):
+    """Publish an event to a channel and pop it."""
+    channel = Channel("benchmark")
+    event = map_webhook_event(
+        dict(payload("user-joined", prefix, 1, user="user"), server_url=SERVER_URL)
+    )
+
+    def operation():
+        channel.publish(event)
+        channel.pop()
+        channel.commit()
+
+    return [("channel", operation)] * rounds
+
+
+class HandlersStage:
+    """Write the events of meetings one by one, with `DataProcessor`."""
+
+    def __init__(self, meetings, users):
+        self.meetings = meetings
+        self.users = users
+        self.session_scope = DatabaseConnector.get_session_scope()
+
+    def operations(self, prefix):
+        def operation(event):
+            with self.session_scope() as session:
+                DataProcessor(session).update(event)
+
+        events = [
+            map_webhook_event(dict(event, server_url=SERVER_URL))
+            for i in range(self.meetings)
+            for event in lifecycle(f"{prefix}-{i}", self.users)
+        ]
+
+        return [
+            (f"handlers.{event.event_type}", lambda event=event: operation(event))
+            for event in events
+        ]
+
+
+class AppStage:
+    """Post the events of meetings one by one to the app, written by the aggregator."""
+
+    channel = "webhooks"
+
+    def __init__(self, meetings, users, batch_size=100, batch_timeout=0.01):
+        self.meetings = meetings
+        self.users = users
+
+        self.aggregator = Aggregator()
+        self.aggregator.register_callback(
+            WebhookDataWriter(),
+            channel=self.channel,
+            batch_size=batch_size,
+            batch_timeout=batch_timeout,
+        )
+
+        app = falcon.App()
+        app.req_options.auto_parse_form_urlencoded = True
+        handler = WebhookEventHandler(self.aggregator.publisher, self.channel)
+        app.add_route("/", WebhookEventListener(handler))
+        self.client = falcon.testing.TestClient(app)
+
+    def start(self):
+        self.aggregator.setup()
+        self.aggregator.start()
+
+    def stop(self):
+        self.aggregator.stop()
+
+    def drain(self):
+        """Wait until the aggregator wrote every event posted so far."""
+        for subscriber in self.aggregator.channels[self.channel]:
+            subscriber.channel.join()
+
+    def operations(self, prefix):
+        def operation(params):
+            result = self.client.simulate_post("/", params=params)
+            assert result.status_code == 200, result.text
+
+        requests = [
+            {"domain": SERVER_URL, "event": json.dumps([event])}
+            for i in range(self.meetings)
+            for event in lifecycle(f"{prefix}-{i}", self.users)
+        ]
+
+        return [("app", lambda params=params: operation(params)) for params in requests]
+
+
+def time_operations(operations):
+    """Latencies (in seconds) of the operations, by case."""
+    latencies = defaultdict(list)
+    for case, operation in operations:
+        start = time.perf_counter()
+        operation()
+        latencies[case].append(time.perf_counter() - start)
+
+    return latencies
+
+
+def trace_operations(operations):
+    """Peak of memory (in bytes) allocated by each operation, by case."""
+    allocations = defaultdict(list)
+    tracemalloc.start()
+    try:
+        for case, operation in operations:
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            operation()
+            allocations[case].append(tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+
+    return allocations
+
+
+def summarize(latencies, elapsed=None):
+    """Events per second and p50 and p99 latency (in microseconds).
+
+    The events per second are computed from `elapsed`, if supplied, instead of
+    the sum of the latencies.
+    """
+    latencies = sorted(latencies)
+
+    return {
+        "events": len(latencies),
+        "events_per_second": len(latencies) / (elapsed or sum(latencies)),
+        "p50_us": statistics.median(latencies) * 1e6,
+        "p99_us": latencies[int(len(latencies) * 0.99) - 1] * 1e6,
+    }
+
+
+def run_stage(stage, operations, drain=None, repeats=3):
+    """Time a stage, then trace its allocations with fresh operations.
+
+    The stage is timed `repeats` times and the best of each metric is kept,
+    as what makes a run slower (other processes, garbage collections) is
+    noise to the comparison with a baseline.
+
+    Parameters
+    ----------
+    stage : str
+        Name of the stage.
+    operations : callable
+        Called with a prefix of meeting ids, it returns the operations to
+        measure as (case, callable) pairs. Each pass gets its own meetings.
+    drain : callable
+        If supplied, it waits for the work left behind by the operations,
+        which is timed with them.
+    repeats : int
+        Number of times the stage is timed.
+
+    Returns
+    -------
+    cases : dict
+        Events per second, p50 and p99 latency (see `summarize`) and median
+        of the memory allocated per event (in bytes) of each case.
+    """
+    cases = {}
+    for repeat in range(repeats):
+        timed = operations(f"{stage}-timed-{repeat}")
+        gc.collect()
+        start = time.perf_counter()
+        latencies = time_operations(timed)
+        if drain is not None:
+            drain()
+        elapsed = time.perf_counter() - start
+
+        for case in latencies:
+            result = summarize(latencies[case], elapsed if drain is not None else None)
+            best = cases.setdefault(case, result)
+            best["events_per_second"] = max(
+                best["events_per_second"], result["events_per_second"]
+            )
+            best["p50_us"] = min(best["p50_us"], result["p50_us"])
+            best["p99_us"] = min(best["p99_us"], result["p99_us"])
+
+    allocations = trace_operations(operations(f"{stage}-traced"))
+    if drain is not None:
+        drain()
+    for case in cases:
+        cases[case]["alloc_bytes"] = statistics.median(allocations[case])
+
+    return cases
+
+
+def run(stages=None, rounds=1000, meetings=20, users=10, url=None, repeats=3):
+    """Measure the cases of each stage.
+
+    Returns
+    -------
+    results : dict
+        The machine it ran on, the parameters and the results of each case.
+    """
+    stages = stages or STAGES
+    cases = {}
+
+    logging.disable(logging.CRITICAL)
+    try:
+        if "mapping" in stages:
+            cases.update(
+                run_stage(
+                    "mapping",
+                    lambda prefix: mapping_operations(rounds, prefix),
+                    repeats=repeats,
+                )
+            )
+        if "channel" in stages:
+            cases.update(
+                run_stage(
+                    "channel",
+                    lambda prefix: channel_operations(rounds, prefix),
+                    repeats=repeats,
+                )
+            )
+
+        if "handlers" in stages or "app" in stages:
+            local_database = LocalDatabase(url)
+            try:
+                DatabaseConnector.connect(local_database.start())
+                local_database.create(DatabaseConnector.engine)
+
+                if "handlers" in stages:
+                    stage = HandlersStage(meetings, users)
+                    cases.update(
+                        run_stage("handlers", stage.operations, repeats=repeats)
+                    )
+
+                if "app" in stages:
+                    stage = AppStage(meetings, users)
+                    stage.start()
+                    try:
+                        cases.update(
+                            run_stage(
+                                "app", stage.operations, stage.drain, repeats=repeats
+                            )
+                        )
+                    finally:
+                        stage.stop()
+            finally:
+                DatabaseConnector.engine.dispose()
+                local_database.stop()
+    finally:
+        logging.disable(logging.NOTSET)
+
+    return {
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor() or platform.machine(),
+        },
+        "parameters": {
+            "rounds": rounds,
+            "meetings": meetings,
+            "users": users,
+            "repeats": repeats,
+            "url": url or "sqlite://",
+        },
+        "cases": cases,
+    }
+
+
+def compare(results, baseline, tolerance=0.25, p99_tolerance=1.0):
+    """Cases of the results worse than in the baseline by more than the tolerance.
+
+    Fewer events per second or more memory allocated per event than
+    `tolerance` allows, or a p99 latency higher than `p99_tolerance` allows
+    (tail latency varies a lot more between runs), are regressions. The p99
+    latency of cases of fewer than `P99_MIN_EVENTS` events is their maximum,
+    too noisy to be compared. Cases missing from either side are ignored.
+
+    Returns
+    -------
+    regressions : list of dict
+        The case, the metric and its value in the baseline and the results.
+    """
+    regressions = []
+    for case, expected in sorted(baseline["cases"].items()):
+        measured = results["cases"].get(case)
+        if measured is None:
+            continue
+
+        worse = {
+            "events_per_second": measured["events_per_second"]
+            < expected["events_per_second"] * (1 - tolerance),
+            "alloc_bytes": measured["alloc_bytes"]
+            > expected["alloc_bytes"] * (1 + tolerance),
+            "p99_us": measured["events"] >= P99_MIN_EVENTS
+            and measured["p99_us"] > expected["p99_us"] * (1 + p99_tolerance),
+        }
+        for metric in ["events_per_second", "p99_us", "alloc_bytes"]:
+            if worse[metric]:
+                regressions.append(
+                    {
+                        "case": case,
+                        "metric": metric,
+                        "baseline": expected[metric],
+                        "result": measured[metric],
+                    }
+                )
+
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument(
+        "--rounds", type=int, default=1000, help="events of each mapping and channel"
+    )
+    parser.add_argument(
+        "--meetings", type=int, default=20, help="meetings of handlers and app"
+    )
+    parser.add_argument("--users", type=int, default=10, help="users of each meeting")
+    parser.add_argument(
+        "--repeats", type=int, default=3, help="times each stage is timed"
+    )
+    parser.add_argument("--url", help="URL of the local database")
+    parser.add_argument("--baseline", help="file of results to compare with")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="fraction a case may be slower or allocate more than in the baseline",
+    )
+    parser.add_argument(
+        "--p99-tolerance",
+        type=float,
+        default=1.0,
+        help="fraction the p99 latency of a case may be higher than in the baseline",
+    )
+    parser.add_argument("--save", help="file to save the results to")
+    args = parser.parse_args(argv)
+
+    results = run(
+        args.stages, args.rounds, args.meetings, args.users, args.url, args.repeats
+    )
+
+    if args.save:
+        with open(args.save, "w") as results_file:
+            json.dump(results, results_file, indent=2, sort_keys=True)
+            results_file.write("\n")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        results["regressions"] = compare(
+            results, baseline, args.tolerance, args.p99_tolerance
+        )
+        if baseline.get("machine") != results["machine"]:
+            print(
+                f"Baseline of another machine: {baseline.get('machine')}",
+                file=sys.stderr,
+            )
+
+    print(json.dumps(results))
+
+    return 1 if results.get("regressions") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
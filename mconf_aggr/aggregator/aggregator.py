@@ -12,10 +12,14 @@ import logging
 import queue
 import reprlib
 import threading
+import time
+import zlib
 from collections import namedtuple
 
 import logaugment
 
+from mconf_aggr.aggregator.retry import RetryQueue
+
 
 class AggregatorNotRunning(Exception):
     """Raised if the aggregator has stopped for some reason.
@@ -39,6 +43,17 @@ class CallbackError(Exception):
     pass
 
 
+class TransientCallbackError(CallbackError):
+    """Raised by callbacks if something goes wrong that may go away by itself.
+
+    As an example, the database being unreachable for a moment while it
+    fails over. Subscribers registered with a retry policy try the data again
+    later instead of dropping it.
+    """
+
+    pass
+
+
 class SetupError(Exception):
     """Raised if something goes wrong while setting aggregator up."""
 
@@ -54,12 +69,48 @@ class ChannelClosed(Exception):
     pass
 
 
+class ChannelEmpty(Exception):
+    """Raised if no data arrives in a channel before a timeout.
+
+    It is not an error, just a signaling exception.
+    """
+
+    pass
+
+
 class PublishError(Exception):
     """Raised if something goes wrong while publishing data."""
 
     pass
 
 
+class ChannelFull(PublishError):
+    """Raised if a bounded channel cannot accept data.
+
+    It signals backpressure: the data was not published and the producer may
+    try again later.
+    """
+
+    pass
+
+
+"""Overflow policies of bounded channels.
+
+POLICY_BLOCK
+    Block the producer until there is room in the channel or the timeout
+    expires, then raise `ChannelFull`.
+POLICY_REJECT
+    Raise `ChannelFull` right away.
+POLICY_SHED
+    Drop low-priority data while the channel is above its high watermark and
+    block for any other data as in `POLICY_BLOCK`.
+"""
+POLICY_BLOCK = "block"
+POLICY_REJECT = "reject"
+POLICY_SHED = "shed"
+POLICIES = (POLICY_BLOCK, POLICY_REJECT, POLICY_SHED)
+
+
 """Represent a subscriber of the aggregator.
 
 It encapsulates a `Channel` object and a callback in a single
@@ -71,20 +122,60 @@ Attributes
         The channel where the subscriber received data from.
     callback : `AggregatorCallback` subclass
         The callback that processes the data.
+    batch_size : int
+        Maximum number of elements delivered at once to the callback. If it
+        is greater than 1 and the callback implements `run_batch`, the
+        callback receives lists through `run_batch`.
+    batch_timeout : float
+        Maximum time (in seconds) to wait for a batch to fill up.
+    retry_policy : `retry.RetryPolicy`
+        How data is retried when the callback raises `TransientCallbackError`.
+        If None, the data is dropped as for any other `CallbackError`.
+    dead_letter : `retry.DeadLetterStore`
+        Where data is written once it is given up on. If None, it is dropped.
+    key : callable
+        Function returning the key of the data. Data with the same key is
+        retried in order.
 """
-Subscriber = namedtuple("Subscriber", ("channel", "callback"))
+Subscriber = namedtuple(
+    "Subscriber",
+    (
+        "channel",
+        "callback",
+        "batch_size",
+        "batch_timeout",
+        "retry_policy",
+        "dead_letter",
+        "key",
+    ),
+    defaults=(1, 0, None, None, None),
+)
 
 
 class AggregatorCallback:
     """Interface to be implemented by callbacks.
 
     It should not be instantiated. Although not formally an abstract class,
-    this class does not implement any of its methods. All your consuming
-    callbacks must inherit from this class and implement at least the
-    `run` method. It is highly advised to implement also the `setup` and
-    `teardown` methods.
+    this class does not implement any of its methods but `run_batch`. All your
+    consuming callbacks must inherit from this class and implement at least
+    the `run` method. It is highly advised to implement also the `setup` and
+    `teardown` methods. Callbacks that can handle several elements at once
+    more efficiently than one by one may also override `run_batch`.
+
+    Callbacks that keep data to handle it later (e.g. until something else
+    happens) should override `held`, so the data is not committed in the
+    channel, and may set `idle_interval` to be called by `idle` while no data
+    arrives.
+
+    Attributes
+    ----------
+    idle_interval : float
+        Time (in seconds) without data after which `idle` is called. If None,
+        `idle` is never called.
     """
 
+    idle_interval = None
+
     def setup(self):
         """Prepare the callback before it starts receiving data.
 
@@ -126,6 +217,109 @@ class AggregatorCallback:
         """
         raise NotImplementedError()
 
+    def run_batch(self, data):
+        """This method is called by the aggregator to send several elements at once.
+
+        It is only called for callbacks registered with a `batch_size` greater
+        than 1. The default implementation calls `run` for each element, so
+        overriding it is optional. Callbacks should override it to share
+        expensive resources (sessions, connections etc) across the batch.
+
+        Parameters
+        ----------
+        data : list
+            Elements received by the channel, in order.
+
+        Raises
+        ------
+        CallbackError
+            If `run` raised `CallbackError` for any element. The remaining
+            elements are still sent to `run`.
+        """
+        failed = 0
+        for item in data:
+            try:
+                self.run(item)
+            except CallbackError:
+                failed += 1
+
+        if failed:
+            raise CallbackError(f"{failed} of {len(data)} element(s) failed")
+
+    def idle(self):
+        """This method is called by the aggregator when no data arrived for a while.
+
+        It is called every `idle_interval` seconds while the channel is empty,
+        by the same thread that calls `run`, so data held by the callback can
+        be handled without waiting for new data. The default implementation
+        does nothing.
+
+        Raises
+        ------
+        CallbackError
+            As `run`.
+        """
+
+    def held(self):
+        """Data received by the calling thread that is not handled yet.
+
+        The channel is only committed up to the first element held, so a
+        durable channel delivers it again after a crash. Elements are matched
+        by identity. After the threads of the callback exited, it is called
+        by the aggregator to list the data held for any of them. The default
+        implementation holds nothing.
+
+        Returns
+        -------
+        list
+            Data received by `run` or `run_batch` that is not handled yet.
+        """
+        return []
+
+
+def implements_run_batch(callback):
+    """Check whether a callback provides its own `run_batch`.
+
+    The check is made on the class of the callback so attributes created on
+    the fly (e.g. by mocks) are not taken as an implementation.
+
+    Parameters
+    ----------
+    callback : object
+        Callback to check.
+
+    Returns
+    -------
+    bool
+        True if the class of `callback` defines `run_batch` other than the
+        default one from `AggregatorCallback`. False, otherwise.
+    """
+    run_batch = getattr(type(callback), "run_batch", None)
+
+    return callable(run_batch) and run_batch is not AggregatorCallback.run_batch
+
+
+def held_by(callback):
+    """Data held by a callback (see `AggregatorCallback.held`).
+
+    Callbacks not inheriting from `AggregatorCallback` (e.g. mocks) hold
+    nothing.
+
+    Parameters
+    ----------
+    callback : object
+        Callback to check.
+
+    Returns
+    -------
+    list
+        Data received by `callback` that is not handled yet.
+    """
+    if not isinstance(callback, AggregatorCallback):
+        return []
+
+    return callback.held()
+
 
 class SubscriberThread(threading.Thread):
     """This class represents the thread to be run for a subscriber."""
@@ -142,6 +336,19 @@ class SubscriberThread(threading.Thread):
         """
         threading.Thread.__init__(self, **kwargs)
         self.subscriber = subscriber
+        self._batched = subscriber.batch_size > 1 and implements_run_batch(
+            subscriber.callback
+        )
+        self._retries = (
+            RetryQueue(subscriber.retry_policy, subscriber.key)
+            if subscriber.retry_policy is not None
+            else None
+        )
+        self._idle_interval = (
+            subscriber.callback.idle_interval
+            if isinstance(subscriber.callback, AggregatorCallback)
+            else None
+        )
         self._errorevent = errorevent
         self._stopevent = threading.Event()
         self.logger = logger or logging.getLogger(__name__)
@@ -159,8 +366,19 @@ class SubscriberThread(threading.Thread):
 
         It runs while the thread is signaled to exit (by calling its `exit`
         method). The data is popped out from the `subscriber`'s channel and
-        sent to the `subscriber`'s callback `run` method. When signaled to
-        exit, it simply returns and the thread is done.
+        sent to the `subscriber`'s callback `run` method, and then committed
+        in the channel. If the subscriber
+        has a `batch_size` greater than 1 and its callback implements
+        `run_batch`, up to `batch_size` elements are popped at once and sent
+        to `run_batch` instead. When signaled to exit, it simply returns and
+        the thread is done.
+
+        If the subscriber has a `retry_policy`, data failing with
+        `TransientCallbackError` is parked and tried again between pops, and
+        nothing is committed while data is parked. On exit, data still parked
+        is given up on. Data held by the callback (see
+        `AggregatorCallback.held`) is not committed either, and the callback's
+        `idle` is called when no data arrives for its `idle_interval`.
         """
         logging_extra = {
             "code": "Subscriber run",
@@ -172,36 +390,63 @@ class SubscriberThread(threading.Thread):
             extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
         )
         while not self._stopevent.is_set():
+            wait = self._run_retries()
+            if wait is not None and self._retries.full():
+                # Stop consuming until parked data is handled.
+                self._stopevent.wait(wait)
+                continue
+
+            if self._idle_interval is not None and (
+                wait is None or wait > self._idle_interval
+            ):
+                wait = self._idle_interval
+
             try:
-                data = self.subscriber.channel.pop()
-                self.subscriber.callback.run(data)
+                if self._batched:
+                    data = self.subscriber.channel.pop_many(
+                        self.subscriber.batch_size, self.subscriber.batch_timeout, wait
+                    )
+                    data = self._defer(data)
+                    if data:
+                        self.subscriber.callback.run_batch(data)
+                else:
+                    data = self._defer([self.subscriber.channel.pop(wait)])
+                    if data:
+                        self.subscriber.callback.run(data[0])
+                self._commit()
+            except ChannelEmpty:
+                self._idle()
             except ChannelClosed:
                 continue
+            except TransientCallbackError:
+                if self._retries is None:
+                    self._log_callback_error()
+                    self._commit()
+                    continue
+
+                for item in data:
+                    self._retries.park(item)
             except CallbackError:
-                logging_extra["keywords"] = [
-                    "run",
-                    "thread",
-                    "subscriber",
-                    "callback",
-                    "exception",
-                    "error",
-                ]
+                # The callback is done with the data even if it failed.
+                self._log_callback_error()
+                self._commit()
 
-                self.logger.info(
-                    "An error occurred while running a subscriber.",
-                    extra=dict(
-                        logging_extra, keywords=json.dumps(logging_extra["keywords"])
-                    ),
-                )
+        self._give_up_retries()
 
         return
 
-    def exit(self):
+    def exit(self, timeout=None):
         """Exit the thread.
 
         This method prepares the thread to exit by signaling its main loop
         to finish, closing the `subscriber`'s channel and waiting for the
         thread to join.
+
+        Parameters
+        ----------
+        timeout : float
+            Maximum time (in seconds) to wait for the thread to join. If None,
+            it waits until the thread is done with the data being handled.
         """
         logging_extra = {
             "code": "Exit threads",
@@ -219,7 +464,27 @@ class SubscriberThread(threading.Thread):
         self._stopevent.set()
         self.subscriber.channel.close()
 
-        threading.Thread.join(self)
+        threading.Thread.join(self, timeout)
+        if self.is_alive():
+            logging_extra["keywords"] = [
+                "exit",
+                "thread",
+                "subscriber",
+                "callback",
+                "timeout",
+                "warning",
+            ]
+            self.logger.warn(
+                "Thread with callback {} did not exit in {}s.".format(
+                    self.subscriber.callback, timeout
+                ),
+                extra=dict(
+                    logging_extra, keywords=json.dumps(logging_extra["keywords"])
+                ),
+            )
+
+            return
+
         self.logger.debug(
             "Thread with callback {} exited with success.".format(
                 self.subscriber.callback
@@ -227,128 +492,942 @@ class SubscriberThread(threading.Thread):
             extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
         )
 
+    def _defer(self, data):
+        """Park data behind parked data with the same key, keeping the rest."""
+        if not self._retries:
+            return data
+
+        return [item for item in data if not self._retries.defer(item)]
+
+    def _commit(self):
+        # The offset of the channel cannot move past data still parked.
+        if not self._retries:
+            self.subscriber.channel.commit(held_by(self.subscriber.callback))
+
+    def _idle(self):
+        if self._idle_interval is None:
+            return
+
+        try:
+            self.subscriber.callback.idle()
+        except TransientCallbackError:
+            # The callback still holds the data, so there is nothing to commit.
+            self._log_callback_error()
+            return
+        except CallbackError:
+            self._log_callback_error()
+
+        self._commit()
+
+    def _run_retries(self):
+        """Try again parked data that is due.
+
+        Returns
+        -------
+        float
+            Time (in seconds) until the next retry is due. None if there is
+            no parked data.
+        """
+        if not self._retries:
+            return None
+
+        for key in self._retries.due():
+            while True:
+                data, failures = self._retries.head(key)
+                if data is None:
+                    break
+
+                try:
+                    self.subscriber.callback.run(data)
+                except TransientCallbackError as err:
+                    if self._retries.fail(key):
+                        break
+
+                    self._dead_letter(data, err, failures + 1)
+                except CallbackError:
+                    self._log_callback_error()
+
+                self._retries.pop(key)
+
+        if not self._retries:
+            self._commit()
+            return None
+
+        return self._retries.next_due()
+
+    def _give_up_retries(self):
+        if not self._retries:
+            return
+
+        for data, failures in self._retries.take_all():
+            self._dead_letter(data, "subscriber exited", failures)
+        self._commit()
+
+    def _dead_letter(self, data, error, failures):
+        logging_extra = {
+            "code": "Subscriber give up",
+            "site": "SubscriberThread._dead_letter",
+            "keywords": ["retry", "dead letter", "subscriber", "callback", "error"],
+        }
+
+        if self.subscriber.dead_letter is None:
+            self.logger.error(
+                "Dropping data of channel {} after {} failure(s): {}".format(
+                    self.subscriber.channel.name, failures, error
+                ),
+                extra=dict(
+                    logging_extra, keywords=json.dumps(logging_extra["keywords"])
+                ),
+            )
+            return
+
+        try:
+            self.subscriber.dead_letter.append(
+                self.subscriber.channel.name, data, str(error), failures
+            )
+        except Exception as err:
+            self.logger.exception(
+                "Could not write data of channel {} to the dead letter store: "
+                "{}".format(self.subscriber.channel.name, err),
+                extra=dict(
+                    logging_extra, keywords=json.dumps(logging_extra["keywords"])
+                ),
+            )
+
+    def _log_callback_error(self):
+        logging_extra = {
+            "code": "Subscriber run",
+            "site": "SubscriberThread.run",
+            "keywords": [
+                "run",
+                "thread",
+                "subscriber",
+                "callback",
+                "exception",
+                "error",
+            ],
+        }
+
+        self.logger.info(
+            "An error occurred while running a subscriber.",
+            extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
+        )
+
+
+class Channel:
+    """Channel to send and receive data.
+
+    This class encapsulates a thread communicating pipe between the
+    aggregator and its subscribers.
+
+    A channel with a `maxsize` is bounded. What happens when data is
+    published to a full channel depends on its `policy` (see `POLICIES`).
+    Crossing the high watermark (and going back below the low watermark) is
+    logged and counted.
+    """
+
+    durable = False  # Whether published data survives a restart of the process.
+
+    def __init__(
+        self,
+        name,
+        maxsize=0,
+        policy=POLICY_BLOCK,
+        block_timeout=None,
+        shed=None,
+        high_watermark=0.8,
+        low_watermark=0.5,
+        logger=None,
+    ):
+        """Constructor of the Channel class.
+
+        Parameters
+        ----------
+        name : str
+            An identifier of the channel.
+        maxsize : int
+            The maximum size of the channel. If it is zero or negative, the
+            channel accepts any number of elements.
+        policy : str
+            What to do when the channel is full. One of `POLICIES`.
+            Defaults to `POLICY_BLOCK`.
+        block_timeout : float
+            Maximum time (in seconds) to block the producer of a full channel.
+            If None, the producer blocks until there is room in the channel.
+        shed : callable
+            Predicate telling whether data is low-priority and may be dropped
+            under `POLICY_SHED`.
+        high_watermark : float
+            Fraction of `maxsize` above which the channel is under pressure.
+        low_watermark : float
+            Fraction of `maxsize` below which the channel is relieved.
+        logger : logging.Logger
+            If not supplied, it will instantiate a new logger from __name__.
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"unknown channel policy: {policy!r}")
+
+        self.name = name
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.shed = shed
+        self._high = maxsize * high_watermark if maxsize > 0 else None
+        self._low = maxsize * low_watermark if maxsize > 0 else None
+        self._above_high = False
+        self._high_watermark_hits = 0
+        self._published = 0
+        self._consumed = 0
+        self._uncommitted = 0
+        self._rejected = 0
+        self._shed = 0
+        self._reserved = 0  # Room taken by publishers not filled yet.
+        self.logger = logger or logging.getLogger(__name__)
+        logaugment.set(
+            self.logger, code="", site="Channel", server="", event="", keywords="null"
+        )
+
+    @property
+    def partitions(self):
+        """Channels to be consumed by subscriber threads.
+
+        A plain channel is consumed by a single thread.
+
+        Returns
+        -------
+        list of Channel
+            A list with this channel only.
+        """
+        return [self]
+
+    @classmethod
+    def reroute(cls, channel, **kwargs):
+        """Move data kept under another partitioning of `channel` into it.
+
+        Data of a plain channel does not survive a restart, so there is
+        nothing to move.
+
+        Parameters
+        ----------
+        channel : Channel or PartitionedChannel
+            Channel just created, of this class or partitioned into it.
+        **kwargs
+            Options `channel` was created with.
+
+        Returns
+        -------
+        int
+            Number of elements moved.
+        """
+        return 0
+
+    def close(self):
+        """Close the channel.
+
+        It simply puts None in the queue to signal that the channel must be
+        closed.
+        """
+        logging_extra = {
+            "code": "Channel close",
+            "site": "Channel.close",
+            "keywords": ["close", "signal", "queue", f"channel={self.name}"],
+        }
+
+        self.logger.debug(
+            "Closing channel {}.".format(self.name),
+            extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
+        )
+        if not self.empty():
+            logging_extra["keywords"] += (
+                ["warning"] if ("warning" not in logging_extra["keywords"]) else []
+            )
+            self.logger.warn(
+                "There are data not consumed in channel {}.".format(self.name),
+                extra=dict(
+                    logging_extra, keywords=json.dumps(logging_extra["keywords"])
+                ),
+            )
+        self._put_sentinel()
+
+    def publish(self, data):
+        """Publish data to channel.
+
+        Parameters
+        ----------
+        data
+            Any data to be sent over the channel.
+
+        Raises
+        ------
+        ChannelFull
+            If the channel is bounded and the data could not be put into it
+            according to its `policy`.
+        """
+        self.publish_many([data])
+
+    def publish_many(self, items):
+        """Publish several elements to channel, all or none of them.
+
+        Low-priority elements may still be shed under `POLICY_SHED`.
+
+        Parameters
+        ----------
+        items : list
+            Data to be sent over the channel, in order.
+
+        Raises
+        ------
+        ChannelFull
+            If the channel is bounded and there was no room for all of the
+            elements according to its `policy`. None of them was published.
+        """
+        logging_extra = {
+            "code": "Channel publish",
+            "site": "Channel.publish",
+            "keywords": ["publish", "data", "queue", f"channel={self.name}"],
+        }
+
+        self.logger.debug(
+            "Putting data into the channel.",
+            extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
+        )
+        items = self._unshed(items)
+        if not items:
+            return
+
+        self._take_room(len(items))
+        self._publish_reserved(items)
+
+    def pop(self, timeout=None):
+        """Pop data from the channel.
+
+        It reads data from the channel's queue.
+        If None is read from the queue, it raises a `ChannelClosed` exception
+        to signal the caller that the channel was closed.
+
+        Parameters
+        ----------
+        timeout : float
+            Maximum time (in seconds) to wait for data. If None, wait
+            indefinitely.
+
+        Returns
+        -------
+        data
+            Any data received by the channel.
+
+        Raises
+        ------
+        ChannelClosed
+            If the channel was closed.
+        ChannelEmpty
+            If no data arrived before the timeout.
+        """
+        logging_extra = {
+            "code": "Channel pop data",
+            "site": "Channel.pop",
+            "keywords": ["pop", "data", "queue", f"channel={self.name}"],
+        }
+
+        self.logger.debug(
+            "Popping data from the channel.",
+            extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
+        )
+        try:
+            data = self.queue.get(timeout=timeout)
+        except queue.Empty:
+            raise ChannelEmpty()
+
+        if data is None:
+            self.logger.debug(
+                "Signaling closing channel {} for clients "
+                "waiting for data.".format(self.name),
+                extra=dict(
+                    logging_extra, keywords=json.dumps(logging_extra["keywords"])
+                ),
+            )
+            raise ChannelClosed()
+
+        self._consumed += 1
+        self._uncommitted += 1
+        self._room_freed()
+        self._check_low_watermark()
+
+        return data
+
+    def restore(self, items):
+        """Put back data that was published before a restart.
+
+        Restored data is put ahead of the bounds of the channel, so a backlog
+        larger than `maxsize` does not block the caller.
+
+        Parameters
+        ----------
+        items : iterable
+            Data to be sent over the channel, in order.
+        """
+        count = 0
+        with self.queue.mutex:
+            for data in items:
+                self.queue.queue.append(data)
+                self.queue.unfinished_tasks += 1
+                count += 1
+            self.queue.not_empty.notify_all()
+
+        self._published += count
+
+        return count
+
+    def commit(self, held=()):
+        """Acknowledge that the data popped so far was handled.
+
+        It is called by subscriber threads after their callback returns.
+        Data is only considered done by `join` after it is committed.
+
+        Parameters
+        ----------
+        held : iterable
+            Data popped that the callback holds to handle later (see
+            `AggregatorCallback.held`). It only matters to channels that keep
+            track of what was handled, such as `spool.DurableChannel`.
+        """
+        uncommitted, self._uncommitted = self._uncommitted, 0
+        for _ in range(uncommitted):
+            self.queue.task_done()
+
+    def join(self, timeout=None):
+        """Wait until all data published to the channel is handled.
+
+        Parameters
+        ----------
+        timeout : float
+            Maximum time (in seconds) to wait. If None, wait indefinitely.
+
+        Returns
+        -------
+        bool
+            True if all data was popped and committed. False if the timeout
+            expired first.
+        """
+        with self.queue.all_tasks_done:
+            return self.queue.all_tasks_done.wait_for(
+                lambda: not self.queue.unfinished_tasks, timeout
+            )
+
+    def take_all(self):
+        """Remove and return all data not consumed yet, without blocking.
+
+        It is intended to be used after the subscribers of the channel have
+        exited, to persist what they left behind.
+
+        Returns
+        -------
+        list
+            Data still in the channel, in order.
+        """
+        items = []
+        while True:
+            try:
+                data = self.queue.get_nowait()
+            except queue.Empty:
+                self._room_freed()
+                return items
+
+            self.queue.task_done()
+            if data is not None:
+                items.append(data)
+
+    def pop_many(self, max_items, timeout, wait=None):
+        """Pop up to `max_items` elements from the channel.
+
+        It blocks until at least one element is available (for up to `wait`
+        seconds) and then keeps reading until `max_items` elements are read
+        or `timeout` seconds have elapsed since the first one.
+        If the channel is closed while a batch is being read, the elements
+        already read are returned and the channel remains closed for the next
+        call.
+
+        Parameters
+        ----------
+        max_items : int
+            Maximum number of elements to return.
+        timeout : float
+            Maximum time (in seconds) to wait for the batch to fill up.
+        wait : float
+            Maximum time (in seconds) to wait for the first element. If None,
+            wait indefinitely.
+
+        Returns
+        -------
+        list
+            Elements received by the channel, in order.
+
+        Raises
+        ------
+        ChannelClosed
+            If the channel was closed before any element was read.
+        ChannelEmpty
+            If no element arrived within `wait` seconds.
+        """
+        batch = [self.pop(wait)]
+
+        deadline = time.monotonic() + timeout
+        while len(batch) < max_items:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    data = self.queue.get(timeout=remaining)
+                else:
+                    data = self.queue.get_nowait()
+            except queue.Empty:
+                break
+
+            if data is None:
+                # Keep the channel closed for whoever pops next.
+                self._put_sentinel()
+                break
+
+            self._consumed += 1
+            self._uncommitted += 1
+            batch.append(data)
+
+        self._room_freed()
+        self._check_low_watermark()
+
+        return batch
+
+    def qsize(self):
+        """Current size of the channel.
+
+        Returns
+        -------
+        int
+            Number of elements in the channel.
+        """
+        return self.queue.qsize()
+
+    def empty(self):
+        """Is the channel empty?
+
+        Returns
+        -------
+        bool
+            True if the channel is empty. False, otherwise.
+        """
+        return self.queue.empty()
+
+    def full(self):
+        """Is the channel full?
+
+        It only makes sense if a `maxsize` is set for the channel.
+
+        Returns
+        -------
+        bool
+            True if the channel is full, ie. the number of elements in it is
+            the same as its `maxsize`. False, otherwise.
+        """
+        return self.queue.full()
+
+    def stats(self):
+        """Counters of the channel usage.
+
+        Returns
+        -------
+        stats : dict
+            Current depth of the channel and number of elements published to
+            and consumed from it.
+        """
+        return {
+            "name": self.name,
+            "depth": self.qsize(),
+            "maxsize": self.queue.maxsize,
+            "published": self._published,
+            "consumed": self._consumed,
+            "rejected": self._rejected,
+            "shed": self._shed,
+            "above_high_watermark": self._above_high,
+            "high_watermark_hits": self._high_watermark_hits,
+        }
+
+    def _unshed(self, items):
+        """Elements not shed as low-priority data."""
+        if not (self.policy == POLICY_SHED and self._above_high and self.shed):
+            return items
+
+        kept = [data for data in items if not self.shed(data)]
+        if len(kept) < len(items):
+            self._shed += len(items) - len(kept)
+            logging_extra = {
+                "code": "Channel publish",
+                "site": "Channel.publish",
+                "keywords": ["publish", "data", "queue", f"channel={self.name}"],
+            }
+            self.logger.debug(
+                "Shedding low-priority data from channel {}.".format(self.name),
+                extra=dict(
+                    logging_extra, keywords=json.dumps(logging_extra["keywords"])
+                ),
+            )
+
+        return kept
+
+    def _take_room(self, count):
+        """Take room for `count` elements, as `_reserve`.
+
+        Raises
+        ------
+        ChannelFull
+            If there was no room in time. The elements are counted as rejected.
+        """
+        try:
+            self._reserve(count)
+        except queue.Full:
+            self._rejected += count
+            logging_extra = {
+                "code": "Channel publish",
+                "site": "Channel.publish",
+                "keywords": [
+                    "publish",
+                    "data",
+                    "queue",
+                    f"channel={self.name}",
+                    "full",
+                    "warning",
+                ],
+            }
+            self.logger.warn(
+                "Channel {} is full. Data not published.".format(self.name),
+                extra=dict(
+                    logging_extra, keywords=json.dumps(logging_extra["keywords"])
+                ),
+            )
+            raise ChannelFull(f"channel {self.name} is full")
+
+    def _publish_reserved(self, items):
+        """Put elements into room taken by `_take_room`."""
+        for index, data in enumerate(items):
+            try:
+                self._put_reserved(data)
+            except BaseException:
+                self._release(len(items) - index)
+                raise
+
+        self._published += len(items)
+        self._check_high_watermark()
+
+        logging_extra = {
+            "code": "Channel publish",
+            "site": "Channel.publish",
+            "keywords": ["publish", "data", "queue", f"channel={self.name}"],
+        }
+        self.logger.debug(
+            "Channel {} has {} element(s).".format(self.name, self.qsize()),
+            extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
+        )
+
+    def _reserve(self, count):
+        """Take room for `count` elements, waiting for it as the policy says.
+
+        Publishers only wait here: elements are then put into the room taken
+        without blocking (see `_put_reserved`). More elements than `maxsize`
+        wait for the channel to be empty.
+
+        Raises
+        ------
+        queue.Full
+            If there was no room in time.
+        """
+        maxsize = self.queue.maxsize
+        if maxsize <= 0:
+            return
+
+        needed = min(count, maxsize)
+
+        def has_room():
+            return maxsize - self.queue._qsize() - self._reserved >= needed
+
+        with self.queue.not_full:
+            if self.policy == POLICY_REJECT:
+                taken = has_room()
+            else:
+                taken = self.queue.not_full.wait_for(has_room, self.block_timeout)
+            if not taken:
+                raise queue.Full
+
+            self._reserved += count
+
+    def _put_reserved(self, data):
+        """Put an element into room taken by `_reserve`, without blocking."""
+        with self.queue.mutex:
+            self.queue.queue.append(data)
+            self.queue.unfinished_tasks += 1
+            if self.queue.maxsize > 0:
+                self._reserved -= 1
+            self.queue.not_empty.notify()
+
+    def _release(self, count):
+        """Give back room taken by `_reserve` and not filled."""
+        if self.queue.maxsize <= 0:
+            return
+
+        with self.queue.not_full:
+            self._reserved -= count
+            self.queue.not_full.notify_all()
+
+    def _room_freed(self):
+        # Publishers may wait for room for several elements, so all of them
+        # are woken up, not only the first one.
+        if self.queue.maxsize > 0:
+            with self.queue.not_full:
+                self.queue.not_full.notify_all()
+
+    def _put_sentinel(self):
+        # A full channel has no consumer waiting for data, so there is no one
+        # to wake up and the sentinel must not block the caller.
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def _check_high_watermark(self):
+        if self._high is None or self._above_high or self.qsize() < self._high:
+            return
+
+        self._above_high = True
+        self._high_watermark_hits += 1
+
+        logging_extra = {
+            "code": "Channel high watermark",
+            "site": "Channel.publish",
+            "keywords": [
+                "watermark",
+                "backpressure",
+                "warning",
+                f"channel={self.name}",
+            ],
+        }
+        self.logger.warn(
+            "Channel {} reached its high watermark ({} of {} element(s)).".format(
+                self.name, self.qsize(), self.queue.maxsize
+            ),
+            extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
+        )
+
+    def _check_low_watermark(self):
+        if not self._above_high or self.qsize() > self._low:
+            return
+
+        self._above_high = False
+
+        logging_extra = {
+            "code": "Channel low watermark",
+            "site": "Channel.pop",
+            "keywords": ["watermark", "backpressure", f"channel={self.name}"],
+        }
+        self.logger.info(
+            "Channel {} is back to its low watermark ({} of {} element(s)).".format(
+                self.name, self.qsize(), self.queue.maxsize
+            ),
+            extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
+        )
+
+    def __repr__(self):
+        return "{!s}(name={!r}, maxsize={!r})".format(
+            self.__class__.__name__, self.name, self.queue.maxsize
+        )
+
+
+class PartitionedChannel:
+    """Channel split into several sub-channels consumed in parallel.
+
+    Each element is routed to one of its partitions by hashing the key
+    returned by `key` for it. Elements with the same key always go to the
+    same partition, so they are consumed in the same order they were
+    published, while elements with different keys may be consumed in
+    parallel by different threads.
+    """
+
+    def __init__(
+        self, name, partitions, key, channel_class=None, logger=None, **kwargs
+    ):
+        """Constructor of the PartitionedChannel class.
+
+        Parameters
+        ----------
+        name : str
+            An identifier of the channel.
+        partitions : int
+            Number of sub-channels.
+        key : callable
+            Function returning the partitioning key of an element.
+            Elements for which it fails are routed by their `None` key.
+        channel_class : type
+            Class of the sub-channels. Defaults to `Channel`.
+        logger : logging.Logger
+            If not supplied, it will instantiate a new logger from __name__.
+        **kwargs
+            Options of each sub-channel (`maxsize`, `policy` etc), as in
+            `channel_class`.
+        """
+        channel_class = channel_class or Channel
+        self.name = name
+        self.key = key
+        self._channels = [
+            channel_class(f"{name}-{i}", logger=logger, **kwargs)
+            for i in range(partitions)
+        ]
+        self.logger = logger or logging.getLogger(__name__)
+        logaugment.set(
+            self.logger,
+            code="",
+            site="PartitionedChannel",
+            server="",
+            event="",
+            keywords="null",
+        )
+
+    @property
+    def partitions(self):
+        """Sub-channels to be consumed by subscriber threads, one thread each.
+
+        Returns
+        -------
+        list of Channel
+            The sub-channels of this channel.
+        """
+        return list(self._channels)
+
+    def partition(self, data):
+        """Select the sub-channel an element is routed to.
+
+        Parameters
+        ----------
+        data
+            Any data to be sent over the channel.
+
+        Returns
+        -------
+        Channel
+            The sub-channel for `data`.
+        """
+        return self._channels[self._index(data)]
+
+    def _index(self, data):
+        try:
+            key = self.key(data)
+        except Exception:
+            key = None
+
+        return zlib.crc32(str(key).encode("utf-8")) % len(self._channels)
+
+    def close(self):
+        """Close all sub-channels."""
+        for channel in self._channels:
+            channel.close()
+
+    @property
+    def durable(self):
+        return all(channel.durable for channel in self._channels)
+
+    def join(self, timeout=None):
+        """Wait until all data published to the sub-channels is handled.
+
+        Parameters
+        ----------
+        timeout : float
+            Maximum time (in seconds) to wait for all sub-channels.
+            If None, wait indefinitely.
+
+        Returns
+        -------
+        bool
+            True if all data was handled. False if the timeout expired first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for channel in self._channels:
+            remaining = (
+                None if deadline is None else max(0, deadline - time.monotonic())
+            )
+            if not channel.join(remaining):
+                return False
+
+        return True
+
+    def take_all(self):
+        """Remove and return all data not consumed yet from all sub-channels.
 
-class Channel:
-    """Channel to send and receive data.
+        Returns
+        -------
+        list
+            Data still in the sub-channels, in order within each of them.
+        """
+        return [data for channel in self._channels for data in channel.take_all()]
 
-    This class encapsulates a thread communicating pipe between the
-    aggregator and its subscribers.
-    """
+    def restore(self, items):
+        """Put back data that was published before a restart.
 
-    def __init__(self, name, maxsize=0, logger=None):
-        """Constructor of the Channel class.
+        Each element is routed to its sub-channel as in `publish`, ahead of
+        the bounds of the sub-channel.
 
         Parameters
         ----------
-        name : str
-            An identifier of the channel.
-        maxsize : int
-            The maximum size of the channel. If it is zero or negative, the
-            channel accepts any number of elements.
-        logger : logging.Logger
-            If not supplied, it will instantiate a new logger from __name__.
+        items : iterable
+            Data to be sent over the channel, in order.
         """
-        self.name = name
-        self.queue = queue.Queue(maxsize=maxsize)
-        self.logger = logger or logging.getLogger(__name__)
-        logaugment.set(
-            self.logger, code="", site="Channel", server="", event="", keywords="null"
-        )
-
-    def close(self):
-        """Close the channel.
-
-        It simply puts None in the queue to signal that the channel must be
-        closed.
-        """
-        logging_extra = {
-            "code": "Channel close",
-            "site": "Channel.close",
-            "keywords": ["close", "signal", "queue", f"channel={self.name}"],
-        }
+        batches = {}
+        for data in items:
+            batches.setdefault(self._index(data), []).append(data)
 
-        self.logger.debug(
-            "Closing channel {}.".format(self.name),
-            extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
+        return sum(
+            self._channels[index].restore(batch) for index, batch in batches.items()
         )
-        if not self.empty():
-            logging_extra["keywords"] += (
-                ["warning"] if ("warning" not in logging_extra["keywords"]) else []
-            )
-            self.logger.warn(
-                "There are data not consumed in channel {}.".format(self.name),
-                extra=dict(
-                    logging_extra, keywords=json.dumps(logging_extra["keywords"])
-                ),
-            )
-        self.queue.put(None)
 
     def publish(self, data):
-        """Publish data to channel.
+        """Publish data to the sub-channel selected by its key.
 
         Parameters
         ----------
         data
             Any data to be sent over the channel.
         """
-        logging_extra = {
-            "code": "Channel publish",
-            "site": "Channel.publish",
-            "keywords": ["publish", "data", "queue", f"channel={self.name}"],
-        }
-
-        self.logger.debug(
-            "Putting data into the channel.",
-            extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
-        )
-        self.queue.put(data)
-        self.logger.debug(
-            "Channel {} has {} element(s).".format(self.name, self.qsize()),
-            extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
-        )
-
-    def pop(self):
-        """Pop data from the channel.
+        self.partition(data).publish(data)
 
-        It reads data from the channel's queue.
-        If None is read from the queue, it raises a `ChannelClosed` exception
-        to signal the caller that the channel was closed.
+    def publish_many(self, items):
+        """Publish several elements to their sub-channels, all or none of them.
 
-        Returns
-        -------
-        data
-            Any data received by the channel.
+        Parameters
+        ----------
+        items : list
+            Data to be sent over the channel, in order.
 
         Raises
         ------
-        ChannelClosed
-            If the channel was closed.
+        ChannelFull
+            If a sub-channel had no room for its elements. None of the
+            elements was published.
         """
-        logging_extra = {
-            "code": "Channel pop data",
-            "site": "Channel.pop",
-            "keywords": ["pop", "data", "queue", f"channel={self.name}"],
-        }
-
-        self.logger.debug(
-            "Popping data from the channel.",
-            extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
-        )
-        data = self.queue.get()
-
-        if data is None:
-            self.logger.debug(
-                "Signaling closing channel {} for clients "
-                "waiting for data.".format(self.name),
-                extra=dict(
-                    logging_extra, keywords=json.dumps(logging_extra["keywords"])
-                ),
-            )
-            raise ChannelClosed()
-
-        self.queue.task_done()
+        groups = {}
+        for data in items:
+            groups.setdefault(self._index(data), []).append(data)
 
-        return data
+        # Room is always taken in the order of the sub-channels, so publishers
+        # waiting for room do not wait for each other in a cycle.
+        reserved = []
+        try:
+            for index in sorted(groups):
+                channel = self._channels[index]
+                groups[index] = channel._unshed(groups[index])
+                if groups[index]:
+                    channel._take_room(len(groups[index]))
+                    reserved.append(index)
+        except ChannelFull:
+            for index in reserved:
+                self._channels[index]._release(len(groups[index]))
+            raise
+
+        for index in reserved:
+            self._channels[index]._publish_reserved(groups[index])
 
     def qsize(self):
         """Current size of the channel.
@@ -356,9 +1435,9 @@ class Channel:
         Returns
         -------
         int
-            Number of elements in the channel.
+            Number of elements in all sub-channels.
         """
-        return self.queue.qsize()
+        return sum(channel.qsize() for channel in self._channels)
 
     def empty(self):
         """Is the channel empty?
@@ -366,26 +1445,39 @@ class Channel:
         Returns
         -------
         bool
-            True if the channel is empty. False, otherwise.
+            True if all sub-channels are empty. False, otherwise.
         """
-        return self.queue.empty()
+        return all(channel.empty() for channel in self._channels)
 
     def full(self):
-        """Is the channel full?
-
-        It only makes sense if a `maxsize` is set for the channel.
+        """Is any sub-channel full?
 
         Returns
         -------
         bool
-            True if the channel is full, ie. the number of elements in it is
-            the same as its `maxsize`. False, otherwise.
+            True if any sub-channel is full. False, otherwise.
         """
-        return self.queue.full()
+        return any(channel.full() for channel in self._channels)
+
+    def stats(self):
+        """Counters of the channel usage.
+
+        Returns
+        -------
+        stats : dict
+            Total depth of the channel and counters of each sub-channel.
+        """
+        partitions = [channel.stats() for channel in self._channels]
+
+        return {
+            "name": self.name,
+            "depth": sum(partition["depth"] for partition in partitions),
+            "partitions": partitions,
+        }
 
     def __repr__(self):
-        return "{!s}(name={!r}, maxsize={!r})".format(
-            self.__class__.__name__, self.name, self.queue.maxsize
+        return "{!s}(name={!r}, partitions={!r})".format(
+            self.__class__.__name__, self.name, len(self._channels)
         )
 
 
@@ -441,39 +1533,66 @@ class Publisher:
         ------
         PublishError
             If no channel was found.
+        ChannelFull
+            If a bounded channel of a subscriber could not accept the data.
         AggregatorNotRunning
             If the aggregator is not currently running.
             It may have stopped due to some failure occurred in
             callbacks or by the stop method of aggregator being called.
         """
+        for subscriber in self._subscribers(channel):
+            subscriber.channel.publish(data)
+
+    def publish_many(self, items, channel="default"):
+        """Publish several elements to the subscribers of the channel.
+
+        Each subscriber gets all or none of the elements (see
+        `Channel.publish_many`).
+
+        Parameters
+        ----------
+        items : list
+            Data to send over the channel, in order.
+        channel : str
+            Identifier of the channel. Defaults to 'default'.
+
+        Raises
+        ------
+        PublishError, AggregatorNotRunning
+            As `publish`.
+        ChannelFull
+            If a bounded channel of a subscriber could not accept all of the
+            elements. Subscribers before it already got them.
+        """
+        for subscriber in self._subscribers(channel):
+            subscriber.channel.publish_many(items)
+
+    def _subscribers(self, channel):
         logging_extra = {
             "code": "Publisher publish",
             "site": "Publisher.publish",
             "keywords": ["publish", "subscriber", "channel", "data"],
         }
 
-        if self._running:
-            self.logger.debug(
-                "Publishing data to subscribers.",
+        if not self._running:
+            raise AggregatorNotRunning()
+
+        self.logger.debug(
+            "Publishing data to subscribers.",
+            extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
+        )
+
+        if self.channels is None:
+            logging_extra["keywords"] += ["error", "exception"]
+            self.logger.exception(
+                "No channel was found for this publisher.",
                 extra=dict(
                     logging_extra, keywords=json.dumps(logging_extra["keywords"])
                 ),
             )
+            raise PublishError()
 
-            if self.channels is None:
-                logging_extra["keywords"] += ["error", "exception"]
-                self.logger.exception(
-                    "No channel was found for this publisher.",
-                    extra=dict(
-                        logging_extra, keywords=json.dumps(logging_extra["keywords"])
-                    ),
-                )
-                raise PublishError()
-
-            for subscriber in self.channels[channel]:
-                subscriber.channel.publish(data)
-        else:
-            raise AggregatorNotRunning()
+        return self.channels[channel]
 
     def stop(self):
         """Stop the publisher."""
@@ -639,9 +1758,15 @@ class Aggregator:
         self.threads = []
 
         for subscriber in self.subscribers:
-            self.threads.append(
-                SubscriberThread(subscriber=subscriber, errorevent=errorevent)
-            )
+            # One thread per partition, each consuming its own sub-channel.
+            for partition in subscriber.channel.partitions:
+                self.threads.append(
+                    SubscriberThread(
+                        subscriber=subscriber._replace(channel=partition),
+                        errorevent=errorevent,
+                        daemon=True,
+                    )
+                )
 
         # Create error-waiting thread.
         self._error_thread = threading.Thread(
@@ -730,12 +1855,22 @@ class Aggregator:
             extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
         )
 
-    def stop(self):
+    def stop(self, timeout=None):
         """Stop the aggregator.
 
-        It calls `teardown` method for each of its subscribers' callback and
-        stops all threads. The aggregator is considered to have stopped with
-        success if all threads exit properly.
+        It stops all threads and then calls `teardown` method for each of its
+        subscribers' callback, so callbacks are no longer running when torn
+        down. The aggregator is considered to have stopped with success if all
+        threads exit properly.
+
+        Parameters
+        ----------
+        timeout : float
+            Maximum time (in seconds) to wait for the threads to exit and the
+            callbacks to be torn down. If None, it waits for all of them.
+            Callbacks with a thread still running after it (e.g. blocked on a
+            database) are not torn down, and threads still running are left
+            behind so the process can still exit.
         """
         logging_extra = {
             "code": "Aggregator stop",
@@ -758,13 +1893,100 @@ class Aggregator:
             extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
         )
 
+        logging_extra["code"] = "Threads exit"
+        logging_extra["keywords"] += ["exit"]
+        self.logger.info(
+            "Exiting threads.",
+            extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
+        )
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self.threads:
+            thread.exit(
+                None if deadline is None else max(0, deadline - time.monotonic())
+            )
+
+        running = [
+            thread.subscriber.callback for thread in self.threads if thread.is_alive()
+        ]
+        if not running:
+            logging_extra["keywords"] += ["success"]
+            self.logger.info(
+                "All threads exited with success.",
+                extra=dict(
+                    logging_extra, keywords=json.dumps(logging_extra["keywords"])
+                ),
+            )
+
         logging_extra["code"] = "Tear down callbacks"
-        logging_extra["keywords"] += ["tear down"]
+        logging_extra["keywords"] = [
+            "aggregator",
+            "stop",
+            "subscriber",
+            "callback",
+            "thread",
+            "tear down",
+        ]
         self.logger.info(
             "Tearing down callbacks.",
             extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
         )
+        if deadline is None:
+            self._teardown_callbacks(running, logging_extra)
+        else:
+            # A teardown blocked (e.g. writing to a database) cannot hold the
+            # process past the deadline either.
+            teardown_thread = threading.Thread(
+                name="teardown",
+                target=self._teardown_callbacks,
+                args=(running, dict(logging_extra)),
+                daemon=True,
+            )
+            teardown_thread.start()
+            teardown_thread.join(max(0, deadline - time.monotonic()))
+            if teardown_thread.is_alive():
+                self.logger.warn(
+                    "Callbacks not torn down in {}s.".format(timeout),
+                    extra=dict(
+                        logging_extra,
+                        keywords=json.dumps(logging_extra["keywords"] + ["warning"]),
+                    ),
+                )
+
+        self.publisher.stop()
+
+        self._running = False
+
+        logging_extra["keywords"] = [
+            "aggregator",
+            "stop",
+            "subscriber",
+            "callback",
+            "thread",
+            "finished",
+        ]
+        self.logger.info(
+            "Aggregator finished with success.",
+            extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
+        )
+
+    def _teardown_callbacks(self, running, logging_extra):
+        """Call `teardown` of each callback but the ones in `running`.
+
+        The channels of the callbacks torn down are committed afterwards.
+        """
         for subscriber in self.subscribers:
+            if any(callback is subscriber.callback for callback in running):
+                self.logger.warn(
+                    "Not tearing down callback {}: still running.".format(
+                        subscriber.callback
+                    ),
+                    extra=dict(
+                        logging_extra,
+                        keywords=json.dumps(logging_extra["keywords"] + ["warning"]),
+                    ),
+                )
+                continue
+
             try:
                 self.logger.debug(
                     "Tearing down callback {}.".format(subscriber.callback),
@@ -800,7 +2022,6 @@ class Aggregator:
                     "thread",
                     "tear down",
                 ]
-                continue
             except Exception:
                 logging_extra["keywords"] = [
                     "exception",
@@ -827,44 +2048,26 @@ class Aggregator:
                     "thread",
                     "tear down",
                 ]
-                continue
-
-        logging_extra["code"] = "Threads exit"
-        logging_extra["keywords"] += ["exit"]
-        self.logger.info(
-            "Exiting threads.",
-            extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
-        )
-        for thread in self.threads:
-            thread.exit()
-
-        if not any([thread.is_alive() for thread in self.threads]):
-            logging_extra["keywords"] += ["success"]
-            self.logger.info(
-                "All threads exited with success.",
-                extra=dict(
-                    logging_extra, keywords=json.dumps(logging_extra["keywords"])
-                ),
-            )
-
-        self.publisher.stop()
-
-        self._running = False
-
-        logging_extra["keywords"] = [
-            "aggregator",
-            "stop",
-            "subscriber",
-            "callback",
-            "thread",
-            "finished",
-        ]
-        self.logger.info(
-            "Aggregator finished with success.",
-            extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
-        )
 
-    def register_callback(self, callback, channel="default"):
+            # Data handled while tearing down is done with, so a durable
+            # channel does not deliver it again.
+            held = held_by(subscriber.callback)
+            for partition in subscriber.channel.partitions:
+                partition.commit(held)
+
+    def register_callback(
+        self,
+        callback,
+        channel="default",
+        batch_size=1,
+        batch_timeout=0,
+        partitions=1,
+        partition_key=None,
+        channel_class=None,
+        retry_policy=None,
+        dead_letter=None,
+        **channel_options,
+    ):
         """Register a new callback.
 
         A callback is an instance of a class implementing the
@@ -877,6 +2080,33 @@ class Aggregator:
             The handler of the received data.
         channel : str
             Channel to subscribe. Defaults to 'default'.
+        batch_size : int
+            Maximum number of elements delivered at once to the callback's
+            `run_batch`. Defaults to 1, ie. each element is sent to `run`.
+            It is ignored if the callback does not override `run_batch`.
+        batch_timeout : float
+            Maximum time (in seconds) to wait for a batch to fill up.
+        partitions : int
+            Number of threads consuming data for the callback. If it is
+            greater than 1, data is routed to the threads by `partition_key`,
+            so data with the same key is handled in order by the same thread.
+        partition_key : callable
+            Function returning the partitioning key of the data.
+            Required if `partitions` is greater than 1. Data with the same key
+            is also retried in order.
+        channel_class : type
+            Class of the channel created for the callback, such as
+            `spool.DurableChannel`. Defaults to `Channel`.
+        retry_policy : `retry.RetryPolicy`
+            How data is retried when the callback raises
+            `TransientCallbackError`. If None, the data is not retried.
+        dead_letter : `retry.DeadLetterStore`
+            Where data is written once it is given up on. If None, it is
+            dropped.
+        **channel_options
+            Options of the channel created for the callback, such as
+            `maxsize`, `policy`, `block_timeout` and `shed` (see `Channel`).
+            With partitions, they apply to each partition.
         """
         logging_extra = {
             "code": "Aggregator callback register",
@@ -909,8 +2139,23 @@ class Aggregator:
             )
             subscribers = []
 
-        channel_obj = Channel(channel)
-        subscriber = Subscriber(channel_obj, callback)
+        if partitions > 1:
+            channel_obj = PartitionedChannel(
+                channel, partitions, partition_key, channel_class, **channel_options
+            )
+        else:
+            channel_obj = (channel_class or Channel)(channel, **channel_options)
+        # Data kept with another number of partitions goes where it now belongs.
+        (channel_class or Channel).reroute(channel_obj, **channel_options)
+        subscriber = Subscriber(
+            channel_obj,
+            callback,
+            batch_size,
+            batch_timeout,
+            retry_policy,
+            dead_letter,
+            partition_key,
+        )
         subscribers.append(subscriber)
         self.channels[channel] = subscribers
 
@@ -944,6 +2189,19 @@ class Aggregator:
             if subscribers
         }
 
+    def stats(self):
+        """Counters of the channels of the aggregator.
+
+        Returns
+        -------
+        stats : dict
+            Counters of the subscribers' channels, keyed by channel name.
+        """
+        return {
+            channel: [subscriber.channel.stats() for subscriber in subscribers]
+            for channel, subscribers in self.channels.items()
+        }
+
     @property
     def subscribers(self):
         return set(itertools.chain(*self.channels.values()))
@@ -44,6 +44,21 @@ class EnvConfig:
         self._config["MCONF_WEBHOOK_DATABASE_PORT"] = (
             os.getenv("MCONF_WEBHOOK_DATABASE_PORT") or "5432"
         )
+        self._config["MCONF_WEBHOOK_DATABASE_COOPERATIVE"] = to_bool(
+            os.getenv("MCONF_WEBHOOK_DATABASE_COOPERATIVE", "True")
+        )
+        self._config["MCONF_WEBHOOK_DATABASE_MIGRATE"] = to_bool(
+            os.getenv("MCONF_WEBHOOK_DATABASE_MIGRATE", "False")
+        )
+        self._config["MCONF_WEBHOOK_DATABASE_URL"] = os.getenv(
+            "MCONF_WEBHOOK_DATABASE_URL"
+        )
+        self._config["MCONF_WEBHOOK_DATABASE_LOCAL"] = to_bool(
+            os.getenv("MCONF_WEBHOOK_DATABASE_LOCAL", "False")
+        )
+        self._config["MCONF_WEBHOOK_DATABASE_SEED_FILE"] = os.getenv(
+            "MCONF_WEBHOOK_DATABASE_SEED_FILE"
+        )
         self._config["MCONF_WEBHOOK_ROUTE"] = os.getenv("MCONF_WEBHOOK_ROUTE") or "/"
         self._config["MCONF_WEBHOOK_AUTH_REQUIRED"] = to_bool(
             os.getenv("MCONF_WEBHOOK_AUTH_REQUIRED", "True")
@@ -52,6 +67,131 @@ class EnvConfig:
         self._config["MCONF_WEBHOOK_DEPRECATED_EVENTS"] = (
             os.getenv("MCONF_WEBHOOK_DEPRECATED_EVENTS", "").replace(",", " ").split()
         )
+        self._config["MCONF_WEBHOOK_SECRET_CACHE_TTL"] = float(
+            os.getenv("MCONF_WEBHOOK_SECRET_CACHE_TTL") or "60"
+        )
+        self._config["MCONF_WEBHOOK_SECRET_CACHE_NEGATIVE_TTL"] = float(
+            os.getenv("MCONF_WEBHOOK_SECRET_CACHE_NEGATIVE_TTL") or "30"
+        )
+        self._config["MCONF_WEBHOOK_SECRET_CACHE_NEGATIVE_SIZE"] = int(
+            os.getenv("MCONF_WEBHOOK_SECRET_CACHE_NEGATIVE_SIZE") or "1024"
+        )
+        self._config["MCONF_WEBHOOK_REFERENCE_CACHE_INTERVAL"] = float(
+            os.getenv("MCONF_WEBHOOK_REFERENCE_CACHE_INTERVAL") or "60"
+        )
+        self._config["MCONF_WEBHOOK_BATCH_SIZE"] = int(
+            os.getenv("MCONF_WEBHOOK_BATCH_SIZE") or "1"
+        )
+        self._config["MCONF_WEBHOOK_BATCH_TIMEOUT"] = float(
+            os.getenv("MCONF_WEBHOOK_BATCH_TIMEOUT") or "50"
+        )
+        self._config["MCONF_WEBHOOK_PARTITIONS"] = int(
+            os.getenv("MCONF_WEBHOOK_PARTITIONS") or "1"
+        )
+        self._config["MCONF_WEBHOOK_CHANNEL_SIZE"] = int(
+            os.getenv("MCONF_WEBHOOK_CHANNEL_SIZE") or "0"
+        )
+        self._config["MCONF_WEBHOOK_CHANNEL_POLICY"] = (
+            os.getenv("MCONF_WEBHOOK_CHANNEL_POLICY") or "block"
+        )
+        self._config["MCONF_WEBHOOK_CHANNEL_BLOCK_TIMEOUT"] = float(
+            os.getenv("MCONF_WEBHOOK_CHANNEL_BLOCK_TIMEOUT") or "1000"
+        )
+        self._config["MCONF_WEBHOOK_CHANNEL_HIGH_WATERMARK"] = float(
+            os.getenv("MCONF_WEBHOOK_CHANNEL_HIGH_WATERMARK") or "0.8"
+        )
+        self._config["MCONF_WEBHOOK_CHANNEL_LOW_WATERMARK"] = float(
+            os.getenv("MCONF_WEBHOOK_CHANNEL_LOW_WATERMARK") or "0.5"
+        )
+        self._config["MCONF_WEBHOOK_SHED_EVENTS"] = (
+            os.getenv(
+                "MCONF_WEBHOOK_SHED_EVENTS",
+                "user-audio-voice-enabled,user-audio-voice-disabled,"
+                "user-audio-listen-only-enabled,user-audio-listen-only-disabled,"
+                "user-cam-broadcast-start,user-cam-broadcast-end",
+            )
+            .replace(",", " ")
+            .split()
+        )
+        self._config["MCONF_WEBHOOK_RETRY_AFTER"] = int(
+            os.getenv("MCONF_WEBHOOK_RETRY_AFTER") or "5"
+        )
+        self._config["MCONF_WEBHOOK_SPOOL_DIR"] = os.getenv("MCONF_WEBHOOK_SPOOL_DIR")
+        self._config["MCONF_WEBHOOK_SPOOL_SEGMENT_SIZE"] = int(
+            os.getenv("MCONF_WEBHOOK_SPOOL_SEGMENT_SIZE") or "16777216"
+        )
+        self._config["MCONF_WEBHOOK_SPOOL_FSYNC_INTERVAL"] = float(
+            os.getenv("MCONF_WEBHOOK_SPOOL_FSYNC_INTERVAL") or "50"
+        )
+        self._config["MCONF_WEBHOOK_DRAIN_DEADLINE"] = float(
+            os.getenv("MCONF_WEBHOOK_DRAIN_DEADLINE") or "25"
+        )
+        self._config["MCONF_WEBHOOK_DRAIN_PROGRESS_INTERVAL"] = float(
+            os.getenv("MCONF_WEBHOOK_DRAIN_PROGRESS_INTERVAL") or "5"
+        )
+        self._config["MCONF_WEBHOOK_DRAIN_SPILL_FILE"] = os.getenv(
+            "MCONF_WEBHOOK_DRAIN_SPILL_FILE"
+        )
+        self._config["MCONF_WEBHOOK_WRITE_RETRIES"] = int(
+            os.getenv("MCONF_WEBHOOK_WRITE_RETRIES") or "5"
+        )
+        self._config["MCONF_WEBHOOK_WRITE_RETRY_BASE_DELAY"] = float(
+            os.getenv("MCONF_WEBHOOK_WRITE_RETRY_BASE_DELAY") or "500"
+        )
+        self._config["MCONF_WEBHOOK_WRITE_RETRY_MAX_DELAY"] = float(
+            os.getenv("MCONF_WEBHOOK_WRITE_RETRY_MAX_DELAY") or "30000"
+        )
+        self._config["MCONF_WEBHOOK_WRITE_RETRY_MAX_PENDING"] = int(
+            os.getenv("MCONF_WEBHOOK_WRITE_RETRY_MAX_PENDING") or "10000"
+        )
+        self._config["MCONF_WEBHOOK_DEAD_LETTER_FILE"] = os.getenv(
+            "MCONF_WEBHOOK_DEAD_LETTER_FILE"
+        )
+        self._config["MCONF_WEBHOOK_DEAD_LETTER_REINJECT"] = to_bool(
+            os.getenv("MCONF_WEBHOOK_DEAD_LETTER_REINJECT", "False")
+        )
+        self._config["MCONF_WEBHOOK_PARKING_TIMEOUT"] = int(
+            os.getenv("MCONF_WEBHOOK_PARKING_TIMEOUT") or "30000"
+        )
+        self._config["MCONF_WEBHOOK_PARKING_SIZE"] = int(
+            os.getenv("MCONF_WEBHOOK_PARKING_SIZE") or "10000"
+        )
+        self._config["MCONF_WEBHOOK_PARKING_CHECK_INTERVAL"] = int(
+            os.getenv("MCONF_WEBHOOK_PARKING_CHECK_INTERVAL") or "1000"
+        )
+        self._config["MCONF_WEBHOOK_MEETING_CACHE"] = to_bool(
+            os.getenv("MCONF_WEBHOOK_MEETING_CACHE", "False")
+        )
+        self._config["MCONF_WEBHOOK_MEETING_CACHE_SIZE"] = int(
+            os.getenv("MCONF_WEBHOOK_MEETING_CACHE_SIZE") or "10000"
+        )
+        self._config["MCONF_WEBHOOK_MEETING_CACHE_FLUSH_INTERVAL"] = int(
+            os.getenv("MCONF_WEBHOOK_MEETING_CACHE_FLUSH_INTERVAL") or "1000"
+        )
+        self._config["MCONF_WEBHOOK_MEETING_CACHE_FLUSH_SIZE"] = int(
+            os.getenv("MCONF_WEBHOOK_MEETING_CACHE_FLUSH_SIZE") or "100"
+        )
+        self._config["MCONF_WEBHOOK_MEETING_CACHE_RECOUNT_INTERVAL"] = int(
+            os.getenv("MCONF_WEBHOOK_MEETING_CACHE_RECOUNT_INTERVAL") or "60000"
+        )
+        self._config["MCONF_WEBHOOK_PARTIAL_UPDATES"] = to_bool(
+            os.getenv("MCONF_WEBHOOK_PARTIAL_UPDATES", "False")
+        )
+        self._config["MCONF_WEBHOOK_EVENT_LOG"] = to_bool(
+            os.getenv("MCONF_WEBHOOK_EVENT_LOG", "False")
+        )
+        self._config["MCONF_WEBHOOK_EVENT_LOG_PROJECTION"] = to_bool(
+            os.getenv("MCONF_WEBHOOK_EVENT_LOG_PROJECTION", "True")
+        )
+        self._config["MCONF_WEBHOOK_EVENT_LOG_CONSUMER"] = (
+            os.getenv("MCONF_WEBHOOK_EVENT_LOG_CONSUMER") or "projection"
+        )
+        self._config["MCONF_WEBHOOK_EVENT_LOG_BATCH_SIZE"] = int(
+            os.getenv("MCONF_WEBHOOK_EVENT_LOG_BATCH_SIZE") or "1000"
+        )
+        self._config["MCONF_WEBHOOK_EVENT_LOG_POLL_INTERVAL"] = float(
+            os.getenv("MCONF_WEBHOOK_EVENT_LOG_POLL_INTERVAL") or "500"
+        )
 
     def __getitem__(self, key):
         """Make accessing configurations easier."""
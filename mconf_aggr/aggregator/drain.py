@@ -0,0 +1,252 @@
+"""This module provides the graceful shutdown of the aggregator.
+
+On shutdown, the aggregator should handle everything it has already accepted
+before exiting, but it cannot take forever: the orchestrator kills the
+process after a grace period. The `DrainCoordinator` stops accepting new
+data, waits (without spinning) for in-flight requests and subscriber channels
+to be done, and gives up at a deadline. Anything still queued at that point
+is spilled to a local file and restored into the channels on the next start.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+import logaugment
+
+from mconf_aggr.aggregator.utils import RequestTimeLogger
+
+
+class DrainCoordinator:
+    """Coordinator of the graceful shutdown of an aggregator."""
+
+    def __init__(
+        self,
+        aggregator,
+        deadline=25,
+        progress_interval=5,
+        spill_file=None,
+        encode=None,
+        decode=None,
+        logger=None,
+    ):
+        """Constructor of the DrainCoordinator.
+
+        Parameters
+        ----------
+        aggregator : Aggregator
+            The aggregator to be drained and stopped.
+        deadline : float
+            Maximum time (in seconds) to wait for the aggregator to drain.
+        progress_interval : float
+            Time (in seconds) between progress reports while draining.
+        spill_file : str
+            File where data left in non-durable channels at the deadline is
+            saved. If not supplied, that data is discarded.
+        encode : callable
+            Function serializing data to bytes of JSON. Required with
+            `spill_file`.
+        decode : callable
+            Function deserializing data serialized by `encode`. Required with
+            `spill_file`.
+        logger : logging.Logger
+            If not supplied, it will instantiate a new logger from __name__.
+        """
+        self.aggregator = aggregator
+        self.deadline = deadline
+        self.progress_interval = progress_interval
+        self.spill_file = spill_file
+        self.encode = encode
+        self.decode = decode
+        self._draining = threading.Event()
+        self.logger = logger or logging.getLogger(__name__)
+        logaugment.set(
+            self.logger,
+            code="",
+            site="DrainCoordinator",
+            server="",
+            event="",
+            keywords="null",
+        )
+
+    @property
+    def draining(self):
+        """Whether the aggregator is draining and new data must be refused."""
+        return self._draining.is_set()
+
+    def drain(self):
+        """Drain and stop the aggregator.
+
+        New data is refused from now on (see `draining`). It waits for
+        in-flight requests and then for every subscriber channel to be handled,
+        reporting progress every `progress_interval` seconds, until `deadline`
+        seconds have elapsed. Data left in non-durable channels is spilled
+        then, and the aggregator is stopped, waiting for its threads only
+        until the deadline.
+
+        Returns
+        -------
+        bool
+            True if everything was handled before the deadline. False
+            otherwise.
+        """
+        logging_extra = {
+            "code": "Drain aggregator",
+            "site": "DrainCoordinator.drain",
+            "keywords": ["drain", "shutdown", "aggregator", "deadline"],
+        }
+
+        self._draining.set()
+
+        self.logger.info(
+            f"Draining aggregator for up to {self.deadline}s.",
+            extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
+        )
+
+        deadline = time.monotonic() + self.deadline
+        drained = self._wait(RequestTimeLogger.wait_idle, deadline)
+
+        channels = [subscriber.channel for subscriber in self.aggregator.subscribers]
+        for channel in channels:
+            if not drained:
+                break
+            drained = self._wait(channel.join, deadline)
+
+        if drained:
+            self.logger.info(
+                "Aggregator drained.",
+                extra=dict(
+                    logging_extra, keywords=json.dumps(logging_extra["keywords"])
+                ),
+            )
+        else:
+            logging_extra["keywords"] += ["warning"]
+            self.logger.warn(
+                "Deadline reached before the aggregator was drained.",
+                extra=dict(
+                    logging_extra, keywords=json.dumps(logging_extra["keywords"])
+                ),
+            )
+            # Spilled before stopping, which may block on threads still busy.
+            self._spill([channel for channel in channels if not channel.durable])
+
+        self.aggregator.stop(max(0, deadline - time.monotonic()))
+
+        return drained
+
+    def restore(self):
+        """Restore data spilled by a previous drain into the channels.
+
+        It must be called after callbacks are registered and before the
+        aggregator starts. The spill file is removed afterwards.
+
+        Returns
+        -------
+        int
+            Number of elements restored.
+        """
+        logging_extra = {
+            "code": "Restore spilled data",
+            "site": "DrainCoordinator.restore",
+            "keywords": ["restore", "spill", "startup", "aggregator"],
+        }
+
+        if not self.spill_file or not os.path.exists(self.spill_file):
+            return 0
+
+        records = {}
+        with open(self.spill_file, encoding="utf-8") as spill_file:
+            for line in spill_file:
+                record = json.loads(line)
+                data = self.decode(json.dumps(record["data"]).encode("utf-8"))
+                records.setdefault(record["channel"], []).append(data)
+
+        # Restored per channel at once, so a durable channel syncs once.
+        restored = 0
+        for name, items in records.items():
+            for subscriber in self.aggregator.channels.get(name, []):
+                restored += subscriber.channel.restore(items)
+
+        os.remove(self.spill_file)
+
+        self.logger.info(
+            f"Restored {restored} element(s) spilled on last shutdown.",
+            extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
+        )
+
+        return restored
+
+    def _wait(self, wait, deadline):
+        """Call `wait(timeout)` in steps of `progress_interval` until the deadline.
+
+        Returns
+        -------
+        bool
+            What `wait` last returned.
+        """
+        logging_extra = {
+            "code": "Drain progress",
+            "site": "DrainCoordinator._wait",
+            "keywords": ["drain", "shutdown", "progress"],
+        }
+
+        while True:
+            remaining = deadline - time.monotonic()
+            if wait(max(0, min(remaining, self.progress_interval))):
+                return True
+
+            if remaining <= self.progress_interval:
+                return False
+
+            self.logger.info(
+                "Still draining: {} request(s) in flight, {} element(s) queued, "
+                "{:.0f}s left.".format(
+                    RequestTimeLogger.current_requests_count,
+                    sum(
+                        subscriber.channel.qsize()
+                        for subscriber in self.aggregator.subscribers
+                    ),
+                    deadline - time.monotonic(),
+                ),
+                extra=dict(
+                    logging_extra, keywords=json.dumps(logging_extra["keywords"])
+                ),
+            )
+
+    def _spill(self, channels):
+        logging_extra = {
+            "code": "Spill data",
+            "site": "DrainCoordinator._spill",
+            "keywords": ["spill", "shutdown", "deadline"],
+        }
+
+        records = [
+            (channel.name, data) for channel in channels for data in channel.take_all()
+        ]
+        if not records:
+            return
+
+        if not self.spill_file:
+            logging_extra["keywords"] += ["error"]
+            self.logger.error(
+                f"Discarding {len(records)} element(s) not handled.",
+                extra=dict(
+                    logging_extra, keywords=json.dumps(logging_extra["keywords"])
+                ),
+            )
+
+            return
+
+        with open(self.spill_file, "a", encoding="utf-8") as spill_file:
+            for name, data in records:
+                record = {"channel": name, "data": json.loads(self.encode(data))}
+                spill_file.write(json.dumps(record) + "\n")
+            spill_file.flush()
+            os.fsync(spill_file.fileno())
+
+        logging_extra["keywords"] += ["warning"]
+        self.logger.warn(
+            f"Spilled {len(records)} element(s) to '{self.spill_file}'.",
+            extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
+        )
@@ -0,0 +1,387 @@
+"""This module provides the retry of data whose callback failed transiently.
+
+A callback raises `TransientCallbackError` when it failed for a reason that
+may go away by itself, such as the database being unreachable for a moment.
+Instead of dropping the data, the subscriber thread parks it in a
+`RetryQueue` and tries it again later, after a jittered exponential backoff
+given by a `RetryPolicy`. Meanwhile, data with the same key (e.g. events of
+the same meeting) is parked behind it, so it is still handled in order, and
+data with other keys keeps flowing.
+
+Data that fails more than `RetryPolicy.max_retries` times is written to a
+`DeadLetterStore`, from where it can be put back into the channels later.
+"""
+import heapq
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import logaugment
+
+
+class RetryPolicy:
+    """How many times and how often data is retried."""
+
+    def __init__(self, max_retries=5, base_delay=0.5, max_delay=30, max_pending=10000):
+        """Constructor of the RetryPolicy.
+
+        Parameters
+        ----------
+        max_retries : int
+            Number of times data is tried again after its first failure.
+        base_delay : float
+            Delay (in seconds) before the first retry. It doubles at each
+            retry.
+        max_delay : float
+            Maximum delay (in seconds) between retries.
+        max_pending : int
+            Maximum number of elements parked at once. The subscriber stops
+            consuming its channel while this limit is reached, which pushes
+            back on the publishers of a bounded channel.
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+
+    def delay(self, failures):
+        """Delay before trying again data that failed `failures` times.
+
+        The delay is drawn between half and the whole of the exponential
+        backoff, so retries of data that failed at once are spread out.
+
+        Returns
+        -------
+        float
+            Delay in seconds.
+        """
+        backoff = min(self.max_delay, self.base_delay * 2 ** (failures - 1))
+
+        return random.uniform(backoff / 2, backoff)
+
+    def __repr__(self):
+        return "{!s}(max_retries={!r}, base_delay={!r}, max_delay={!r})".format(
+            self.__class__.__name__, self.max_retries, self.base_delay, self.max_delay
+        )
+
+
+class RetryQueue:
+    """Data waiting to be tried again, kept in order by key.
+
+    Only the first element of each key is retried. The others are parked
+    behind it until it succeeds or is given up on.
+
+    It is not thread-safe: each subscriber thread has its own.
+    """
+
+    def __init__(self, policy, key=None):
+        """Constructor of the RetryQueue.
+
+        Parameters
+        ----------
+        policy : RetryPolicy
+            When data is retried and given up on.
+        key : callable
+            Function returning the key of the data. Data with the same key is
+            handled in order. If not supplied, all data shares the same key.
+        """
+        self.policy = policy
+        self.key = key or (lambda data: None)
+        self._pending = {}  # Parked data by key, the first one being retried.
+        self._failures = {}  # Failures of the first element by key.
+        self._schedule = []  # Heap of (due time, sequence, key).
+        self._sequence = 0
+        self._size = 0
+
+    def defer(self, data):
+        """Park data behind data with the same key, if there is any.
+
+        Returns
+        -------
+        bool
+            True if the data was parked. False if there is no data with its
+            key waiting, so it can be handled right away.
+        """
+        pending = self._pending.get(self._key(data))
+        if pending is None:
+            return False
+
+        pending.append(data)
+        self._size += 1
+
+        return True
+
+    def park(self, data):
+        """Park data that failed, to be tried again after a delay.
+
+        If data with the same key is already waiting, the data is parked
+        behind it instead.
+        """
+        if self.defer(data):
+            return
+
+        key = self._key(data)
+        self._pending[key] = deque([data])
+        self._failures[key] = 0
+        self._size += 1
+        self.fail(key)
+
+    def fail(self, key):
+        """Count a failure of the first element of a key.
+
+        Returns
+        -------
+        bool
+            True if it is scheduled to be tried again. False if it failed
+            more than `max_retries` times and must be given up on.
+        """
+        self._failures[key] += 1
+        if self._failures[key] > self.policy.max_retries:
+            return False
+
+        due = time.monotonic() + self.policy.delay(self._failures[key])
+        heapq.heappush(self._schedule, (due, self._sequence, key))
+        self._sequence += 1
+
+        return True
+
+    def due(self):
+        """Keys whose first element is due to be tried again.
+
+        Returns
+        -------
+        list
+            Keys in the order they became due.
+        """
+        now = time.monotonic()
+        keys = []
+        while self._schedule and self._schedule[0][0] <= now:
+            keys.append(heapq.heappop(self._schedule)[2])
+
+        return keys
+
+    def head(self, key):
+        """First element of a key and its number of failures.
+
+        Returns
+        -------
+        (data, failures) : tuple
+            The element or None if nothing with the key is waiting.
+        """
+        pending = self._pending.get(key)
+        if not pending:
+            self._pending.pop(key, None)
+            self._failures.pop(key, None)
+            return None, 0
+
+        return pending[0], self._failures[key]
+
+    def pop(self, key):
+        """Remove the first element of a key, once handled or given up on."""
+        self._pending[key].popleft()
+        self._failures[key] = 0
+        self._size -= 1
+        if not self._pending[key]:
+            del self._pending[key]
+            del self._failures[key]
+
+    def take_all(self):
+        """Remove and return all data parked, in order within each key.
+
+        Returns
+        -------
+        list of (data, failures)
+            Each element and how many times it failed.
+        """
+        items = []
+        for key, pending in self._pending.items():
+            failures = self._failures[key]
+            for data in pending:
+                items.append((data, failures))
+                failures = 0
+
+        self._pending.clear()
+        self._failures.clear()
+        self._schedule.clear()
+        self._size = 0
+
+        return items
+
+    def next_due(self):
+        """Time (in seconds) until the next retry is due.
+
+        Returns
+        -------
+        float
+            Zero if a retry is already due. None if nothing is scheduled.
+        """
+        if not self._schedule:
+            return None
+
+        return max(0, self._schedule[0][0] - time.monotonic())
+
+    def full(self):
+        """Whether `RetryPolicy.max_pending` elements are parked."""
+        return self._size >= self.policy.max_pending
+
+    def _key(self, data):
+        try:
+            return self.key(data)
+        except Exception:
+            return None
+
+    def __len__(self):
+        return self._size
+
+
+class DeadLetterStore:
+    """Append-only file of data given up on, one JSON record per line.
+
+    Each record has the channel the data came from, the data itself and why
+    and when it was given up on. Records are put back into their channels by
+    `reinject`, which removes the file afterwards.
+    """
+
+    def __init__(self, path, encode, decode, logger=None):
+        """Constructor of the DeadLetterStore.
+
+        Parameters
+        ----------
+        path : str
+            File where data is appended.
+        encode : callable
+            Function serializing data to bytes of JSON.
+        decode : callable
+            Function deserializing data serialized by `encode`.
+        logger : logging.Logger
+            If not supplied, it will instantiate a new logger from __name__.
+        """
+        self.path = path
+        self.encode = encode
+        self.decode = decode
+        self._lock = threading.Lock()
+        self._appended = 0
+        self._reinjected = 0
+        self.logger = logger or logging.getLogger(__name__)
+        logaugment.set(
+            self.logger,
+            code="",
+            site="DeadLetterStore",
+            server="",
+            event="",
+            keywords="null",
+        )
+
+    def append(self, channel, data, error="", failures=0):
+        """Append data given up on to the file and sync it to disk.
+
+        Parameters
+        ----------
+        channel : str
+            Name of the channel the data came from.
+        data
+            Any data `encode` is able to serialize.
+        error : str
+            Description of the last failure.
+        failures : int
+            Number of times the data failed.
+        """
+        logging_extra = {
+            "code": "Dead letter",
+            "site": "DeadLetterStore.append",
+            "keywords": ["dead letter", "retry", "warning", f"channel={channel}"],
+        }
+
+        record = {
+            "channel": channel,
+            "error": error,
+            "failures": failures,
+            "failed_at": time.time(),
+            "data": json.loads(self.encode(data)),
+        }
+
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as dead_letter_file:
+                dead_letter_file.write(json.dumps(record) + "\n")
+                dead_letter_file.flush()
+                os.fsync(dead_letter_file.fileno())
+            self._appended += 1
+
+        self.logger.warn(
+            f"Gave up on data of channel {channel} after {failures} failure(s): "
+            f"{error}",
+            extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
+        )
+
+    def reinject(self, aggregator):
+        """Put data of the file back into the channels it came from.
+
+        It must be called after callbacks are registered and before the
+        aggregator starts. The file is removed afterwards. Note that the data
+        is handled after anything already handled for the same key, which may
+        not be its original order.
+
+        Parameters
+        ----------
+        aggregator : Aggregator
+            Aggregator whose channels receive the data.
+
+        Returns
+        -------
+        int
+            Number of elements put back.
+        """
+        logging_extra = {
+            "code": "Reinject dead letters",
+            "site": "DeadLetterStore.reinject",
+            "keywords": ["dead letter", "reinject", "startup", "aggregator"],
+        }
+
+        with self._lock:
+            if not os.path.exists(self.path):
+                return 0
+
+            records = {}
+            with open(self.path, encoding="utf-8") as dead_letter_file:
+                for line in dead_letter_file:
+                    record = json.loads(line)
+                    data = self.decode(json.dumps(record["data"]).encode("utf-8"))
+                    records.setdefault(record["channel"], []).append(data)
+
+            # Restored per channel at once, so a durable channel syncs once.
+            reinjected = 0
+            for name, items in records.items():
+                for subscriber in aggregator.channels.get(name, []):
+                    reinjected += subscriber.channel.restore(items)
+
+            os.remove(self.path)
+            self._reinjected += reinjected
+
+        self.logger.info(
+            f"Reinjected {reinjected} element(s) from '{self.path}'.",
+            extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
+        )
+
+        return reinjected
+
+    def stats(self):
+        """Counters of the store.
+
+        Returns
+        -------
+        stats : dict
+            Path of the file and number of elements appended to it and
+            reinjected from it.
+        """
+        return {
+            "path": self.path,
+            "appended": self._appended,
+            "reinjected": self._reinjected,
+        }
+
+    def __repr__(self):
+        return "{!s}(path={!r})".format(self.__class__.__name__, self.path)
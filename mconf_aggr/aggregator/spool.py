@@ -0,0 +1,495 @@
+"""This module provides a channel backed by an append-only log on local disk.
+
+Data published to a `DurableChannel` is written to disk before it is made
+available to subscribers, so it survives a crash or restart of the process.
+Each subscriber thread commits the channel after its callback returns, which
+advances a consumer offset kept in the same directory up to the first element
+the callback still holds (e.g. parked events waiting for their meeting). When
+the channel is created again, everything published after the last committed
+offset is read back and delivered before any new data.
+
+The log is split in segment files named after their sequence number. Each
+record is made of a header with the length and the CRC32 of its payload
+followed by the payload itself. A record cut short by a crash (or with a bad
+checksum) is considered the end of the log and is discarded on recovery.
+Segments whose records were all committed are deleted.
+"""
+import json
+import os
+import re
+import shutil
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+
+import logaugment
+
+from mconf_aggr.aggregator.aggregator import Channel
+
+_HEADER = struct.Struct(">II")  # Payload length and CRC32.
+_SEGMENT_SUFFIX = ".seg"
+_OFFSET_FILE = "offset.json"
+
+
+class DurableChannel(Channel):
+    """Channel whose data is persisted in a segment-rotated log on disk.
+
+    It has the same interface as `Channel`. Data is written to the operating
+    system on every publish and synced to disk at most `fsync_interval`
+    seconds later (by the next publish or by a timer when publishing stops),
+    so a crash of the process loses nothing and a crash of the host loses at
+    most the data of the last interval.
+    """
+
+    durable = True
+
+    def __init__(
+        self,
+        name,
+        directory,
+        encode,
+        decode,
+        segment_size=16 * 1024 * 1024,
+        fsync_interval=0.05,
+        logger=None,
+        **kwargs,
+    ):
+        """Constructor of the DurableChannel class.
+
+        Parameters
+        ----------
+        name : str
+            An identifier of the channel. The log is kept under a directory
+            with this name.
+        directory : str
+            Directory where the logs of the channels are kept.
+        encode : callable
+            Function serializing data to bytes.
+        decode : callable
+            Function deserializing bytes back to data.
+        segment_size : int
+            Size (in bytes) after which a new segment file is started.
+        fsync_interval : float
+            Maximum time (in seconds) between syncs of the log to disk.
+            If zero, every record is synced as soon as it is written.
+        logger : logging.Logger
+            If not supplied, it will instantiate a new logger from __name__.
+        **kwargs
+            Options of the channel (`maxsize`, `policy` etc), as in `Channel`.
+        """
+        super().__init__(name, logger=logger, **kwargs)
+        logaugment.set(
+            self.logger,
+            code="",
+            site="DurableChannel",
+            server="",
+            event="",
+            keywords="null",
+        )
+
+        self.directory = os.path.join(directory, name)
+        self.encode = encode
+        self.decode = decode
+        self.segment_size = segment_size
+        self.fsync_interval = fsync_interval
+
+        self._lock = threading.Lock()
+        self._positions = deque()  # End of the record of each queued element.
+        self._unacked = deque()  # (data, end of its record) popped, not committed.
+        self._committed = (0, 0)
+        self._file = None
+        self._segment = 0
+        self._last_sync = time.monotonic()
+        self._synced = True
+        self._sync_timer = None
+        self._fsyncs = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._recover()
+
+    @classmethod
+    def reroute(cls, channel, directory, **kwargs):
+        """Move data spooled under another number of partitions into `channel`.
+
+        Logs of partitions that no longer exist are read and deleted, and
+        data recovered in a partition other than the one it is now routed to
+        is moved there. Moved data is written to its new log before it is
+        committed in the old one, so nothing is lost if this is interrupted
+        (but it may be delivered twice). Data of a key comes from a single
+        partition, so it is kept in order.
+
+        Parameters
+        ----------
+        channel : DurableChannel or PartitionedChannel
+            Channel just created, of this class or partitioned into it.
+        directory : str
+            Directory where the logs of the channels are kept.
+        **kwargs
+            Other options `channel` was created with.
+
+        Returns
+        -------
+        int
+            Number of elements moved.
+        """
+        logging_extra = {
+            "code": "Channel reroute",
+            "site": "DurableChannel.reroute",
+            "keywords": ["recover", "spool", "partition", f"channel={channel.name}"],
+        }
+
+        partitions = channel.partitions
+        names = {partition.name for partition in partitions}
+        pattern = re.compile(re.escape(channel.name) + r"(-\d+)?")
+        stale = [
+            cls(entry, directory, **kwargs)
+            for entry in sorted(os.listdir(directory))
+            if pattern.fullmatch(entry) and entry not in names
+        ]
+
+        route = getattr(channel, "partition", lambda data: channel)
+        sources = [
+            partition
+            for partition in partitions
+            if any(route(data) is not partition for data in partition.queue.queue)
+        ] + stale
+        taken = [source._take_recovered() for source in sources]
+        moved = channel.restore(data for items in taken for data in items)
+
+        for source in sources:
+            source.commit()
+        for source in stale:
+            source._file.close()
+            shutil.rmtree(source.directory)
+
+        if moved:
+            channel.logger.warn(
+                "Moved {} element(s) spooled under another number of partitions "
+                "of channel {}.".format(moved, channel.name),
+                extra=dict(
+                    logging_extra,
+                    keywords=json.dumps(logging_extra["keywords"] + ["warning"]),
+                ),
+            )
+
+        return moved
+
+    def _publish_reserved(self, items):
+        # Data is only written to the log once there is room for all of it in
+        # the channel, so nothing of data rejected is kept in the log.
+        super()._publish_reserved(items)
+        self._sync_if_due()
+
+    def pop(self, timeout=None):
+        data = super().pop(timeout)
+        self._unacked.append((data, self._positions.popleft()))
+
+        return data
+
+    def pop_many(self, max_items, timeout, wait=None):
+        batch = super().pop_many(max_items, timeout, wait)
+        # The first element was popped by `pop`, which already took its position.
+        for data in batch[1:]:
+            self._unacked.append((data, self._positions.popleft()))
+
+        return batch
+
+    def commit(self, held=()):
+        """Advance the consumer offset past the data popped so far.
+
+        The offset stops before the first element still held by the callback,
+        so it is delivered again after a crash, along with everything popped
+        after it. The offset is replaced atomically, so it is either the old
+        or the new one after a crash. Segments left fully behind it are
+        deleted.
+
+        Parameters
+        ----------
+        held : iterable
+            Data popped that is not handled yet, matched by identity.
+        """
+        super().commit(held)
+
+        held = {id(data) for data in held}
+        offset = None
+        while self._unacked and id(self._unacked[0][0]) not in held:
+            _, offset = self._unacked.popleft()
+
+        if offset is None or offset == self._committed:
+            return
+
+        self._write_offset(offset)
+        self._committed = offset
+
+        for segment in self._segments():
+            if segment >= offset[0]:
+                break
+            os.remove(self._segment_path(segment))
+
+    def close(self):
+        """Close the channel and sync the log to disk.
+
+        The log remains open: data published after closing the channel is
+        still persisted and delivered on the next start.
+        """
+        super().close()
+        self.sync()
+        with self._lock:
+            if self._sync_timer is not None:
+                self._sync_timer.cancel()
+                self._sync_timer = None
+
+    def sync(self):
+        """Sync the log to disk."""
+        with self._lock:
+            self._sync()
+
+    def stats(self):
+        """Counters of the channel usage.
+
+        Returns
+        -------
+        stats : dict
+            Counters of `Channel.stats` plus the number of segments on disk,
+            the committed offset and the number of syncs to disk.
+        """
+        stats = super().stats()
+        stats.update(
+            {
+                "segments": len(self._segments()),
+                "committed_segment": self._committed[0],
+                "committed_position": self._committed[1],
+                "fsyncs": self._fsyncs,
+            }
+        )
+
+        return stats
+
+    def restore(self, items):
+        """Put back data kept elsewhere (e.g. spilled or dead-lettered).
+
+        Data is written to the log first, as if published, so it is
+        committed and recovered like any other data of the channel.
+        """
+        items = list(items)
+        with self._lock:
+            for data in items:
+                self._append(data)
+            count = super().restore(items)
+        self.sync()
+
+        return count
+
+    def _put_reserved(self, data):
+        # Room in the channel is already taken, so nothing blocks while the
+        # log is locked, and the order of the log is the order of the channel.
+        with self._lock:
+            self._append(data)
+            super()._put_reserved(data)
+
+    def _take_recovered(self):
+        """Take all data recovered, as if popped, to be committed after."""
+        items = super().take_all()
+        self._unacked.extend(zip(items, self._positions))
+        self._positions.clear()
+
+        return items
+
+    def _append(self, data):
+        """Write the record of data to the log. Must be called holding `_lock`."""
+        payload = self.encode(data)
+        record = _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+        if self._file.tell() >= self.segment_size:
+            self._rotate()
+
+        start = self._file.tell()
+        try:
+            self._file.write(record)
+            self._file.flush()
+        except Exception:
+            # Not published: drop what was written so it is not replayed.
+            self._file.truncate(start)
+            self._file.seek(start)
+            raise
+        self._synced = False
+        self._positions.append((self._segment, start + len(record)))
+
+    def _sync_if_due(self):
+        if time.monotonic() - self._last_sync >= self.fsync_interval:
+            self.sync()
+            return
+
+        with self._lock:
+            if self._synced or self._sync_timer is not None:
+                return
+
+            delay = self._last_sync + self.fsync_interval - time.monotonic()
+            self._sync_timer = threading.Timer(max(0, delay), self._timed_sync)
+            self._sync_timer.daemon = True
+            self._sync_timer.start()
+
+    def _timed_sync(self):
+        with self._lock:
+            self._sync_timer = None
+            self._sync()
+
+    def _sync(self):
+        if not self._synced:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._synced = True
+            self._fsyncs += 1
+        self._last_sync = time.monotonic()
+
+    def _rotate(self):
+        self._sync()
+        self._file.close()
+        self._segment += 1
+        self._file = open(self._segment_path(self._segment), "ab")
+
+    def _recover(self):
+        logging_extra = {
+            "code": "Channel recover",
+            "site": "DurableChannel._recover",
+            "keywords": ["recover", "spool", "disk", f"channel={self.name}"],
+        }
+
+        self._committed = self._read_offset()
+        committed_segment, committed_position = self._committed
+
+        pending = []
+        segments = [s for s in self._segments() if s >= committed_segment]
+        for index, segment in enumerate(segments):
+            start = committed_position if segment == committed_segment else 0
+            records, end = self._read_segment(segment, start)
+            pending.extend(records)
+
+            if end is not None:
+                # Torn or corrupted record: everything after it is discarded.
+                logging_extra["keywords"] += ["warning"]
+                self.logger.warn(
+                    "Discarding corrupted tail of segment {} of channel {}.".format(
+                        segment, self.name
+                    ),
+                    extra=dict(
+                        logging_extra, keywords=json.dumps(logging_extra["keywords"])
+                    ),
+                )
+                with open(self._segment_path(segment), "r+b") as segment_file:
+                    segment_file.truncate(end)
+                for later in segments[index + 1 :]:  # noqa: E203
+                    os.remove(self._segment_path(later))
+                break
+
+        segments = self._segments()
+        self._segment = max(segments[-1] if segments else 0, committed_segment)
+        self._file = open(self._segment_path(self._segment), "ab")
+        if (
+            self._segment == committed_segment
+            and self._file.tell() < committed_position
+        ):
+            # The offset is ahead of what reached the disk: never write behind it.
+            self._rotate()
+
+        # Already in the log: restored into the channel only.
+        self._positions.extend(position for position, _ in pending)
+        super().restore(data for _, data in pending)
+
+        if pending:
+            self.logger.info(
+                "Recovered {} element(s) not committed in channel {}.".format(
+                    len(pending), self.name
+                ),
+                extra=dict(
+                    logging_extra, keywords=json.dumps(logging_extra["keywords"])
+                ),
+            )
+
+    def _read_segment(self, segment, start):
+        """Read records of a segment from a position on.
+
+        Returns
+        -------
+        (records, end) : (list, int)
+            List of (end position, data) tuples and the position of the first
+            invalid record or None if the whole segment is valid.
+        """
+        records = []
+        with open(self._segment_path(segment), "rb") as segment_file:
+            segment_file.seek(start)
+            position = start
+            while True:
+                header = segment_file.read(_HEADER.size)
+                if not header:
+                    return records, None
+
+                if len(header) < _HEADER.size:
+                    return records, position
+
+                length, crc = _HEADER.unpack(header)
+                payload = segment_file.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    return records, position
+
+                position += _HEADER.size + length
+                records.append(((segment, position), self.decode(payload)))
+
+    def _read_offset(self):
+        logging_extra = {
+            "code": "Channel recover",
+            "site": "DurableChannel._read_offset",
+            "keywords": ["recover", "spool", "offset", "error", f"channel={self.name}"],
+        }
+
+        try:
+            with open(os.path.join(self.directory, _OFFSET_FILE)) as offset_file:
+                offset = json.load(offset_file)
+
+            return (int(offset["segment"]), int(offset["position"]))
+        except FileNotFoundError:
+            return (0, 0)
+        except (ValueError, KeyError, TypeError) as err:
+            # Everything left in the log is delivered again: at least once.
+            self.logger.error(
+                "Corrupted offset of channel {}, replaying it from its oldest "
+                "segment: {}".format(self.name, err),
+                extra=dict(
+                    logging_extra, keywords=json.dumps(logging_extra["keywords"])
+                ),
+            )
+
+            return (0, 0)
+
+    def _write_offset(self, offset):
+        path = os.path.join(self.directory, _OFFSET_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as offset_file:
+            json.dump({"segment": offset[0], "position": offset[1]}, offset_file)
+            offset_file.flush()
+            os.fsync(offset_file.fileno())
+        os.replace(tmp_path, path)
+
+        # The rename itself is only durable once the directory is synced.
+        directory = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+    def _segments(self):
+        return sorted(
+            int(filename[: -len(_SEGMENT_SUFFIX)])
+            for filename in os.listdir(self.directory)
+            if filename.endswith(_SEGMENT_SUFFIX)
+        )
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f"{segment:020d}{_SEGMENT_SUFFIX}")
+
+    def __repr__(self):
+        return "{!s}(name={!r}, directory={!r})".format(
+            self.__class__.__name__, self.name, self.directory
+        )
@@ -1,3 +1,6 @@
+import signal
+import sys
+import threading
 import time
 from contextlib import contextmanager
 
@@ -44,53 +47,74 @@ class RequestTimeLogger:
     """
     current_requests_count = 0
 
+    """Notified whenever a request finishes."""
+    condition = threading.Condition()
+
     @staticmethod
     @contextmanager
     def time_logger_requests(logger_func, msg, extra=dict(), **kw_format):
         """Provide a log for the elapsed time in the context block and handle
         statistics of requests."""
-        RequestTimeLogger.current_requests_count += 1
-
-        start_time = time.time()
-        yield None
-        end_time = time.time()
-
-        elapsed_time = round(end_time - start_time, 4)
-        kw_format.update({"elapsed": elapsed_time})
+        with RequestTimeLogger.condition:
+            RequestTimeLogger.current_requests_count += 1
 
         try:
-            logger_func(msg.format(**kw_format), extra=extra)
-        except Exception as err:
-            kw = ", ".join(["{}: {}".format(k, v) for k, v in kw_format.items()])
-            print("Error while logging elapsed time: {} ({}).".format(err, kw))
-
-        RequestTimeLogger.current_requests_count -= 1
-
+            start_time = time.time()
+            yield None
+            end_time = time.time()
+
+            elapsed_time = round(end_time - start_time, 4)
+            kw_format.update({"elapsed": elapsed_time})
+
+            try:
+                logger_func(msg.format(**kw_format), extra=extra)
+            except Exception as err:
+                kw = ", ".join(["{}: {}".format(k, v) for k, v in kw_format.items()])
+                print("Error while logging elapsed time: {} ({}).".format(err, kw))
+        finally:
+            with RequestTimeLogger.condition:
+                RequestTimeLogger.current_requests_count -= 1
+                RequestTimeLogger.condition.notify_all()
 
-def signal_handler(aggregator, liveness_probe, signal):
+    @staticmethod
+    def wait_idle(timeout=None):
+        """Wait until no request is being handled.
+
+        Parameters
+        ----------
+        timeout : float
+            Maximum time (in seconds) to wait. If None, wait indefinitely.
+
+        Returns
+        -------
+        bool
+            True if no request is being handled. False if the timeout expired
+            first.
+        """
+        with RequestTimeLogger.condition:
+            return RequestTimeLogger.condition.wait_for(
+                lambda: RequestTimeLogger.current_requests_count <= 0, timeout
+            )
+
+
+def signal_handler(drain_coordinator, liveness_probe, signum):
     """Unix signals handler.
 
     Handle signals, closing the application gracefully if the signal is a SIGTERM.
 
     Parameters
     ----------
-    aggregator : Aggregator
-        The aggregator object which this thread monitors errors for.
+    drain_coordinator : drain.DrainCoordinator
+        The coordinator which drains the aggregator before it stops.
     liveness_probe : LivenessProbeListener
         The probe listener which handles the /health route.
-    signal : signal
+    signum : int
         The signal which was spawned in the main thread.
     """
-
-    if signal == signal.SIGTERM:
+    if signum == signal.SIGTERM:
         liveness_probe.close()
 
-        # Wait aggregator handle with all the received events before close it
-        while (
-            any([not x.channel.empty() for x in aggregator.subscribers])
-            or RequestTimeLogger.current_requests_count > 0
-        ):
-            print("There are events to handle yet.")
-
-        aggregator.stop()
-        exit(0)
+        # Wait aggregator handle the received events (up to a deadline) before
+        # closing it.
+        drain_coordinator.drain()
+        sys.exit(0)
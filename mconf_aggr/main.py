@@ -2,6 +2,7 @@ import gevent
 
 gevent.monkey.patch_all()
 
+import atexit
 import logging
 import signal
 import sys
@@ -10,15 +11,26 @@ import falcon
 
 import mconf_aggr.aggregator.cfg as cfg
 from mconf_aggr.aggregator.aggregator import Aggregator, SetupError
+from mconf_aggr.aggregator.drain import DrainCoordinator
+from mconf_aggr.aggregator.retry import DeadLetterStore, RetryPolicy
+from mconf_aggr.aggregator.spool import DurableChannel
 from mconf_aggr.aggregator.utils import signal_handler
-from mconf_aggr.webhook.database import DatabaseConnector
+from mconf_aggr.webhook.cache import secret_cache
+from mconf_aggr.webhook.database import DatabaseConnector, make_psycopg_green
 from mconf_aggr.webhook.database_handler import WebhookDataWriter
 from mconf_aggr.webhook.event_listener import WebhookEventHandler, WebhookEventListener
+from mconf_aggr.webhook.event_log import EventLogProjector, EventLogWriter
+from mconf_aggr.webhook.event_mapper import decode_webhook_event, encode_webhook_event
 from mconf_aggr.webhook.hook_register import WebhookRegister
+from mconf_aggr.webhook.local_database import LocalDatabase, load_seed
+from mconf_aggr.webhook.migrations.migrator import Migrator
+from mconf_aggr.webhook.migrations.versions import MIGRATIONS
 from mconf_aggr.webhook.probe_listener import (
     LivenessProbeListener,
     ReadinessProbeListener,
 )
+from mconf_aggr.webhook.reference_cache import reference_cache
+from mconf_aggr.webhook.stats_listener import StatsListener
 
 logger = logging.getLogger(__name__)
 
@@ -33,24 +45,187 @@ req_opt.auto_parse_form_urlencoded = True
 route = cfg.config["MCONF_WEBHOOK_ROUTE"]
 
 channel = "webhooks"
-webhook_writer = WebhookDataWriter()
+# Events of meetings not written yet are parked for up to
+# MCONF_WEBHOOK_PARKING_TIMEOUT milliseconds instead of being dropped.
+# With MCONF_WEBHOOK_SPOOL_DIR, the spool does not move past parked events.
+# With MCONF_WEBHOOK_MEETING_CACHE, changes of user events to running meetings
+# are written behind every MCONF_WEBHOOK_MEETING_CACHE_FLUSH_INTERVAL milliseconds.
+# The spool and the event log projection do not move past events whose changes
+# are not written yet.
+webhook_writer = WebhookDataWriter(
+    parking_timeout=cfg.config["MCONF_WEBHOOK_PARKING_TIMEOUT"] / 1000,
+    parking_size=cfg.config["MCONF_WEBHOOK_PARKING_SIZE"],
+    parking_check_interval=cfg.config["MCONF_WEBHOOK_PARKING_CHECK_INTERVAL"] / 1000,
+    meeting_cache=cfg.config["MCONF_WEBHOOK_MEETING_CACHE"],
+    meeting_cache_size=cfg.config["MCONF_WEBHOOK_MEETING_CACHE_SIZE"],
+    meeting_cache_flush_interval=(
+        cfg.config["MCONF_WEBHOOK_MEETING_CACHE_FLUSH_INTERVAL"] / 1000
+    ),
+    meeting_cache_flush_size=cfg.config["MCONF_WEBHOOK_MEETING_CACHE_FLUSH_SIZE"],
+    meeting_cache_recount_interval=(
+        cfg.config["MCONF_WEBHOOK_MEETING_CACHE_RECOUNT_INTERVAL"] / 1000
+    ),
+    partial_updates=cfg.config["MCONF_WEBHOOK_PARTIAL_UPDATES"],
+)
+
+# In event log mode, events received are only appended to table event_log, in
+# bulk, and a projection applies them with webhook_writer on its own pace.
+# Instances with MCONF_WEBHOOK_EVENT_LOG_PROJECTION disabled only append.
+writer = webhook_writer
+event_log_projector = None
+if cfg.config["MCONF_WEBHOOK_EVENT_LOG"]:
+    writer = EventLogWriter()
+    if cfg.config["MCONF_WEBHOOK_EVENT_LOG_PROJECTION"]:
+        event_log_projector = EventLogProjector(
+            webhook_writer,
+            consumer=cfg.config["MCONF_WEBHOOK_EVENT_LOG_CONSUMER"],
+            batch_size=cfg.config["MCONF_WEBHOOK_EVENT_LOG_BATCH_SIZE"],
+            poll_interval=cfg.config["MCONF_WEBHOOK_EVENT_LOG_POLL_INTERVAL"] / 1000,
+        )
 aggregator = Aggregator()
 
 database = DatabaseConnector()
 
-database.connect()
+# Let other greenlets (e.g. HTTP requests) run while waiting for the database.
+if cfg.config["MCONF_WEBHOOK_DATABASE_COOPERATIVE"]:
+    make_psycopg_green()
+
+# In local mode, the aggregator runs on a database of its own (SQLite or a
+# temporary PostgreSQL), whose tables are created and seeded on startup.
+local_database = None
+database_url = None
+if cfg.config["MCONF_WEBHOOK_DATABASE_LOCAL"]:
+    seed_file = cfg.config["MCONF_WEBHOOK_DATABASE_SEED_FILE"]
+    local_database = LocalDatabase(
+        cfg.config["MCONF_WEBHOOK_DATABASE_URL"],
+        seed=load_seed(seed_file) if seed_file else None,
+    )
+    database_url = local_database.start()
+    atexit.register(local_database.stop)
+
+database.connect(database_url)
+
+if local_database is not None:
+    local_database.create(database.engine)
+
+# Create the indexes handlers depend on (concurrently on PostgreSQL).
+if cfg.config["MCONF_WEBHOOK_DATABASE_MIGRATE"]:
+    Migrator(database.engine, MIGRATIONS).upgrade()
+
+# Load shared secrets at once so requests are authenticated without database access.
+secret_cache.ttl = cfg.config["MCONF_WEBHOOK_SECRET_CACHE_TTL"]
+secret_cache.negative_ttl = cfg.config["MCONF_WEBHOOK_SECRET_CACHE_NEGATIVE_TTL"]
+secret_cache.negative_size = cfg.config["MCONF_WEBHOOK_SECRET_CACHE_NEGATIVE_SIZE"]
+secret_cache.start()
+
+# Load servers, shared secrets and institutions so handlers look them up in memory.
+reference_cache.interval = cfg.config["MCONF_WEBHOOK_REFERENCE_CACHE_INTERVAL"]
+reference_cache.start()
+
+# Bounded channels apply backpressure (MCONF_WEBHOOK_CHANNEL_POLICY) to the
+# senders when the writer falls behind instead of growing without limit.
+channel_options = dict(
+    maxsize=cfg.config["MCONF_WEBHOOK_CHANNEL_SIZE"],
+    policy=cfg.config["MCONF_WEBHOOK_CHANNEL_POLICY"],
+    block_timeout=cfg.config["MCONF_WEBHOOK_CHANNEL_BLOCK_TIMEOUT"] / 1000,
+    high_watermark=cfg.config["MCONF_WEBHOOK_CHANNEL_HIGH_WATERMARK"],
+    low_watermark=cfg.config["MCONF_WEBHOOK_CHANNEL_LOW_WATERMARK"],
+    shed=lambda webhook_event: webhook_event.event_type
+    in cfg.config["MCONF_WEBHOOK_SHED_EVENTS"],
+)
+
+# Accepted events survive restarts if they are spooled to disk.
+spool_dir = cfg.config["MCONF_WEBHOOK_SPOOL_DIR"]
+if spool_dir:
+    channel_options.update(
+        channel_class=DurableChannel,
+        directory=spool_dir,
+        encode=encode_webhook_event,
+        decode=decode_webhook_event,
+        segment_size=cfg.config["MCONF_WEBHOOK_SPOOL_SEGMENT_SIZE"],
+        fsync_interval=cfg.config["MCONF_WEBHOOK_SPOOL_FSYNC_INTERVAL"] / 1000,
+    )
+
+# Writes failing for transient reasons (e.g. a database failover) are retried
+# with backoff, keeping events of a meeting in order. Events given up on are
+# saved to MCONF_WEBHOOK_DEAD_LETTER_FILE, if set.
+retry_policy = None
+if cfg.config["MCONF_WEBHOOK_WRITE_RETRIES"] > 0:
+    retry_policy = RetryPolicy(
+        max_retries=cfg.config["MCONF_WEBHOOK_WRITE_RETRIES"],
+        base_delay=cfg.config["MCONF_WEBHOOK_WRITE_RETRY_BASE_DELAY"] / 1000,
+        max_delay=cfg.config["MCONF_WEBHOOK_WRITE_RETRY_MAX_DELAY"] / 1000,
+        max_pending=cfg.config["MCONF_WEBHOOK_WRITE_RETRY_MAX_PENDING"],
+    )
 
-aggregator.register_callback(webhook_writer, channel=channel)
+dead_letter = None
+if cfg.config["MCONF_WEBHOOK_DEAD_LETTER_FILE"]:
+    dead_letter = DeadLetterStore(
+        cfg.config["MCONF_WEBHOOK_DEAD_LETTER_FILE"],
+        encode=encode_webhook_event,
+        decode=decode_webhook_event,
+    )
+
+# Events are written in batches of up to MCONF_WEBHOOK_BATCH_SIZE, waiting at most
+# MCONF_WEBHOOK_BATCH_TIMEOUT milliseconds for a batch to fill up.
+# Events of a meeting are always written in order by the same one of the
+# MCONF_WEBHOOK_PARTITIONS writer threads.
+aggregator.register_callback(
+    writer,
+    channel=channel,
+    batch_size=cfg.config["MCONF_WEBHOOK_BATCH_SIZE"],
+    batch_timeout=cfg.config["MCONF_WEBHOOK_BATCH_TIMEOUT"] / 1000,
+    partitions=cfg.config["MCONF_WEBHOOK_PARTITIONS"],
+    partition_key=lambda webhook_event: webhook_event.event.internal_meeting_id,
+    retry_policy=retry_policy,
+    dead_letter=dead_letter,
+    **channel_options,
+)
 
 livenessProbe = LivenessProbeListener()
 readinessProbe = ReadinessProbeListener()
 
+statsListener = StatsListener()
+statsListener.register("secret_cache", secret_cache.stats)
+statsListener.register("reference_cache", reference_cache.stats)
+statsListener.register("webhook_writer", webhook_writer.stats)
+if writer is not webhook_writer:
+    statsListener.register("event_log", writer.stats)
+if event_log_projector is not None:
+    statsListener.register("event_log_projection", event_log_projector.stats)
+statsListener.register("channels", aggregator.stats)
+if dead_letter is not None:
+    statsListener.register("dead_letter", dead_letter.stats)
+
+# Events left queued at the deadline of the last shutdown are handled first.
+drain_coordinator = DrainCoordinator(
+    aggregator,
+    deadline=cfg.config["MCONF_WEBHOOK_DRAIN_DEADLINE"],
+    progress_interval=cfg.config["MCONF_WEBHOOK_DRAIN_PROGRESS_INTERVAL"],
+    spill_file=cfg.config["MCONF_WEBHOOK_DRAIN_SPILL_FILE"],
+    encode=encode_webhook_event,
+    decode=decode_webhook_event,
+)
+drain_coordinator.restore()
+
+if dead_letter is not None and cfg.config["MCONF_WEBHOOK_DEAD_LETTER_REINJECT"]:
+    dead_letter.reinject(aggregator)
+
 try:
     aggregator.setup()
 
+    # The projection stops on exit, once the aggregator has drained.
+    if event_log_projector is not None:
+        event_log_projector.start()
+        atexit.register(event_log_projector.stop)
+
     # Create the signal handling for graceful shutdown
     gevent.signal_handler(
-        signal.SIGTERM, signal_handler, aggregator, livenessProbe, signal.SIGTERM
+        signal.SIGTERM,
+        signal_handler,
+        drain_coordinator,
+        livenessProbe,
+        signal.SIGTERM,
     )
 except SetupError:
     sys.exit(1)
@@ -58,11 +233,16 @@ except SetupError:
 publisher = aggregator.publisher
 
 event_handler = WebhookEventHandler(publisher, channel)
-hook = WebhookEventListener(event_handler)
+hook = WebhookEventListener(
+    event_handler,
+    retry_after=cfg.config["MCONF_WEBHOOK_RETRY_AFTER"],
+    drain_coordinator=drain_coordinator,
+)
 
 app.add_route(route, hook)
 app.add_route("/health", livenessProbe)
 app.add_route("/ready", readinessProbe)
+app.add_route("/stats", statsListener)
 
 should_register = cfg.config["MCONF_WEBHOOK_SHOULD_REGISTER"]
 if should_register:
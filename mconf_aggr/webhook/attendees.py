@@ -0,0 +1,165 @@
+"""This module provides the index of the attendees of a meeting.
+
+Attendees are stored in table meetings as a JSON list of objects. User events
+look up one attendee by its `internal_user_id`, which is a linear scan of the
+list. `Attendees` keeps them in an ordered dict keyed by `internal_user_id`
+instead, so each lookup, join and leave costs the same whatever the size of
+the meeting, and is turned back into the same JSON list when written.
+
+The counters of table meetings derived from the attendees (participants,
+moderators, listeners, ...) are kept up to date from the change of each
+attendee as well, instead of being recounted from all of them on each event.
+"""
+from collections import OrderedDict
+
+# Counters of table meetings and whether an attendee counts in each of them.
+COUNTERS = {
+    "participant_count": lambda attendee: attendee.get("role") != "TRANSFER",
+    "transfer_count": lambda attendee: attendee.get("role") == "TRANSFER",
+    "moderator_count": lambda attendee: attendee.get("role") == "MODERATOR",
+    "listener_count": lambda attendee: bool(attendee.get("is_listening_only")),
+    "voice_participant_count": lambda attendee: bool(attendee.get("has_joined_voice")),
+    "video_count": lambda attendee: bool(attendee.get("has_video")),
+}
+
+
+class Attendees:
+    """Attendees of a meeting in order of arrival, keyed by `internal_user_id`."""
+
+    __slots__ = ("_attendees", "_counts")
+
+    def __init__(self, attendees=None):
+        """Constructor of the Attendees.
+
+        Parameters
+        ----------
+        attendees : list of dict
+            Attendees as stored in column meetings.attendees. They are not
+            copied, but attendees changed are replaced (see `change`).
+        """
+        self._attendees = OrderedDict(
+            (attendee["internal_user_id"], attendee) for attendee in attendees or []
+        )
+        self._counts = self._count_all()
+
+    def get(self, user_id):
+        """Attendee with an internal user id, or None if there is none."""
+        return self._attendees.get(user_id)
+
+    def add(self, attendee):
+        """Add an attendee, unless one with its internal user id is there.
+
+        Returns
+        -------
+        bool
+            True if the attendee was added.
+        """
+        user_id = attendee["internal_user_id"]
+        if user_id in self._attendees:
+            return False
+
+        self._attendees[user_id] = attendee
+        self._count(attendee, 1)
+
+        return True
+
+    def remove(self, user_id):
+        """Remove the attendee with an internal user id.
+
+        Returns
+        -------
+        dict
+            The attendee removed or None if there was none.
+        """
+        attendee = self._attendees.pop(user_id, None)
+        if attendee is not None:
+            self._count(attendee, -1)
+
+        return attendee
+
+    def change(self, user_id, update):
+        """Change the attendee with an internal user id, if there is one.
+
+        Attendees must be changed through this method, so the counters follow
+        them. The attendee is replaced by a changed copy, so copies of the
+        `Attendees` (see `copy`) are not changed.
+
+        Parameters
+        ----------
+        user_id : str
+            Internal user id of the attendee.
+        update : callable
+            Function changing the attendee passed to it.
+
+        Returns
+        -------
+        bool
+            True if the attendee was found.
+        """
+        attendee = self._attendees.get(user_id)
+        if attendee is None:
+            return False
+
+        self._count(attendee, -1)
+        attendee = dict(attendee)
+        update(attendee)
+        self._attendees[user_id] = attendee
+        self._count(attendee, 1)
+
+        return True
+
+    def copy(self):
+        """Copy of the attendees, sharing the attendees not changed since."""
+        attendees = Attendees.__new__(Attendees)
+        attendees._attendees = OrderedDict(self._attendees)
+        attendees._counts = dict(self._counts)
+
+        return attendees
+
+    def counts(self):
+        """Counters of table meetings derived from the attendees."""
+        return dict(self._counts)
+
+    def recount(self):
+        """Recount the counters from all attendees in a single pass.
+
+        Returns
+        -------
+        bool
+            True if the counters kept up to date had drifted.
+        """
+        counts = self._count_all()
+        drifted = counts != self._counts
+        self._counts = counts
+
+        return drifted
+
+    def _count(self, attendee, sign):
+        for name, counts_in in COUNTERS.items():
+            if counts_in(attendee):
+                self._counts[name] += sign
+
+    def _count_all(self):
+        counts = dict.fromkeys(COUNTERS, 0)
+        for attendee in self._attendees.values():
+            for name, counts_in in COUNTERS.items():
+                if counts_in(attendee):
+                    counts[name] += 1
+
+        return counts
+
+    def to_json(self):
+        """Attendees as stored in column meetings.attendees."""
+        return list(self._attendees.values())
+
+    def __contains__(self, user_id):
+        return user_id in self._attendees
+
+    def __iter__(self):
+        return iter(self._attendees.values())
+
+    def __len__(self):
+        return len(self._attendees)
+
+    def __repr__(self):
+        return "{!s}({!r})".format(self.__class__.__name__, self.to_json())
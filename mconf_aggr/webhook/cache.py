@@ -0,0 +1,271 @@
+"""This module provides in-memory caches for data read from database on hot paths.
+
+Every webhook request must be authenticated against the shared secret of the
+server it comes from. Instead of querying the database for each request, the
+secrets are kept in a process-wide cache that is loaded in bulk, refreshed
+periodically in background and can be invalidated explicitly. Servers that
+are not found in database are remembered for a short time as well, so a flood
+of requests from unknown domains does not turn into a flood of queries.
+
+A global object `secret_cache` is available for use in other modules.
+"""
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import logaugment
+
+from mconf_aggr.webhook.database_handler import AuthenticationHandler
+from mconf_aggr.webhook.exceptions import DatabaseNotReadyError
+
+
+class SecretCache:
+    """Process-wide cache of shared secrets keyed by server URL.
+
+    Entries are considered fresh for `ttl` seconds. After `start()` is called,
+    the whole `servers` table is loaded at once and a background thread
+    reloads it twice every `ttl` seconds. Servers not found in the cache (or whose
+    entry is stale) fall back to a single lookup in the database.
+
+    Servers not found in database are kept in a bounded LRU of unknown servers
+    for `negative_ttl` seconds. Requests from them are rejected without
+    touching the database until the entry expires or the cache is refreshed.
+
+    If `ttl` is zero or negative, the cache is disabled and every lookup goes
+    straight to the database.
+    """
+
+    def __init__(
+        self, ttl=60, negative_ttl=30, negative_size=1024, handler=None, logger=None
+    ):
+        """Constructor of the `SecretCache`.
+
+        Parameters
+        ----------
+        ttl : float
+            Time (in seconds) an entry is considered fresh.
+        negative_ttl : float
+            Time (in seconds) an unknown server is remembered as unknown.
+        negative_size : int
+            Maximum number of unknown servers remembered at once.
+        handler : AuthenticationHandler
+            Handler used to retrieve secrets from database.
+            If not supplied, it will instantiate a new `AuthenticationHandler`.
+        logger : logging.Logger
+            If not supplied, it will instantiate a new logger from __name__.
+        """
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.negative_size = negative_size
+        self._handler = handler or AuthenticationHandler()
+        self._secrets = {}  # Server URL -> (secret, loaded at).
+        self._unknown = OrderedDict()  # Server URL -> expires at (LRU order).
+        self._hits = 0
+        self._negative_hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+        self._stopevent = threading.Event()
+        self._refresh_thread = None
+        self.logger = logger or logging.getLogger(__name__)
+        logaugment.set(
+            self.logger,
+            code="",
+            site="SecretCache",
+            server="",
+            event="",
+            keywords="null",
+        )
+
+    @property
+    def enabled(self):
+        return self.ttl is not None and self.ttl > 0
+
+    def start(self):
+        """Load all secrets from database and start refreshing them in background.
+
+        It does nothing if the cache is disabled.
+        """
+        if not self.enabled:
+            return
+
+        self.refresh()
+
+        self._stopevent.clear()
+        self._refresh_thread = threading.Thread(
+            name="secret_cache_refresh", target=self._refresh_loop, daemon=True
+        )
+        self._refresh_thread.start()
+
+    def stop(self):
+        """Stop refreshing the cache in background."""
+        self._stopevent.set()
+
+        if self._refresh_thread is not None:
+            self._refresh_thread.join()
+            self._refresh_thread = None
+
+    def secret(self, server):
+        """Get the shared secret of a server.
+
+        It has the same interface as `AuthenticationHandler.secret` so both can
+        be used interchangeably.
+
+        Parameters
+        ----------
+        server : str
+            Normalized URL of the server.
+
+        Returns
+        -------
+        secret : str
+            Secret of the server or None if it was not found.
+        """
+        if not self.enabled:
+            return self._handler.secret(server)
+
+        now = time.monotonic()
+
+        entry = self._secrets.get(server)
+        if entry is not None:
+            secret, loaded_at = entry
+            if now - loaded_at < self.ttl:
+                self._hits += 1
+
+                return secret
+
+        if self._is_unknown(server, now):
+            self._negative_hits += 1
+
+            return None
+
+        self._misses += 1
+        try:
+            secret = self._handler.secret(server, raise_exception=True)
+        except DatabaseNotReadyError:
+            # Do not remember the server as unknown if it could not be checked.
+            return None
+
+        with self._lock:
+            if secret:
+                self._secrets[server] = (secret, time.monotonic())
+            else:
+                self._secrets.pop(server, None)
+                self._remember_unknown(server)
+
+        return secret
+
+    def stats(self):
+        """Counters of the cache usage.
+
+        Returns
+        -------
+        stats : dict
+            Number of entries, hits, misses (lookups that reached the
+            database) and negative hits (unknown servers rejected from cache).
+        """
+        return {
+            "size": len(self._secrets),
+            "unknown_size": len(self._unknown),
+            "hits": self._hits,
+            "negative_hits": self._negative_hits,
+            "misses": self._misses,
+        }
+
+    def refresh(self):
+        """Reload every secret from database at once.
+
+        If the database is not available, the current entries are kept.
+        """
+        logging_extra = {
+            "code": "Secret cache refresh",
+            "site": "SecretCache.refresh",
+            "keywords": ["shared secret", "cache", "refresh", "database"],
+        }
+
+        try:
+            secrets = self._handler.secrets()
+        except DatabaseNotReadyError:
+            logging_extra["keywords"] += ["warning"]
+            self.logger.warn(
+                "Unable to refresh secret cache. Keeping current entries.",
+                extra=dict(
+                    logging_extra, keywords=json.dumps(logging_extra["keywords"])
+                ),
+            )
+
+            return
+
+        loaded_at = time.monotonic()
+        with self._lock:
+            self._secrets = {
+                server: (secret, loaded_at) for server, secret in secrets.items()
+            }
+            # Servers just added to database must not stay rejected.
+            for server in secrets:
+                self._unknown.pop(server, None)
+
+        self.logger.debug(
+            f"Secret cache refreshed with {len(secrets)} server(s).",
+            extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
+        )
+
+    def invalidate(self, server=None):
+        """Drop cached entries so they are read again from database.
+
+        Parameters
+        ----------
+        server : str
+            Server whose entry must be dropped. If not supplied, all entries
+            are dropped.
+        """
+        with self._lock:
+            if server is None:
+                self._secrets = {}
+                self._unknown.clear()
+            else:
+                self._secrets.pop(server, None)
+                self._unknown.pop(server, None)
+
+    def _is_unknown(self, server, now):
+        with self._lock:
+            expires_at = self._unknown.get(server)
+            if expires_at is None:
+                return False
+
+            if now >= expires_at:
+                del self._unknown[server]
+
+                return False
+
+            self._unknown.move_to_end(server)
+
+            return True
+
+    def _remember_unknown(self, server):
+        if self.negative_ttl <= 0 or self.negative_size <= 0:
+            return
+
+        self._unknown[server] = time.monotonic() + self.negative_ttl
+        self._unknown.move_to_end(server)
+
+        while len(self._unknown) > self.negative_size:
+            self._unknown.popitem(last=False)
+
+    def _refresh_loop(self):
+        # Refresh twice per TTL so entries do not expire while database is up.
+        while not self._stopevent.wait(self.ttl / 2):
+            self.refresh()
+
+    def __len__(self):
+        return len(self._secrets)
+
+    def __repr__(self):
+        return "{!s}(ttl={!r}, size={!r})".format(
+            self.__class__.__name__, self.ttl, len(self)
+        )
+
+
+"""Singleton ``SecretCache`` instance. Intended to be used outside this module."""
+secret_cache = SecretCache()
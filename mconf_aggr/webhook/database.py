@@ -1,10 +1,18 @@
 from contextlib import contextmanager
 
-from sqlalchemy import create_engine
+import psycopg2
+from gevent.socket import wait_read, wait_write
+from psycopg2 import extensions
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 
 from mconf_aggr.aggregator import cfg
 
+# Time (in seconds) a SQLite connection waits for the writer holding the lock.
+SQLITE_TIMEOUT = 30
+
 
 class DatabaseConnector:
     """Wrapper of PostgreSQL connection.
@@ -18,18 +26,25 @@ class DatabaseConnector:
     to the database (currently it does nothing).
     """
 
+    engine = None
     Session = None
 
     @classmethod
-    def connect(cls):
+    def connect(cls, url=None):
         """Configure and connect the database.
 
         It is responsible for creating an engine for the URI provided and
         configure the session.
+
+        Parameters
+        ----------
+        url : str
+            URL of the database. If not supplied, it is built from the
+            MCONF_WEBHOOK_DATABASE_* configuration.
         """
-        engine = create_engine(cls._build_uri(), echo=False)
+        cls.engine = create_database_engine(url or cls._build_uri(), echo=False)
         cls.Session = sessionmaker()
-        cls.Session.configure(bind=engine)
+        cls.Session.configure(bind=cls.engine)
 
     @classmethod
     def close(cls):
@@ -59,6 +74,10 @@ class DatabaseConnector:
 
     @classmethod
     def _build_uri(cls):
+        url = cfg.config["MCONF_WEBHOOK_DATABASE_URL"]
+        if url:
+            return url
+
         user = cfg.config["MCONF_WEBHOOK_DATABASE_USER"]
         password = cfg.config["MCONF_WEBHOOK_DATABASE_PASSWORD"]
         host = cfg.config["MCONF_WEBHOOK_DATABASE_HOST"]
@@ -66,3 +85,104 @@ class DatabaseConnector:
         port = cfg.config["MCONF_WEBHOOK_DATABASE_PORT"]
 
         return f"postgresql://{user}:{password}@{host}:{port}/{database}"
+
+
+def create_database_engine(url, **kwargs):
+    """Create an engine with the options the backend of the database needs.
+
+    On SQLite, transactions are begun by the engine with `BEGIN IMMEDIATE`
+    instead of by the driver, so SAVEPOINTs work and concurrent writers wait
+    for the lock (up to `SQLITE_TIMEOUT` seconds) instead of failing. An
+    in-memory database has a single connection, shared by all sessions, which
+    must therefore not be used concurrently.
+
+    Parameters
+    ----------
+    url : str
+        URL of the database.
+    **kwargs
+        Other arguments of `sqlalchemy.create_engine`.
+
+    Returns
+    -------
+    sqlalchemy.engine.Engine
+    """
+    url = make_url(url)
+    if url.get_backend_name() != "sqlite":
+        return create_engine(url, **kwargs)
+
+    if url.database in (None, "", ":memory:"):
+        kwargs.setdefault("poolclass", StaticPool)
+    engine = create_engine(
+        url,
+        connect_args={
+            "isolation_level": None,
+            "check_same_thread": False,
+            "timeout": SQLITE_TIMEOUT,
+        },
+        **kwargs,
+    )
+    event.listen(engine, "begin", _begin_immediate)
+
+    return engine
+
+
+def _begin_immediate(connection):
+    connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def is_transient(err):
+    """Whether a database error may go away by itself, e.g. during a failover."""
+    return isinstance(err, (exc.OperationalError, exc.InterfaceError)) or getattr(
+        err, "connection_invalidated", False
+    )
+
+
+def make_psycopg_green():
+    """Make psycopg2 cooperate with gevent.
+
+    By default, psycopg2 blocks the whole process while waiting for the
+    database, which under gevent means every greenlet (including the ones
+    serving HTTP requests) is frozen during a query. With a wait callback,
+    psycopg2 yields to the gevent hub whenever it would block on the socket.
+
+    It must be called once, before any connection is opened.
+
+    Raises
+    ------
+    psycopg2.ProgrammingError
+        If psycopg2 does not support wait callbacks.
+    """
+    if not hasattr(extensions, "set_wait_callback"):
+        raise psycopg2.ProgrammingError(
+            "Psycopg2 does not support coroutines (set_wait_callback not found)."
+        )
+
+    extensions.set_wait_callback(gevent_wait_callback)
+
+
+def gevent_wait_callback(conn, timeout=None):
+    """Wait callback for psycopg2 that yields to gevent while waiting on I/O.
+
+    Parameters
+    ----------
+    conn : psycopg2.extensions.connection
+        Connection being polled.
+    timeout : float
+        Maximum time (in seconds) to wait for each I/O event.
+
+    Raises
+    ------
+    psycopg2.OperationalError
+        If polling the connection returns an unknown state.
+    """
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            break
+        elif state == extensions.POLL_READ:
+            wait_read(conn.fileno(), timeout=timeout)
+        elif state == extensions.POLL_WRITE:
+            wait_write(conn.fileno(), timeout=timeout)
+        else:
+            raise psycopg2.OperationalError(f"Bad result from poll: {state!r}")
@@ -5,16 +5,25 @@ which event was received by the `update` method on `WebhookDataWriter` and passe
 `update` on `DataProcessor`.
 
 """
+import contextlib
 import json
 import logging
+import threading
+import time
 
 import logaugment
 import sqlalchemy
 from sqlalchemy.orm.attributes import flag_modified
 
-from mconf_aggr.aggregator.aggregator import AggregatorCallback, CallbackError
+from mconf_aggr.aggregator.aggregator import (
+    AggregatorCallback,
+    CallbackError,
+    TransientCallbackError,
+)
 from mconf_aggr.aggregator.utils import time_logger
-from mconf_aggr.webhook.database import DatabaseConnector
+from mconf_aggr.webhook import meeting_end, partial_update, upsert
+from mconf_aggr.webhook.attendees import Attendees
+from mconf_aggr.webhook.database import DatabaseConnector, is_transient
 from mconf_aggr.webhook.database_model import (
     Institutions,
     Meetings,
@@ -29,6 +38,9 @@ from mconf_aggr.webhook.exceptions import (
     InvalidWebhookEventError,
     WebhookDatabaseError,
 )
+from mconf_aggr.webhook.meeting_cache import MeetingCache
+from mconf_aggr.webhook.parking import ParkingBuffer
+from mconf_aggr.webhook.reference_cache import reference_cache
 
 session_scope = DatabaseConnector.get_session_scope()
 
@@ -44,15 +56,24 @@ class Status:
 class DatabaseEventHandler:
     """This is an abstract class that handles webhook events."""
 
-    def __init__(self, session, logger=None):
+    def __init__(self, session, logger=None, meeting_cache=None, partial_updates=False):
         """Constructor of the DataEventHandler.
 
         Parameters
         ----------
         session : sqlalchemy.Session
             Session used by SQLAlchemy to interact with the database.
+        meeting_cache : meeting_cache.MeetingCache
+            Cache of running meetings written behind. If not supplied, rows of
+            table meetings are loaded and written by each event.
+        partial_updates : bool
+            Whether changes to a single attendee of an uncached meeting are
+            written without loading its row (see `partial_update`), where the
+            database supports it.
         """
         self.session = session
+        self.meeting_cache = meeting_cache
+        self.partial_updates = partial_updates
         self.logger = logger or logging.getLogger(__name__)
         logaugment.set(
             self.logger,
@@ -73,6 +94,100 @@ class DatabaseEventHandler:
         """
         raise NotImplementedError()
 
+    def _partial_updates(self):
+        """Whether attendee changes are written by partial updates."""
+        return (
+            self.partial_updates
+            and self.meeting_cache is None
+            and partial_update.is_supported(self.session)
+        )
+
+    def _attendees(self, meetings_table):
+        """Attendees of a row of table meetings, keyed by internal user id.
+
+        Cached meetings keep them as `Attendees` already. Otherwise, the JSON
+        list of the row is indexed, and it is replaced by `_set_attendees`.
+        """
+        if isinstance(meetings_table.attendees, Attendees):
+            return meetings_table.attendees
+
+        return Attendees(meetings_table.attendees)
+
+    def _set_attendees(self, meetings_table, attendees):
+        """Store attendees changed in a row of table meetings."""
+        if meetings_table.attendees is not attendees:
+            meetings_table.attendees = attendees.to_json()
+
+    def _recording(self, int_id, fields, status):
+        """Row of table recordings of a meeting, created if there is none.
+
+        Where supported, the row is inserted unless it already exists, instead
+        of being looked up first.
+
+        Parameters
+        ----------
+        int_id : str
+            Internal meeting id of the recording.
+        fields : dict
+            Columns of the recording, if created.
+        status : str
+            Status of the recording, if created.
+
+        Returns
+        -------
+        (records_table, created) : (Recordings, bool)
+            The row and whether it was created by this event.
+        """
+        new_recording = Recordings(**fields)
+        new_recording.status = status
+        new_recording.playback = []
+        new_recording.workflow = {}
+
+        participants = (
+            self.session.query(UsersEvents.id)
+            .join(MeetingsEvents)
+            .filter(MeetingsEvents.internal_meeting_id == int_id)
+        )
+
+        created = False
+        if upsert.is_supported(self.session):
+            created = (
+                upsert.insert_if_new(
+                    self.session,
+                    new_recording,
+                    participants=participants.with_entities(
+                        sqlalchemy.func.count(UsersEvents.id)
+                    ).scalar_subquery(),
+                )
+                is not None
+            )
+
+        records_table = (
+            self.session.query(Recordings)
+            .filter(Recordings.internal_meeting_id == int_id)
+            .first()
+        )
+
+        # Table recordings does not exist yet. Create it.
+        if not records_table:
+            records_table = new_recording
+            records_table.participants = int(participants.count())
+            created = True
+
+        return records_table, created
+
+    def _save_meeting(self, meetings_table):
+        """Save changes to the attendees of a row of table meetings."""
+        if self.meeting_cache is not None:
+            self.meeting_cache.mark_dirty(meetings_table)
+            return
+
+        # SQLAlchemy was not considering the attendees array as modified, so it
+        # had to be forced.
+        flag_modified(meetings_table, "attendees")
+
+        self.session.add(meetings_table)
+
 
 class MeetingCreatedHandler(DatabaseEventHandler):
     """This class handles meeting-created events."""
@@ -130,27 +245,17 @@ class MeetingCreatedHandler(DatabaseEventHandler):
             extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
         )
 
-        # Create tables meetings_events and meetings.
+        # Create tables meetings_events and meetings. Where supported, the
+        # row of meetings_events is only inserted if new, instead of being
+        # looked up first.
+        upserted = upsert.is_supported(self.session)
         if (
-            self.session.query(MeetingsEvents)
+            not upserted
+            and self.session.query(MeetingsEvents)
             .filter(MeetingsEvents.internal_meeting_id == event.internal_meeting_id)
             .first()
         ):
-            logging_extra["code"] = "Meeting already exists"
-            logging_extra["keywords"] = [
-                "event handler",
-                "warning",
-                "database",
-                f"internal-meeting-id={event.internal_meeting_id}",
-            ]
-
-            self.logger.warn(
-                f"Meeting with internal-meeting-id '{event.internal_meeting_id}' "
-                "already exists.",
-                extra=dict(
-                    logging_extra, keywords=json.dumps(logging_extra["keywords"])
-                ),
-            )
+            self._meeting_exists(event, logging_extra)
             return
 
         new_meetings_events = MeetingsEvents(**event._asdict())
@@ -169,12 +274,14 @@ class MeetingCreatedHandler(DatabaseEventHandler):
             new_meetings_events.parent_meeting_id = None
 
         if metadata.mconf_shared_secret_guid and not metadata.mconf_secret_name:
-            new_meetings_events.shared_secret_name = (
+            shared_secret = reference_cache.shared_secret(
+                metadata.mconf_shared_secret_guid
+            ) or (
                 self.session.query(SharedSecrets)
                 .filter(SharedSecrets.guid == metadata.mconf_shared_secret_guid)
                 .first()
-                .name
             )
+            new_meetings_events.shared_secret_name = shared_secret.name
 
         if not metadata.mconf_shared_secret_guid:
             logging_extra["code"] = ("Empty shared secret",)
@@ -208,7 +315,9 @@ class MeetingCreatedHandler(DatabaseEventHandler):
                     f"institution={metadata.mconflb_institution_name}",
                     f"internal-meeting-id={event.internal_meeting_id}",
                 ]
-                found_secret = (
+                found_secret = reference_cache.shared_secret_by_name(
+                    metadata.mconflb_institution_name
+                ) or (
                     self.session.query(SharedSecrets)
                     .filter(SharedSecrets.name == metadata.mconflb_institution_name)
                     .first()
@@ -225,7 +334,9 @@ class MeetingCreatedHandler(DatabaseEventHandler):
                 # We found the secret, try to find its institution to complete
                 # the table with information
                 try:
-                    found_institution = (
+                    found_institution = reference_cache.institution(
+                        found_secret.institution_guid
+                    ) or (
                         self.session.query(Institutions)
                         .filter(Institutions.guid == found_secret.institution_guid)
                         .first()
@@ -286,7 +397,7 @@ class MeetingCreatedHandler(DatabaseEventHandler):
                 )
 
         if not metadata.mconf_server_guid and not metadata.mconf_server_url:
-            servers_table = (
+            servers_table = reference_cache.server(event.server_url) or (
                 self.session.query(Servers)
                 .filter(Servers.name == event.server_url)
                 .first()
@@ -325,10 +436,37 @@ class MeetingCreatedHandler(DatabaseEventHandler):
             transfer=False,
             transfer_count=0,
         )
-        new_meeting.meeting_event = new_meetings_events
+
+        if upserted:
+            meeting_event_id = upsert.insert_if_new(self.session, new_meetings_events)
+            if meeting_event_id is None:
+                self._meeting_exists(event, logging_extra)
+                return
+
+            new_meeting.meeting_event_id = meeting_event_id
+        else:
+            new_meeting.meeting_event = new_meetings_events
+
+        if self.meeting_cache is not None:
+            self.meeting_cache.evict(new_meeting.int_meeting_id)
 
         self.session.add(new_meeting)
 
+    def _meeting_exists(self, event, logging_extra):
+        logging_extra["code"] = "Meeting already exists"
+        logging_extra["keywords"] = [
+            "event handler",
+            "warning",
+            "database",
+            f"internal-meeting-id={event.internal_meeting_id}",
+        ]
+
+        self.logger.warn(
+            f"Meeting with internal-meeting-id '{event.internal_meeting_id}' "
+            "already exists.",
+            extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
+        )
+
 
 class MeetingEndedHandler(DatabaseEventHandler):
     """This class handles meeting-ended events."""
@@ -364,6 +502,26 @@ class MeetingEndedHandler(DatabaseEventHandler):
             extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
         )
 
+        # Its row of table meetings is deleted, so changes not flushed are moot.
+        if self.meeting_cache is not None:
+            self.meeting_cache.evict(int_id)
+
+        if meeting_end.is_supported(self.session):
+            ended = meeting_end.end_meeting(self.session, int_id, event.end_time)
+        else:
+            ended = self._end_meeting(int_id, event.end_time)
+
+        if ended:
+            self.logger.info(
+                f"Meeting ended with {ended.closed_users} user(s) still in it "
+                f"for internal-meeting-id: '{int_id}'.",
+                extra=dict(
+                    logging_extra, keywords=json.dumps(logging_extra["keywords"])
+                ),
+            )
+
+    def _end_meeting(self, int_id, end_time):
+        """Finalize a meeting with the ORM, as `meeting_end.end_meeting`."""
         # Table meetings_events to be updated.
         meetings_events_table = (
             self.session.query(MeetingsEvents)
@@ -371,32 +529,36 @@ class MeetingEndedHandler(DatabaseEventHandler):
             .first()
         )
 
-        if meetings_events_table:
-            # Update all users that don't have a leave time to the meeting's end time
-            (
-                self.session.query(UsersEvents)
-                .filter(
-                    UsersEvents.meeting_event_id == meetings_events_table.id,
-                    UsersEvents.leave_time is None,
-                )
-                .update({"leave_time": event.end_time}, synchronize_session="fetch")
+        if not meetings_events_table:
+            return None
+
+        # Update all users that don't have a leave time to the meeting's end time.
+        closed_users = (
+            self.session.query(UsersEvents)
+            .filter(
+                UsersEvents.meeting_event_id == meetings_events_table.id,
+                UsersEvents.leave_time.is_(None),
             )
-            # make sure the users events are updated before deleting the meeting
-            self.session.commit()
+            .update({"leave_time": end_time}, synchronize_session="evaluate")
+        )
 
-            meetings_events_table.end_time = event.end_time
+        meetings_events_table.end_time = end_time
 
-            self.session.add(meetings_events_table)
+        self.session.add(meetings_events_table)
 
-            # Table meetings to be updated.
-            meetings_table = (
-                self.session.query(Meetings)
-                .filter(Meetings.int_meeting_id == int_id)
-                .first()
-            )
+        # Table meetings to be deleted.
+        meetings_table = (
+            self.session.query(Meetings)
+            .filter(Meetings.int_meeting_id == int_id)
+            .first()
+        )
 
-            if meetings_table:
-                self.session.delete(meetings_table)
+        if meetings_table:
+            self.session.delete(meetings_table)
+
+        return meeting_end.EndedMeeting(
+            meetings_events_table.id, closed_users, meetings_table is not None
+        )
 
 
 class UserJoinedHandler(DatabaseEventHandler):
@@ -462,24 +624,13 @@ class UserJoinedHandler(DatabaseEventHandler):
             users_events_table.meeting_event = meetings_events_table
 
             # Table meetings to be updated.
-            meetings_table = (
-                self.session.query(Meetings)
-                .filter(Meetings.int_meeting_id == int_id)
-                .first()
-            )
-
-            if meetings_table:
-                meetings_table.attendees = self._attendee_json(
-                    meetings_table.attendees, attendee
-                )
-                self._update_meeting(meetings_table)
-
-                # SQLAlchemy was not considering the attendees array as modified, so it
-                # had to be forced.
-                flag_modified(meetings_table, "attendees")
+            if self._partial_updates():
+                found = partial_update.add_attendee(self.session, int_id, attendee)
+            else:
+                found = self._add_attendee(int_id, attendee)
 
+            if found:
                 self.session.add(users_events_table)
-                self.session.add(meetings_table)
                 self.session.flush()
             else:
                 logging_extra["code"] = ("Meeting not found for this user",)
@@ -502,22 +653,43 @@ class UserJoinedHandler(DatabaseEventHandler):
                     f"no meeting found for user '{event.internal_user_id}'"
                 )
 
-            # Update unique_users in table meetings_events.
-            users_joined = (
-                self.session.query(UsersEvents)
-                .join(UsersEvents.meeting_event)
-                .filter(MeetingsEvents.internal_meeting_id == int_id)
-                .count()
-            )
-
-            meetings_events_table.unique_users = users_joined
+            # Update unique_users in table meetings_events. The user was just
+            # inserted in table users_events, whose internal_user_id is unique,
+            # so it is a new user: increment the counter in the UPDATE instead
+            # of counting all users of the meeting.
+            joined_before = sqlalchemy.func.coalesce(MeetingsEvents.unique_users, 0)
+            meetings_events_table.unique_users = joined_before + 1
 
             # Meeting starts when first user joins it.
-            if users_joined == 1:
-                meetings_events_table.start_time = event.join_time
+            meetings_events_table.start_time = sqlalchemy.case(
+                (joined_before == 0, event.join_time),
+                else_=MeetingsEvents.start_time,
+            )
 
             self.session.add(meetings_events_table)
 
+    def _add_attendee(self, int_id, attendee):
+        if self.meeting_cache is not None:
+            meetings_table = self.meeting_cache.get(self.session, int_id)
+        else:
+            meetings_table = (
+                self.session.query(Meetings)
+                .filter(Meetings.int_meeting_id == int_id)
+                .first()
+            )
+
+        if not meetings_table:
+            return False
+
+        attendees = self._attendees(meetings_table)
+        attendees.add(attendee)
+        self._set_attendees(meetings_table, attendees)
+        self._update_meeting(meetings_table)
+
+        self._save_meeting(meetings_table)
+
+        return True
+
     def _get_users_events(self, raw_event):
         event_dict = raw_event._asdict()
 
@@ -532,21 +704,6 @@ class UserJoinedHandler(DatabaseEventHandler):
 
         return users_events
 
-    def _attendee_json(self, base, new):
-        if not base:
-            arr = []
-            arr.append(new)
-
-            return arr
-        else:
-            arr = base
-            for elem in arr:
-                if elem["internal_user_id"] == new["internal_user_id"]:
-                    return arr
-            arr.append(new)
-
-            return arr
-
     def _update_meeting(self, meetings_table):
         meetings_table.running = True
         _update_meeting(meetings_table)
@@ -590,22 +747,12 @@ class UserLeftHandler(DatabaseEventHandler):
         )
 
         # Table meetings to be updated.
-        meetings_table = (
-            self.session.query(Meetings)
-            .join(Meetings.meeting_event)
-            .filter(MeetingsEvents.internal_meeting_id == int_id)
-            .first()
-        )
-
-        if meetings_table:
-            self._remove_attendee(meetings_table, user_id)
-            self._update_meeting(meetings_table)
-
-            # Mark meetings.attendees as modified for SQLAlchemy.
-            flag_modified(meetings_table, "attendees")
-
-            self.session.add(meetings_table)
+        if self._partial_updates():
+            found = partial_update.remove_attendee(self.session, int_id, user_id)
         else:
+            found = self._remove_attendee(int_id, user_id)
+
+        if not found:
             logging_extra["code"] = ("Meeting not found",)
             logging_extra["keywords"] = [
                 "meeting not found",
@@ -650,10 +797,28 @@ class UserLeftHandler(DatabaseEventHandler):
                 ),
             )
 
-    def _remove_attendee(self, meetings_table, user_id):
-        for idx, attendee in enumerate(meetings_table.attendees):
-            if attendee["internal_user_id"] == user_id:
-                del meetings_table.attendees[idx]
+    def _remove_attendee(self, int_id, user_id):
+        if self.meeting_cache is not None:
+            meetings_table = self.meeting_cache.get(self.session, int_id)
+        else:
+            meetings_table = (
+                self.session.query(Meetings)
+                .join(Meetings.meeting_event)
+                .filter(MeetingsEvents.internal_meeting_id == int_id)
+                .first()
+            )
+
+        if not meetings_table:
+            return False
+
+        attendees = self._attendees(meetings_table)
+        attendees.remove(user_id)
+        self._set_attendees(meetings_table, attendees)
+        self._update_meeting(meetings_table)
+
+        self._save_meeting(meetings_table)
+
+        return True
 
     def _update_meeting(self, meetings_table):
         _update_meeting(meetings_table)
@@ -698,21 +863,12 @@ class UserEventHandler(DatabaseEventHandler):
         )
 
         # Table meetings to be updated.
-        meetings_table = (
-            self.session.query(Meetings)
-            .join(Meetings.meeting_event)
-            .filter(MeetingsEvents.internal_meeting_id == int_id)
-            .first()
-        )
-
-        if meetings_table:
-            self._update_attendees(meetings_table.attendees, event, user_id)
-            self._update_meeting(meetings_table)
-
-            flag_modified(meetings_table, "attendees")
-
-            self.session.add(meetings_table)
+        if self._partial_updates():
+            found = self._patch_attendee(int_id, event, user_id)
         else:
+            found = self._change_attendee(int_id, event, user_id)
+
+        if not found:
             logging_extra["code"] = ("Meeting not found",)
             logging_extra["keywords"] = [
                 "meeting not found",
@@ -729,14 +885,49 @@ class UserEventHandler(DatabaseEventHandler):
                 ),
             )
 
+    def _change_attendee(self, int_id, update, user_id):
+        if self.meeting_cache is not None:
+            meetings_table = self.meeting_cache.get(self.session, int_id)
+        else:
+            meetings_table = (
+                self.session.query(Meetings)
+                .join(Meetings.meeting_event)
+                .filter(MeetingsEvents.internal_meeting_id == int_id)
+                .first()
+            )
+
+        if not meetings_table:
+            return False
+
+        attendees = self._attendees(meetings_table)
+        self._update_attendees(attendees, update, user_id)
+        self._set_attendees(meetings_table, attendees)
+        self._update_meeting(meetings_table)
+
+        self._save_meeting(meetings_table)
+
+        return True
+
+    def _patch_attendee(self, int_id, update, user_id):
+        """Write the change of the attendee by a partial update.
+
+        Attendees are only ever set values taken from the event, so the keys
+        set on an empty attendee are the patch.
+        """
+        patch = {}
+        if update.event_name == self.event_type:
+            self._update_attendee(patch, update)
+
+        return partial_update.patch_attendee(self.session, int_id, user_id, patch)
+
     def _update_meeting(self, meetings_table):
         _update_meeting(meetings_table)
 
-    def _update_attendees(self, base, update, user_id):
-        for attendee in base:
-            if attendee["internal_user_id"] == user_id:
-                if update.event_name == self.event_type:
-                    self._update_attendee(attendee, update)
+    def _update_attendees(self, attendees, update, user_id):
+        if update.event_name == self.event_type:
+            attendees.change(
+                user_id, lambda attendee: self._update_attendee(attendee, update)
+            )
 
     def _update_attendee(self, attendee, update):
         raise NotImplementedError("Give specific behavior for the user event")
@@ -838,31 +1029,15 @@ class RapArchiveHandler(DatabaseEventHandler):
 
         # Meeting was set to be recorded.
         if recorded:
-            records_table = (
-                self.session.query(Recordings)
-                .filter(Recordings.internal_meeting_id == int_id)
-                .first()
-            )
-
-            # Table recordings does not exist yet. Create it.
-            if not records_table:
-                # Remove the recorded field so no error is raised since that
-                # field is not present in the database.
-                event_dict = event._asdict()
-                event_dict.pop("recorded", None)
-
-                records_table = Recordings(**event_dict)
+            # Remove the recorded field so no error is raised since that
+            # field is not present in the database.
+            event_dict = event._asdict()
+            event_dict.pop("recorded", None)
 
-                records_table.status = Status.PROCESSING
-                records_table.playback = []
-                records_table.workflow = {}
-                records_table.participants = int(
-                    self.session.query(UsersEvents.id)
-                    .join(MeetingsEvents)
-                    .filter(MeetingsEvents.internal_meeting_id == int_id)
-                    .count()
-                )
-            elif records_table.status == Status.DELETED:
+            records_table, created = self._recording(
+                int_id, event_dict, Status.PROCESSING
+            )
+            if not created and records_table.status == Status.DELETED:
                 records_table.status = Status.PROCESSING
 
             meetings_events_table = (
@@ -944,33 +1119,17 @@ class RapHandler(DatabaseEventHandler):
             extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
         )
 
-        records_table = (
-            self.session.query(Recordings)
-            .filter(Recordings.internal_meeting_id == int_id)
-            .first()
+        # Start as deleted since we don't yet know if
+        # this meeting was recorded or not
+        records_table, created = self._recording(
+            int_id, event._asdict(), Status.DELETED
         )
-
-        # Table recordings does not exist yet. Create it.
-        if not records_table:
-            records_table = Recordings(**event._asdict())
-
-            # Start as deleted since we don't yet know if
-            # this meeting was recorded or not
-            records_table.status = Status.DELETED
-            records_table.playback = []
-            records_table.workflow = {}
-            records_table.participants = int(
-                self.session.query(UsersEvents.id)
-                .join(MeetingsEvents)
-                .filter(MeetingsEvents.internal_meeting_id == int_id)
-                .count()
-            )
-        elif records_table.status == Status.DELETED:
+        if not created and records_table.status == Status.DELETED:
             records_table.status = Status.PROCESSING
 
         # Assume the requester server to be the new host of the recording.
         if event_type == "rap-sanity-started":
-            server_id_result = (
+            server_id_result = reference_cache.server(server_url) or (
                 self.session.query(Servers.id)
                 .filter(Servers.name == server_url)
                 .first()
@@ -1502,30 +1661,18 @@ class MeetingTransferHandler(DatabaseEventHandler):
 
 
 def _update_meeting(meetings_table):
-    """Common updates on table meetings."""
-
-    meetings_table.transfer_count = sum(
-        1 for attendee in meetings_table.attendees if attendee["role"] == "TRANSFER"
-    )
-    meetings_table.participant_count = (
-        len(meetings_table.attendees) - meetings_table.transfer_count
-    )
+    """Common updates on table meetings.
+
+    The counters of cached meetings are kept up to date by their `Attendees`.
+    Those of other rows are counted from their attendees in a single pass.
+    """
+    attendees = meetings_table.attendees
+    if not isinstance(attendees, Attendees):
+        attendees = Attendees(attendees)
+
+    for name, value in attendees.counts().items():
+        setattr(meetings_table, name, value)
     meetings_table.has_user_joined = meetings_table.participant_count != 0
-    meetings_table.moderator_count = sum(
-        1 for attendee in meetings_table.attendees if attendee["role"] == "MODERATOR"
-    )
-    meetings_table.transfer_count = sum(
-        1 for attendee in meetings_table.attendees if attendee["role"] == "TRANSFER"
-    )
-    meetings_table.listener_count = sum(
-        1 for attendee in meetings_table.attendees if attendee["is_listening_only"]
-    )
-    meetings_table.voice_participant_count = sum(
-        1 for attendee in meetings_table.attendees if attendee["has_joined_voice"]
-    )
-    meetings_table.video_count = sum(
-        1 for a in meetings_table.attendees if a["has_video"]
-    )
 
 
 def _upsert_playback(records_table, event_playback):
@@ -1567,15 +1714,21 @@ def _has_same_playback_format(playback1, playback2):
 class DataProcessor:
     """Data processor (dispatcher) of the received event."""
 
-    def __init__(self, session, logger=None):
+    def __init__(self, session, logger=None, meeting_cache=None, partial_updates=False):
         """Constructor of the DataProcessor.
 
         Parameters
         ----------
         session : sqlalchemy.Session
             Session used by SQLAlchemy to interact with the database.
+        meeting_cache : meeting_cache.MeetingCache
+            Cache of running meetings passed to the handlers, if any.
+        partial_updates : bool
+            Whether handlers write attendee changes by partial updates.
         """
         self.session = session
+        self.meeting_cache = meeting_cache
+        self.partial_updates = partial_updates
         self.logger = logger or logging.getLogger(__name__)
         logaugment.set(
             self.logger,
@@ -1614,40 +1767,40 @@ class DataProcessor:
         )
 
         if event_type == "meeting-created":
-            event_handler = MeetingCreatedHandler(self.session)
+            handler_class = MeetingCreatedHandler
 
         elif event_type == "user-joined":
-            event_handler = UserJoinedHandler(self.session)
+            handler_class = UserJoinedHandler
 
         elif event_type == "user-left":
-            event_handler = UserLeftHandler(self.session)
+            handler_class = UserLeftHandler
 
         elif event_type == "meeting-ended":
-            event_handler = MeetingEndedHandler(self.session)
+            handler_class = MeetingEndedHandler
 
         elif event_type == "user-audio-voice-enabled":
-            event_handler = UserVoiceEnabledHandler(self.session)
+            handler_class = UserVoiceEnabledHandler
 
         elif event_type == "user-audio-voice-disabled":
-            event_handler = UserVoiceDisabledHandler(self.session)
+            handler_class = UserVoiceDisabledHandler
 
         elif event_type == "user-audio-listen-only-enabled":
-            event_handler = UserListenOnlyEnabledHandler(self.session)
+            handler_class = UserListenOnlyEnabledHandler
 
         elif event_type == "user-audio-listen-only-disabled":
-            event_handler = UserListenOnlyDisabledHandler(self.session)
+            handler_class = UserListenOnlyDisabledHandler
 
         elif event_type == "user-cam-broadcast-start":
-            event_handler = UserCamBroadcastStartHandler(self.session)
+            handler_class = UserCamBroadcastStartHandler
 
         elif event_type == "user-cam-broadcast-end":
-            event_handler = UserCamBroadcastEndHandler(self.session)
+            handler_class = UserCamBroadcastEndHandler
 
         elif event_type == "user-presenter-assigned":
-            event_handler = UserPresenterAssignedHandler(self.session)
+            handler_class = UserPresenterAssignedHandler
 
         elif event_type == "user-presenter-unassigned":
-            event_handler = UserPresenterUnassignedHandler(self.session)
+            handler_class = UserPresenterUnassignedHandler
 
         elif event_type in [
             "rap-archive-started",
@@ -1660,25 +1813,25 @@ class DataProcessor:
             "rap-post-publish-started",
             "rap-post-publish-ended",
         ]:
-            event_handler = RapHandler(self.session)
+            handler_class = RapHandler
 
         elif event_type in ["rap-archive-ended"]:
-            event_handler = RapArchiveHandler(self.session)
+            handler_class = RapArchiveHandler
 
         elif event_type in ["rap-process-started", "rap-process-ended"]:
-            event_handler = RapProcessHandler(self.session)
+            handler_class = RapProcessHandler
 
         elif event_type in ["rap-publish-started", "rap-publish-ended"]:
-            event_handler = RapPublishHandler(self.session)
+            handler_class = RapPublishHandler
 
         elif event_type in ["rap-unpublished", "rap-published"]:
-            event_handler = RapPublishUnpublishHandler(self.session)
+            handler_class = RapPublishUnpublishHandler
 
         elif event_type == "rap-deleted":
-            event_handler = RapDeleteHandler(self.session)
+            handler_class = RapDeleteHandler
 
         elif event_type in ["meeting-transfer-enabled", "meeting-transfer-disabled"]:
-            event_handler = MeetingTransferHandler(self.session)
+            handler_class = MeetingTransferHandler
 
         else:
             logging_extra["code"] = "Unknown event"
@@ -1691,7 +1844,16 @@ class DataProcessor:
             )
             raise InvalidWebhookEventError(f"unknown event type '{event_type}'")
 
-        return event_handler
+        return handler_class(
+            self.session,
+            meeting_cache=self.meeting_cache,
+            partial_updates=self.partial_updates,
+        )
+
+
+def _meeting_of(event):
+    """Internal meeting id of an event, or None if it has none."""
+    return getattr(getattr(event, "event", None), "internal_meeting_id", None)
 
 
 class WebhookDataWriter(AggregatorCallback):
@@ -1707,14 +1869,85 @@ class WebhookDataWriter(AggregatorCallback):
     When finished, its `teardown` can be called to close any opened resource.
     """
 
-    def __init__(self, connector=None, logger=None):
+    def __init__(
+        self,
+        connector=None,
+        logger=None,
+        parking_timeout=0,
+        parking_size=10000,
+        parking_check_interval=1,
+        meeting_cache=False,
+        meeting_cache_size=10000,
+        meeting_cache_flush_interval=1,
+        meeting_cache_flush_size=100,
+        meeting_cache_recount_interval=60,
+        partial_updates=False,
+    ):
         """Constructor of the WebhookDataWriter.
 
         Parameters
         ----------
         connector : Database connector (driver).
             If not supplied, it will instantiate a new `PostgresConnector`.
+        parking_timeout : float
+            Maximum time (in seconds) events are parked waiting for their
+            meeting to be written. If zero, events are never parked.
+        parking_size : int
+            Maximum number of events parked by each writer thread.
+        parking_check_interval : float
+            Time (in seconds) between checks whether a meeting with parked
+            events was written by someone else.
+        meeting_cache : bool
+            Whether rows of table meetings changed by user events are cached
+            and written behind (see `meeting_cache.MeetingCache`). Events
+            whose changes are not written yet are held (see `held`).
+        meeting_cache_size : int
+            Maximum number of meetings cached by each writer thread.
+        meeting_cache_flush_interval : float
+            Maximum time (in seconds) changes to cached meetings wait to be
+            written.
+        meeting_cache_flush_size : int
+            Number of changed meetings of a writer thread above which they are
+            written right away.
+        meeting_cache_recount_interval : float
+            Time (in seconds) between recounts of the counters of cached
+            meetings from all their attendees, as a consistency check.
+        partial_updates : bool
+            Whether changes to a single attendee of an uncached meeting are
+            written without loading its row, on PostgreSQL (see
+            `partial_update`). Other databases always use the ORM.
         """
+        self.parking_timeout = parking_timeout
+        self.parking_size = parking_size
+        self.parking_check_interval = parking_check_interval
+        # Parked events are released, and events written behind committed, on
+        # quiet partitions as well.
+        idle_intervals = []
+        if parking_timeout:
+            idle_intervals.append(parking_check_interval)
+        if meeting_cache:
+            idle_intervals.append(meeting_cache_flush_interval)
+        self.idle_interval = min(idle_intervals, default=None)
+        self._local = threading.local()
+        self._parking_buffers = []
+        self.meeting_cache = meeting_cache
+        self.meeting_cache_size = meeting_cache_size
+        self.meeting_cache_flush_interval = meeting_cache_flush_interval
+        self.meeting_cache_flush_size = meeting_cache_flush_size
+        self.meeting_cache_recount_interval = meeting_cache_recount_interval
+        self.partial_updates = partial_updates
+        self._meeting_caches = []
+        self._flush_wakeup = threading.Event()
+        self._flush_stopevent = threading.Event()
+        self._flush_thread = None
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._batched_events = 0
+        self._failed_events = 0
+        self._last_batch_size = 0
+        self._last_commit_latency = 0.0
+        self._max_commit_latency = 0.0
+        self._total_commit_latency = 0.0
         self.logger = logger or logging.getLogger(__name__)
         logaugment.set(
             self.logger,
@@ -1738,6 +1971,13 @@ class WebhookDataWriter(AggregatorCallback):
             extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
         )
 
+        if self.meeting_cache:
+            self._flush_stopevent.clear()
+            self._flush_thread = threading.Thread(
+                name="meeting_cache_flush", target=self._flush_loop, daemon=True
+            )
+            self._flush_thread.start()
+
     def teardown(self):
         """Release any resources used to iteract with the database."""
         logging_extra = {
@@ -1757,19 +1997,55 @@ class WebhookDataWriter(AggregatorCallback):
             extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
         )
 
+        if self._flush_thread is not None:
+            self._flush_stopevent.set()
+            self._flush_wakeup.set()
+            self._flush_thread.join()
+            self._flush_thread = None
+
+        # The writer threads have exited: write what is still cached and parked.
+        self.flush_meetings()
+
+        with self._stats_lock:
+            parkings = list(self._parking_buffers)
+        events = [event for parking in parkings for event in parking.parked()]
+
+        if events:
+            self.logger.info(
+                f"Writing {len(events)} parked event(s) before tearing down.",
+                extra=dict(
+                    logging_extra, keywords=json.dumps(logging_extra["keywords"])
+                ),
+            )
+            try:
+                self._write_batch(events)
+            except CallbackError:
+                pass  # Already logged. They are still held, so not committed.
+            else:
+                for parking in parkings:
+                    parking.take_all()
+
+            self.flush_meetings()
+
     def run(self, data):
         """Run main logic of the writer.
 
         This method is intended to run in a separate thread by the aggregator
         whenever new data must be persisted.
 
+        If parking is enabled, the event is parked when its meeting was not
+        written yet, and it is written along with the events released from
+        parking, as in `run_batch`.
+
         data : event_mapper.WebhookEvent
             This is a single event to be handled and persisted into database.
 
         Raises
         ------
+        aggregator.aggregator.TransientCallbackError
+            If the database could not be reached or the connection was lost.
         aggregator.aggregator.CallbackError
-            If any error occur while persisting event into database.
+            If any other error occur while persisting event into database.
         """
         logging_extra = {
             "code": "WebhookDataWriter run",
@@ -1778,6 +2054,12 @@ class WebhookDataWriter(AggregatorCallback):
             "server": getattr(data, "server_url", ""),
             "event": getattr(data, "event_type", ""),
         }
+
+        parking = self._parking_buffer()
+        if parking is not None:
+            return self._run_parked(parking, [data])
+
+        cache = self._meeting_cache()
         try:
             with time_logger(
                 self.logger.info,
@@ -1786,8 +2068,14 @@ class WebhookDataWriter(AggregatorCallback):
                     logging_extra, keywords=json.dumps(logging_extra["keywords"])
                 ),
             ):
-                with session_scope() as session:
-                    DataProcessor(session).update(data)
+                with self._meetings_savepoint(cache), session_scope() as session:
+                    DataProcessor(
+                        session,
+                        meeting_cache=cache,
+                        partial_updates=self.partial_updates,
+                    ).update(data)
+                    if cache is not None:
+                        cache.hold(data)
         except sqlalchemy.exc.OperationalError as err:
             logging_extra["keywords"] = [
                 "not persisting data",
@@ -1804,7 +2092,7 @@ class WebhookDataWriter(AggregatorCallback):
                 ),
             )
 
-            raise CallbackError() from err
+            raise TransientCallbackError() from err
         except WebhookDatabaseError as err:
             logging_extra["keywords"] = [
                 "not persisting data",
@@ -1840,8 +2128,511 @@ class WebhookDataWriter(AggregatorCallback):
                 ),
             )
 
+            if is_transient(err):
+                raise TransientCallbackError() from err
             raise CallbackError() from err
 
+        self._wake_flush(cache)
+
+    def run_batch(self, data):
+        """Run main logic of the writer for several events at once.
+
+        All events are written in a single transaction, so the cost of
+        committing is paid once per batch. Each event runs inside its own
+        SAVEPOINT: if an event fails, only its changes are rolled back and the
+        remaining events of the batch are still written. If it fails because
+        of an error that may go away by itself (e.g. a deadlock or a lost
+        connection), nothing of the batch is written, so it can be retried.
+
+        If parking is enabled, events whose meeting was not written yet are
+        parked instead, and events released from parking are written along
+        with the batch.
+
+        data : list of event_mapper.WebhookEvent
+            Events to be handled and persisted into database, in order.
+
+        Raises
+        ------
+        aggregator.aggregator.TransientCallbackError
+            If an event or the batch could not be written because of an error
+            that may go away by itself, such as a lost connection. Nothing of
+            the batch was written then.
+        aggregator.aggregator.CallbackError
+            If the batch could not be committed into database.
+        """
+        parking = self._parking_buffer()
+        if parking is not None:
+            return self._run_parked(parking, data)
+
+        return self._write_batch(data)
+
+    def idle(self):
+        """Write the parked events that are due while no event arrives.
+
+        Events whose meeting was written by someone else in the meantime, or
+        parked for longer than `parking_timeout`, are written as in `run`.
+
+        Raises
+        ------
+        aggregator.aggregator.TransientCallbackError
+            As `run_batch`. The events are parked again.
+        aggregator.aggregator.CallbackError
+            As `run_batch`.
+        """
+        parking = self._parking_buffer()
+        if parking:
+            self._run_parked(parking, [])
+
+    def held(self):
+        """Events received but not written yet, which must not be committed.
+
+        These are the events parked and, with the meeting cache, the events
+        whose changes to meetings are not written yet. Called by a writer
+        thread, only its own events are returned. Otherwise (e.g. once the
+        writer threads exited), the events of all of them.
+
+        Returns
+        -------
+        list of event_mapper.WebhookEvent
+            Events received by `run`, `run_batch` or `write_batch` and not
+            written yet.
+        """
+        parking = getattr(self._local, "parking", None)
+        cache = getattr(self._local, "meeting_cache", None)
+        with self._stats_lock:
+            parkings = [parking] if parking is not None else list(self._parking_buffers)
+            caches = [cache] if cache is not None else list(self._meeting_caches)
+
+        held = [event for parking in parkings for event in parking.parked()]
+        held.extend(event for cache in caches for event in cache.held())
+
+        return held
+
+    def write_batch(self, data, before_commit=None):
+        """Write events in a single transaction, without parking any of them.
+
+        It applies events read back from the event log (see
+        `event_log.EventLogProjector`), which are already in order.
+
+        Parameters
+        ----------
+        data : list of event_mapper.WebhookEvent
+            Events to be handled and persisted into database, in order.
+        before_commit : callable
+            Called with the session right before the batch is committed (e.g.
+            to record in the same transaction how far events were written).
+            If it raises, nothing of the batch is written.
+
+        Raises
+        ------
+        aggregator.aggregator.TransientCallbackError
+            As `run_batch`.
+        aggregator.aggregator.CallbackError
+            As `run_batch`.
+        """
+        return self._write_batch(data, before_commit)
+
+    def _write_batch(self, data, before_commit=None):
+        """Write events in a single transaction, each inside a SAVEPOINT."""
+        logging_extra = {
+            "code": "WebhookDataWriter run batch",
+            "site": "WebhookDataWriter.run_batch",
+            "keywords": [
+                "WebhookDataWriter",
+                "run",
+                "batch",
+                "thread",
+                "hook",
+                "database",
+            ],
+        }
+
+        cache = self._meeting_cache()
+        failed = 0
+        try:
+            with time_logger(
+                self.logger.info,
+                "Processing batch of {size} event(s) to database took {elapsed}s.",
+                extra=dict(
+                    logging_extra, keywords=json.dumps(logging_extra["keywords"])
+                ),
+                size=len(data),
+            ):
+                with self._meetings_savepoint(cache), session_scope() as session:
+                    processor = DataProcessor(
+                        session,
+                        meeting_cache=cache,
+                        partial_updates=self.partial_updates,
+                    )
+                    for event in data:
+                        if not self._run_nested(session, processor, event, cache):
+                            failed += 1
+
+                    if before_commit is not None:
+                        before_commit(session)
+
+                    commit_start = time.time()
+                    session.commit()
+                    commit_latency = time.time() - commit_start
+        except Exception as err:
+            logging_extra["keywords"] = [
+                "not persisting data",
+                "error",
+                "run",
+                "batch",
+                "thread",
+                "hook",
+                "database",
+            ]
+            self.logger.error(
+                f"Error while committing batch of {len(data)} event(s). "
+                f"Not persisting data: {err}",
+                extra=dict(
+                    logging_extra, keywords=json.dumps(logging_extra["keywords"])
+                ),
+            )
+            self._update_batch_stats(len(data), len(data), None)
+
+            if is_transient(err):
+                raise TransientCallbackError() from err
+            raise CallbackError() from err
+
+        self._update_batch_stats(len(data), failed, commit_latency)
+        self._wake_flush(cache)
+
+        logging_extra["code"] = "Batch committed"
+        self.logger.debug(
+            f"Batch of {len(data)} event(s) committed in {commit_latency:.4f}s "
+            f"with {failed} failed event(s).",
+            extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
+        )
+
+    def stats(self):
+        """Counters of the batches written by this writer.
+
+        Returns
+        -------
+        stats : dict
+            Number of batches, events and failed events written in batches,
+            size of the last batch and commit latencies (in seconds).
+        """
+        with self._stats_lock:
+            return {
+                "batches": self._batches,
+                "events": self._batched_events,
+                "failed_events": self._failed_events,
+                "last_batch_size": self._last_batch_size,
+                "last_commit_latency": self._last_commit_latency,
+                "max_commit_latency": self._max_commit_latency,
+                "avg_commit_latency": (
+                    self._total_commit_latency / self._batches if self._batches else 0.0
+                ),
+                "parking": self._parking_stats(),
+                "meeting_cache": self._meeting_cache_stats(),
+            }
+
+    def flush_meetings(self):
+        """Write the cached meetings changed since their last flush.
+
+        Returns
+        -------
+        int
+            Number of meetings written.
+        """
+        with self._stats_lock:
+            caches = list(self._meeting_caches)
+
+        return sum(cache.flush() for cache in caches)
+
+    def _meeting_cache(self):
+        """Meeting cache of the calling thread, or None if it is disabled."""
+        if not self.meeting_cache:
+            return None
+
+        cache = getattr(self._local, "meeting_cache", None)
+        if cache is None:
+            cache = MeetingCache(
+                self.meeting_cache_size, self.meeting_cache_recount_interval
+            )
+            self._local.meeting_cache = cache
+            with self._stats_lock:
+                self._meeting_caches.append(cache)
+
+        return cache
+
+    def _meetings_savepoint(self, cache):
+        """Hold the meeting cache, if any, undoing its changes on errors."""
+        if cache is None:
+            return contextlib.nullcontext()
+
+        return cache.savepoint()
+
+    def _wake_flush(self, cache):
+        if cache is not None and cache.dirty_count() >= self.meeting_cache_flush_size:
+            self._flush_wakeup.set()
+
+    def _flush_loop(self):
+        while not self._flush_stopevent.is_set():
+            self._flush_wakeup.wait(self.meeting_cache_flush_interval)
+            self._flush_wakeup.clear()
+            if not self._flush_stopevent.is_set():
+                self.flush_meetings()
+
+    def _meeting_cache_stats(self):
+        stats = {
+            "meetings": 0,
+            "dirty": 0,
+            "hits": 0,
+            "loads": 0,
+            "flushes": 0,
+            "flushed": 0,
+            "flush_errors": 0,
+            "recounts": 0,
+            "drifts": 0,
+        }
+        for cache in self._meeting_caches:
+            for name, value in cache.stats().items():
+                stats[name] += value
+
+        return stats
+
+    def _parking_buffer(self):
+        """Parking buffer of the calling thread, or None if parking is disabled."""
+        if not self.parking_timeout:
+            return None
+
+        parking = getattr(self._local, "parking", None)
+        if parking is None:
+            parking = ParkingBuffer(
+                self.parking_timeout, self.parking_check_interval, self.parking_size
+            )
+            self._local.parking = parking
+            with self._stats_lock:
+                self._parking_buffers.append(parking)
+
+        return parking
+
+    def _parking_stats(self):
+        stats = {
+            "parked_events": 0,
+            "parked_meetings": 0,
+            "total_parked": 0,
+            "expired": 0,
+            "evicted": 0,
+        }
+        for parking in self._parking_buffers:
+            for name, value in parking.stats().items():
+                stats[name] += value
+
+        return stats
+
+    def _run_parked(self, parking, data):
+        """Write events, parking those whose meeting was not written yet.
+
+        Events released from parking are written in the same batch. If the
+        batch fails transiently, parking is put back as it was, so `data` can
+        be retried as a whole.
+        """
+        ready, released, parked = self._admit(parking, data)
+        if not ready:
+            return
+
+        try:
+            self._write_batch(ready)
+        except TransientCallbackError:
+            for key in reversed(parked):
+                parking.unpark(key)
+            for key, events in reversed(released):
+                parking.restore(key, events)
+            raise
+
+        for event in ready:
+            if event.event_type == "meeting-created":
+                parking.mark_known(_meeting_of(event))
+
+    def _admit(self, parking, data):
+        """Sort events into those to write now and those to park.
+
+        Events of a meeting with events parked are parked behind them without
+        querying the database. Other events are parked if their meeting is
+        neither known to exist nor found in the database. A single query
+        checks all such meetings and the parked meetings due to be checked.
+
+        Returns
+        -------
+        (ready, released, parked) : (list, list, list)
+            Events to write now in order, events released from parking as
+            (meeting, events) and meetings of the events just parked.
+        """
+        logging_extra = {
+            "code": "Parking",
+            "site": "WebhookDataWriter._admit",
+            "keywords": ["parking", "meeting", "warning", "hook", "database"],
+        }
+
+        expired, checks = parking.due()
+        keys = set(checks)
+        for event in data:
+            key = _meeting_of(event)
+            if (
+                key
+                and event.event_type != "meeting-created"
+                and key not in parking
+                and not parking.is_known(key)
+            ):
+                keys.add(key)
+
+        found = self._existing_meetings(keys) if keys else set()
+
+        ready = []
+        released = []
+        parked = []
+
+        def release(key):
+            events = parking.release(key)
+            if events:
+                released.append((key, events))
+                ready.extend(events)
+
+            return events
+
+        def give_up(key, events, reason):
+            self.logger.warn(
+                f"Meeting {key} not found {reason}. "
+                f"Writing its {len(events)} parked event(s) anyway.",
+                extra=dict(
+                    logging_extra, keywords=json.dumps(logging_extra["keywords"])
+                ),
+            )
+
+        for key in expired:
+            parking.mark_known(key)
+            give_up(key, release(key), "in time")
+
+        for key in checks:
+            if key in found:
+                parking.mark_known(key)
+                release(key)
+
+        for event in data:
+            key = _meeting_of(event)
+            if not key:
+                ready.append(event)
+            elif event.event_type == "meeting-created":
+                ready.append(event)
+                release(key)
+            elif key in parking or (key not in found and not parking.is_known(key)):
+                for evicted_key, events in parking.park(key, event):
+                    parking.mark_known(evicted_key)
+                    released.append((evicted_key, events))
+                    ready.extend(events)
+                    give_up(evicted_key, events, "before parking filled up")
+                parked.append(key)
+            else:
+                parking.mark_known(key)
+                ready.append(event)
+
+        return ready, released, parked
+
+    def _existing_meetings(self, keys):
+        """Meetings among `keys` written to the database.
+
+        Raises
+        ------
+        aggregator.aggregator.TransientCallbackError
+            If the database could not be queried because of an error that may
+            go away by itself.
+        aggregator.aggregator.CallbackError
+            If the database could not be queried.
+        """
+        try:
+            with session_scope() as session:
+                rows = (
+                    session.query(MeetingsEvents.internal_meeting_id)
+                    .filter(MeetingsEvents.internal_meeting_id.in_(keys))
+                    .all()
+                )
+        except Exception as err:
+            logging_extra = {
+                "code": "Parking",
+                "site": "WebhookDataWriter._existing_meetings",
+                "keywords": ["parking", "meeting", "error", "hook", "database"],
+            }
+            self.logger.error(
+                f"Error while looking up meetings of events: {err}",
+                extra=dict(
+                    logging_extra, keywords=json.dumps(logging_extra["keywords"])
+                ),
+            )
+
+            if is_transient(err):
+                raise TransientCallbackError() from err
+            raise CallbackError() from err
+
+        return {row[0] for row in rows}
+
+    def _run_nested(self, session, processor, event, cache=None):
+        """Process a single event of a batch inside a SAVEPOINT.
+
+        Changes of the event to the meetings of `cache`, if any, are undone
+        along with the SAVEPOINT.
+
+        Returns
+        -------
+        bool
+            True if the event was processed successfully. False otherwise.
+
+        Raises
+        ------
+        Exception
+            The error of the event, if it may go away by itself (see
+            `database.is_transient`), so the whole batch is retried instead
+            of being committed without the event.
+        """
+        logging_extra = {
+            "code": "WebhookDataWriter run nested",
+            "site": "WebhookDataWriter._run_nested",
+            "keywords": ["not persisting data", "error", "batch", "savepoint"],
+            "server": getattr(event, "server_url", ""),
+            "event": getattr(event, "event_type", ""),
+        }
+
+        savepoint = session.begin_nested()
+        try:
+            with self._meetings_savepoint(cache):
+                processor.update(event)
+                if cache is not None:
+                    cache.hold(event)
+                if savepoint.is_active:
+                    savepoint.commit()
+        except Exception as err:
+            if savepoint.is_active:
+                savepoint.rollback()
+            if is_transient(err):
+                raise
+
+            self.logger.error(
+                f"Error while persisting event of batch. Not persisting it: {err}",
+                extra=dict(
+                    logging_extra, keywords=json.dumps(logging_extra["keywords"])
+                ),
+            )
+
+            return False
+
+        return True
+
+    def _update_batch_stats(self, size, failed, commit_latency):
+        with self._stats_lock:
+            self._batches += 1
+            self._batched_events += size
+            self._failed_events += failed
+            self._last_batch_size = size
+            if commit_latency is not None:
+                self._last_commit_latency = commit_latency
+                self._max_commit_latency = max(self._max_commit_latency, commit_latency)
+                self._total_commit_latency += commit_latency
+
 
 class AuthenticationHandler:
     """Provide a way to get server data from database."""
@@ -1864,18 +2655,26 @@ class AuthenticationHandler:
             keywords="null",
         )
 
-    def secret(self, server):
+    def secret(self, server, raise_exception=False):
         """Get a shared secret for a given server in the database.
 
         Parameters
         ----------
         server : str
             Server for which it should get a token from database.
+        raise_exception : bool
+            If True, errors while querying the database are raised instead of
+            being handled as if the server was not found.
 
         Returns
         -------
         token : str
             Token of the server as retrieved from database.
+
+        Raises
+        ------
+        DatabaseNotReadyError
+            If `raise_exception` is True and the database could not be queried.
         """
         logging_extra = {
             "code": "Get secret",
@@ -1884,6 +2683,8 @@ class AuthenticationHandler:
             "keywords": ["shared secret", "authentication", "database"],
         }
 
+        # Read from the database: secrets are cached by `cache.SecretCache`,
+        # whose reloads must see rotated or removed secrets right away.
         found_secret = None
         with session_scope() as session:
             try:
@@ -1905,6 +2706,8 @@ class AuthenticationHandler:
                         logging_extra, keywords=json.dumps(logging_extra["keywords"])
                     ),
                 )
+                if raise_exception:
+                    raise DatabaseNotReadyError() from err
                 server = None
             except Exception as err:
                 logging_extra["code"] = "Unknown error"
@@ -1921,6 +2724,8 @@ class AuthenticationHandler:
                         logging_extra, keywords=json.dumps(logging_extra["keywords"])
                     ),
                 )
+                if raise_exception:
+                    raise DatabaseNotReadyError() from err
                 server = None
 
             if server:
@@ -1929,6 +2734,53 @@ class AuthenticationHandler:
 
         return found_secret
 
+    def secrets(self):
+        """Get the shared secrets of all servers in the database at once.
+
+        Returns
+        -------
+        secrets : dict
+            Secrets retrieved from database keyed by server name.
+
+        Raises
+        ------
+        DatabaseNotReadyError
+            If servers could not be retrieved from database.
+        """
+        logging_extra = {
+            "code": "Get secrets",
+            "site": "AuthenticationHandler.secrets",
+            "keywords": ["shared secret", "authentication", "database", "bulk"],
+        }
+
+        with session_scope() as session:
+            try:
+                rows = session.query(Servers.name, Servers.secret).all()
+            except sqlalchemy.exc.OperationalError as err:
+                logging_extra["code"] = "Database error"
+                logging_extra["keywords"] += ["exception", "error"]
+                self.logger.error(
+                    f"Operational error on database while loading secrets: {err}",
+                    extra=dict(
+                        logging_extra, keywords=json.dumps(logging_extra["keywords"])
+                    ),
+                )
+
+                raise DatabaseNotReadyError()
+            except Exception as err:
+                logging_extra["code"] = "Unknown error"
+                logging_extra["keywords"] += ["exception", "warning"]
+                self.logger.warn(
+                    f"Unknown error while loading secrets: {err}",
+                    extra=dict(
+                        logging_extra, keywords=json.dumps(logging_extra["keywords"])
+                    ),
+                )
+
+                raise DatabaseNotReadyError()
+
+        return {row.name: row.secret for row in rows if row.name and row.secret}
+
 
 class WebhookServerHandler:
     """Provide a way to get all available servers from database."""
@@ -94,7 +94,7 @@ class Meetings(Base):
     __tablename__ = "meetings"
 
     id = Column(Integer, primary_key=True)
-    meeting_event_id = Column(Integer, ForeignKey("meetings_events.id"))
+    meeting_event_id = Column(Integer, ForeignKey("meetings_events.id"), index=True)
     meeting_event = relationship("MeetingsEvents")
 
     created_at = Column(DateTime, default=datetime.datetime.now)
@@ -113,8 +113,8 @@ class Meetings(Base):
 
     m_shared_secret_guid = Column(String)
     m_institution_guid = Column(String)
-    ext_meeting_id = Column(String)
-    int_meeting_id = Column(String)
+    ext_meeting_id = Column(String, index=True)
+    int_meeting_id = Column(String, index=True)
     transfer = Column(Boolean)
     transfer_count = Column(Integer)
 
@@ -244,7 +244,7 @@ class MeetingsEvents(Base):
 
     id = Column(Integer, primary_key=True)
 
-    shared_secret_guid = Column(String)  # Index?
+    shared_secret_guid = Column(String, index=True)
     shared_secret_name = Column(String(50))
     server_guid = Column(String)
     server_url = Column(String(255))
@@ -255,9 +255,9 @@ class MeetingsEvents(Base):
         DateTime, default=datetime.datetime.now, onupdate=datetime.datetime.now
     )
 
-    external_meeting_id = Column(String(255))  # Index?
-    internal_meeting_id = Column(String(255), unique=True)  # Index?
-    parent_meeting_id = Column(String(255))  # Index?
+    external_meeting_id = Column(String(255), index=True)
+    internal_meeting_id = Column(String(255), unique=True)
+    parent_meeting_id = Column(String(255), index=True)
     name = Column(String(255))
     create_time = Column(BigInteger)
     create_date = Column(String(50))
@@ -535,7 +535,7 @@ class UsersEvents(Base):
     __tablename__ = "users_events"
 
     id = Column(Integer, primary_key=True)
-    meeting_event_id = Column(Integer, ForeignKey("meetings_events.id"))
+    meeting_event_id = Column(Integer, ForeignKey("meetings_events.id"), index=True)
     meeting_event = relationship("MeetingsEvents")
 
     created_at = Column(DateTime, default=datetime.datetime.now)
@@ -613,7 +613,7 @@ class Servers(Base):
     id = Column(Integer, primary_key=True)
     guid = Column(String, unique=True)
     institution_guid = Column(String, ForeignKey("institutions.guid"), unique=True)
-    name = Column(String(50))
+    name = Column(String(50), index=True)
     secret = Column(String(50))
     ip = Column(String(15))
     enabled = Column(Boolean)
@@ -675,7 +675,7 @@ class SharedSecrets(Base):
     id = Column(Integer, primary_key=True)
     guid = Column(String, unique=True)
     institution_guid = Column(String, ForeignKey("institutions.guid"), unique=True)
-    name = Column(String)
+    name = Column(String, index=True)
     secret = Column(String)
     scope = Column(String)
     created_at = Column(DateTime, default=datetime.datetime.now)
@@ -9,11 +9,15 @@ import falcon
 import logaugment
 
 import mconf_aggr.aggregator.cfg as cfg
-from mconf_aggr.aggregator.aggregator import PublishError
+from mconf_aggr.aggregator.aggregator import ChannelFull, PublishError
 from mconf_aggr.aggregator.utils import RequestTimeLogger, time_logger
-from mconf_aggr.webhook.database_handler import AuthenticationHandler
+from mconf_aggr.webhook.cache import secret_cache
 from mconf_aggr.webhook.event_mapper import map_webhook_event
-from mconf_aggr.webhook.exceptions import RequestProcessingError, WebhookError
+from mconf_aggr.webhook.exceptions import (
+    RequestProcessingError,
+    ServiceUnavailableError,
+    WebhookError,
+)
 
 """Falcon follows the REST architectural style, meaning (among
 other things) that you think in terms of resources and state
@@ -150,7 +154,7 @@ class AuthMiddleware:
         matches exactly the token received. Otherwise, it returns False.
         """
         if not handler:
-            handler = AuthenticationHandler()
+            handler = secret_cache
 
         secret = handler.secret(host)
 
@@ -171,16 +175,25 @@ class WebhookEventListener:
     It could handle POST, GET, PUT and DELETE requests as well.
     """
 
-    def __init__(self, event_handler, logger=None):
+    def __init__(
+        self, event_handler, retry_after=5, drain_coordinator=None, logger=None
+    ):
         """Constructor of the WebhookEventListener.
 
         Parameters
         ----------
         event_handler : WebhookEventHandler.
+        retry_after : int
+            Time (in seconds) the sender is asked to wait before sending again
+            events that could not be accepted.
+        drain_coordinator : drain.DrainCoordinator
+            If supplied, events are refused while it is draining the aggregator.
         logger : logging.Logger
             If not supplied, it will instantiate a new logger from __name__.
         """
         self.event_handler = event_handler
+        self.retry_after = retry_after
+        self.drain_coordinator = drain_coordinator
         self.logger = logger or logging.getLogger(__name__)
         logaugment.set(
             self.logger,
@@ -235,7 +248,8 @@ class WebhookEventListener:
             )
 
             # Always responds with HTTP status code 200 in order to prevent
-            # the sending webhook endpoint from stopping requesting.
+            # the sending webhook endpoint from stopping requesting, except
+            # when events must be sent again later.
             try:
                 logging_extra["code"] = "Processing webhook event"
                 self.logger.debug(
@@ -244,7 +258,23 @@ class WebhookEventListener:
                         logging_extra, keywords=json.dumps(logging_extra["keywords"])
                     ),
                 )
+                if self.drain_coordinator and self.drain_coordinator.draining:
+                    raise ServiceUnavailableError("Shutting down")
+
                 self.event_handler.process_event(server_url, event)
+            except ServiceUnavailableError as err:
+                logging_extra["code"] = "Service unavailable"
+                logging_extra["keywords"] += ["backpressure", "warning"]
+                self.logger.warn(
+                    f"Event not accepted, asking to retry later: {err}",
+                    extra=dict(
+                        logging_extra, keywords=json.dumps(logging_extra["keywords"])
+                    ),
+                )
+                response = WebhookResponse(str(err))
+                resp.text = json.dumps(response.error)
+                resp.status = falcon.HTTP_503
+                resp.set_header("Retry-After", str(self.retry_after))
             except WebhookError as err:
                 logging_extra["code"] = "Webhook error"
                 logging_extra["keywords"] += ["exception", "error"]
@@ -346,6 +376,9 @@ class WebhookEventHandler:
         Raises
         Exception
             If any error occur during event handling.
+        ServiceUnavailableError
+            If the channel has no room for the events of the message. None of
+            them was published, so the message can be sent again as a whole.
 
         Parameters
         ----------
@@ -403,7 +436,9 @@ class WebhookEventHandler:
 
         deprecated_events = cfg.config["MCONF_WEBHOOK_DEPRECATED_EVENTS"]
 
-        # We can handle more than one event at once.
+        # We can handle more than one event at once. They are all mapped
+        # before any is published, so either all or none of them are.
+        accepted = []
         for webhook_event in decoded_events:
             with time_logger(
                 self.logger.info,
@@ -447,41 +482,7 @@ class WebhookEventHandler:
                         )
 
                     else:
-                        try:
-                            logging_extra["event"] = webhook_event.event_type
-                            logging_extra["code"] = "Publishing webhook event"
-                            logging_extra["keywords"] = [
-                                "WebhookEventHandler",
-                                "parse",
-                                "publish",
-                                "data",
-                                "process",
-                                "to aggregator",
-                                f"channel={self.channel}",
-                            ]
-                            self.logger.debug(
-                                "Publishing event.",
-                                extra=dict(
-                                    logging_extra,
-                                    keywords=json.dumps(logging_extra["keywords"]),
-                                ),
-                            )
-                            self.publisher.publish(webhook_event, channel=self.channel)
-
-                        except PublishError:
-                            logging_extra["code"] = "Publish error"
-                            logging_extra["keywords"] = [
-                                "WebhookEventHandler",
-                                "parse",
-                                "publish",
-                                "data",
-                                "process",
-                                "to aggregator",
-                                "exception",
-                                "error",
-                            ]
-                            self.logger.error("Something went wrong while publishing.")
-                            continue
+                        accepted.append(webhook_event)
 
                 else:
                     logging_extra["code"] = "Not publishing"
@@ -507,6 +508,47 @@ class WebhookEventHandler:
                     "publish",
                 ]
 
+        if not accepted:
+            return
+
+        try:
+            logging_extra["code"] = "Publishing webhook events"
+            logging_extra["keywords"] = [
+                "WebhookEventHandler",
+                "parse",
+                "publish",
+                "data",
+                "process",
+                "to aggregator",
+                f"channel={self.channel}",
+            ]
+            self.logger.debug(
+                f"Publishing {len(accepted)} event(s).",
+                extra=dict(
+                    logging_extra, keywords=json.dumps(logging_extra["keywords"])
+                ),
+            )
+            self.publisher.publish_many(accepted, channel=self.channel)
+
+        except ChannelFull as err:
+            raise ServiceUnavailableError(
+                "Too many events waiting to be processed"
+            ) from err
+
+        except PublishError:
+            logging_extra["code"] = "Publish error"
+            logging_extra["keywords"] = [
+                "WebhookEventHandler",
+                "parse",
+                "publish",
+                "data",
+                "process",
+                "to aggregator",
+                "exception",
+                "error",
+            ]
+            self.logger.error("Something went wrong while publishing.")
+
     def _decode(self, event):
         return json.loads(event)
 
@@ -0,0 +1,572 @@
+"""This module provides the append-only log of webhook events.
+
+By default, each event is applied by `WebhookDataWriter` to tables meetings,
+meetings_events, users_events and recordings as soon as it is received, so
+intake is as slow as the handlers, and the event itself is not kept. In event
+log mode, `EventLogWriter` only appends the events received to table
+event_log, a whole batch in a single multi-row INSERT. `EventLogProjector`
+reads the log back in order and applies its events with `WebhookDataWriter`,
+on its own pace.
+
+The projector tracks how far it read the log as the position of its consumer
+in table event_log_offsets. The position is advanced in the transaction that
+applies the events, so events are applied once even if the projector stops
+halfway. With the meeting cache of the writer, changes of events to meetings
+are written later (see `meeting_cache.MeetingCache`): the position then stops
+before the first event whose changes are not written yet, and moves past it
+once they are, so the events after it are applied again after a crash.
+Projections are rebuilt by reading the log again from the start, with a new
+consumer or after `EventLogProjector.reset`.
+
+On PostgreSQL, table event_log is partitioned by month of reception, so old
+months can be detached or dropped as a whole. Partitions are created by the
+writer as needed. Appends are serialized by an advisory lock held until they
+are committed: ids are then committed in order, and the projector never skips
+an event committed after one with a greater id.
+
+The tables are created by migration 2 (see `migrations.versions`).
+"""
+import datetime
+import json
+import logging
+import threading
+from collections import deque
+
+import logaugment
+from sqlalchemy import (
+    JSON,
+    BigInteger,
+    Column,
+    DateTime,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    func,
+    select,
+    text,
+)
+from sqlalchemy.dialects.postgresql import JSONB
+
+from mconf_aggr.aggregator.aggregator import (
+    AggregatorCallback,
+    CallbackError,
+    TransientCallbackError,
+)
+from mconf_aggr.webhook.database import DatabaseConnector, is_transient
+from mconf_aggr.webhook.event_mapper import (
+    webhook_event_from_dict,
+    webhook_event_to_dict,
+)
+from mconf_aggr.webhook.exceptions import (
+    InvalidWebhookEventError,
+    ProjectionConflictError,
+)
+
+session_scope = DatabaseConnector.get_session_scope()
+
+# Arbitrary key of the advisory lock held while appending to the log.
+APPEND_LOCK_KEY = 2_031_061_843
+
+metadata = MetaData()
+
+event_log_table = Table(
+    "event_log",
+    metadata,
+    Column("id", BigInteger().with_variant(Integer, "sqlite"), primary_key=True),
+    Column("received_at", DateTime, nullable=False),
+    Column("event_type", String(64), nullable=False),
+    Column("server_url", String(255)),
+    Column("internal_meeting_id", String(255)),
+    Column("payload", JSON().with_variant(JSONB, "postgresql"), nullable=False),
+)
+
+# On PostgreSQL, the primary key must include the key of the partitions.
+EVENT_LOG_POSTGRESQL = """
+CREATE TABLE IF NOT EXISTS event_log (
+    id bigserial NOT NULL,
+    received_at timestamp without time zone NOT NULL,
+    event_type varchar(64) NOT NULL,
+    server_url varchar(255),
+    internal_meeting_id varchar(255),
+    payload jsonb NOT NULL,
+    PRIMARY KEY (id, received_at)
+) PARTITION BY RANGE (received_at)
+"""
+
+offsets_table = Table(
+    "event_log_offsets",
+    metadata,
+    Column("consumer", String(64), primary_key=True),
+    Column("position", BigInteger, nullable=False),
+    Column(
+        "updated_at",
+        DateTime,
+        default=datetime.datetime.now,
+        onupdate=datetime.datetime.now,
+    ),
+)
+
+
+def partition_of(received_at):
+    """Partition of table event_log of the events received at a time.
+
+    Parameters
+    ----------
+    received_at : datetime.datetime
+
+    Returns
+    -------
+    name : str
+        Name of the partition (e.g. event_log_202610 for October 2026).
+    start : datetime.date
+        First day of the month of the partition.
+    end : datetime.date
+        First day of the following month.
+    """
+    start = received_at.date().replace(day=1)
+    end = (start + datetime.timedelta(days=32)).replace(day=1)
+
+    return f"event_log_{start:%Y%m}", start, end
+
+
+class EventLogWriter(AggregatorCallback):
+    """Writer appending webhook events to table event_log."""
+
+    def __init__(self, logger=None):
+        """Constructor of the EventLogWriter.
+
+        Parameters
+        ----------
+        logger : logging.Logger
+            If not supplied, it will instantiate a new logger from __name__.
+        """
+        self._partitions = set()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._events = 0
+        self._failed_batches = 0
+        self.logger = logger or logging.getLogger(__name__)
+        logaugment.set(
+            self.logger,
+            code="",
+            site="EventLogWriter",
+            server="",
+            event="",
+            keywords="null",
+        )
+
+    def setup(self):
+        """Nothing to set up: sessions are opened for each batch."""
+        pass
+
+    def teardown(self):
+        """Nothing to tear down: sessions are closed after each batch."""
+        pass
+
+    def run(self, data):
+        """Append a single event to the log, as `run_batch`."""
+        self.run_batch([data])
+
+    def run_batch(self, data):
+        """Append events to the log, in order, in a single INSERT.
+
+        Parameters
+        ----------
+        data : list of event_mapper.WebhookEvent
+            Events to be appended.
+
+        Raises
+        ------
+        aggregator.aggregator.TransientCallbackError
+            If the database could not be reached or the connection was lost.
+        aggregator.aggregator.CallbackError
+            If the events could not be appended for any other reason. None of
+            them was appended then.
+        """
+        logging_extra = {
+            "code": "EventLogWriter run batch",
+            "site": "EventLogWriter.run_batch",
+            "keywords": ["EventLogWriter", "event log", "batch", "database"],
+        }
+
+        received_at = datetime.datetime.now()
+        rows = [
+            {
+                "received_at": received_at,
+                "event_type": event.event_type,
+                "server_url": event.server_url,
+                "internal_meeting_id": getattr(
+                    event.event, "internal_meeting_id", None
+                ),
+                "payload": webhook_event_to_dict(event),
+            }
+            for event in data
+        ]
+
+        try:
+            with session_scope() as session:
+                connection = session.connection()
+                if connection.dialect.name == "postgresql":
+                    connection.execute(
+                        text("SELECT pg_advisory_xact_lock(:key)"),
+                        {"key": APPEND_LOCK_KEY},
+                    )
+                    self._create_partitions(connection, received_at)
+                connection.execute(event_log_table.insert(), rows)
+        except Exception as err:
+            with self._stats_lock:
+                self._failed_batches += 1
+
+            logging_extra["keywords"] += ["not persisting data", "error"]
+            self.logger.error(
+                f"Error while appending {len(data)} event(s) to the event log. "
+                f"Not persisting data: {err}",
+                extra=dict(
+                    logging_extra, keywords=json.dumps(logging_extra["keywords"])
+                ),
+            )
+
+            if is_transient(err):
+                raise TransientCallbackError() from err
+            raise CallbackError() from err
+
+        with self._stats_lock:
+            self._batches += 1
+            self._events += len(data)
+
+    def stats(self):
+        """Counters of the writer.
+
+        Returns
+        -------
+        stats : dict
+            Number of batches and events appended, and of batches failed.
+        """
+        with self._stats_lock:
+            return {
+                "batches": self._batches,
+                "events": self._events,
+                "failed_batches": self._failed_batches,
+            }
+
+    def _create_partitions(self, connection, received_at):
+        # The partition of the next month is created ahead, so that writers do
+        # not race to create it when the month turns.
+        next_month = partition_of(received_at)[2]
+        for day in (
+            received_at,
+            datetime.datetime.combine(next_month, datetime.time()),
+        ):
+            name, start, end = partition_of(day)
+            if name in self._partitions:
+                continue
+
+            connection.exec_driver_sql(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF event_log "
+                f"FOR VALUES FROM ('{start}') TO ('{end}')"
+            )
+            self._partitions.add(name)
+
+    def __repr__(self):
+        return "{!s}()".format(self.__class__.__name__)
+
+
+class EventLogProjector:
+    """Consumer of the event log applying its events with `WebhookDataWriter`.
+
+    A single projector must run for each consumer. Another one would fail to
+    advance the position of the consumer and retry, but it would only waste
+    work.
+    """
+
+    def __init__(
+        self,
+        writer,
+        consumer="projection",
+        batch_size=1000,
+        poll_interval=0.5,
+        logger=None,
+    ):
+        """Constructor of the EventLogProjector.
+
+        Parameters
+        ----------
+        writer : database_handler.WebhookDataWriter
+            Writer applying the events read from the log.
+        consumer : str
+            Name of the consumer whose position is tracked.
+        batch_size : int
+            Maximum number of events applied in each transaction.
+        poll_interval : float
+            Time (in seconds) between reads of the log once all of it was
+            applied, or after an error.
+        logger : logging.Logger
+            If not supplied, it will instantiate a new logger from __name__.
+        """
+        self.writer = writer
+        self.consumer = consumer
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._position = 0
+        self._cursor = None  # Id of the last event applied.
+        self._pending = deque()  # (id, event) applied after the position.
+        self._head = 0
+        self._projected = 0
+        self._invalid = 0
+        self._errors = 0
+        self._stopevent = threading.Event()
+        self._project_thread = None
+        self.logger = logger or logging.getLogger(__name__)
+        logaugment.set(
+            self.logger,
+            code="",
+            site="EventLogProjector",
+            server="",
+            event="",
+            keywords="null",
+        )
+
+    def start(self):
+        """Set the writer up and start applying the log in background."""
+        self.writer.setup()
+
+        self._stopevent.clear()
+        self._project_thread = threading.Thread(
+            name="event_log_projector", target=self._project_loop, daemon=True
+        )
+        self._project_thread.start()
+
+    def stop(self):
+        """Stop applying the log and tear the writer down.
+
+        The position is advanced past the events written by the teardown.
+        """
+        self._stopevent.set()
+
+        if self._project_thread is not None:
+            self._project_thread.join()
+            self._project_thread = None
+
+        self.writer.teardown()
+
+        try:
+            with session_scope() as session:
+                self._release(session, self._read_position(session))
+        except Exception as err:
+            logging_extra = {
+                "code": "Event log projection",
+                "site": "EventLogProjector.stop",
+                "keywords": ["EventLogProjector", "event log", "projection", "error"],
+            }
+            self.logger.error(
+                f"Error while advancing the position of the consumer: {err}",
+                extra=dict(
+                    logging_extra, keywords=json.dumps(logging_extra["keywords"])
+                ),
+            )
+
+    def project(self):
+        """Apply the next events of the log, after the position of the consumer.
+
+        The position is advanced in the same transaction, up to the first
+        event held by the writer (see `WebhookDataWriter.held`). Events
+        applied after it are not read again, unless the position is moved by
+        someone else. Once no event is left to read, the position is advanced
+        past the events released by the writer since.
+
+        Returns
+        -------
+        int
+            Number of events read from the log (0 if all of it was applied).
+
+        Raises
+        ------
+        aggregator.aggregator.CallbackError
+            If the events could not be applied. The position is kept then.
+        """
+        logging_extra = {
+            "code": "Event log projection",
+            "site": "EventLogProjector.project",
+            "keywords": ["EventLogProjector", "event log", "projection", "database"],
+        }
+
+        with session_scope() as session:
+            position = self._read_position(session)
+            if self._cursor is None or position != self._position:
+                # First read, or the position was moved by someone else.
+                self._cursor = position
+                self._pending.clear()
+            self._head = session.execute(
+                select(func.max(event_log_table.c.id))
+            ).scalar()
+            rows = session.execute(
+                select(event_log_table.c.id, event_log_table.c.payload)
+                .where(event_log_table.c.id > self._cursor)
+                .order_by(event_log_table.c.id)
+                .limit(self.batch_size)
+            ).all()
+            self._position = position
+
+            if not rows:
+                self._release(session, position)
+                return 0
+
+        events = []
+        pending = deque(self._pending)
+        for row in rows:
+            try:
+                events.append(webhook_event_from_dict(row.payload))
+                pending.append((row.id, events[-1]))
+            except InvalidWebhookEventError as err:
+                self._invalid += 1
+                self.logger.warn(
+                    f"Skipping event {row.id} of the event log: {err}",
+                    extra=dict(
+                        logging_extra,
+                        keywords=json.dumps(logging_extra["keywords"] + ["warning"]),
+                    ),
+                )
+
+        last = rows[-1].id
+        advanced = []
+
+        def before_commit(session):
+            advanced.append(self._written(pending, last))
+            self._advance(session, position, advanced[0])
+
+        self.writer.write_batch(events, before_commit=before_commit)
+
+        self._position = advanced[0]
+        self._cursor = last
+        self._pending = pending
+        self._projected += len(events)
+
+        return len(rows)
+
+    def reset(self, position=0):
+        """Move the consumer to a position, e.g. 0 to rebuild the projection.
+
+        Parameters
+        ----------
+        position : int
+            Id of the last event considered applied.
+        """
+        with session_scope() as session:
+            self._read_position(session)
+            session.execute(
+                offsets_table.update()
+                .where(offsets_table.c.consumer == self.consumer)
+                .values(position=position)
+            )
+
+        self._position = position
+        self._cursor = position
+        self._pending.clear()
+
+    def stats(self):
+        """Counters of the projector.
+
+        Returns
+        -------
+        stats : dict
+            Position of the consumer and last id of the log when last read,
+            how many events it is behind, and number of events applied,
+            skipped as invalid and errors.
+        """
+        head = self._head or 0
+        return {
+            "consumer": self.consumer,
+            "position": self._position,
+            "head": head,
+            "lag": max(head - self._position, 0),
+            "projected": self._projected,
+            "invalid": self._invalid,
+            "errors": self._errors,
+        }
+
+    def _read_position(self, session):
+        position = session.execute(
+            select(offsets_table.c.position).where(
+                offsets_table.c.consumer == self.consumer
+            )
+        ).scalar()
+        if position is None:
+            session.execute(
+                offsets_table.insert().values(consumer=self.consumer, position=0)
+            )
+            position = 0
+
+        return position
+
+    def _written(self, pending, last):
+        """Position up to which the events applied are written.
+
+        Events not held by the writer are dropped from the head of `pending`,
+        up to the first one held.
+
+        Returns
+        -------
+        int
+            Id before the first event held, or `last` if none is held.
+        """
+        held = {id(event) for event in self.writer.held()}
+        while pending and id(pending[0][1]) not in held:
+            pending.popleft()
+
+        return pending[0][0] - 1 if pending else last
+
+    def _release(self, session, position):
+        """Advance the position past the events applied released since."""
+        if self._cursor is None or position != self._position:
+            return
+
+        written = self._written(self._pending, self._cursor)
+        if written != position:
+            self._advance(session, position, written)
+            self._position = written
+
+    def _advance(self, session, position, last):
+        advanced = session.execute(
+            offsets_table.update()
+            .where(
+                offsets_table.c.consumer == self.consumer,
+                offsets_table.c.position == position,
+            )
+            .values(position=last)
+        )
+        if advanced.rowcount != 1:
+            raise ProjectionConflictError(
+                f"Position of consumer '{self.consumer}' was moved from {position}."
+            )
+
+    def _project_loop(self):
+        logging_extra = {
+            "code": "Event log projection",
+            "site": "EventLogProjector._project_loop",
+            "keywords": ["EventLogProjector", "event log", "projection", "error"],
+        }
+
+        while not self._stopevent.is_set():
+            try:
+                read = self.project()
+            except CallbackError:
+                self._errors += 1  # Already logged by the writer.
+                read = 0
+            except Exception as err:
+                self._errors += 1
+                self.logger.error(
+                    f"Error while reading the event log: {err}",
+                    extra=dict(
+                        logging_extra, keywords=json.dumps(logging_extra["keywords"])
+                    ),
+                )
+                read = 0
+
+            if read < self.batch_size:
+                self._stopevent.wait(self.poll_interval)
+
+    def __repr__(self):
+        return "{!s}(consumer={!r}, position={!r})".format(
+            self.__class__.__name__, self.consumer, self._position
+        )
@@ -184,484 +184,433 @@ MeetingTransferEvent = collections.namedtuple(
 )
 
 
-def map_webhook_event(event):
-    """Map from a webhook event received to the corresponding data structure.
+"""Internal event representations by name, used to decode serialized events."""
+_EVENT_TYPES = {
+    event_class.__name__: event_class
+    for event_class in (
+        MeetingCreatedEvent,
+        MeetingEndedEvent,
+        UserJoinedEvent,
+        UserLeftEvent,
+        UserVoiceEnabledEvent,
+        UserEvent,
+        RapProcessEvent,
+        RapPublishEvent,
+        RapPublishEndedEvent,
+        RapPublishUnpublishHandler,
+        RapDeletedEvent,
+        RapEvent,
+        RapArchiveEvent,
+        MeetingTransferEvent,
+    )
+}
+
 
-    This function calls the corresponding function based on the type of event received.
-    It can be thought as an event dispatcher.
+def encode_webhook_event(webhook_event):
+    """Serialize a mapped webhook event to JSON.
 
     Parameters
     ----------
-    event : dict
-        Dict with fields and values of the event as received by the webhook.
+    webhook_event : event_mapper.WebhookEvent
+        Event as returned by `map_webhook_event`.
 
     Returns
     -------
-    mapped_event : event_mapper.WebhookEvent
-        It encapsulates both the event type and the event itself.
+    bytes
+        UTF-8 encoded JSON of the event.
     """
-    logger = logging.getLogger(__name__)
-    logaugment.set(
-        logger, code="", site="map_webhook_event", server="", event="", keywords="null"
-    )
-
-    logging_extra = {
-        "code": "Webhook mapping",
-        "keywords": ["webhook", "map", "event", "data structure", "data"],
-    }
-
-    try:
-        event_type = event["data"]["id"]
-        server_url = event["server_url"]
-    except (KeyError, TypeError) as err:
-        logging_extra["code"] = "Invalid message id"
-        logging_extra["keywords"] += (
-            ["warning"] if ("warning" not in logging_extra["keywords"]) else []
-        )
-        logger.warn(
-            "Webhook message dos not contain a valid id: {}".format(err),
-            extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
-        )
-        raise InvalidWebhookMessageError("Webhook message dos not contain a valid id")
-
-    logging_extra["server"] = server_url
-    logging_extra["event"] = event_type
-    logger.debug(
-        "Mapping event",
-        extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
-    )
-
-    if event_type == "meeting-created":
-        mapped_event = _map_create_event(event, event_type, server_url)
-
-    elif event_type == "meeting-ended":
-        mapped_event = _map_end_event(event, event_type, server_url)
-
-    elif event_type == "user-joined":
-        mapped_event = _map_user_joined_event(event, event_type, server_url)
-
-    elif event_type == "user-left":
-        mapped_event = _map_user_left_event(event, event_type, server_url)
-
-    elif event_type == "user-audio-voice-enabled":
-        mapped_event = _map_user_voice_enabled_event(event, event_type, server_url)
-
-    elif event_type in [
-        "user-audio-voice-enabled",
-        "user-audio-voice-disabled",
-        "user-audio-listen-only-enabled",
-        "user-audio-listen-only-disabled",
-        "user-cam-broadcast-start",
-        "user-cam-broadcast-end",
-        "user-presenter-assigned",
-        "user-presenter-unassigned",
-    ]:
-        mapped_event = _map_user_event(event, event_type, server_url)
-
-    elif event_type in [
-        "rap-publish-started",
-        "rap-post-publish-started",
-        "rap-post-publish-ended",
-    ]:
-        mapped_event = _map_rap_publish_event(event, event_type, server_url)
-
-    elif event_type == "rap-publish-ended":
-        mapped_event = _map_rap_publish_ended_event(event, event_type, server_url)
-
-    elif event_type in [
-        "rap-process-started",
-        "rap-process-ended",
-        "rap-post-process-started",
-        "rap-post-process-ended",
-    ]:
-        mapped_event = _map_rap_process_event(event, event_type, server_url)
-
-    elif event_type in [
-        "rap-sanity-started",
-        "rap-sanity-ended",
-        "rap-post-archive-started",
-        "rap-post-archive-ended",
-        "rap-archive-started",
-    ]:
-        mapped_event = _map_rap_event(event, event_type, server_url)
-
-    elif event_type in ["rap-archive-ended"]:
-        mapped_event = _map_rap_archive_event(event, event_type, server_url)
-
-    elif event_type in ["rap-unpublished", "rap-published"]:
-        mapped_event = _map_rap_published_unpublished_event(
-            event, event_type, server_url
-        )
-
-    elif event_type == "rap-deleted":
-        mapped_event = _map_rap_deleted_event(event, event_type, server_url)
-
-    elif event_type in ["meeting-transfer-enabled", "meeting-transfer-disabled"]:
-        mapped_event = _map_transfer_event(event, event_type, server_url)
-
-    else:
-        logging_extra["code"] = "Invalid webhook event id"
-        logging_extra["keywords"] += ["warning"]
-        logger.warn(
-            "Webhook event id is not valid: '{}'".format(event_type),
-            extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
-        )
-        raise InvalidWebhookEventError(
-            "Webhook event '{}' is not valid".format(event_type)
-        )
+    return json.dumps(webhook_event_to_dict(webhook_event)).encode("utf-8")
 
-    return mapped_event
 
+def decode_webhook_event(data):
+    """Deserialize a webhook event serialized by `encode_webhook_event`.
 
-def _map_create_event(event, event_type, server_url):
-    """Map `meeting-created` event to internal representation"""
-
-    create_event = MeetingCreatedEvent(
-        server_url=event.get("server_url", ""),
-        external_meeting_id=_get_nested(
-            event, ["data", "attributes", "meeting", "external-meeting-id"], ""
-        ),
-        internal_meeting_id=_get_nested(
-            event, ["data", "attributes", "meeting", "internal-meeting-id"], ""
-        ),
-        parent_meeting_id=_get_nested(
-            event, ["data", "attributes", "meeting", "parent-id"], ""
-        ),
-        name=_get_nested(event, ["data", "attributes", "meeting", "name"], ""),
-        create_time=_get_nested(
-            event, ["data", "attributes", "meeting", "create-time"], 0
-        ),
-        create_date=_get_nested(
-            event, ["data", "attributes", "meeting", "create-date"], None
-        ),
-        voice_bridge=_get_nested(
-            event, ["data", "attributes", "meeting", "voice-conf"], ""
-        ),
-        dial_number=_get_nested(
-            event, ["data", "attributes", "meeting", "dial-number"], ""
-        ),
-        attendee_pw=_get_nested(
-            event, ["data", "attributes", "meeting", "viewer-pass"], ""
-        ),
-        moderator_pw=_get_nested(
-            event, ["data", "attributes", "meeting", "moderator-pass"], ""
-        ),
-        duration=_get_nested(event, ["data", "attributes", "meeting", "duration"], 0),
-        recording=_get_nested(
-            event, ["data", "attributes", "meeting", "record"], False
-        ),
-        max_users=_get_nested(event, ["data", "attributes", "meeting", "max-users"], 0),
-        is_breakout=_get_nested(
-            event, ["data", "attributes", "meeting", "is-breakout"], False
-        ),
-        meta_data=_get_nested(event, ["data", "attributes", "meeting", "metadata"], {}),
-    )
-
-    webhook_event = WebhookEvent(event_type, create_event, server_url)
-
-    return webhook_event
-
-
-def _map_rap_deleted_event(event, event_type, server_url):
-    """Map `rap-deleted` event to internal representation."""
-    end_event = RapDeletedEvent(
-        external_meeting_id=_get_nested(
-            event, ["data", "attributes", "meeting", "external-meeting-id"], ""
-        ),
-        internal_meeting_id=_get_nested(
-            event, ["data", "attributes", "meeting", "internal-meeting-id"], ""
-        ),
-    )
-
-    webhook_event = WebhookEvent(event_type, end_event, server_url)
-
-    return webhook_event
-
-
-def _map_rap_published_unpublished_event(event, event_type, server_url):
-    """Map `rap-unpublished` event to internal representation."""
-    end_event = RapPublishUnpublishHandler(
-        external_meeting_id=_get_nested(
-            event, ["data", "attributes", "meeting", "external-meeting-id"], ""
-        ),
-        internal_meeting_id=_get_nested(
-            event, ["data", "attributes", "meeting", "internal-meeting-id"], ""
-        ),
-    )
+    Parameters
+    ----------
+    data : bytes
+        UTF-8 encoded JSON of the event.
 
-    webhook_event = WebhookEvent(event_type, end_event, server_url)
+    Returns
+    -------
+    event_mapper.WebhookEvent
+        The same event that was serialized.
 
-    return webhook_event
+    Raises
+    ------
+    InvalidWebhookEventError
+        If the data does not represent a known event.
+    """
+    try:
+        decoded = json.loads(data)
+    except ValueError as err:
+        raise InvalidWebhookEventError(f"Serialized event is not valid: {err}")
 
+    return webhook_event_from_dict(decoded)
 
-def _map_end_event(event, event_type, server_url):
-    """Map `meeting-ended` event to internal representation."""
-    end_event = MeetingEndedEvent(
-        external_meeting_id=_get_nested(
-            event, ["data", "attributes", "meeting", "external-meeting-id"], ""
-        ),
-        internal_meeting_id=_get_nested(
-            event, ["data", "attributes", "meeting", "internal-meeting-id"], ""
-        ),
-        end_time=_get_nested(event, ["data", "event", "ts"], 0),
-    )
 
-    webhook_event = WebhookEvent(event_type, end_event, server_url)
+def webhook_event_to_dict(webhook_event):
+    """Mapped webhook event as a dict of JSON types, as `encode_webhook_event`.
 
-    return webhook_event
+    Parameters
+    ----------
+    webhook_event : event_mapper.WebhookEvent
+        Event as returned by `map_webhook_event`.
 
+    Returns
+    -------
+    dict
+    """
+    return {
+        "event_type": webhook_event.event_type,
+        "server_url": webhook_event.server_url,
+        "type": type(webhook_event.event).__name__,
+        "event": webhook_event.event._asdict(),
+    }
 
-def _map_user_joined_event(event, event_type, server_url):
-    """Map `user-joined` event to internal representation."""
-    user_event = UserJoinedEvent(
-        name=_get_nested(event, ["data", "attributes", "user", "name"], ""),
-        role=_get_nested(event, ["data", "attributes", "user", "role"], ""),
-        internal_user_id=_get_nested(
-            event, ["data", "attributes", "user", "internal-user-id"], ""
-        ),
-        external_user_id=_get_nested(
-            event, ["data", "attributes", "user", "external-user-id"], ""
-        ),
-        internal_meeting_id=_get_nested(
-            event, ["data", "attributes", "meeting", "internal-meeting-id"], ""
-        ),
-        external_meeting_id=_get_nested(
-            event, ["data", "attributes", "meeting", "external-meeting-id"], ""
-        ),
-        join_time=_get_nested(event, ["data", "event", "ts"], ""),
-        is_presenter=_get_nested(
-            event, ["data", "attributes", "user", "presenter"], True
-        ),
-        userdata=_get_nested(event, ["data", "attributes", "user", "userdata"], {}),
-    )
 
-    webhook_event = WebhookEvent(event_type, user_event, server_url)
+def webhook_event_from_dict(decoded):
+    """Webhook event of a dict returned by `webhook_event_to_dict`.
 
-    return webhook_event
+    Parameters
+    ----------
+    decoded : dict
 
+    Returns
+    -------
+    event_mapper.WebhookEvent
 
-def _map_user_left_event(event, event_type, server_url):
-    """Map `user-left` event to internal representation."""
-    user_event = UserLeftEvent(
-        internal_user_id=_get_nested(
-            event, ["data", "attributes", "user", "internal-user-id"], ""
-        ),
-        external_user_id=_get_nested(
-            event, ["data", "attributes", "user", "external-user-id"], ""
-        ),
-        internal_meeting_id=_get_nested(
-            event, ["data", "attributes", "meeting", "internal-meeting-id"], ""
-        ),
-        external_meeting_id=_get_nested(
-            event, ["data", "attributes", "meeting", "external-meeting-id"], ""
-        ),
-        leave_time=_get_nested(event, ["data", "event", "ts"], ""),
-        userdata=_get_nested(event, ["data", "attributes", "user", "userdata"], {}),
-    )
+    Raises
+    ------
+    InvalidWebhookEventError
+        If the dict does not represent a known event.
+    """
+    try:
+        event_class = _EVENT_TYPES[decoded["type"]]
+        event = event_class(**decoded["event"])
+    except (KeyError, TypeError) as err:
+        raise InvalidWebhookEventError(f"Serialized event is not valid: {err}")
 
-    webhook_event = WebhookEvent(event_type, user_event, server_url)
+    return WebhookEvent(decoded["event_type"], event, decoded["server_url"])
 
-    return webhook_event
 
+# Prefixes shared by the fields of the events.
+_EVENT = ("data", "event")
+_ATTRIBUTES = ("data", "attributes")
+_MEETING = _ATTRIBUTES + ("meeting",)
+_USER = _ATTRIBUTES + ("user",)
+_RECORDING = _ATTRIBUTES + ("recording",)
 
-def _map_user_voice_enabled_event(event, event_type, server_url):
-    """Map `user-audio-voice-enabled` event to internal representation."""
-    user_event = UserVoiceEnabledEvent(
-        internal_user_id=_get_nested(
-            event, ["data", "attributes", "user", "internal-user-id"], ""
-        ),
-        external_user_id=_get_nested(
-            event, ["data", "attributes", "user", "external-user-id"], ""
-        ),
-        internal_meeting_id=_get_nested(
-            event, ["data", "attributes", "meeting", "internal-meeting-id"], ""
-        ),
-        external_meeting_id=_get_nested(
-            event, ["data", "attributes", "meeting", "external-meeting-id"], ""
-        ),
-        has_joined_voice=_get_nested(
-            event, ["data", "attributes", "user", "sharing-mic"], True
-        ),
-        is_listening_only=_get_nested(
-            event, ["data", "attributes", "user", "listening-only"], True
-        ),
-        event_name=event_type,
-    )
+# Marks a field whose value is the type of the event itself.
+_EVENT_TYPE = object()
 
-    webhook_event = WebhookEvent(event_type, user_event, server_url)
+_MEETING_IDS = {
+    "external_meeting_id": (_MEETING + ("external-meeting-id",), ""),
+    "internal_meeting_id": (_MEETING + ("internal-meeting-id",), ""),
+}
 
-    return webhook_event
+_USER_IDS = {
+    "internal_user_id": (_USER + ("internal-user-id",), ""),
+    "external_user_id": (_USER + ("external-user-id",), ""),
+}
 
+_RECORD_IDS = dict(_MEETING_IDS, record_id=(_MEETING + ("internal-meeting-id",), ""))
 
-def _map_user_event(event, event_type, server_url):
-    """Map `user-*` event to internal representation."""
-    user_event = UserEvent(
-        internal_user_id=_get_nested(
-            event, ["data", "attributes", "user", "internal-user-id"], ""
-        ),
-        external_user_id=_get_nested(
-            event, ["data", "attributes", "user", "external-user-id"], ""
-        ),
-        external_meeting_id=_get_nested(
-            event, ["data", "attributes", "meeting", "external-meeting-id"], ""
-        ),
-        internal_meeting_id=_get_nested(
-            event, ["data", "attributes", "meeting", "internal-meeting-id"], ""
-        ),
-        event_name=event_type,
-    )
+"""Declarative mapping from webhook events to their internal representation.
 
-    webhook_event = WebhookEvent(event_type, user_event, server_url)
+Each entry has the types of event it applies to, the namedtuple representing
+them and, for every field of the namedtuple, either the path of keys of its
+value in the event received along with a default for when the path is missing,
+or `_EVENT_TYPE`. It is compiled once into `_MAPPERS` when this module is
+imported.
+"""
+_MAPPING_SPEC = [
+    (
+        ["meeting-created"],
+        MeetingCreatedEvent,
+        dict(
+            _MEETING_IDS,
+            server_url=(("server_url",), ""),
+            parent_meeting_id=(_MEETING + ("parent-id",), ""),
+            name=(_MEETING + ("name",), ""),
+            create_time=(_MEETING + ("create-time",), 0),
+            create_date=(_MEETING + ("create-date",), None),
+            voice_bridge=(_MEETING + ("voice-conf",), ""),
+            dial_number=(_MEETING + ("dial-number",), ""),
+            attendee_pw=(_MEETING + ("viewer-pass",), ""),
+            moderator_pw=(_MEETING + ("moderator-pass",), ""),
+            duration=(_MEETING + ("duration",), 0),
+            recording=(_MEETING + ("record",), False),
+            max_users=(_MEETING + ("max-users",), 0),
+            is_breakout=(_MEETING + ("is-breakout",), False),
+            meta_data=(_MEETING + ("metadata",), {}),
+        ),
+    ),
+    (
+        ["meeting-ended"],
+        MeetingEndedEvent,
+        dict(_MEETING_IDS, end_time=(_EVENT + ("ts",), 0)),
+    ),
+    (
+        ["user-joined"],
+        UserJoinedEvent,
+        dict(
+            _MEETING_IDS,
+            **_USER_IDS,
+            name=(_USER + ("name",), ""),
+            role=(_USER + ("role",), ""),
+            join_time=(_EVENT + ("ts",), ""),
+            is_presenter=(_USER + ("presenter",), True),
+            userdata=(_USER + ("userdata",), {}),
+        ),
+    ),
+    (
+        ["user-left"],
+        UserLeftEvent,
+        dict(
+            _MEETING_IDS,
+            **_USER_IDS,
+            leave_time=(_EVENT + ("ts",), ""),
+            userdata=(_USER + ("userdata",), {}),
+        ),
+    ),
+    (
+        ["user-audio-voice-enabled"],
+        UserVoiceEnabledEvent,
+        dict(
+            _MEETING_IDS,
+            **_USER_IDS,
+            has_joined_voice=(_USER + ("sharing-mic",), True),
+            is_listening_only=(_USER + ("listening-only",), True),
+            event_name=_EVENT_TYPE,
+        ),
+    ),
+    (
+        [
+            "user-audio-voice-disabled",
+            "user-audio-listen-only-enabled",
+            "user-audio-listen-only-disabled",
+            "user-cam-broadcast-start",
+            "user-cam-broadcast-end",
+            "user-presenter-assigned",
+            "user-presenter-unassigned",
+        ],
+        UserEvent,
+        dict(_MEETING_IDS, **_USER_IDS, event_name=_EVENT_TYPE),
+    ),
+    (
+        ["rap-publish-started", "rap-post-publish-started", "rap-post-publish-ended"],
+        RapPublishEvent,
+        dict(
+            _RECORD_IDS,
+            workflow=(_ATTRIBUTES + ("workflow",), {}),
+            current_step=_EVENT_TYPE,
+        ),
+    ),
+    (
+        ["rap-publish-ended"],
+        RapPublishEndedEvent,
+        dict(
+            _MEETING_IDS,
+            name=(_RECORDING + ("name",), ""),
+            is_breakout=(_RECORDING + ("isBreakout",), False),
+            start_time=(_RECORDING + ("start-time",), 0),
+            end_time=(_RECORDING + ("end-time",), 0),
+            size=(_RECORDING + ("size",), ""),
+            raw_size=(_RECORDING + ("raw-size",), 0),
+            meta_data=(_RECORDING + ("metadata",), {}),
+            playback=(_RECORDING + ("playback",), ""),
+            download=(_RECORDING + ("download",), ""),
+            workflow=(_ATTRIBUTES + ("workflow",), {}),
+            current_step=_EVENT_TYPE,
+        ),
+    ),
+    (
+        [
+            "rap-process-started",
+            "rap-process-ended",
+            "rap-post-process-started",
+            "rap-post-process-ended",
+        ],
+        RapProcessEvent,
+        dict(
+            _RECORD_IDS,
+            workflow=(_ATTRIBUTES + ("workflow",), {}),
+            current_step=_EVENT_TYPE,
+        ),
+    ),
+    (
+        [
+            "rap-sanity-started",
+            "rap-sanity-ended",
+            "rap-post-archive-started",
+            "rap-post-archive-ended",
+            "rap-archive-started",
+        ],
+        RapEvent,
+        dict(_RECORD_IDS, current_step=_EVENT_TYPE),
+    ),
+    (
+        ["rap-archive-ended"],
+        RapArchiveEvent,
+        dict(
+            _RECORD_IDS,
+            recorded=(_ATTRIBUTES + ("recorded",), True),
+            current_step=_EVENT_TYPE,
+        ),
+    ),
+    (["rap-unpublished", "rap-published"], RapPublishUnpublishHandler, _MEETING_IDS),
+    (["rap-deleted"], RapDeletedEvent, _MEETING_IDS),
+    (
+        ["meeting-transfer-enabled", "meeting-transfer-disabled"],
+        MeetingTransferEvent,
+        dict(_MEETING_IDS, event_name=_EVENT_TYPE),
+    ),
+]
+
+
+def _compile(event_class, fields):
+    """Compile the fields of an entry of the mapping spec into an extractor.
+
+    The paths of the fields are merged into a tree, so a prefix shared by
+    several of them (e.g. `data.attributes.meeting`) is looked up only once
+    per event.
 
-    return webhook_event
+    Parameters
+    ----------
+    event_class : namedtuple
+        Internal representation of the event.
+    fields : dict
+        Path and default (or `_EVENT_TYPE`) of each field of `event_class`.
 
+    Returns
+    -------
+    extract : callable
+        Function receiving the event as received by the webhook and its type,
+        and returning an instance of `event_class`.
+
+    Raises
+    ------
+    ValueError
+        If the fields do not match the fields of `event_class`.
+    """
+    if set(fields) != set(event_class._fields):
+        raise ValueError(
+            "Fields of {} do not match its spec: {}".format(
+                event_class.__name__,
+                sorted(set(fields).symmetric_difference(event_class._fields)),
+            )
+        )
 
-def _map_rap_process_event(event, event_type, server_url):
-    """Map `rap[-post]-process-*` event to internal representation."""
-    rap_event = RapProcessEvent(
-        external_meeting_id=_get_nested(
-            event, ["data", "attributes", "meeting", "external-meeting-id"], ""
-        ),
-        internal_meeting_id=_get_nested(
-            event, ["data", "attributes", "meeting", "internal-meeting-id"], ""
-        ),
-        record_id=_get_nested(
-            event, ["data", "attributes", "meeting", "internal-meeting-id"], ""
-        ),
-        workflow=_get_nested(event, ["data", "attributes", "workflow"], {}),
-        current_step=event_type,
-    )
+    prefixes = {(): 0}  # Index of each prefix among the nodes resolved.
+    steps = []  # (index of the parent node, key) of each prefix.
+    getters = []  # (index of the parent node, key, default) of each field.
+    for field in event_class._fields:
+        if fields[field] is _EVENT_TYPE:
+            getters.append(_EVENT_TYPE)
+            continue
 
-    webhook_event = WebhookEvent(event_type, rap_event, server_url)
+        path, default = fields[field]
+        for depth in range(1, len(path)):
+            if path[:depth] not in prefixes:
+                steps.append((prefixes[path[: depth - 1]], path[depth - 1]))
+                prefixes[path[:depth]] = len(steps)
+        getters.append((prefixes[path[:-1]], path[-1], default))
 
-    return webhook_event
+    def extract(event, event_type):
+        nodes = [event]
+        for parent, key in steps:
+            node = nodes[parent]
+            nodes.append(node.get(key) if isinstance(node, dict) else None)
 
+        values = []
+        for getter in getters:
+            if getter is _EVENT_TYPE:
+                values.append(event_type)
+                continue
 
-def _map_rap_publish_event(event, event_type, server_url):
-    """Map `rap[-post]-publish-*` event to internal representation
-    (except for started)."""
-    rap_event = RapPublishEvent(
-        external_meeting_id=_get_nested(
-            event, ["data", "attributes", "meeting", "external-meeting-id"], ""
-        ),
-        internal_meeting_id=_get_nested(
-            event, ["data", "attributes", "meeting", "internal-meeting-id"], ""
-        ),
-        record_id=_get_nested(
-            event, ["data", "attributes", "meeting", "internal-meeting-id"], ""
-        ),
-        workflow=_get_nested(event, ["data", "attributes", "workflow"], {}),
-        current_step=event_type,
-    )
+            parent, key, default = getter
+            node = nodes[parent]
+            values.append(node.get(key, default) if isinstance(node, dict) else default)
 
-    webhook_event = WebhookEvent(event_type, rap_event, server_url)
+        return event_class._make(values)
 
-    return webhook_event
+    return extract
 
 
-def _map_rap_publish_ended_event(event, event_type, server_url):
-    """Map `rap-publish-ended` event to internal representation."""
-    rap_event = RapPublishEndedEvent(
-        name=_get_nested(event, ["data", "attributes", "recording", "name"], ""),
-        is_breakout=_get_nested(
-            event, ["data", "attributes", "recording", "isBreakout"], False
-        ),
-        start_time=_get_nested(
-            event, ["data", "attributes", "recording", "start-time"], 0
-        ),
-        end_time=_get_nested(event, ["data", "attributes", "recording", "end-time"], 0),
-        size=_get_nested(event, ["data", "attributes", "recording", "size"], ""),
-        raw_size=_get_nested(event, ["data", "attributes", "recording", "raw-size"], 0),
-        meta_data=_get_nested(
-            event, ["data", "attributes", "recording", "metadata"], {}
-        ),
-        playback=_get_nested(
-            event, ["data", "attributes", "recording", "playback"], ""
-        ),
-        download=_get_nested(
-            event, ["data", "attributes", "recording", "download"], ""
-        ),
-        external_meeting_id=_get_nested(
-            event, ["data", "attributes", "meeting", "external-meeting-id"], ""
-        ),
-        internal_meeting_id=_get_nested(
-            event, ["data", "attributes", "meeting", "internal-meeting-id"], ""
-        ),
-        workflow=_get_nested(event, ["data", "attributes", "workflow"], {}),
-        current_step=event_type,
-    )
+def _compile_spec(spec):
+    """Compile the mapping spec into a dict of extractors by type of event."""
+    mappers = {}
+    for event_types, event_class, fields in spec:
+        extract = _compile(event_class, fields)
+        for event_type in event_types:
+            if event_type in mappers:
+                raise ValueError(f"Event '{event_type}' is mapped more than once")
+            mappers[event_type] = extract
 
-    webhook_event = WebhookEvent(event_type, rap_event, server_url)
+    return mappers
 
-    return webhook_event
 
+"""Extractor of the internal representation of each type of event."""
+_MAPPERS = _compile_spec(_MAPPING_SPEC)
 
-def _map_rap_archive_event(event, event_type, server_url):
-    """Map `rap-archive-*` event to internal representation."""
-    rap_event = RapArchiveEvent(
-        external_meeting_id=_get_nested(
-            event, ["data", "attributes", "meeting", "external-meeting-id"], ""
-        ),
-        internal_meeting_id=_get_nested(
-            event, ["data", "attributes", "meeting", "internal-meeting-id"], ""
-        ),
-        record_id=_get_nested(
-            event, ["data", "attributes", "meeting", "internal-meeting-id"], ""
-        ),
-        recorded=_get_nested(event, ["data", "attributes", "recorded"], True),
-        current_step=event_type,
-    )
 
-    webhook_event = WebhookEvent(event_type, rap_event, server_url)
+def map_webhook_event(event):
+    """Map from a webhook event received to the corresponding data structure.
 
-    return webhook_event
+    The event is dispatched by its type to an extractor compiled from
+    `_MAPPING_SPEC`.
 
+    Parameters
+    ----------
+    event : dict
+        Dict with fields and values of the event as received by the webhook.
 
-def _map_transfer_event(event, event_type, server_url):
-    """Map `meeting-transfer-*` event to internal representation."""
-    transfer_event = MeetingTransferEvent(
-        external_meeting_id=_get_nested(
-            event, ["data", "attributes", "meeting", "external-meeting-id"], ""
-        ),
-        internal_meeting_id=_get_nested(
-            event, ["data", "attributes", "meeting", "internal-meeting-id"], ""
-        ),
-        event_name=event_type,
+    Returns
+    -------
+    mapped_event : event_mapper.WebhookEvent
+        It encapsulates both the event type and the event itself.
+    """
+    logger = logging.getLogger(__name__)
+    logaugment.set(
+        logger, code="", site="map_webhook_event", server="", event="", keywords="null"
     )
 
-    webhook_event = WebhookEvent(event_type, transfer_event, server_url)
-
-    return webhook_event
+    logging_extra = {
+        "code": "Webhook mapping",
+        "keywords": ["webhook", "map", "event", "data structure", "data"],
+    }
 
+    try:
+        event_type = event["data"]["id"]
+        server_url = event["server_url"]
+    except (KeyError, TypeError) as err:
+        logging_extra["code"] = "Invalid message id"
+        logging_extra["keywords"] += (
+            ["warning"] if ("warning" not in logging_extra["keywords"]) else []
+        )
+        logger.warn(
+            "Webhook message dos not contain a valid id: {}".format(err),
+            extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
+        )
+        raise InvalidWebhookMessageError("Webhook message dos not contain a valid id")
 
-def _map_rap_event(event, event_type, server_url):
-    """Map `rap-*` event to internal representation (except for process and publish)."""
-    rap_event = RapEvent(
-        external_meeting_id=_get_nested(
-            event, ["data", "attributes", "meeting", "external-meeting-id"], ""
-        ),
-        internal_meeting_id=_get_nested(
-            event, ["data", "attributes", "meeting", "internal-meeting-id"], ""
-        ),
-        record_id=_get_nested(
-            event, ["data", "attributes", "meeting", "internal-meeting-id"], ""
-        ),
-        current_step=event_type,
+    logging_extra["server"] = server_url
+    logging_extra["event"] = event_type
+    logger.debug(
+        "Mapping event",
+        extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
     )
 
-    webhook_event = WebhookEvent(event_type, rap_event, server_url)
-
-    return webhook_event
-
-
-def _get_nested(d, keys, default):
-    """This function allows retrieving a value for a given list of keys from
-    nested dictionaries or returning a default value passed as argument if any
-    of the keys is not found.
-    """
-    for k in keys:
-        if k not in d:
-            return default
-        d = d[k]
+    extract = _MAPPERS.get(event_type)
+    if extract is None:
+        logging_extra["code"] = "Invalid webhook event id"
+        logging_extra["keywords"] += ["warning"]
+        logger.warn(
+            "Webhook event id is not valid: '{}'".format(event_type),
+            extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
+        )
+        raise InvalidWebhookEventError(
+            "Webhook event '{}' is not valid".format(event_type)
+        )
 
-    return d
+    return WebhookEvent(event_type, extract(event, event_type), server_url)
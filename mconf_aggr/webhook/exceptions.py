@@ -25,6 +25,12 @@ class InvalidWebhookEventError(WebhookError):
     pass
 
 
+class ServiceUnavailableError(WebhookError):
+    """Raised if an event cannot be accepted for now and should be sent again later."""
+
+    pass
+
+
 class WebhookDatabaseError(WebhookError):
     """Raised if any error occurrs while interacting with the database."""
 
@@ -33,3 +39,15 @@ class WebhookDatabaseError(WebhookError):
 
 class DatabaseNotReadyError(WebhookError):
     """Raised if the database does not seem ready for connections."""
+
+
+class ProjectionConflictError(WebhookDatabaseError):
+    """Raised if the position of a consumer of the event log was moved meanwhile."""
+
+    pass
+
+
+class ReplayError(WebhookError):
+    """Raised if archived events could not be replayed into the database."""
+
+    pass
@@ -0,0 +1,313 @@
+"""This module provides databases of their own for local runs and benchmarks.
+
+The tables written by the aggregator are owned by other applications, so the
+aggregator usually runs against a database created elsewhere. In local mode
+(MCONF_WEBHOOK_DATABASE_LOCAL), `LocalDatabase` creates everything the
+aggregator needs in a database of its own instead:
+
+* the tables of `database_model`, the tables of the migrations and the
+  migrations themselves (see `migrations.versions`);
+* rows of the reference tables (servers, shared secrets and institutions),
+  so meetings can be created and requests authenticated.
+
+The database is, by URL (MCONF_WEBHOOK_DATABASE_URL):
+
+* `sqlite://` (or no URL): an in-memory SQLite database, lost on exit;
+* `sqlite:///path/to/file.db`: a SQLite file, kept between runs;
+* `temporary-postgresql`: a PostgreSQL server started in a temporary
+  directory and removed on exit, if `initdb` and `pg_ctl` are installed;
+* any other URL: an existing database, where what is missing is created.
+"""
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+
+import logaugment
+from sqlalchemy.orm import Session
+
+from mconf_aggr.webhook.database_model import Base, Institutions, Servers, SharedSecrets
+from mconf_aggr.webhook.exceptions import DatabaseNotReadyError
+from mconf_aggr.webhook.migrations.migrator import Migrator
+from mconf_aggr.webhook.migrations.versions import MIGRATIONS
+
+TEMPORARY_POSTGRESQL = "temporary-postgresql"
+
+# Reference tables of a local database, unless a seed file is supplied.
+# Events from server https://localhost are authenticated with "local-secret".
+LOCAL_SEED = {
+    "institutions": [{"guid": "local-institution", "name": "Local"}],
+    "shared_secrets": [
+        {
+            "guid": "local-shared-secret",
+            "name": "local",
+            "secret": "local-secret",
+            "institution_guid": "local-institution",
+        }
+    ],
+    "servers": [
+        {
+            "guid": "local-server",
+            "name": "https://localhost",
+            "secret": "local-secret",
+            "enabled": True,
+        }
+    ],
+}
+
+# Reference tables in order of creation, as rows refer to institutions.
+_SEED_MODELS = [
+    ("institutions", Institutions),
+    ("shared_secrets", SharedSecrets),
+    ("servers", Servers),
+]
+
+
+def load_seed(path):
+    """Load the rows of the reference tables from a JSON file.
+
+    Parameters
+    ----------
+    path : str
+        Path of a JSON object with lists of rows by table, as `LOCAL_SEED`.
+
+    Returns
+    -------
+    seed : dict
+    """
+    with open(path) as seed_file:
+        return json.load(seed_file)
+
+
+def seed_reference_tables(session, seed):
+    """Add the rows of the reference tables not added yet.
+
+    Rows are matched by guid, so seeding again does not duplicate them.
+
+    Parameters
+    ----------
+    session : sqlalchemy.Session
+        Session the rows are added to. It is not committed.
+    seed : dict
+        Lists of rows by table, as `LOCAL_SEED`.
+
+    Returns
+    -------
+    int
+        Number of rows added.
+    """
+    added = 0
+    for table, model in _SEED_MODELS:
+        rows = seed.get(table, [])
+        existing = {
+            guid
+            for (guid,) in session.query(model.guid).filter(
+                model.guid.in_([row["guid"] for row in rows])
+            )
+        }
+        for row in rows:
+            if row["guid"] not in existing:
+                session.add(model(**row))
+                added += 1
+        # Later tables refer to these rows.
+        session.flush()
+
+    return added
+
+
+class TemporaryPostgreSQL:
+    """PostgreSQL server in a temporary directory, removed when stopped.
+
+    It listens only on a Unix socket in that directory, so it does not
+    conflict with other servers.
+    """
+
+    def __init__(self, bin_dir=None):
+        """Constructor of the TemporaryPostgreSQL.
+
+        Parameters
+        ----------
+        bin_dir : str
+            Directory of `initdb` and `pg_ctl`. If not supplied, they are
+            looked up in PATH.
+        """
+        self.bin_dir = bin_dir
+        self.directory = None
+
+    def available(self):
+        """Whether the programs to run a server are installed."""
+        return all(self._program(name) for name in ("initdb", "pg_ctl"))
+
+    def start(self):
+        """Initialize and start the server.
+
+        Returns
+        -------
+        url : str
+            URL of database postgres of the server.
+
+        Raises
+        ------
+        DatabaseNotReadyError
+            If the programs are not installed or the server did not start.
+        """
+        if not self.available():
+            raise DatabaseNotReadyError(
+                "initdb and pg_ctl of PostgreSQL were not found (in PATH or "
+                f"{self.bin_dir})"
+            )
+
+        self.directory = tempfile.mkdtemp(prefix="mconf-aggr-postgresql-")
+        data = os.path.join(self.directory, "data")
+        try:
+            self._run(
+                "initdb", "-D", data, "-U", "postgres", "-A", "trust", "--no-sync"
+            )
+            self._run(
+                "pg_ctl",
+                "-D",
+                data,
+                "-l",
+                os.path.join(self.directory, "postgresql.log"),
+                "-o",
+                f"-F -h '' -k {self.directory}",
+                "-w",
+                "start",
+            )
+        except DatabaseNotReadyError:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
+            raise
+
+        return f"postgresql://postgres@/postgres?host={self.directory}"
+
+    def stop(self):
+        """Stop the server and remove its directory."""
+        if self.directory is None:
+            return
+
+        try:
+            self._run(
+                "pg_ctl",
+                "-D",
+                os.path.join(self.directory, "data"),
+                "-m",
+                "immediate",
+                "-w",
+                "stop",
+            )
+        finally:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
+
+    def _program(self, name):
+        if self.bin_dir is not None:
+            path = os.path.join(self.bin_dir, name)
+            return path if os.access(path, os.X_OK) else None
+
+        return shutil.which(name)
+
+    def _run(self, name, *args):
+        try:
+            subprocess.run(
+                [self._program(name), *args],
+                check=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+            )
+        except (OSError, subprocess.CalledProcessError) as err:
+            output = getattr(err, "output", b"") or b""
+            raise DatabaseNotReadyError(
+                f"{name} failed: {err} {output.decode(errors='replace')}".strip()
+            ) from err
+
+
+class LocalDatabase:
+    """Database of its own, created and seeded for local runs."""
+
+    def __init__(self, url=None, seed=None, logger=None):
+        """Constructor of the LocalDatabase.
+
+        Parameters
+        ----------
+        url : str
+            URL of the database, or `TEMPORARY_POSTGRESQL`. If not supplied,
+            an in-memory SQLite database is used.
+        seed : dict
+            Rows of the reference tables by table. If not supplied,
+            `LOCAL_SEED` is used.
+        logger : logging.Logger
+            If not supplied, it will instantiate a new logger from __name__.
+        """
+        self.url = url or "sqlite://"
+        self.seed = LOCAL_SEED if seed is None else seed
+        self._server = None
+        self.logger = logger or logging.getLogger(__name__)
+        logaugment.set(
+            self.logger,
+            code="",
+            site="LocalDatabase",
+            server="",
+            event="",
+            keywords="null",
+        )
+
+    def start(self):
+        """Start the temporary server, if any.
+
+        Returns
+        -------
+        url : str
+            URL to connect to the database.
+
+        Raises
+        ------
+        DatabaseNotReadyError
+            If the temporary server could not be started.
+        """
+        if self.url != TEMPORARY_POSTGRESQL:
+            return self.url
+
+        self._server = TemporaryPostgreSQL()
+
+        return self._server.start()
+
+    def create(self, engine):
+        """Create the tables and seed the reference tables.
+
+        What already exists is kept, so it can be called on every start.
+
+        Parameters
+        ----------
+        engine : sqlalchemy.engine.Engine
+            Engine of the database.
+        """
+        logging_extra = {
+            "code": "Local database",
+            "site": "LocalDatabase.create",
+            "keywords": ["local", "database", "schema", "seed"],
+        }
+
+        Base.metadata.create_all(engine)
+        Migrator(engine, MIGRATIONS).upgrade()
+
+        with Session(engine) as session:
+            added = seed_reference_tables(session, self.seed)
+            session.commit()
+
+        self.logger.info(
+            f"Local database {engine.url!r} is ready ({added} reference row(s) "
+            "added).",
+            extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
+        )
+
+    def stop(self):
+        """Stop the temporary server, if any. Its data is lost."""
+        if self._server is not None:
+            self._server.stop()
+            self._server = None
+
+    def __repr__(self):
+        return "{!s}(url={!r})".format(self.__class__.__name__, self.url)
@@ -0,0 +1,422 @@
+"""This module provides the cache of running meetings written behind.
+
+User events (joins, leaves and audio, camera and presenter toggles) change the
+attendees of a row of table meetings and the counters derived from them.
+Without a cache, each of them loads the row and writes it whole back. With a
+`MeetingCache`, the row is loaded once, changed in memory by each event and
+written back later, so many toggles in a large meeting become a single UPDATE.
+
+The cache is authoritative for the columns it writes: they must not be changed
+by anyone else (e.g. another instance) while the meeting is cached. Meetings
+are evicted when they end.
+
+The counters of a cached meeting are kept up to date by its `Attendees` from
+the change of each attendee. They are recounted from all attendees only from
+time to time when flushed, as a consistency check.
+
+Meetings are changed inside the transaction (and the SAVEPOINT) of the event
+changing them, but written later, in another one. Changes are made inside
+`savepoint`, so they are undone if the transaction of the event is rolled
+back, and the cache never holds changes whose events were not written.
+
+The cache holds the events whose changes are not written yet (see `held`),
+so neither the spool (see `aggregator.spool.DurableChannel`) nor the event log
+projector (see `event_log.EventLogProjector`) moves past them before they are.
+Events after them are then delivered again after a crash, so changes not
+written yet are made again.
+"""
+import contextlib
+import copy
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import logaugment
+
+from mconf_aggr.webhook.attendees import Attendees
+from mconf_aggr.webhook.database import DatabaseConnector
+from mconf_aggr.webhook.database_model import Meetings
+
+session_scope = DatabaseConnector.get_session_scope()
+
+# Columns of table meetings changed by user events.
+_COLUMNS = (
+    "running",
+    "has_user_joined",
+    "participant_count",
+    "listener_count",
+    "voice_participant_count",
+    "video_count",
+    "moderator_count",
+    "transfer_count",
+    "attendees",
+)
+
+
+class LiveMeeting:
+    """Copy of the columns of a row of table meetings changed by user events.
+
+    It has the same attributes as `Meetings`, so handlers change both alike,
+    except for `attendees`, which are kept as `Attendees`.
+    """
+
+    __slots__ = ("id", "int_meeting_id") + _COLUMNS
+
+    def __init__(self, meetings_table):
+        self.id = meetings_table.id
+        self.int_meeting_id = meetings_table.int_meeting_id
+        for column in _COLUMNS:
+            setattr(self, column, copy.deepcopy(getattr(meetings_table, column)))
+        self.attendees = Attendees(self.attendees)
+
+    def mapping(self):
+        """Values of the row to be written back."""
+        mapping = {column: getattr(self, column) for column in _COLUMNS}
+        mapping["id"] = self.id
+        mapping["attendees"] = copy.deepcopy(self.attendees.to_json())
+
+        return mapping
+
+    def copy(self):
+        """Copy of the meeting, unchanged by later changes to it."""
+        meeting = LiveMeeting.__new__(LiveMeeting)
+        meeting.id = self.id
+        meeting.int_meeting_id = self.int_meeting_id
+        for column in _COLUMNS:
+            setattr(meeting, column, getattr(self, column))
+        meeting.attendees = self.attendees.copy()
+
+        return meeting
+
+
+class MeetingCache:
+    """Rows of table meetings of running meetings, keyed by `int_meeting_id`.
+
+    It is used by a single writer thread, which holds `lock` while changing
+    the meetings, and flushed by another one.
+    """
+
+    def __init__(self, max_size=10000, recount_interval=60, logger=None):
+        """Constructor of the MeetingCache.
+
+        Parameters
+        ----------
+        max_size : int
+            Maximum number of meetings cached. Above it, meetings not changed
+            since their last flush are evicted, least recently used first.
+        recount_interval : float
+            Time (in seconds) between recounts of the counters of the meetings
+            flushed from all their attendees.
+        logger : logging.Logger
+            If not supplied, it will instantiate a new logger from __name__.
+        """
+        self.max_size = max_size
+        self.recount_interval = recount_interval
+        self._next_recount = time.monotonic() + recount_interval
+        self.lock = threading.RLock()
+        self._meetings = OrderedDict()  # LiveMeeting by meeting, in LRU order.
+        self._dirty = set()
+        # Events whose changes to each meeting are not written yet.
+        self._held = {}
+        self._flushing = []  # Events held of the flushes running.
+        # Meetings as they were before each open savepoint, innermost last.
+        self._savepoints = []
+        self._hits = 0
+        self._loads = 0
+        self._flushes = 0
+        self._flushed = 0
+        self._flush_errors = 0
+        self._recounts = 0
+        self._drifts = 0
+        self.logger = logger or logging.getLogger(__name__)
+        logaugment.set(
+            self.logger,
+            code="",
+            site="MeetingCache",
+            server="",
+            event="",
+            keywords="null",
+        )
+
+    def get(self, session, int_id):
+        """Get a meeting, loading it on first use.
+
+        Parameters
+        ----------
+        session : sqlalchemy.Session
+            Session used to load the meeting.
+        int_id : str
+            Internal meeting id of the meeting.
+
+        Returns
+        -------
+        LiveMeeting
+            The meeting or None if it is not in the database.
+        """
+        self._save(int_id)
+        meeting = self._meetings.get(int_id)
+        if meeting is not None:
+            self._meetings.move_to_end(int_id)
+            self._hits += 1
+
+            return meeting
+
+        meetings_table = (
+            session.query(Meetings).filter(Meetings.int_meeting_id == int_id).first()
+        )
+        if meetings_table is None:
+            return None
+
+        meeting = LiveMeeting(meetings_table)
+        self._meetings[int_id] = meeting
+        self._loads += 1
+        self._shrink()
+
+        return meeting
+
+    def mark_dirty(self, meeting):
+        """Mark a meeting as changed, to be written back at the next flush."""
+        self._dirty.add(meeting.int_meeting_id)
+
+    def evict(self, int_id):
+        """Forget a meeting, discarding its changes not flushed yet."""
+        with self.lock:
+            self._save(int_id)
+            self._meetings.pop(int_id, None)
+            self._dirty.discard(int_id)
+            self._held.pop(int_id, None)
+
+    def hold(self, event):
+        """Hold an event until the meetings it changed are written.
+
+        It must be called inside the `savepoint` of the event, which undoes
+        it along with the changes of the event.
+
+        Parameters
+        ----------
+        event : event_mapper.WebhookEvent
+            Event that changed the meetings got inside the savepoint.
+        """
+        if not self._savepoints:
+            return
+
+        for int_id in self._savepoints[-1]:
+            if int_id in self._dirty:
+                self._held.setdefault(int_id, []).append(event)
+
+    def held(self):
+        """Events whose changes to meetings are not written yet.
+
+        Returns
+        -------
+        list of event_mapper.WebhookEvent
+            Events held, including those whose meetings are being written.
+        """
+        with self.lock:
+            return [
+                event
+                for held in [self._held] + self._flushing
+                for events in held.values()
+                for event in events
+            ]
+
+    @contextlib.contextmanager
+    def savepoint(self):
+        """Undo the changes made to meetings inside it if it raises.
+
+        It holds `lock` and it may be nested, like the SAVEPOINTs of a
+        transaction: changes made inside an inner savepoint are undone as
+        well if an outer one raises.
+        """
+        with self.lock:
+            self._savepoints.append({})
+            try:
+                yield
+            except BaseException:
+                self._rollback(self._savepoints.pop())
+                raise
+
+            saved = self._savepoints.pop()
+            if self._savepoints:
+                for int_id, meeting in saved.items():
+                    self._savepoints[-1].setdefault(int_id, meeting)
+
+    def dirty_count(self):
+        """Number of meetings changed since the last flush."""
+        return len(self._dirty)
+
+    def flush(self):
+        """Write the meetings changed since the last flush in one transaction.
+
+        Meetings that could not be written are written at the next flush.
+        Events held for the meetings written are released.
+
+        Returns
+        -------
+        int
+            Number of meetings written.
+        """
+        logging_extra = {
+            "code": "Meeting cache flush",
+            "site": "MeetingCache.flush",
+            "keywords": ["meeting cache", "flush", "database"],
+        }
+
+        with self.lock:
+            dirty = [key for key in self._dirty if key in self._meetings]
+            if time.monotonic() >= self._next_recount:
+                self._recount(dirty)
+            mappings = [self._meetings[key].mapping() for key in dirty]
+            self._dirty.clear()
+            held, self._held = self._held, {}
+            if not mappings:
+                return 0
+
+            self._flushing.append(held)
+
+        try:
+            with session_scope() as session:
+                session.bulk_update_mappings(Meetings, mappings)
+        except Exception as err:
+            with self.lock:
+                self._end_flush(held)
+                self._dirty.update(key for key in dirty if key in self._meetings)
+                for key, events in held.items():
+                    if key in self._meetings:
+                        self._held[key] = events + self._held.get(key, [])
+                self._flush_errors += 1
+
+            logging_extra["keywords"] += ["error"]
+            self.logger.error(
+                f"Error while writing {len(mappings)} cached meeting(s): {err}",
+                extra=dict(
+                    logging_extra, keywords=json.dumps(logging_extra["keywords"])
+                ),
+            )
+
+            return 0
+
+        with self.lock:
+            self._end_flush(held)
+        self._flushes += 1
+        self._flushed += len(mappings)
+
+        self.logger.debug(
+            f"Wrote {len(mappings)} cached meeting(s).",
+            extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
+        )
+
+        return len(mappings)
+
+    def stats(self):
+        """Counters of the cache.
+
+        Returns
+        -------
+        stats : dict
+            Number of meetings cached and changed, of hits and loads, and of
+            flushes, meetings written and flush errors, and of meetings
+            recounted and found drifted.
+        """
+        return {
+            "meetings": len(self._meetings),
+            "dirty": len(self._dirty),
+            "hits": self._hits,
+            "loads": self._loads,
+            "flushes": self._flushes,
+            "flushed": self._flushed,
+            "flush_errors": self._flush_errors,
+            "recounts": self._recounts,
+            "drifts": self._drifts,
+        }
+
+    def _end_flush(self, held):
+        """Forget the events held of a flush. Must be called holding `lock`."""
+        self._flushing = [
+            flushing for flushing in self._flushing if flushing is not held
+        ]
+
+    def _recount(self, keys):
+        self._next_recount = time.monotonic() + self.recount_interval
+        for key in keys:
+            meeting = self._meetings[key]
+            self._recounts += 1
+            if not meeting.attendees.recount():
+                continue
+
+            self._drifts += 1
+            for name, value in meeting.attendees.counts().items():
+                setattr(meeting, name, value)
+            meeting.has_user_joined = meeting.participant_count != 0
+
+            self.logger.warning(
+                f"Counters of cached meeting '{key}' drifted from its attendees.",
+                extra={
+                    "code": "Meeting cache recount",
+                    "site": "MeetingCache._recount",
+                    "keywords": json.dumps(["meeting cache", "recount", "drift"]),
+                },
+            )
+
+    def _save(self, int_id):
+        """Keep the meeting as it is, if not kept yet by the open savepoint.
+
+        Meetings are saved as they are handed out to be changed: changes made
+        inside a savepoint are always to meetings got inside it.
+        """
+        if not self._savepoints or int_id in self._savepoints[-1]:
+            return
+
+        meeting = self._meetings.get(int_id)
+        if meeting is None:
+            self._savepoints[-1][int_id] = None
+            return
+
+        # Events are only appended to the list of held events while the
+        # savepoint is open, so it is enough to keep its length.
+        held = self._held.get(int_id, [])
+        self._savepoints[-1][int_id] = (
+            meeting.copy(),
+            int_id in self._dirty,
+            held,
+            len(held),
+        )
+
+    def _rollback(self, saved):
+        for int_id, meeting in saved.items():
+            if meeting is None:
+                self._meetings.pop(int_id, None)
+                self._dirty.discard(int_id)
+                self._held.pop(int_id, None)
+                continue
+
+            meeting, dirty, held, held_count = meeting
+            self._meetings[int_id] = meeting
+            if dirty:
+                self._dirty.add(int_id)
+            else:
+                self._dirty.discard(int_id)
+            if held_count:
+                del held[held_count:]
+                self._held[int_id] = held
+            else:
+                self._held.pop(int_id, None)
+
+    def _shrink(self):
+        if len(self._meetings) <= self.max_size:
+            return
+
+        # The meeting loaded last is about to be changed: keep it.
+        for key in list(self._meetings)[:-1]:
+            if len(self._meetings) <= self.max_size:
+                break
+            if key not in self._dirty:
+                del self._meetings[key]
+
+    def __contains__(self, int_id):
+        return int_id in self._meetings
+
+    def __len__(self):
+        return len(self._meetings)
@@ -0,0 +1,112 @@
+"""This module provides the finalization of meetings in a single statement.
+
+When a meeting ends, its row of table meetings_events is stamped with the end
+time, every user of the meeting that has not left yet is given the end time as
+leave time, and its live row of table meetings is deleted. On PostgreSQL,
+`end_meeting` does all of it in one statement, with data-modifying common
+table expressions chained by `RETURNING`, so it takes a single round trip
+whatever the number of users, and it is atomic on its own.
+
+Other dialects are not supported (see `is_supported`): handlers fall back to
+the ORM for them.
+"""
+import collections
+import datetime
+
+import sqlalchemy
+
+from mconf_aggr.webhook.database_model import Meetings, MeetingsEvents, UsersEvents
+
+EndedMeeting = collections.namedtuple(
+    "EndedMeeting", ["meeting_event_id", "closed_users", "deleted"]
+)
+
+
+def is_supported(session):
+    """Whether `end_meeting` is supported by the database of a session."""
+    return session.get_bind().dialect.name == "postgresql"
+
+
+def end_meeting(session, int_id, end_time):
+    """Finalize a meeting.
+
+    Parameters
+    ----------
+    session : sqlalchemy.Session
+        Session of a PostgreSQL database.
+    int_id : str
+        Internal meeting id of the meeting.
+    end_time : int
+        Timestamp of the end of the meeting.
+
+    Returns
+    -------
+    EndedMeeting
+        Id of the row of table meetings_events, number of users closed and
+        whether the row of table meetings was deleted. None if the meeting
+        was not found in table meetings_events, in which case nothing changes.
+    """
+    # Columns with `onupdate` are set explicitly: their defaults are not
+    # applied to statements of common table expressions.
+    now = datetime.datetime.now()
+
+    ended = (
+        sqlalchemy.update(MeetingsEvents)
+        .where(MeetingsEvents.internal_meeting_id == int_id)
+        .values(end_time=end_time, updated_at=now)
+        .returning(MeetingsEvents.id)
+        .cte("ended")
+    )
+    closed = (
+        sqlalchemy.update(UsersEvents)
+        .where(
+            UsersEvents.meeting_event_id == ended.c.id,
+            UsersEvents.leave_time.is_(None),
+        )
+        .values(leave_time=end_time, updated_at=now)
+        .returning(UsersEvents.id)
+        .cte("closed")
+    )
+    deleted = (
+        sqlalchemy.delete(Meetings)
+        .where(
+            Meetings.int_meeting_id == int_id,
+            sqlalchemy.select(ended.c.id).exists(),
+        )
+        .returning(Meetings.id)
+        .cte("deleted")
+    )
+    statement = sqlalchemy.select(
+        ended.c.id,
+        _count(closed).label("closed_users"),
+        _count(deleted).label("deleted"),
+    )
+
+    # Changes pending in the session (e.g. users joined in the same batch) must
+    # be seen by the statement.
+    session.flush()
+    row = session.execute(statement).first()
+    if row is None:
+        return None
+
+    meeting_event_id, closed_users, deleted_meetings = row
+
+    # Instances loaded in the session must not be written back stale. Their
+    # attributes are read without loading them, as their rows may be gone.
+    for instance in list(session.identity_map.values()):
+        loaded = sqlalchemy.inspect(instance).dict
+        if isinstance(instance, Meetings):
+            if loaded.get("int_meeting_id") == int_id:
+                session.expunge(instance)
+        elif isinstance(instance, MeetingsEvents):
+            if loaded.get("id") == meeting_event_id:
+                session.expire(instance)
+        elif isinstance(instance, UsersEvents):
+            if loaded.get("meeting_event_id") == meeting_event_id:
+                session.expire(instance)
+
+    return EndedMeeting(meeting_event_id, closed_users, deleted_meetings > 0)
+
+
+def _count(cte):
+    return sqlalchemy.select(sqlalchemy.func.count()).select_from(cte).scalar_subquery()
@@ -0,0 +1,91 @@
+"""Command line of the migrations of the database.
+
+It connects to the database configured with the MCONF_WEBHOOK_DATABASE_*
+environment variables:
+
+    python -m mconf_aggr.webhook.migrations upgrade [--target VERSION]
+    python -m mconf_aggr.webhook.migrations status
+    python -m mconf_aggr.webhook.migrations check-plans
+
+`check-plans` exits with status 1 if any query of the handlers scans a table
+sequentially.
+"""
+import argparse
+import sys
+
+from mconf_aggr.webhook.database import DatabaseConnector
+from mconf_aggr.webhook.migrations import query_plan
+from mconf_aggr.webhook.migrations.migrator import Migrator
+from mconf_aggr.webhook.migrations.versions import MIGRATIONS
+
+
+def upgrade(engine, args):
+    upgraded = Migrator(engine, MIGRATIONS).upgrade(target=args.target)
+    if upgraded:
+        print(f"Applied migrations: {', '.join(map(str, upgraded))}.")
+    else:
+        print("Database is up to date.")
+
+    return 0
+
+
+def status(engine, args):
+    applied = Migrator(engine, MIGRATIONS).applied()
+    for migration in MIGRATIONS:
+        state = "applied" if migration.version in applied else "pending"
+        print(f"{migration.version:>4}  {state:<8} {migration.description}")
+
+    return 0
+
+
+def check_plans(engine, args):
+    failed = 0
+    for check in query_plan.check(engine):
+        query = check.query
+        if check.scanned_tables:
+            failed += 1
+            print(
+                f"SEQ SCAN  {query.handler}: {query.description} "
+                f"(scans {', '.join(check.scanned_tables)})"
+            )
+            if args.verbose:
+                print(check.plan)
+        else:
+            print(f"ok        {query.handler}: {query.description}")
+
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m mconf_aggr.webhook.migrations",
+        description="Migrate the database and check the query plans of the handlers.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    upgrade_parser = commands.add_parser("upgrade", help="apply pending migrations")
+    upgrade_parser.add_argument(
+        "--target", type=int, help="version of the last migration to apply"
+    )
+    upgrade_parser.set_defaults(run=upgrade)
+
+    status_parser = commands.add_parser("status", help="list migrations")
+    status_parser.set_defaults(run=status)
+
+    plans_parser = commands.add_parser(
+        "check-plans", help="flag handler queries scanning tables sequentially"
+    )
+    plans_parser.add_argument(
+        "--verbose", action="store_true", help="print the plans flagged"
+    )
+    plans_parser.set_defaults(run=check_plans)
+
+    args = parser.parse_args(argv)
+
+    DatabaseConnector.connect()
+
+    return args.run(DatabaseConnector.engine, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
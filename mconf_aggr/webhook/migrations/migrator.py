@@ -0,0 +1,295 @@
+"""This module provides the versioned migrations of the database.
+
+The tables written by the aggregator are shared with other applications, which
+own their definition. Migrations here only change what the aggregator itself
+depends on (e.g. the indexes of the columns its handlers look rows up by).
+
+Each `Migration` has a version and a list of operations. `Migrator` applies the
+migrations not yet applied in order of version, and records each of them in
+table `mconf_aggr_migrations` once all of its operations succeeded. Operations
+must therefore be idempotent: a migration interrupted halfway is run again as
+a whole.
+
+On PostgreSQL, indexes are created with `CREATE INDEX CONCURRENTLY`, which
+does not lock the table against writes while the index is built, and the
+migrator holds an advisory lock so that concurrent runs (e.g. several
+containers starting at once) apply each migration only once.
+"""
+import datetime
+import json
+import logging
+
+import logaugment
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, text
+
+# Arbitrary key of the advisory lock held while migrating.
+LOCK_KEY = 2_031_061_842
+
+metadata = MetaData()
+
+migrations_table = Table(
+    "mconf_aggr_migrations",
+    metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(255)),
+    Column("applied_at", DateTime, default=datetime.datetime.now),
+)
+
+
+class CreateIndex:
+    """Operation creating an index, unless it already exists.
+
+    On PostgreSQL, the index is built concurrently. A concurrent build that
+    failed leaves an invalid index behind, which is dropped and built again.
+    """
+
+    def __init__(self, table, *columns, name=None, unique=False):
+        """Constructor of the CreateIndex.
+
+        Parameters
+        ----------
+        table : str
+            Name of the table.
+        *columns : str
+            Names of the columns, in order.
+        name : str
+            Name of the index. If not supplied, it is named as SQLAlchemy names
+            the indexes of columns declared with `index=True`
+            (`ix_<table>_<column>`).
+        unique : bool
+            Whether the index is unique.
+        """
+        self.table = table
+        self.columns = columns
+        self.name = name or "_".join(("ix", table) + columns)
+        self.unique = unique
+
+    def apply(self, connection):
+        """Create the index.
+
+        Parameters
+        ----------
+        connection : sqlalchemy.engine.Connection
+            Connection in autocommit mode.
+        """
+        concurrently = ""
+        if connection.dialect.name == "postgresql":
+            concurrently = "CONCURRENTLY "
+            if self._is_invalid(connection):
+                connection.exec_driver_sql(
+                    f"DROP INDEX CONCURRENTLY IF EXISTS {self.name}"
+                )
+
+        unique = "UNIQUE " if self.unique else ""
+        connection.exec_driver_sql(
+            f"CREATE {unique}INDEX {concurrently}IF NOT EXISTS {self.name} "
+            f"ON {self.table} ({', '.join(self.columns)})"
+        )
+
+    def _is_invalid(self, connection):
+        return (
+            connection.execute(
+                text(
+                    "SELECT 1 FROM pg_index i "
+                    "JOIN pg_class c ON c.oid = i.indexrelid "
+                    "WHERE c.relname = :name AND NOT i.indisvalid"
+                ),
+                {"name": self.name},
+            ).first()
+            is not None
+        )
+
+    def __repr__(self):
+        return "{!s}(name={!r})".format(self.__class__.__name__, self.name)
+
+
+class CreateTable:
+    """Operation creating a table, unless it already exists."""
+
+    def __init__(self, table, postgresql=None):
+        """Constructor of the CreateTable.
+
+        Parameters
+        ----------
+        table : sqlalchemy.Table
+            Definition of the table.
+        postgresql : str
+            DDL run instead on PostgreSQL (e.g. of a partitioned table). It
+            must not fail if the table already exists.
+        """
+        self.table = table
+        self.postgresql = postgresql
+
+    def apply(self, connection):
+        """Create the table.
+
+        Parameters
+        ----------
+        connection : sqlalchemy.engine.Connection
+            Connection in autocommit mode.
+        """
+        if self.postgresql is not None and connection.dialect.name == "postgresql":
+            connection.exec_driver_sql(self.postgresql)
+        else:
+            self.table.create(connection, checkfirst=True)
+
+    def __repr__(self):
+        return "{!s}(name={!r})".format(self.__class__.__name__, self.table.name)
+
+
+class Migration:
+    """Version of the database, reached by applying a list of operations."""
+
+    def __init__(self, version, description, operations):
+        """Constructor of the Migration.
+
+        Parameters
+        ----------
+        version : int
+            Number of the migration. Migrations are applied in order of version.
+        description : str
+            Short description of what the migration changes.
+        operations : list
+            Operations applied in order (e.g. `CreateIndex`). Each one has a
+            method `apply(connection)`, called with a connection in autocommit
+            mode.
+        """
+        self.version = version
+        self.description = description
+        self.operations = operations
+
+    def __repr__(self):
+        return "{!s}(version={!r}, description={!r})".format(
+            self.__class__.__name__, self.version, self.description
+        )
+
+
+class Migrator:
+    """Apply migrations to a database and keep track of its version."""
+
+    def __init__(self, engine, migrations, logger=None):
+        """Constructor of the Migrator.
+
+        Parameters
+        ----------
+        engine : sqlalchemy.engine.Engine
+            Engine of the database to be migrated.
+        migrations : list of Migration
+            All migrations, in any order.
+        logger : logging.Logger
+            If not supplied, it will instantiate a new logger from __name__.
+        """
+        self.engine = engine
+        self.migrations = sorted(migrations, key=lambda migration: migration.version)
+        self.logger = logger or logging.getLogger(__name__)
+        logaugment.set(
+            self.logger,
+            code="",
+            site="Migrator",
+            server="",
+            event="",
+            keywords="null",
+        )
+
+    def applied(self):
+        """Versions of the migrations already applied.
+
+        Returns
+        -------
+        versions : set of int
+        """
+        metadata.create_all(self.engine)
+
+        with self.engine.connect() as connection:
+            return self._applied(connection)
+
+    def pending(self):
+        """Migrations not yet applied, in order of version.
+
+        Returns
+        -------
+        migrations : list of Migration
+        """
+        applied = self.applied()
+
+        return [
+            migration
+            for migration in self.migrations
+            if migration.version not in applied
+        ]
+
+    def upgrade(self, target=None):
+        """Apply the migrations not yet applied, in order of version.
+
+        Parameters
+        ----------
+        target : int
+            Version of the last migration to be applied. If not supplied, all
+            migrations are applied.
+
+        Returns
+        -------
+        versions : list of int
+            Versions of the migrations applied by this call.
+        """
+        logging_extra = {
+            "code": "Database migration",
+            "site": "Migrator.upgrade",
+            "keywords": ["migration", "database"],
+        }
+
+        metadata.create_all(self.engine)
+
+        upgraded = []
+        with self.engine.connect().execution_options(
+            isolation_level="AUTOCOMMIT"
+        ) as connection:
+            locked = connection.dialect.name == "postgresql"
+            if locked:
+                connection.execute(
+                    text("SELECT pg_advisory_lock(:key)"), {"key": LOCK_KEY}
+                )
+
+            try:
+                # Read once locked, as another run may just have applied some.
+                applied = self._applied(connection)
+                for migration in self.migrations:
+                    if migration.version in applied:
+                        continue
+                    if target is not None and migration.version > target:
+                        break
+
+                    self.logger.info(
+                        f"Applying migration {migration.version}: "
+                        f"{migration.description}.",
+                        extra=dict(
+                            logging_extra,
+                            keywords=json.dumps(logging_extra["keywords"]),
+                        ),
+                    )
+
+                    for operation in migration.operations:
+                        operation.apply(connection)
+
+                    connection.execute(
+                        migrations_table.insert().values(
+                            version=migration.version,
+                            description=migration.description,
+                        )
+                    )
+                    upgraded.append(migration.version)
+            finally:
+                if locked:
+                    connection.execute(
+                        text("SELECT pg_advisory_unlock(:key)"), {"key": LOCK_KEY}
+                    )
+
+        return upgraded
+
+    def _applied(self, connection):
+        return {row.version for row in connection.execute(migrations_table.select())}
+
+    def __repr__(self):
+        return "{!s}(migrations={!r})".format(
+            self.__class__.__name__, len(self.migrations)
+        )
@@ -0,0 +1,208 @@
+"""This module provides the check of the query plans of the handlers.
+
+Each query the handlers look rows up with is explained by the database, and
+the tables it scans sequentially are reported: the cost of such a lookup grows
+with the size of the table, so it usually lacks an index (see `versions`).
+
+Small tables are scanned sequentially even when they are indexed, as it is
+cheaper. On PostgreSQL, sequential scans are therefore disabled while the
+queries are explained (`enable_seqscan = off`): the planner only falls back to
+them when no index can be used. On SQLite, the plan of `EXPLAIN QUERY PLAN`
+already tells full scans (`SCAN`) from index lookups (`SEARCH`).
+"""
+import collections
+import re
+
+from sqlalchemy import func, select
+
+from mconf_aggr.webhook.database_model import (
+    Institutions,
+    Meetings,
+    MeetingsEvents,
+    Recordings,
+    Servers,
+    SharedSecrets,
+    UsersEvents,
+)
+
+PlanQuery = collections.namedtuple("PlanQuery", ["handler", "description", "statement"])
+PlanCheck = collections.namedtuple("PlanCheck", ["query", "plan", "scanned_tables"])
+
+# Values of the parameters of the queries. Plans do not depend on them.
+_ID = "query-plan-check"
+_PK = 0
+
+_SQLITE_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)")
+
+
+def handler_queries():
+    """Queries the handlers look rows up with, as they are run for events.
+
+    Returns
+    -------
+    queries : list of PlanQuery
+    """
+    return [
+        PlanQuery(
+            "MeetingCreatedHandler",
+            "meetings_events by internal_meeting_id",
+            select(MeetingsEvents).where(MeetingsEvents.internal_meeting_id == _ID),
+        ),
+        PlanQuery(
+            "MeetingCreatedHandler",
+            "meetings by ext_meeting_id",
+            select(Meetings).where(Meetings.ext_meeting_id == _ID),
+        ),
+        PlanQuery(
+            "MeetingCreatedHandler",
+            "servers by name",
+            select(Servers).where(Servers.name == _ID),
+        ),
+        PlanQuery(
+            "MeetingCreatedHandler",
+            "shared_secrets by guid",
+            select(SharedSecrets).where(SharedSecrets.guid == _ID),
+        ),
+        PlanQuery(
+            "MeetingCreatedHandler",
+            "shared_secrets by name",
+            select(SharedSecrets).where(SharedSecrets.name == _ID),
+        ),
+        PlanQuery(
+            "MeetingCreatedHandler",
+            "institutions by guid",
+            select(Institutions).where(Institutions.guid == _ID),
+        ),
+        PlanQuery(
+            "MeetingEndedHandler",
+            "users_events of a meeting not left yet",
+            select(UsersEvents).where(
+                UsersEvents.meeting_event_id == _PK, UsersEvents.leave_time.is_(None)
+            ),
+        ),
+        PlanQuery(
+            "UserJoinedHandler",
+            "meetings by int_meeting_id",
+            select(Meetings).where(Meetings.int_meeting_id == _ID),
+        ),
+        PlanQuery(
+            "UserLeftHandler",
+            "users_events by internal_user_id",
+            select(UsersEvents).where(UsersEvents.internal_user_id == _ID),
+        ),
+        PlanQuery(
+            "UserLeftHandler",
+            "meetings joined to meetings_events by internal_meeting_id",
+            select(Meetings)
+            .join(Meetings.meeting_event)
+            .where(MeetingsEvents.internal_meeting_id == _ID),
+        ),
+        PlanQuery(
+            "RapHandler",
+            "recordings by internal_meeting_id",
+            select(Recordings).where(Recordings.internal_meeting_id == _ID),
+        ),
+        PlanQuery(
+            "RapHandler",
+            "participants of a meeting",
+            select(func.count(UsersEvents.id))
+            .join(MeetingsEvents)
+            .where(MeetingsEvents.internal_meeting_id == _ID),
+        ),
+        PlanQuery(
+            "AuthenticationHandler",
+            "secret of servers by name",
+            select(Servers.secret).where(Servers.name == _ID),
+        ),
+    ]
+
+
+def check(engine, queries=None):
+    """Explain queries and find the tables they scan sequentially.
+
+    Nothing is written to the database.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        Engine of a PostgreSQL or SQLite database.
+    queries : list of PlanQuery
+        Queries to be explained. If not supplied, `handler_queries()`.
+
+    Returns
+    -------
+    checks : list of PlanCheck
+        Plan of each query, as text, and names of the tables it scans
+        sequentially (empty if it uses indexes only).
+    """
+    if queries is None:
+        queries = handler_queries()
+
+    checks = []
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            if connection.dialect.name == "postgresql":
+                connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+
+            for query in queries:
+                plan, scanned_tables = explain(connection, query.statement)
+                checks.append(PlanCheck(query, plan, scanned_tables))
+        finally:
+            transaction.rollback()
+
+    return checks
+
+
+def explain(connection, statement):
+    """Explain a statement.
+
+    Parameters
+    ----------
+    connection : sqlalchemy.engine.Connection
+        Connection of a PostgreSQL or SQLite database.
+    statement : sqlalchemy.sql.expression.Select
+        Statement to be explained.
+
+    Returns
+    -------
+    plan : str
+        Plan of the statement, as reported by the database.
+    scanned_tables : list of str
+        Names of the tables the plan scans sequentially.
+
+    Raises
+    ------
+    ValueError
+        If the dialect of the database is not supported.
+    """
+    sql = str(
+        statement.compile(
+            dialect=connection.dialect, compile_kwargs={"literal_binds": True}
+        )
+    )
+
+    if connection.dialect.name == "postgresql":
+        plan = connection.exec_driver_sql(f"EXPLAIN {sql}").scalars().all()
+        scanned_tables = [
+            match.group(1)
+            for line in plan
+            for match in [re.search(r"Seq Scan on (\w+)", line)]
+            if match
+        ]
+    elif connection.dialect.name == "sqlite":
+        plan = [
+            row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")
+        ]
+        scanned_tables = [
+            match.group(1)
+            for line in plan
+            for match in [_SQLITE_SCAN.match(line)]
+            if match
+        ]
+    else:
+        raise ValueError(
+            f"Query plans of dialect {connection.dialect.name} are not supported."
+        )
+
+    return "\n".join(plan), scanned_tables
@@ -0,0 +1,38 @@
+"""This module provides the migrations of the database, in order of version.
+
+New migrations are appended to `MIGRATIONS` with the next version. Migrations
+already released must not be changed: databases that applied them would not
+apply them again.
+"""
+from mconf_aggr.webhook.event_log import (
+    EVENT_LOG_POSTGRESQL,
+    event_log_table,
+    offsets_table,
+)
+from mconf_aggr.webhook.migrations.migrator import CreateIndex, CreateTable, Migration
+
+MIGRATIONS = [
+    Migration(
+        1,
+        "Index the columns handlers look rows up by",
+        [
+            CreateIndex("meetings", "int_meeting_id"),
+            CreateIndex("meetings", "ext_meeting_id"),
+            CreateIndex("meetings", "meeting_event_id"),
+            CreateIndex("meetings_events", "external_meeting_id"),
+            CreateIndex("meetings_events", "parent_meeting_id"),
+            CreateIndex("meetings_events", "shared_secret_guid"),
+            CreateIndex("users_events", "meeting_event_id"),
+            CreateIndex("servers", "name"),
+            CreateIndex("shared_secrets", "name"),
+        ],
+    ),
+    Migration(
+        2,
+        "Create the event log and the positions of its consumers",
+        [
+            CreateTable(event_log_table, postgresql=EVENT_LOG_POSTGRESQL),
+            CreateTable(offsets_table),
+        ],
+    ),
+]
@@ -0,0 +1,206 @@
+"""This module provides the buffer of events waiting for their meeting.
+
+Webhook events may be handled before the `meeting-created` event of their
+meeting is written (e.g. when it arrives late or on another instance). Their
+handlers would not find the meeting and drop them. Instead, the writer parks
+them in a `ParkingBuffer`, keyed by `internal_meeting_id`, until the meeting
+is written or a timeout expires. Events of a meeting with events already
+parked are parked behind them without querying the database, so the events of
+a meeting are still written in order.
+"""
+import time
+from collections import OrderedDict, deque
+
+
+class _Parked:
+    """Events of a meeting waiting for it, and when to check it again."""
+
+    __slots__ = ("events", "deadline", "next_check")
+
+    def __init__(self, deadline, next_check):
+        self.events = deque()
+        self.deadline = deadline
+        self.next_check = next_check
+
+
+class ParkingBuffer:
+    """Bounded buffer of events waiting for their meeting to be written.
+
+    It also remembers the meetings known to exist, so events of these are not
+    checked again. It is not thread-safe: each writer thread has its own, as
+    events of a meeting are always handled by the same thread.
+    """
+
+    def __init__(self, timeout=30, check_interval=1, max_size=10000, known_size=10000):
+        """Constructor of the ParkingBuffer.
+
+        Parameters
+        ----------
+        timeout : float
+            Maximum time (in seconds) events of a meeting are parked. After
+            that, they are handled as if the meeting existed.
+        check_interval : float
+            Time (in seconds) between checks whether a meeting with parked
+            events was written by someone else.
+        max_size : int
+            Maximum number of events parked. Above it, the events of the
+            meeting parked first are released.
+        known_size : int
+            Number of meetings remembered to exist.
+        """
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self.max_size = max_size
+        self.known_size = known_size
+        self._parked = OrderedDict()  # _Parked by meeting, in parking order.
+        self._known = OrderedDict()  # Meetings known to exist, in LRU order.
+        self._size = 0
+        self._total_parked = 0
+        self._expired = 0
+        self._evicted = 0
+
+    def park(self, key, event):
+        """Park an event of a meeting.
+
+        Returns
+        -------
+        list of (key, list)
+            Events of meetings released to make room for the event, which
+            must be handled right away.
+        """
+        parked = self._parked.get(key)
+        if parked is None:
+            now = time.monotonic()
+            parked = _Parked(now + self.timeout, now + self.check_interval)
+            self._parked[key] = parked
+
+        parked.events.append(event)
+        self._size += 1
+        self._total_parked += 1
+
+        evicted = []
+        if self._size > self.max_size:
+            for oldest in list(self._parked):
+                if self._size <= self.max_size:
+                    break
+                if oldest != key:
+                    evicted.append((oldest, self.release(oldest)))
+                    self._evicted += 1
+
+        return evicted
+
+    def unpark(self, key):
+        """Remove the event parked last for a meeting."""
+        parked = self._parked[key]
+        parked.events.pop()
+        self._size -= 1
+        self._total_parked -= 1
+        if not parked.events:
+            del self._parked[key]
+
+    def release(self, key):
+        """Remove and return the events parked for a meeting.
+
+        Returns
+        -------
+        list
+            Events of the meeting, in order. Empty if none is parked.
+        """
+        parked = self._parked.pop(key, None)
+        if parked is None:
+            return []
+
+        self._size -= len(parked.events)
+
+        return list(parked.events)
+
+    def restore(self, key, events):
+        """Put back released events ahead of the events parked for a meeting."""
+        if not events:
+            return
+
+        parked = self._parked.get(key)
+        if parked is None:
+            now = time.monotonic()
+            parked = _Parked(now + self.timeout, now)
+            self._parked[key] = parked
+
+        parked.events.extendleft(reversed(events))
+        self._size += len(events)
+
+    def due(self):
+        """Meetings whose events expired and meetings due to be checked.
+
+        Meetings returned to be checked are not returned again before
+        `check_interval` seconds.
+
+        Returns
+        -------
+        (expired, checks) : (list, list)
+            Meetings whose events are parked for longer than `timeout` and
+            meetings to be checked in the database.
+        """
+        now = time.monotonic()
+        expired = []
+        checks = []
+        for key, parked in self._parked.items():
+            if parked.deadline <= now:
+                expired.append(key)
+            elif parked.next_check <= now:
+                parked.next_check = now + self.check_interval
+                checks.append(key)
+
+        self._expired += len(expired)
+
+        return expired, checks
+
+    def parked(self):
+        """All events parked, in order within each meeting, without removing them."""
+        return [event for parked in self._parked.values() for event in parked.events]
+
+    def take_all(self):
+        """Remove and return all events parked, in order within each meeting."""
+        events = self.parked()
+        self._parked.clear()
+        self._size = 0
+
+        return events
+
+    def is_known(self, key):
+        """Whether the meeting is remembered to exist."""
+        if key not in self._known:
+            return False
+
+        self._known.move_to_end(key)
+
+        return True
+
+    def mark_known(self, key):
+        """Remember that the meeting exists."""
+        self._known[key] = True
+        self._known.move_to_end(key)
+        if len(self._known) > self.known_size:
+            self._known.popitem(last=False)
+
+    def stats(self):
+        """Counters of the buffer.
+
+        Returns
+        -------
+        stats : dict
+            Number of events and meetings parked now, and number of events
+            parked, meetings expired and meetings evicted so far.
+        """
+        return {
+            "parked_events": self._size,
+            "parked_meetings": len(self._parked),
+            "total_parked": self._total_parked,
+            "expired": self._expired,
+            "evicted": self._evicted,
+        }
+
+    def __contains__(self, key):
+        return key in self._parked
+
+    def __len__(self):
+        return self._size
@@ -0,0 +1,198 @@
+"""This module provides partial updates of the attendees of table meetings.
+
+Without them, a change to one attendee loads the whole JSON list of attendees
+of the meeting and writes it whole back, so the bytes sent per user event grow
+with the size of the meeting. On PostgreSQL, the functions below change a
+single attendee instead with JSONB operators (`||` to add it, `-` to remove
+it and `jsonb_set` to patch it) and adjust the counters derived from it in the
+same UPDATE, without loading the row. Only the attendee and its internal user
+id are sent, whatever the size of the meeting.
+
+Other dialects are not supported (see `is_supported`): handlers fall back to
+the ORM for them.
+"""
+import json
+
+import sqlalchemy
+
+from mconf_aggr.webhook.database_model import Meetings
+
+# Attendees of the row being updated, as JSONB.
+_ATTENDEES = "coalesce(m.attendees::jsonb, '[]'::jsonb)"
+
+# Whether an attendee (a JSONB expression) counts in each counter of table
+# meetings, as `attendees.COUNTERS`, and the key of the attendee it depends on.
+_COUNTS_IN = {
+    "participant_count": ("role", "coalesce({0} ->> 'role', '') <> 'TRANSFER'"),
+    "transfer_count": ("role", "{0} ->> 'role' = 'TRANSFER'"),
+    "moderator_count": ("role", "{0} ->> 'role' = 'MODERATOR'"),
+    "listener_count": (
+        "is_listening_only",
+        "coalesce(({0} ->> 'is_listening_only')::boolean, false)",
+    ),
+    "voice_participant_count": (
+        "has_joined_voice",
+        "coalesce(({0} ->> 'has_joined_voice')::boolean, false)",
+    ),
+    "video_count": ("has_video", "coalesce(({0} ->> 'has_video')::boolean, false)"),
+}
+
+# Index of the attendee with an internal user id in the row being updated, or
+# NULL if there is none.
+_FROM_INDEX = f"""
+FROM (
+    SELECT mm.id, (
+        SELECT (t.i - 1)::int
+        FROM jsonb_array_elements(
+            coalesce(mm.attendees::jsonb, '[]'::jsonb)
+        ) WITH ORDINALITY AS t(a, i)
+        WHERE t.a ->> 'internal_user_id' = :user_id
+        LIMIT 1
+    ) AS idx
+    FROM {Meetings.__tablename__} AS mm
+    WHERE mm.int_meeting_id = :int_meeting_id
+) AS f
+WHERE m.id = f.id
+"""
+
+
+def is_supported(session):
+    """Whether partial updates are supported by the database of a session."""
+    return session.get_bind().dialect.name == "postgresql"
+
+
+def add_attendee(session, int_id, attendee):
+    """Add an attendee to a meeting, unless one with its user id is there.
+
+    The meeting is marked as running with users joined, as by the ORM.
+
+    Parameters
+    ----------
+    session : sqlalchemy.Session
+        Session of a PostgreSQL database.
+    int_id : str
+        Internal meeting id of the meeting.
+    attendee : dict
+        Attendee as stored in column meetings.attendees.
+
+    Returns
+    -------
+    bool
+        False if the meeting was not found.
+    """
+    present = f"{_ATTENDEES} @> CAST(:probe AS jsonb)"
+    statement = _update(
+        attendees=f"""CASE WHEN {present} THEN m.attendees
+            ELSE ({_ATTENDEES} || CAST(:attendees AS jsonb))::json END""",
+        old="NULL::jsonb",
+        new=f"CASE WHEN {present} THEN NULL ELSE CAST(:attendee AS jsonb) END",
+        counters=_COUNTS_IN,
+        where="WHERE m.int_meeting_id = :int_meeting_id",
+        running=True,
+    )
+
+    return _execute(
+        session,
+        statement,
+        int_id,
+        probe=json.dumps([{"internal_user_id": attendee["internal_user_id"]}]),
+        attendees=json.dumps([attendee]),
+        attendee=json.dumps(attendee),
+    )
+
+
+def remove_attendee(session, int_id, user_id):
+    """Remove the attendee with an internal user id from a meeting.
+
+    Returns
+    -------
+    bool
+        False if the meeting was not found.
+    """
+    statement = _update(
+        attendees=f"""CASE WHEN f.idx IS NULL THEN m.attendees
+            ELSE ({_ATTENDEES} - f.idx)::json END""",
+        old=f"({_ATTENDEES} -> f.idx)",
+        new="NULL::jsonb",
+        counters=_COUNTS_IN,
+        where=_FROM_INDEX,
+    )
+
+    return _execute(session, statement, int_id, user_id=user_id)
+
+
+def patch_attendee(session, int_id, user_id, patch):
+    """Set keys of the attendee with an internal user id in a meeting.
+
+    Parameters
+    ----------
+    patch : dict
+        Keys of the attendee to be set and their values.
+
+    Returns
+    -------
+    bool
+        False if the meeting was not found.
+    """
+    patched = f"(({_ATTENDEES} -> f.idx) || CAST(:patch AS jsonb))"
+    statement = _update(
+        attendees=f"""CASE WHEN f.idx IS NULL THEN m.attendees
+            ELSE jsonb_set({_ATTENDEES}, ARRAY[f.idx::text], {patched})::json END""",
+        old=f"({_ATTENDEES} -> f.idx)",
+        new=patched,
+        counters={
+            name: counts_in
+            for name, counts_in in _COUNTS_IN.items()
+            if counts_in[0] in patch
+        },
+        where=_FROM_INDEX,
+    )
+
+    return _execute(
+        session, statement, int_id, user_id=user_id, patch=json.dumps(patch)
+    )
+
+
+def _update(attendees, old, new, counters, where, running=False):
+    """UPDATE of the attendees of a meeting and of the counters they change.
+
+    `old` and `new` are the attendee changed before and after the change, as
+    JSONB expressions which are NULL when there is none.
+    """
+    assignments = [f"attendees = {attendees}"]
+    deltas = {}
+    for name, (_, condition) in counters.items():
+        deltas[name] = f"- {_counted(condition, old)} + {_counted(condition, new)}"
+        assignments.append(f"{name} = m.{name} {deltas[name]}")
+
+    if running:
+        assignments += ["running = true", "has_user_joined = true"]
+    elif "participant_count" in deltas:
+        participants = f"m.participant_count {deltas['participant_count']}"
+        assignments.append(f"has_user_joined = ({participants}) <> 0")
+
+    return sqlalchemy.text(
+        f"UPDATE {Meetings.__tablename__} AS m SET "
+        + ", ".join(assignments)
+        + " "
+        + where
+    )
+
+
+def _counted(condition, attendee):
+    return (
+        f"(CASE WHEN {attendee} IS NOT NULL AND ({condition.format(attendee)}) "
+        "THEN 1 ELSE 0 END)"
+    )
+
+
+def _execute(session, statement, int_id, **params):
+    # Changes pending in the session (e.g. a meeting created in the same batch)
+    # must be seen by the statement, and rows it changes must not be stale.
+    session.flush()
+    result = session.execute(statement, dict(params, int_meeting_id=int_id))
+    for instance in list(session.identity_map.values()):
+        if isinstance(instance, Meetings) and instance.int_meeting_id == int_id:
+            session.expire(instance)
+
+    return result.rowcount > 0
@@ -0,0 +1,244 @@
+"""This module provides the cache of the reference tables of the database.
+
+Handlers look up rows of tables servers, shared_secrets and institutions for
+events (e.g. up to three lookups per meeting-created event), although these
+tables change rarely. `ReferenceCache` keeps them in memory instead, indexed
+by the columns they are looked up by. They are loaded at once into a new
+`ReferenceSnapshot`, numbered by a version, which replaces the previous one
+as a whole, on an interval or on demand with `refresh()`.
+
+Rows not found in the snapshot (e.g. added since the last refresh, or if the
+cache was never loaded) are looked up in the database by the handlers as
+before.
+
+A global object `reference_cache` is available for use in other modules.
+"""
+import collections
+import json
+import logging
+import threading
+import time
+
+import logaugment
+
+from mconf_aggr.webhook.database import DatabaseConnector
+from mconf_aggr.webhook.database_model import Institutions, Servers, SharedSecrets
+
+session_scope = DatabaseConnector.get_session_scope()
+
+Server = collections.namedtuple("Server", ["id", "guid", "name"])
+SharedSecret = collections.namedtuple(
+    "SharedSecret", ["guid", "name", "institution_guid"]
+)
+Institution = collections.namedtuple("Institution", ["guid", "name"])
+
+
+class ReferenceSnapshot:
+    """Rows of the reference tables loaded at once. It is never changed."""
+
+    def __init__(self, version=0, servers=(), shared_secrets=(), institutions=()):
+        """Constructor of the ReferenceSnapshot.
+
+        Parameters
+        ----------
+        version : int
+            Number of the snapshot, increased by each refresh.
+        servers : iterable of Server
+        shared_secrets : iterable of SharedSecret
+        institutions : iterable of Institution
+        """
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.servers_by_name = {server.name: server for server in servers}
+        self.shared_secrets_by_guid = {secret.guid: secret for secret in shared_secrets}
+        self.shared_secrets_by_name = {secret.name: secret for secret in shared_secrets}
+        self.institutions_by_guid = {
+            institution.guid: institution for institution in institutions
+        }
+
+
+class ReferenceCache:
+    """Process-wide cache of the reference tables, shared by all handlers."""
+
+    def __init__(self, interval=60, logger=None):
+        """Constructor of the ReferenceCache.
+
+        Parameters
+        ----------
+        interval : float
+            Time (in seconds) between refreshes in background. If zero or
+            negative, the cache is disabled and every lookup misses.
+        logger : logging.Logger
+            If not supplied, it will instantiate a new logger from __name__.
+        """
+        self.interval = interval
+        self._snapshot = ReferenceSnapshot()
+        self._refresh_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._refresh_errors = 0
+        self._stopevent = threading.Event()
+        self._refresh_thread = None
+        self.logger = logger or logging.getLogger(__name__)
+        logaugment.set(
+            self.logger,
+            code="",
+            site="ReferenceCache",
+            server="",
+            event="",
+            keywords="null",
+        )
+
+    @property
+    def enabled(self):
+        return self.interval is not None and self.interval > 0
+
+    @property
+    def version(self):
+        """Version of the current snapshot, 0 until it is first loaded."""
+        return self._snapshot.version
+
+    def start(self):
+        """Load the reference tables and start refreshing them in background.
+
+        It does nothing if the cache is disabled.
+        """
+        if not self.enabled:
+            return
+
+        self.refresh()
+
+        self._stopevent.clear()
+        self._refresh_thread = threading.Thread(
+            name="reference_cache_refresh", target=self._refresh_loop, daemon=True
+        )
+        self._refresh_thread.start()
+
+    def stop(self):
+        """Stop refreshing the cache in background."""
+        self._stopevent.set()
+
+        if self._refresh_thread is not None:
+            self._refresh_thread.join()
+            self._refresh_thread = None
+
+    def refresh(self):
+        """Load the reference tables into a new snapshot.
+
+        If they could not be loaded, the current snapshot is kept.
+
+        Returns
+        -------
+        bool
+            True if the snapshot was replaced.
+        """
+        logging_extra = {
+            "code": "Reference cache refresh",
+            "site": "ReferenceCache.refresh",
+            "keywords": ["reference cache", "refresh", "database"],
+        }
+
+        with self._refresh_lock:
+            try:
+                with session_scope() as session:
+                    servers = [
+                        Server(*row)
+                        for row in session.query(Servers.id, Servers.guid, Servers.name)
+                    ]
+                    shared_secrets = [
+                        SharedSecret(*row)
+                        for row in session.query(
+                            SharedSecrets.guid,
+                            SharedSecrets.name,
+                            SharedSecrets.institution_guid,
+                        )
+                    ]
+                    institutions = [
+                        Institution(*row)
+                        for row in session.query(Institutions.guid, Institutions.name)
+                    ]
+            except Exception as err:
+                self._refresh_errors += 1
+                logging_extra["keywords"] += ["warning"]
+                self.logger.warn(
+                    f"Unable to refresh reference cache. Keeping version "
+                    f"{self.version}: {err}",
+                    extra=dict(
+                        logging_extra, keywords=json.dumps(logging_extra["keywords"])
+                    ),
+                )
+
+                return False
+
+            self._snapshot = ReferenceSnapshot(
+                self.version + 1, servers, shared_secrets, institutions
+            )
+
+        self.logger.debug(
+            f"Reference cache refreshed to version {self.version} with "
+            f"{len(servers)} server(s), {len(shared_secrets)} shared secret(s) and "
+            f"{len(institutions)} institution(s).",
+            extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
+        )
+
+        return True
+
+    def server(self, name):
+        """Server with a name (its URL), or None if it is not cached."""
+        return self._get(self._snapshot.servers_by_name, name)
+
+    def shared_secret(self, guid):
+        """Shared secret with a guid, or None if it is not cached."""
+        return self._get(self._snapshot.shared_secrets_by_guid, guid)
+
+    def shared_secret_by_name(self, name):
+        """Shared secret with a name, or None if it is not cached."""
+        return self._get(self._snapshot.shared_secrets_by_name, name)
+
+    def institution(self, guid):
+        """Institution with a guid, or None if it is not cached."""
+        return self._get(self._snapshot.institutions_by_guid, guid)
+
+    def stats(self):
+        """Counters of the cache.
+
+        Returns
+        -------
+        stats : dict
+            Version and age (in seconds) of the snapshot, number of rows cached
+            by table, and number of hits, misses and refresh errors.
+        """
+        snapshot = self._snapshot
+
+        return {
+            "version": snapshot.version,
+            "age": time.monotonic() - snapshot.loaded_at,
+            "servers": len(snapshot.servers_by_name),
+            "shared_secrets": len(snapshot.shared_secrets_by_guid),
+            "institutions": len(snapshot.institutions_by_guid),
+            "hits": self._hits,
+            "misses": self._misses,
+            "refresh_errors": self._refresh_errors,
+        }
+
+    def _get(self, rows, key):
+        row = rows.get(key) if key is not None else None
+        if row is None:
+            self._misses += 1
+        else:
+            self._hits += 1
+
+        return row
+
+    def _refresh_loop(self):
+        while not self._stopevent.wait(self.interval):
+            self.refresh()
+
+    def __repr__(self):
+        return "{!s}(interval={!r}, version={!r})".format(
+            self.__class__.__name__, self.interval, self.version
+        )
+
+
+"""Singleton ``ReferenceCache`` instance. Intended to be used outside this module."""
+reference_cache = ReferenceCache()
@@ -0,0 +1,547 @@
+"""This module provides the replay of archived webhook events into the database.
+
+After a bug of a handler is fixed, tables meetings_events, users_events and
+recordings can be rebuilt by replaying the events received since then. The
+archives are files of JSON lines, gzipped or not. Each line is one of:
+
+* a webhook event as received (with its `server_url`, or the one supplied
+  with `--server-url`), which is mapped with `map_webhook_event`;
+* a list of such events, as the body of a webhook request;
+* a mapped event, as serialized by `encode_webhook_event` (e.g. lines of the
+  spool, of the dead letter file or payloads of the event log).
+
+Events are applied by `WebhookDataWriter` in large batches, each one in a
+single transaction. With several workers, events are partitioned by meeting
+(the breakout rooms of a meeting go with it) and each partition is written by
+its own process, so events of a meeting are still applied in order.
+
+It connects to the database configured with the MCONF_WEBHOOK_DATABASE_*
+environment variables:
+
+    mconf-aggr-replay [--workers N] [--batch-size N] ARCHIVE [ARCHIVE ...]
+    python -m mconf_aggr.webhook.replay [--workers N] ARCHIVE [ARCHIVE ...]
+
+Events already applied are applied again, so replay into a database where the
+tables to be rebuilt were emptied.
+"""
+import argparse
+import gzip
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import time
+import zlib
+
+import logaugment
+
+from mconf_aggr.aggregator import cfg
+from mconf_aggr.aggregator.aggregator import CallbackError, TransientCallbackError
+from mconf_aggr.webhook.database import DatabaseConnector
+from mconf_aggr.webhook.database_handler import WebhookDataWriter
+from mconf_aggr.webhook.event_mapper import map_webhook_event, webhook_event_from_dict
+from mconf_aggr.webhook.exceptions import ReplayError
+from mconf_aggr.webhook.reference_cache import reference_cache
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def open_archive(path):
+    """Open an archive for reading its lines, decompressing it if gzipped.
+
+    Parameters
+    ----------
+    path : str
+        Path of the archive, or "-" for the standard input (not gzipped).
+
+    Returns
+    -------
+    file object
+        Text file of the archive.
+    """
+    if path == "-":
+        return os.fdopen(os.dup(sys.stdin.fileno()), encoding="utf-8")
+
+    with open(path, "rb") as archive:
+        gzipped = archive.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+
+    if gzipped:
+        return gzip.open(path, "rt", encoding="utf-8")
+
+    return open(path, encoding="utf-8")
+
+
+class ArchiveReader:
+    """Iterable of the webhook events of archives, in order.
+
+    Lines which are not valid JSON and events which could not be mapped are
+    logged and skipped.
+    """
+
+    def __init__(self, paths, server_url="", logger=None):
+        """Constructor of the ArchiveReader.
+
+        Parameters
+        ----------
+        paths : list of str
+            Paths of the archives, read in order.
+        server_url : str
+            Server of the events received that do not have one.
+        logger : logging.Logger
+            If not supplied, it will instantiate a new logger from __name__.
+        """
+        self.paths = paths
+        self.server_url = server_url
+        self.lines = 0
+        self.invalid = 0
+        self.logger = logger or logging.getLogger(__name__)
+        logaugment.set(
+            self.logger,
+            code="",
+            site="ArchiveReader",
+            server="",
+            event="",
+            keywords="null",
+        )
+
+    def __iter__(self):
+        for path in self.paths:
+            with open_archive(path) as archive:
+                for number, line in enumerate(archive, start=1):
+                    if not line.strip():
+                        continue
+
+                    self.lines += 1
+                    yield from self._events(path, number, line)
+
+    def _events(self, path, number, line):
+        logging_extra = {
+            "code": "Invalid archived event",
+            "site": "ArchiveReader._events",
+            "keywords": ["replay", "archive", "warning"],
+        }
+
+        try:
+            decoded = json.loads(line)
+        except ValueError as err:
+            self._invalid(path, number, f"invalid JSON: {err}", logging_extra)
+            return
+
+        for event in decoded if isinstance(decoded, list) else [decoded]:
+            try:
+                if "type" in event and "event_type" in event:
+                    webhook_event = webhook_event_from_dict(event)
+                else:
+                    webhook_event = map_webhook_event(
+                        dict({"server_url": self.server_url}, **event)
+                    )
+            except Exception as err:
+                self._invalid(path, number, err, logging_extra)
+                continue
+
+            yield webhook_event
+
+    def _invalid(self, path, number, err, logging_extra):
+        self.invalid += 1
+        self.logger.warning(
+            f"Skipping event of {path}:{number}: {err}",
+            extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
+        )
+
+
+class MeetingPartitioner:
+    """Partitioning of events by meeting.
+
+    Events of breakout rooms go to the partition of their parent meeting, as
+    the meeting-created of a breakout room refers to it.
+    """
+
+    def __init__(self, partitions):
+        """Constructor of the MeetingPartitioner.
+
+        Parameters
+        ----------
+        partitions : int
+            Number of partitions.
+        """
+        self.partitions = partitions
+        self._parents = {}
+
+    def key(self, webhook_event):
+        """Meeting an event is partitioned by.
+
+        Parameters
+        ----------
+        webhook_event : event_mapper.WebhookEvent
+
+        Returns
+        -------
+        str
+            Internal id of the meeting, or of its parent meeting.
+        """
+        meeting = webhook_event.event.internal_meeting_id
+        parent = getattr(webhook_event.event, "parent_meeting_id", None)
+        # Meetings which are not breakout rooms have parent "bbb-none".
+        if webhook_event.event_type == "meeting-created" and parent not in (
+            None,
+            "",
+            "bbb-none",
+        ):
+            self._parents[meeting] = self._parents.get(parent, parent)
+
+        return self._parents.get(meeting, meeting)
+
+    def partition(self, webhook_event):
+        """Partition of an event, as `PartitionedChannel` routes events.
+
+        Parameters
+        ----------
+        webhook_event : event_mapper.WebhookEvent
+
+        Returns
+        -------
+        int
+            Number of the partition, from 0 to `partitions` - 1.
+        """
+        key = self.key(webhook_event)
+
+        return zlib.crc32(str(key).encode("utf-8")) % self.partitions
+
+
+class Replayer:
+    """Replay of webhook events into the database, in batches."""
+
+    def __init__(
+        self,
+        workers=1,
+        batch_size=1000,
+        queue_size=4,
+        retries=3,
+        retry_delay=1,
+        writer_options=None,
+        reference_cache_interval=60,
+        progress_interval=10,
+        logger=None,
+    ):
+        """Constructor of the Replayer.
+
+        Parameters
+        ----------
+        workers : int
+            Number of worker processes. If 1, events are written by the
+            calling process, which must be connected to the database.
+        batch_size : int
+            Number of events written in each transaction.
+        queue_size : int
+            Maximum number of batches waiting for each worker. Reading waits
+            for the workers when their queues are full.
+        retries : int
+            Maximum number of retries of a batch failing for transient reasons.
+        retry_delay : float
+            Time (in seconds) before the first retry, doubled on each retry.
+        writer_options : dict
+            Keyword arguments of the `WebhookDataWriter` of each worker.
+        reference_cache_interval : float
+            Interval of the reference cache of each worker process. If zero,
+            the reference tables are not loaded.
+        progress_interval : float
+            Time (in seconds) between logs of the progress.
+        logger : logging.Logger
+            If not supplied, it will instantiate a new logger from __name__.
+        """
+        self.workers = workers
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.writer_options = writer_options or {}
+        self.reference_cache_interval = reference_cache_interval
+        self.progress_interval = progress_interval
+        self.logger = logger or logging.getLogger(__name__)
+        logaugment.set(
+            self.logger,
+            code="",
+            site="Replayer",
+            server="",
+            event="",
+            keywords="null",
+        )
+
+    def run(self, events):
+        """Write events into the database.
+
+        Parameters
+        ----------
+        events : iterable of event_mapper.WebhookEvent
+            Events in order of reception.
+
+        Returns
+        -------
+        stats : dict
+            Number of events, meetings, batches, failed batches and failed
+            events, elapsed time (in seconds), throughput (in events per
+            second) and the same counters of each worker.
+
+        Raises
+        ------
+        ReplayError
+            If a worker process exited before writing all of its events.
+        """
+        self._read = 0
+        self._meetings = set()
+        self._start = self._progress_at = time.monotonic()
+
+        if self.workers > 1:
+            workers = self._run_workers(events)
+        else:
+            workers = [
+                _replay(
+                    self._batches(events),
+                    self.writer_options,
+                    self.retries,
+                    self.retry_delay,
+                )
+            ]
+        elapsed = time.monotonic() - self._start
+
+        stats = {
+            "events": self._read,
+            "meetings": len(self._meetings),
+            "elapsed": elapsed,
+            "events_per_second": self._read / elapsed if elapsed else 0.0,
+        }
+        for name in ("batches", "failed_batches", "failed_events"):
+            stats[name] = sum(worker[name] for worker in workers)
+        stats["workers"] = workers
+
+        return stats
+
+    def _batches(self, events):
+        partitioner = MeetingPartitioner(1)
+        batch = []
+        for event in self._count(events, partitioner):
+            batch.append(event)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+
+        if batch:
+            yield batch
+
+    def _run_workers(self, events):
+        context = multiprocessing.get_context()
+        batches = [context.Queue(self.queue_size) for _ in range(self.workers)]
+        results = context.Queue()
+        processes = [
+            context.Process(
+                name=f"replay-{index}",
+                target=_run_worker,
+                args=(
+                    index,
+                    batches[index],
+                    results,
+                    self.writer_options,
+                    self.retries,
+                    self.retry_delay,
+                    self.reference_cache_interval,
+                ),
+                daemon=True,
+            )
+            for index in range(self.workers)
+        ]
+        for process in processes:
+            process.start()
+
+        try:
+            partitioner = MeetingPartitioner(self.workers)
+            pending = [[] for _ in processes]
+            for event in self._count(events, partitioner):
+                index = partitioner.partition(event)
+                pending[index].append(event)
+                if len(pending[index]) >= self.batch_size:
+                    self._put(batches[index], processes[index], pending[index])
+                    pending[index] = []
+
+            for index, process in enumerate(processes):
+                if pending[index]:
+                    self._put(batches[index], process, pending[index])
+                self._put(batches[index], process, None)
+
+            workers = dict(self._get(results, processes) for _ in processes)
+            for process in processes:
+                process.join()
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+
+        return [workers[index] for index in range(self.workers)]
+
+    def _count(self, events, partitioner):
+        for event in events:
+            self._read += 1
+            self._meetings.add(partitioner.key(event))
+            self._log_progress()
+
+            yield event
+
+    def _log_progress(self):
+        now = time.monotonic()
+        if now - self._progress_at < self.progress_interval:
+            return
+
+        self._progress_at = now
+        logging_extra = {
+            "code": "Replay progress",
+            "site": "Replayer.run",
+            "keywords": ["replay", "progress", "throughput"],
+        }
+        self.logger.info(
+            f"Read {self._read} event(s) of {len(self._meetings)} meeting(s) "
+            f"({self._read / (now - self._start):.0f} events/s).",
+            extra=dict(logging_extra, keywords=json.dumps(logging_extra["keywords"])),
+        )
+
+    def _put(self, batches, process, batch):
+        while True:
+            try:
+                return batches.put(batch, timeout=1)
+            except queue.Full:
+                if not process.is_alive():
+                    raise ReplayError(
+                        f"Worker {process.name} exited with code {process.exitcode}"
+                    )
+
+    def _get(self, results, processes):
+        while True:
+            try:
+                return results.get(timeout=1)
+            except queue.Empty:
+                for process in processes:
+                    if process.exitcode not in (None, 0):
+                        raise ReplayError(
+                            f"Worker {process.name} exited with code "
+                            f"{process.exitcode}"
+                        )
+
+
+def _run_worker(
+    index, batches, results, writer_options, retries, retry_delay, cache_interval
+):
+    """Worker process writing the batches of its partition until None."""
+    DatabaseConnector.connect()
+    reference_cache.interval = cache_interval
+    if reference_cache.enabled:
+        reference_cache.refresh()
+
+    stats = _replay(iter(batches.get, None), writer_options, retries, retry_delay)
+    results.put((index, stats))
+
+
+def _replay(batches, writer_options, retries, retry_delay):
+    """Write batches of events with a new writer.
+
+    Returns
+    -------
+    stats : dict
+        Number of batches, failed batches and failed events.
+    """
+    writer = WebhookDataWriter(**writer_options)
+    writer.setup()
+
+    written = failed = 0
+    try:
+        for batch in batches:
+            written += 1
+            for attempt in range(retries + 1):
+                try:
+                    writer.write_batch(batch)
+                except TransientCallbackError:
+                    if attempt < retries:
+                        time.sleep(retry_delay * 2**attempt)
+                        continue
+                    failed += 1
+                except CallbackError:
+                    failed += 1  # Already logged.
+                break
+    finally:
+        writer.teardown()
+
+    return {
+        "batches": written,
+        "failed_batches": failed,
+        "failed_events": writer.stats()["failed_events"],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="mconf-aggr-replay",
+        description="Replay archived webhook events into the database.",
+    )
+    parser.add_argument(
+        "archives",
+        nargs="+",
+        metavar="ARCHIVE",
+        help="file of JSON lines, gzipped or not ('-' reads the standard input)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of worker processes (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1000,
+        help="number of events written in each transaction (default: 1000)",
+    )
+    parser.add_argument(
+        "--server-url", default="", help="server of the events without one"
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=3,
+        help="retries of batches failing for transient reasons (default: 3)",
+    )
+    parser.add_argument("--json", action="store_true", help="print stats as JSON")
+    args = parser.parse_args(argv)
+
+    reference_cache_interval = cfg.config["MCONF_WEBHOOK_REFERENCE_CACHE_INTERVAL"]
+    if args.workers <= 1:
+        DatabaseConnector.connect()
+        reference_cache.interval = reference_cache_interval
+        if reference_cache.enabled:
+            reference_cache.refresh()
+
+    reader = ArchiveReader(args.archives, server_url=args.server_url)
+    replayer = Replayer(
+        workers=args.workers,
+        batch_size=args.batch_size,
+        retries=args.retries,
+        writer_options=dict(
+            partial_updates=cfg.config["MCONF_WEBHOOK_PARTIAL_UPDATES"]
+        ),
+        reference_cache_interval=reference_cache_interval,
+    )
+    stats = replayer.run(reader)
+    stats["invalid"] = reader.invalid
+
+    if args.json:
+        print(json.dumps(stats))
+    else:
+        print(
+            f"Replayed {stats['events']} event(s) of {stats['meetings']} meeting(s) "
+            f"in {stats['elapsed']:.1f}s ({stats['events_per_second']:.0f} events/s): "
+            f"{stats['failed_events']} failed, {stats['invalid']} invalid."
+        )
+
+    return 1 if stats["failed_events"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""This module is responsible for exposing internal counters over HTTP.
+
+Components that keep counters (caches, channels, writers etc) register a
+`stats` callable in the listener and their current values are returned as
+JSON on GET requests.
+"""
+import json
+import logging
+
+import falcon
+import logaugment
+
+
+class StatsListener:
+    """Listener for the endpoint /stats."""
+
+    def __init__(self, logger=None):
+        """Constructor of the StatsListener.
+
+        Parameters
+        ----------
+        logger : logging.Logger
+            If not supplied, it will instantiate a new logger from __name__.
+        """
+        self._providers = {}
+        self.logger = logger or logging.getLogger(__name__)
+        logaugment.set(
+            self.logger,
+            code="",
+            site="StatsListener",
+            server="",
+            event="",
+            keywords="null",
+        )
+
+    def register(self, name, provider):
+        """Register a provider of counters.
+
+        Parameters
+        ----------
+        name : str
+            Key under which the counters are exposed.
+        provider : callable
+            Callable with no arguments returning a JSON-serializable dict.
+        """
+        self._providers[name] = provider
+
+    def stats(self):
+        """Collect the counters of all registered providers.
+
+        Returns
+        -------
+        stats : dict
+            Counters keyed by provider name.
+        """
+        logging_extra = {
+            "code": "Collect stats",
+            "site": "StatsListener.stats",
+            "keywords": ["stats", "counters", "listener"],
+        }
+
+        stats = {}
+        for name, provider in self._providers.items():
+            try:
+                stats[name] = provider()
+            except Exception as err:
+                logging_extra["keywords"] += ["exception", "warning"]
+                self.logger.warn(
+                    f"Unable to collect stats of '{name}': {err}",
+                    extra=dict(
+                        logging_extra, keywords=json.dumps(logging_extra["keywords"])
+                    ),
+                )
+                stats[name] = None
+
+        return stats
+
+    def on_get(self, req, resp):
+        """Handle GET requests.
+
+        Parameters
+        ----------
+        req : falcon.Request
+        resp : falcon.Response
+        """
+        resp.text = json.dumps(self.stats())
+        resp.status = falcon.HTTP_200
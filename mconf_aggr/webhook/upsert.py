@@ -0,0 +1,62 @@
+"""This module provides the creation of rows that may already exist.
+
+Handlers of meeting-created and recording events create rows of tables
+meetings_events and recordings unless they already exist. Looking them up
+before inserting them costs a round trip per event, and races when events of
+a meeting are written by more than one writer: both find no row and the second
+insert violates the unique constraint (on `internal_meeting_id` or
+`record_id`). On PostgreSQL, `insert_if_new` inserts the row with
+`INSERT ... ON CONFLICT DO NOTHING` instead, and tells whether it was new.
+
+Other dialects are not supported (see `is_supported`): handlers fall back to
+looking the row up first for them.
+"""
+import sqlalchemy
+from sqlalchemy.dialects import postgresql
+
+
+def is_supported(session):
+    """Whether `insert_if_new` is supported by the database of a session."""
+    return session.get_bind().dialect.name == "postgresql"
+
+
+def insert_if_new(session, row, **values):
+    """Insert a new row, unless it conflicts with an existing one.
+
+    The row itself is not added to the session: load it to change it further.
+
+    Parameters
+    ----------
+    session : sqlalchemy.Session
+        Session of a PostgreSQL database.
+    row : database_model.Base
+        Row to be inserted. Attributes not set are left to their defaults.
+    **values
+        Values of attributes of the row computed by the database (e.g. a
+        scalar subquery), by attribute name.
+
+    Returns
+    -------
+    int
+        Primary key of the row inserted, or None if it already existed.
+    """
+    mapper = sqlalchemy.inspect(type(row))
+    columns = {}
+    for prop in mapper.column_attrs:
+        value = values.get(prop.key, getattr(row, prop.key))
+        if value is not None:
+            columns[prop.columns[0]] = value
+
+    statement = (
+        postgresql.insert(mapper.local_table)
+        .values(columns)
+        .on_conflict_do_nothing()
+        .returning(*mapper.primary_key)
+    )
+
+    # Rows pending in the session (e.g. the meeting of a recording created in
+    # the same batch) must be seen by the statement.
+    session.flush()
+    inserted = session.execute(statement).first()
+
+    return inserted[0] if inserted is not None else None
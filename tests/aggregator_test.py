@@ -60,3 +60,15 @@ class TestAggregator(unittest.TestCase):
         self.assertIn(channel_1, self.aggregator.channels)
 
         self.assertNotIn(channel_2, self.aggregator.channels.keys())
+
+    def test_setup_one_thread_per_partition(self):
+        aggregator = Aggregator()
+        aggregator.register_callback(
+            mock.Mock(), channel="partitioned", partitions=4, partition_key=str
+        )
+
+        aggregator.setup()
+
+        self.assertEqual(len(aggregator.threads), 4)
+        channels = {thread.subscriber.channel.name for thread in aggregator.threads}
+        self.assertEqual(len(channels), 4)
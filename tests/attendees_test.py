@@ -0,0 +1,104 @@
+import json
+import unittest
+
+from mconf_aggr.webhook.attendees import Attendees
+
+
+def attendee(user_id):
+    return {"internal_user_id": user_id, "has_video": False}
+
+
+class TestAttendees(unittest.TestCase):
+    def setUp(self):
+        self.stored = [attendee("user-1"), attendee("user-2")]
+        self.attendees = Attendees(self.stored)
+
+    def test_get(self):
+        self.assertIs(self.attendees.get("user-2"), self.stored[1])
+        self.assertIsNone(self.attendees.get("user-3"))
+        self.assertIn("user-1", self.attendees)
+
+    def test_add_keeps_order_and_ignores_duplicates(self):
+        self.assertTrue(self.attendees.add(attendee("user-3")))
+        self.assertFalse(self.attendees.add(attendee("user-1")))
+
+        self.assertEqual(
+            [a["internal_user_id"] for a in self.attendees],
+            ["user-1", "user-2", "user-3"],
+        )
+        self.assertEqual(len(self.attendees), 3)
+
+    def test_remove(self):
+        self.assertEqual(self.attendees.remove("user-1"), attendee("user-1"))
+        self.assertIsNone(self.attendees.remove("user-1"))
+
+        self.assertEqual(self.attendees.to_json(), [attendee("user-2")])
+
+    def test_json_shape_is_unchanged(self):
+        self.attendees.get("user-1")["has_video"] = True
+
+        self.assertEqual(
+            json.dumps(self.attendees.to_json()),
+            json.dumps([dict(attendee("user-1"), has_video=True), attendee("user-2")]),
+        )
+
+    def test_empty(self):
+        self.assertEqual(Attendees(None).to_json(), [])
+        self.assertEqual(set(Attendees(None).counts().values()), {0})
+
+
+class TestAttendeesCounters(unittest.TestCase):
+    def setUp(self):
+        self.attendees = Attendees(
+            [
+                dict(attendee("user-1"), role="MODERATOR", has_joined_voice=True),
+                dict(attendee("user-2"), role="VIEWER"),
+                dict(attendee("user-3"), role="TRANSFER"),
+            ]
+        )
+
+    def test_counted_on_construction(self):
+        counts = self.attendees.counts()
+
+        self.assertEqual(counts["participant_count"], 2)
+        self.assertEqual(counts["transfer_count"], 1)
+        self.assertEqual(counts["moderator_count"], 1)
+        self.assertEqual(counts["voice_participant_count"], 1)
+        self.assertEqual(counts["video_count"], 0)
+
+    def test_follow_joins_leaves_and_changes(self):
+        self.attendees.add(dict(attendee("user-4"), role="MODERATOR", has_video=True))
+        self.attendees.remove("user-1")
+        self.assertTrue(
+            self.attendees.change(
+                "user-2", lambda attendee: attendee.update(is_listening_only=True)
+            )
+        )
+        self.assertFalse(self.attendees.change("user-5", lambda attendee: None))
+
+        counts = self.attendees.counts()
+        self.assertEqual(counts["participant_count"], 2)
+        self.assertEqual(counts["moderator_count"], 1)
+        self.assertEqual(counts["listener_count"], 1)
+        self.assertEqual(counts["voice_participant_count"], 0)
+        self.assertEqual(counts["video_count"], 1)
+        self.assertFalse(self.attendees.recount())
+
+    def test_copy_not_changed(self):
+        copy = self.attendees.copy()
+
+        self.attendees.change(
+            "user-2", lambda attendee: attendee.update(is_listening_only=True)
+        )
+        self.attendees.remove("user-1")
+
+        self.assertFalse(copy.get("user-2").get("is_listening_only"))
+        self.assertIn("user-1", copy)
+        self.assertEqual(copy.counts()["listener_count"], 0)
+
+    def test_recount_detects_drift(self):
+        self.attendees.get("user-2")["has_video"] = True
+
+        self.assertEqual(self.attendees.counts()["video_count"], 0)
+        self.assertTrue(self.attendees.recount())
+        self.assertEqual(self.attendees.counts()["video_count"], 1)
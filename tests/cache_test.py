@@ -0,0 +1,140 @@
+import unittest
+import unittest.mock as mock
+
+from mconf_aggr.webhook.cache import SecretCache
+from mconf_aggr.webhook.exceptions import DatabaseNotReadyError
+
+
+class TestSecretCache(unittest.TestCase):
+    def setUp(self):
+        self.handler_mock = mock.Mock()
+        self.handler_mock.secrets = mock.MagicMock(
+            return_value={"https://host0": "123", "https://host1": "1234"}
+        )
+        self.handler_mock.secret = mock.MagicMock(return_value="102030")
+        self.cache = SecretCache(ttl=60, handler=self.handler_mock)
+
+    def test_refresh_loads_in_bulk(self):
+        self.cache.refresh()
+
+        self.assertEqual(self.cache.secret("https://host0"), "123")
+        self.assertEqual(self.cache.secret("https://host1"), "1234")
+        self.handler_mock.secrets.assert_called_once()
+        self.handler_mock.secret.assert_not_called()
+
+    def test_miss_falls_back_to_handler(self):
+        self.assertEqual(self.cache.secret("https://host2"), "102030")
+        self.assertEqual(self.cache.secret("https://host2"), "102030")
+
+        self.handler_mock.secret.assert_called_once_with(
+            "https://host2", raise_exception=True
+        )
+
+    def test_stale_entry_is_reloaded(self):
+        with mock.patch("mconf_aggr.webhook.cache.time.monotonic", return_value=0):
+            self.cache.refresh()
+
+        with mock.patch("mconf_aggr.webhook.cache.time.monotonic", return_value=61):
+            self.assertEqual(self.cache.secret("https://host0"), "102030")
+
+        self.handler_mock.secret.assert_called_once_with(
+            "https://host0", raise_exception=True
+        )
+
+    def test_refresh_keeps_entries_on_database_error(self):
+        self.cache.refresh()
+        self.handler_mock.secrets.side_effect = DatabaseNotReadyError
+
+        self.cache.refresh()
+
+        self.assertEqual(self.cache.secret("https://host0"), "123")
+
+    def test_invalidate(self):
+        self.cache.refresh()
+
+        self.cache.invalidate("https://host0")
+        self.assertEqual(len(self.cache), 1)
+
+        self.cache.invalidate()
+        self.assertEqual(len(self.cache), 0)
+
+    def test_disabled(self):
+        cache = SecretCache(ttl=0, handler=self.handler_mock)
+        cache.start()
+
+        self.assertEqual(cache.secret("https://host0"), "102030")
+        self.assertEqual(cache.secret("https://host0"), "102030")
+
+        self.handler_mock.secrets.assert_not_called()
+        self.assertEqual(self.handler_mock.secret.call_count, 2)
+
+    def test_start_stop(self):
+        self.cache.start()
+
+        try:
+            self.assertEqual(self.cache.secret("https://host1"), "1234")
+        finally:
+            self.cache.stop()
+
+        self.assertIsNone(self.cache._refresh_thread)
+
+    def test_unknown_server_is_not_queried_again(self):
+        self.handler_mock.secret.return_value = None
+
+        self.assertIsNone(self.cache.secret("https://unknown"))
+        self.assertIsNone(self.cache.secret("https://unknown"))
+        self.assertIsNone(self.cache.secret("https://unknown"))
+
+        self.handler_mock.secret.assert_called_once()
+        self.assertEqual(self.cache.stats()["misses"], 1)
+        self.assertEqual(self.cache.stats()["negative_hits"], 2)
+
+    def test_unknown_server_expires(self):
+        self.handler_mock.secret.return_value = None
+
+        with mock.patch("mconf_aggr.webhook.cache.time.monotonic", return_value=0):
+            self.cache.secret("https://unknown")
+
+        with mock.patch("mconf_aggr.webhook.cache.time.monotonic", return_value=31):
+            self.cache.secret("https://unknown")
+
+        self.assertEqual(self.handler_mock.secret.call_count, 2)
+
+    def test_unknown_servers_are_bounded(self):
+        self.handler_mock.secret.return_value = None
+        cache = SecretCache(ttl=60, negative_size=2, handler=self.handler_mock)
+
+        for i in range(3):
+            cache.secret(f"https://unknown{i}")
+
+        self.assertEqual(cache.stats()["unknown_size"], 2)
+
+        # The least recently used one was evicted.
+        cache.secret("https://unknown0")
+        self.assertEqual(self.handler_mock.secret.call_count, 4)
+
+    def test_database_error_is_not_remembered(self):
+        self.handler_mock.secret.side_effect = DatabaseNotReadyError
+
+        self.assertIsNone(self.cache.secret("https://host2"))
+        self.assertIsNone(self.cache.secret("https://host2"))
+
+        self.assertEqual(self.handler_mock.secret.call_count, 2)
+        self.assertEqual(self.cache.stats()["unknown_size"], 0)
+
+    def test_refresh_forgets_unknown_server(self):
+        self.handler_mock.secret.return_value = None
+        self.cache.secret("https://host0")
+
+        self.cache.refresh()
+
+        self.assertEqual(self.cache.secret("https://host0"), "123")
+
+    def test_hits(self):
+        self.cache.refresh()
+
+        self.cache.secret("https://host0")
+        self.cache.secret("https://host1")
+
+        self.assertEqual(self.cache.stats()["hits"], 2)
+        self.assertEqual(self.cache.stats()["misses"], 0)
@@ -1,6 +1,21 @@
 import unittest
 
-from mconf_aggr.aggregator.aggregator import AggregatorCallback
+from mconf_aggr.aggregator.aggregator import (
+    AggregatorCallback,
+    CallbackError,
+    implements_run_batch,
+)
+
+
+class ListCallback(AggregatorCallback):
+    def __init__(self):
+        self.received = []
+
+    def run(self, data):
+        if data is None:
+            raise CallbackError()
+
+        self.received.append(data)
 
 
 class TestCallback(unittest.TestCase):
@@ -18,3 +33,23 @@ class TestCallback(unittest.TestCase):
     def test_run(self):
         with self.assertRaises(NotImplementedError):
             self.callback.run(None)
+
+    def test_run_batch_not_implemented(self):
+        with self.assertRaises(NotImplementedError):
+            self.callback.run_batch([None])
+
+    def test_run_batch_default_calls_run(self):
+        callback = ListCallback()
+
+        callback.run_batch([1, 2, 3])
+
+        self.assertEqual(callback.received, [1, 2, 3])
+        self.assertFalse(implements_run_batch(callback))
+
+    def test_run_batch_default_runs_remaining_on_error(self):
+        callback = ListCallback()
+
+        with self.assertRaises(CallbackError):
+            callback.run_batch([1, None, 3])
+
+        self.assertEqual(callback.received, [1, 3])
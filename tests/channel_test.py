@@ -1,9 +1,18 @@
 import logging
+import threading
 import unittest
 
 import logaugment
 
-from mconf_aggr.aggregator.aggregator import Channel
+from mconf_aggr.aggregator.aggregator import (
+    POLICY_REJECT,
+    POLICY_SHED,
+    Channel,
+    ChannelClosed,
+    ChannelEmpty,
+    ChannelFull,
+    PartitionedChannel,
+)
 
 
 class TestChannel(unittest.TestCase):
@@ -65,6 +74,149 @@ class TestChannel(unittest.TestCase):
 
         self.assertTrue(self.channel.empty())
 
+    def test_pop_many(self):
+        for i in range(4):
+            self.channel.publish(i)
+
+        self.assertEqual(self.channel.pop_many(3, 0), [0, 1, 2])
+        self.assertEqual(self.channel.pop_many(3, 0), [3])
+        self.assertTrue(self.channel.empty())
+
+    def test_pop_many_timeout(self):
+        self.channel.publish(1)
+
+        self.assertEqual(self.channel.pop_many(3, 0.01), [1])
+
+    def test_pop_timeout(self):
+        with self.assertRaises(ChannelEmpty):
+            self.channel.pop(0.01)
+
+        with self.assertRaises(ChannelEmpty):
+            self.channel.pop_many(3, 0, wait=0.01)
+
+    def test_pop_many_closed_while_reading(self):
+        self.channel.publish(1)
+        self.channel.publish(2)
+        self.channel.close()
+
+        self.assertEqual(self.channel.pop_many(5, 0), [1, 2])
+
+        # The channel remains closed for the next reader.
+        with self.assertRaises(ChannelClosed):
+            self.channel.pop_many(5, 0)
+
+    def test_publish_many_all_or_nothing(self):
+        channel = Channel("test_channel", maxsize=5, policy=POLICY_REJECT)
+        channel.publish_many([1, 2, 3])
+
+        with self.assertRaises(ChannelFull):
+            channel.publish_many([4, 5, 6])
+
+        self.assertEqual(channel.qsize(), 3)
+        channel.publish_many([4, 5])
+        self.assertEqual(channel.take_all(), [1, 2, 3, 4, 5])
+        self.assertEqual(channel.stats()["rejected"], 3)
+
+    def test_publish_many_waits_for_room(self):
+        channel = Channel("test_channel", maxsize=2, block_timeout=1)
+        channel.publish(1)
+        consumer = threading.Timer(0.05, channel.pop)
+        consumer.start()
+        self.addCleanup(consumer.join)
+
+        channel.publish_many([2, 3])
+
+        self.assertEqual(channel.take_all(), [2, 3])
+
+    def test_publish_many_beyond_maxsize_waits_for_empty(self):
+        channel = Channel("test_channel", maxsize=2, policy=POLICY_REJECT)
+
+        channel.publish_many([1, 2, 3])
+
+        with self.assertRaises(ChannelFull):
+            channel.publish(4)
+        self.assertEqual(channel.take_all(), [1, 2, 3])
+
+    def test_block_timeout(self):
+        channel = Channel("test_block_channel", maxsize=1, block_timeout=0.01)
+        channel.publish(1)
+
+        with self.assertRaises(ChannelFull):
+            channel.publish(2)
+
+        self.assertEqual(channel.stats()["rejected"], 1)
+
+    def test_reject(self):
+        channel = Channel("test_reject_channel", maxsize=2, policy=POLICY_REJECT)
+        channel.publish(1)
+        channel.publish(2)
+
+        with self.assertRaises(ChannelFull):
+            channel.publish(3)
+
+        self.assertEqual(channel.qsize(), 2)
+
+    def test_shed_above_high_watermark(self):
+        channel = Channel(
+            "test_shed_channel",
+            maxsize=4,
+            policy=POLICY_SHED,
+            block_timeout=0,
+            shed=lambda data: data < 0,
+        )
+        channel.publish(-1)
+        channel.publish(1)
+        channel.publish(2)
+        channel.publish(3)  # Reaches the high watermark.
+
+        channel.publish(-2)  # Shed.
+        with self.assertRaises(ChannelFull):
+            channel.publish(4)
+
+        self.assertEqual(channel.qsize(), 4)
+        self.assertEqual(channel.stats()["shed"], 1)
+
+    def test_watermarks(self):
+        channel = Channel("test_watermark_channel", maxsize=10)
+        for i in range(8):
+            channel.publish(i)
+
+        self.assertTrue(channel.stats()["above_high_watermark"])
+
+        for i in range(2):
+            channel.pop()
+        self.assertTrue(channel.stats()["above_high_watermark"])
+
+        channel.pop_many(5, 0)
+        self.assertFalse(channel.stats()["above_high_watermark"])
+        self.assertEqual(channel.stats()["high_watermark_hits"], 1)
+
+    def test_close_full(self):
+        channel = Channel("test_close_full_channel", maxsize=1)
+        channel.publish(1)
+
+        channel.close()
+
+        self.assertEqual(channel.pop(), 1)
+
+    def test_join(self):
+        self.channel.publish(1)
+        self.assertFalse(self.channel.join(0))
+
+        self.channel.pop()
+        self.assertFalse(self.channel.join(0))
+
+        self.channel.commit()
+        self.assertTrue(self.channel.join(0))
+
+    def test_take_all(self):
+        self.channel.publish(1)
+        self.channel.publish(2)
+        self.channel.close()
+
+        self.assertEqual(self.channel.take_all(), [1, 2])
+        self.assertTrue(self.channel.empty())
+
     def test_log_unwritten(self):
         # Enable log generation. It is disabled by tests.py by default.
         logging.disable(logging.NOTSET)
@@ -81,3 +233,71 @@ class TestChannel(unittest.TestCase):
 
         # Disable log generation again.
         logging.disable(logging.CRITICAL)
+
+
+class TestPartitionedChannel(unittest.TestCase):
+    def setUp(self):
+        self.channel = PartitionedChannel(
+            "test_partitioned_channel", 4, key=lambda data: data[0]
+        )
+
+    def test_same_key_same_partition(self):
+        for i in range(10):
+            self.channel.publish(("meeting-1", i))
+
+        partition = self.channel.partition(("meeting-1", None))
+        self.assertEqual(partition.qsize(), 10)
+        self.assertEqual([partition.pop()[1] for i in range(10)], list(range(10)))
+
+    def test_keys_are_spread(self):
+        for i in range(100):
+            self.channel.publish((f"meeting-{i}", i))
+
+        depths = [partition.qsize() for partition in self.channel.partitions]
+        self.assertEqual(sum(depths), 100)
+        self.assertTrue(all(depths))
+
+    def test_invalid_key(self):
+        self.channel.publish(None)
+
+        self.assertEqual(self.channel.qsize(), 1)
+
+    def test_stats(self):
+        self.channel.publish(("meeting-1", 1))
+        self.channel.partition(("meeting-1", None)).pop()
+        self.channel.publish(("meeting-2", 2))
+
+        stats = self.channel.stats()
+        self.assertEqual(stats["depth"], 1)
+        self.assertEqual(len(stats["partitions"]), 4)
+        self.assertEqual(sum(p["published"] for p in stats["partitions"]), 2)
+        self.assertEqual(sum(p["consumed"] for p in stats["partitions"]), 1)
+
+    def test_close(self):
+        self.channel.close()
+
+        for partition in self.channel.partitions:
+            with self.assertRaises(ChannelClosed):
+                partition.pop()
+
+    def test_publish_many_all_or_nothing(self):
+        channel = PartitionedChannel(
+            "test_partitioned_channel",
+            4,
+            key=lambda data: data[0],
+            maxsize=2,
+            policy=POLICY_REJECT,
+        )
+        full = channel.partition(("meeting-1", None))
+        other = next(
+            f"meeting-{i}"
+            for i in range(2, 100)
+            if channel.partition((f"meeting-{i}", None)) is not full
+        )
+        channel.publish_many([("meeting-1", 1), ("meeting-1", 2)])
+
+        with self.assertRaises(ChannelFull):
+            channel.publish_many([(other, 1), ("meeting-1", 3)])
+
+        self.assertEqual(channel.qsize(), 2)
+        self.assertEqual(channel.stats()["depth"], 2)
@@ -0,0 +1,34 @@
+import unittest
+import unittest.mock as mock
+
+import psycopg2
+
+from mconf_aggr.webhook.database import gevent_wait_callback
+
+
+class TestGeventWaitCallback(unittest.TestCase):
+    def test_wait_until_ok(self):
+        conn_mock = mock.Mock()
+        conn_mock.fileno.return_value = 42
+        conn_mock.poll.side_effect = [
+            psycopg2.extensions.POLL_WRITE,
+            psycopg2.extensions.POLL_READ,
+            psycopg2.extensions.POLL_OK,
+        ]
+
+        with mock.patch(
+            "mconf_aggr.webhook.database.wait_read"
+        ) as wait_read_mock, mock.patch(
+            "mconf_aggr.webhook.database.wait_write"
+        ) as wait_write_mock:
+            gevent_wait_callback(conn_mock)
+
+        wait_write_mock.assert_called_once_with(42, timeout=None)
+        wait_read_mock.assert_called_once_with(42, timeout=None)
+
+    def test_bad_state(self):
+        conn_mock = mock.Mock()
+        conn_mock.poll.return_value = -1
+
+        with self.assertRaises(psycopg2.OperationalError):
+            gevent_wait_callback(conn_mock)
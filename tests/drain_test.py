@@ -0,0 +1,148 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from mconf_aggr.aggregator.aggregator import Aggregator, AggregatorCallback
+from mconf_aggr.aggregator.drain import DrainCoordinator
+from mconf_aggr.aggregator.utils import RequestTimeLogger
+
+
+class BlockingCallback(AggregatorCallback):
+    def __init__(self):
+        self.received = []
+        self.release = threading.Event()
+
+    def setup(self):
+        pass
+
+    def teardown(self):
+        pass
+
+    def run(self, data):
+        self.release.wait()
+        self.received.append(data)
+
+
+class BlockingTeardownCallback(BlockingCallback):
+    def teardown(self):
+        self.release.wait()
+
+
+def encode(data):
+    return json.dumps(data).encode("utf-8")
+
+
+def decode(data):
+    return json.loads(data)
+
+
+class TestDrainCoordinator(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.spill_file = os.path.join(self.directory, "spill.jsonl")
+        self.callback = BlockingCallback()
+        self.aggregator = Aggregator()
+        self.aggregator.register_callback(self.callback, channel="drain")
+        self.aggregator.setup()
+        self.aggregator.start()
+        self.coordinator = DrainCoordinator(
+            self.aggregator,
+            deadline=0.1,
+            progress_interval=0.05,
+            spill_file=self.spill_file,
+            encode=encode,
+            decode=decode,
+        )
+
+    def tearDown(self):
+        self.callback.release.set()
+        self.aggregator.stop()
+        shutil.rmtree(self.directory)
+
+    def test_drain(self):
+        self.callback.release.set()
+        for i in range(3):
+            self.aggregator.publisher.publish(i, channel="drain")
+
+        self.assertTrue(self.coordinator.drain())
+
+        self.assertTrue(self.coordinator.draining)
+        self.assertEqual(self.callback.received, [0, 1, 2])
+        self.assertFalse(os.path.exists(self.spill_file))
+
+    def test_deadline_spills_and_restores(self):
+        for i in range(3):
+            self.aggregator.publisher.publish({"data": i}, channel="drain")
+
+        # Let the element being handled finish only after the deadline.
+        release_timer = threading.Timer(0.3, self.callback.release.set)
+        release_timer.start()
+
+        self.assertFalse(self.coordinator.drain())
+
+        # The first element was being handled at the deadline.
+        with open(self.spill_file) as spill_file:
+            self.assertEqual(len(spill_file.readlines()), 2)
+
+        aggregator = Aggregator()
+        aggregator.register_callback(BlockingCallback(), channel="drain")
+        coordinator = DrainCoordinator(
+            aggregator, spill_file=self.spill_file, decode=decode
+        )
+
+        self.assertEqual(coordinator.restore(), 2)
+
+        channel = aggregator.channels["drain"][0].channel
+        self.assertEqual(channel.pop_many(5, 0), [{"data": 1}, {"data": 2}])
+        self.assertFalse(os.path.exists(self.spill_file))
+
+    def test_callback_blocked_past_deadline(self):
+        for i in range(3):
+            self.aggregator.publisher.publish({"data": i}, channel="drain")
+
+        # The callback is released only in tearDown, long after the deadline.
+        drain_thread = threading.Thread(target=self.coordinator.drain, daemon=True)
+        drain_thread.start()
+        drain_thread.join(2)
+
+        self.assertFalse(drain_thread.is_alive())
+        with open(self.spill_file) as spill_file:
+            self.assertEqual(len(spill_file.readlines()), 2)
+        self.assertTrue(any(thread.is_alive() for thread in self.aggregator.threads))
+
+    def test_teardown_blocked_past_deadline(self):
+        callback = BlockingTeardownCallback()
+        aggregator = Aggregator()
+        aggregator.register_callback(callback, channel="teardown")
+        aggregator.setup()
+        aggregator.start()
+        coordinator = DrainCoordinator(aggregator, deadline=0.1)
+
+        drain_thread = threading.Thread(target=coordinator.drain, daemon=True)
+        drain_thread.start()
+        drain_thread.join(2)
+        callback.release.set()
+
+        self.assertFalse(drain_thread.is_alive())
+
+
+class TestRequestTimeLogger(unittest.TestCase):
+    def test_wait_idle(self):
+        self.assertTrue(RequestTimeLogger.wait_idle(0))
+
+        with RequestTimeLogger.time_logger_requests(lambda *args, **kwargs: None, ""):
+            self.assertFalse(RequestTimeLogger.wait_idle(0.01))
+
+        self.assertTrue(RequestTimeLogger.wait_idle(0))
+
+    def test_count_on_error(self):
+        with self.assertRaises(ValueError):
+            with RequestTimeLogger.time_logger_requests(
+                lambda *args, **kwargs: None, ""
+            ):
+                raise ValueError()
+
+        self.assertEqual(RequestTimeLogger.current_requests_count, 0)
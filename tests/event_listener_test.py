@@ -6,6 +6,13 @@ from unittest.mock import MagicMock, call
 import falcon
 
 import mconf_aggr.aggregator.cfg as cfg
+from mconf_aggr.aggregator.aggregator import (
+    POLICY_REJECT,
+    Channel,
+    ChannelFull,
+    Publisher,
+    Subscriber,
+)
 from mconf_aggr.webhook.event_listener import (
     AuthMiddleware,
     WebhookEventHandler,
@@ -13,7 +20,11 @@ from mconf_aggr.webhook.event_listener import (
     WebhookResponse,
     _normalize_server_url,
 )
-from mconf_aggr.webhook.exceptions import RequestProcessingError, WebhookError
+from mconf_aggr.webhook.exceptions import (
+    RequestProcessingError,
+    ServiceUnavailableError,
+    WebhookError,
+)
 
 
 class TestListener(unittest.TestCase):
@@ -88,6 +99,41 @@ class TestListener(unittest.TestCase):
 
         self.assertEqual(resp_mock.status, falcon.HTTP_200)
 
+    def test_process_event_unavailable(self):
+        req_mock = mock.Mock()
+        resp_mock = mock.Mock()
+
+        event_handler_mock = mock.Mock()
+        event_handler_mock.process_event = MagicMock(
+            side_effect=ServiceUnavailableError
+        )
+        self.event_listener.event_handler = event_handler_mock
+
+        self.event_listener.on_post(req_mock, resp_mock)
+
+        resp_body = json.loads(resp_mock.text)
+
+        self.assertEqual(resp_body["status"], "Error")
+
+        self.assertEqual(resp_mock.status, falcon.HTTP_503)
+        resp_mock.set_header.assert_called_with("Retry-After", "5")
+
+    def test_refused_while_draining(self):
+        req_mock = mock.Mock()
+        resp_mock = mock.Mock()
+
+        event_handler_mock = mock.Mock()
+        drain_coordinator_mock = mock.Mock()
+        drain_coordinator_mock.draining = True
+        event_listener = WebhookEventListener(
+            event_handler_mock, drain_coordinator=drain_coordinator_mock
+        )
+
+        event_listener.on_post(req_mock, resp_mock)
+
+        event_handler_mock.process_event.assert_not_called()
+        self.assertEqual(resp_mock.status, falcon.HTTP_503)
+
 
 class TestResponse(unittest.TestCase):
     def setUp(self):
@@ -203,7 +249,7 @@ class TestWebhookEventHandler(unittest.TestCase):
         ):
             self.event_handler.process_event("localhost", self.event)
 
-        self.event_handler.publisher.publish.assert_not_called()
+        self.event_handler.publisher.publish_many.assert_not_called()
 
     def test_publish_called_only_when_valid(self):
         mapped_events = [mapped_1, mapped_2, mapped_3] = [
@@ -217,15 +263,41 @@ class TestWebhookEventHandler(unittest.TestCase):
         ):
             self.event_handler.process_event("localhost", self.event)
 
-            calls = [
-                call(mapped_1, channel=self.channel_mock),
-                call(mapped_3, channel=self.channel_mock),
-            ]
-
-            self.event_handler.publisher.publish.assert_has_calls(
-                calls, any_order=False
+            self.event_handler.publisher.publish_many.assert_called_once_with(
+                [mapped_1, mapped_3], channel=self.channel_mock
             )
 
+    def test_channel_full(self):
+        mapper_mock = mock.MagicMock(return_value=mock.Mock())
+        self.publisher_mock.publish_many.side_effect = ChannelFull
+        with mock.patch(
+            "mconf_aggr.webhook.event_listener.map_webhook_event", mapper_mock
+        ):
+            with self.assertRaises(ServiceUnavailableError):
+                self.event_handler.process_event("localhost", self.event)
+
+        # The events of the message are published at once, all or none.
+        self.publisher_mock.publish_many.assert_called_once()
+        self.assertEqual(len(self.publisher_mock.publish_many.call_args[0][0]), 3)
+
+    def test_channel_full_publishes_nothing_of_the_message(self):
+        publisher = Publisher()
+        channel = Channel("webhooks", maxsize=4, policy=POLICY_REJECT)
+        publisher.update_channels({"webhooks": [Subscriber(channel, None)]})
+        self.event_handler.publisher = publisher
+        self.event_handler.channel = "webhooks"
+        channel.publish(mock.Mock(event=0))
+
+        with mock.patch(
+            "mconf_aggr.webhook.event_listener.map_webhook_event",
+            side_effect=lambda event: mock.Mock(event=event["id"]),
+        ):
+            self.event_handler.process_event("localhost", '[{"id": 1}, {"id": 2}]')
+            with self.assertRaises(ServiceUnavailableError):
+                self.event_handler.process_event("localhost", '[{"id": 3}, {"id": 4}]')
+
+        self.assertEqual([data.event for data in channel.take_all()], [0, 1, 2])
+
     def test_normalize_server_url(self):
         server_url = "my-server.com"
         self.assertEqual(_normalize_server_url(server_url), "https://my-server.com")
@@ -0,0 +1,232 @@
+import datetime
+import unittest
+import unittest.mock as mock
+
+import sqlalchemy
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from mconf_aggr.aggregator.aggregator import CallbackError, TransientCallbackError
+from mconf_aggr.webhook.database import DatabaseConnector
+from mconf_aggr.webhook.event_log import (
+    EventLogProjector,
+    EventLogWriter,
+    event_log_table,
+    metadata,
+    offsets_table,
+    partition_of,
+)
+from mconf_aggr.webhook.event_mapper import (
+    MeetingEndedEvent,
+    WebhookEvent,
+    webhook_event_to_dict,
+)
+from mconf_aggr.webhook.exceptions import ProjectionConflictError
+
+
+def meeting_ended(int_id):
+    return WebhookEvent(
+        "meeting-ended", MeetingEndedEvent("external", int_id, 1), "server"
+    )
+
+
+class SessionWriter:
+    """Writer applying nothing but what is done before commit, as WebhookDataWriter."""
+
+    def __init__(self):
+        self.written = []
+        self.error = None
+        self.concurrently = None
+        self.holding = set()  # Meetings whose events are held.
+        self.writing = []
+
+    def teardown(self):
+        self.holding.clear()
+
+    def held(self):
+        # Events of the batch being written are held before it is committed.
+        return [
+            event
+            for batch in self.written + [self.writing]
+            for event in batch
+            if event.event.internal_meeting_id in self.holding
+        ]
+
+    def write_batch(self, data, before_commit=None):
+        self.writing = data
+        try:
+            with DatabaseConnector.get_session_scope()() as session:
+                if self.concurrently is not None:
+                    session.execute(self.concurrently)
+                before_commit(session)
+                if self.error is not None:
+                    raise self.error
+        finally:
+            self.writing = []
+        self.written.append(data)
+
+
+class EventLogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine(
+            "sqlite://",
+            poolclass=StaticPool,
+            connect_args={"check_same_thread": False},
+        )
+        metadata.create_all(self.engine)
+        patcher = mock.patch.object(
+            DatabaseConnector, "Session", sessionmaker(bind=self.engine)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def rows(self, table):
+        with self.engine.connect() as connection:
+            return connection.execute(select(table)).all()
+
+
+class TestEventLogWriter(EventLogTestCase):
+    def test_appends_batch(self):
+        writer = EventLogWriter()
+
+        writer.run_batch([meeting_ended("meeting-1"), meeting_ended("meeting-2")])
+        writer.run(meeting_ended("meeting-3"))
+
+        rows = self.rows(event_log_table)
+        self.assertEqual(
+            [row.internal_meeting_id for row in rows],
+            ["meeting-1", "meeting-2", "meeting-3"],
+        )
+        self.assertEqual(
+            rows[0].payload, webhook_event_to_dict(meeting_ended("meeting-1"))
+        )
+        self.assertEqual(writer.stats()["batches"], 2)
+        self.assertEqual(writer.stats()["events"], 3)
+
+    def test_errors(self):
+        writer = EventLogWriter()
+        metadata.drop_all(self.engine)
+
+        with self.assertRaises(CallbackError):
+            writer.run(meeting_ended("meeting-1"))
+
+        with mock.patch.object(
+            DatabaseConnector,
+            "Session",
+            side_effect=sqlalchemy.exc.OperationalError("", {}, Exception()),
+        ):
+            with self.assertRaises(TransientCallbackError):
+                writer.run(meeting_ended("meeting-1"))
+
+        self.assertEqual(writer.stats()["failed_batches"], 2)
+
+    def test_creates_partitions_once_on_postgresql(self):
+        writer = EventLogWriter()
+        with mock.patch("mconf_aggr.webhook.event_log.session_scope") as scope_mock:
+            connection = scope_mock().__enter__().connection()
+            connection.dialect.name = "postgresql"
+
+            writer.run(meeting_ended("meeting-1"))
+            writer.run(meeting_ended("meeting-2"))
+
+        created = [args[0] for args, _ in connection.exec_driver_sql.call_args_list]
+        self.assertEqual(len(created), 2)
+        self.assertIn("PARTITION OF event_log", created[0])
+
+    def test_partition_of(self):
+        self.assertEqual(
+            partition_of(datetime.datetime(2026, 12, 31, 23, 59)),
+            ("event_log_202612", datetime.date(2026, 12, 1), datetime.date(2027, 1, 1)),
+        )
+
+
+class TestEventLogProjector(EventLogTestCase):
+    def setUp(self):
+        super().setUp()
+        EventLogWriter().run_batch([meeting_ended(f"meeting-{i}") for i in range(5)])
+        self.writer = SessionWriter()
+        self.projector = EventLogProjector(self.writer, batch_size=3)
+
+    def projected(self):
+        return [
+            event.event.internal_meeting_id
+            for batch in self.writer.written
+            for event in batch
+        ]
+
+    def test_projects_in_order_from_position(self):
+        self.assertEqual(self.projector.project(), 3)
+        self.assertEqual(self.projector.project(), 2)
+        self.assertEqual(self.projector.project(), 0)
+
+        self.assertEqual(self.projected(), [f"meeting-{i}" for i in range(5)])
+        self.assertEqual(self.rows(offsets_table)[0].position, 5)
+        self.assertEqual(self.projector.stats()["lag"], 0)
+
+    def test_position_kept_on_error(self):
+        self.writer.error = CallbackError()
+
+        with self.assertRaises(CallbackError):
+            self.projector.project()
+
+        self.assertEqual(self.rows(offsets_table)[0].position, 0)
+
+    def test_reset_rebuilds(self):
+        self.projector.project()
+        self.projector.project()
+
+        self.projector.reset()
+        self.projector.project()
+
+        self.assertEqual(len(self.projected()), 8)
+
+    def test_invalid_event_skipped(self):
+        with self.engine.begin() as connection:
+            connection.execute(
+                event_log_table.update()
+                .where(event_log_table.c.id == 1)
+                .values(payload={"type": "Unknown"})
+            )
+
+        self.assertEqual(self.projector.project(), 3)
+
+        self.assertEqual(self.projected(), ["meeting-1", "meeting-2"])
+        self.assertEqual(self.projector.stats()["invalid"], 1)
+
+    def test_position_moved_by_someone_else(self):
+        self.writer.concurrently = offsets_table.update().values(position=1)
+
+        with self.assertRaises(ProjectionConflictError):
+            self.projector.project()
+
+        self.assertEqual(self.rows(offsets_table)[0].position, 0)
+
+    def test_position_stops_before_held_event(self):
+        self.writer.holding.add("meeting-1")
+
+        self.assertEqual(self.projector.project(), 3)
+        self.assertEqual(self.rows(offsets_table)[0].position, 1)
+        self.assertEqual(self.projector.project(), 2)
+        self.assertEqual(self.projector.project(), 0)
+
+        self.assertEqual(self.projected(), [f"meeting-{i}" for i in range(5)])
+        self.assertEqual(self.rows(offsets_table)[0].position, 1)
+
+        # Events after the one held are applied again after a crash.
+        restarted = EventLogProjector(SessionWriter(), batch_size=10)
+        self.assertEqual(restarted.project(), 4)
+        restarted.reset(1)
+
+        self.writer.holding.clear()
+        self.assertEqual(self.projector.project(), 0)
+
+        self.assertEqual(self.rows(offsets_table)[0].position, 5)
+
+    def test_stop_advances_past_events_written(self):
+        self.writer.holding.add("meeting-1")
+        self.projector.project()
+
+        self.projector.stop()
+
+        self.assertEqual(self.rows(offsets_table)[0].position, 3)
@@ -1,7 +1,8 @@
 import unittest
-import unittest.mock as mock
 
 from mconf_aggr.webhook.event_mapper import (
+    _MAPPERS,
+    _MAPPING_SPEC,
     MeetingCreatedEvent,
     MeetingEndedEvent,
     RapPublishEndedEvent,
@@ -11,7 +12,10 @@ from mconf_aggr.webhook.event_mapper import (
     UserLeftEvent,
     UserVoiceEnabledEvent,
     WebhookEvent,
-    _get_nested,
+    _compile,
+    _compile_spec,
+    decode_webhook_event,
+    encode_webhook_event,
     map_webhook_event,
 )
 from mconf_aggr.webhook.exceptions import (
@@ -97,14 +101,6 @@ class TestMapping(unittest.TestCase):
             ),
         )
 
-        with mock.patch(
-            "mconf_aggr.webhook.event_mapper._map_create_event"
-        ) as _map_create_event_mock:
-            map_webhook_event(event)
-            _map_create_event_mock.assert_called_with(
-                event, "meeting-created", "localhost"
-            )
-
         got = map_webhook_event(event)
 
         self.assertEqual(got, expected)
@@ -135,14 +131,6 @@ class TestMapping(unittest.TestCase):
             ),
         )
 
-        with mock.patch(
-            "mconf_aggr.webhook.event_mapper._map_end_event"
-        ) as _map_end_event_mock:
-            map_webhook_event(event)
-            _map_end_event_mock.assert_called_with(
-                event, "meeting-ended", "mocked-server"
-            )
-
         got = map_webhook_event(event)
 
         self.assertEqual(got, expected)
@@ -186,14 +174,6 @@ class TestMapping(unittest.TestCase):
             ),
         )
 
-        with mock.patch(
-            "mconf_aggr.webhook.event_mapper._map_user_joined_event"
-        ) as _map_user_joined_event_mock:
-            map_webhook_event(event)
-            _map_user_joined_event_mock.assert_called_with(
-                event, "user-joined", "mocked-server"
-            )
-
         got = map_webhook_event(event)
 
         self.assertEqual(got, expected)
@@ -231,14 +211,6 @@ class TestMapping(unittest.TestCase):
             ),
         )
 
-        with mock.patch(
-            "mconf_aggr.webhook.event_mapper._map_user_left_event"
-        ) as _map_user_left_event_mock:
-            map_webhook_event(event)
-            _map_user_left_event_mock.assert_called_with(
-                event, "user-left", "mocked-server"
-            )
-
         got = map_webhook_event(event)
 
         self.assertEqual(got, expected)
@@ -279,14 +251,6 @@ class TestMapping(unittest.TestCase):
             ),
         )
 
-        with mock.patch(
-            "mconf_aggr.webhook.event_mapper._map_user_voice_enabled_event"
-        ) as _map_user_voice_enabled_event_mock:
-            map_webhook_event(event)
-            _map_user_voice_enabled_event_mock.assert_called_with(
-                event, "user-audio-voice-enabled", "mocked-server"
-            )
-
         got = map_webhook_event(event)
 
         self.assertEqual(got, expected)
@@ -323,14 +287,6 @@ class TestMapping(unittest.TestCase):
             ),
         )
 
-        with mock.patch(
-            "mconf_aggr.webhook.event_mapper._map_user_event"
-        ) as _map_user_event_mock:
-            map_webhook_event(event)
-            _map_user_event_mock.assert_called_with(
-                event, "user-audio-voice-disabled", "mocked-server"
-            )
-
         got = map_webhook_event(event)
 
         self.assertEqual(got, expected)
@@ -410,14 +366,6 @@ class TestMapping(unittest.TestCase):
             ),
         )
 
-        with mock.patch(
-            "mconf_aggr.webhook.event_mapper._map_rap_publish_ended_event"
-        ) as _map_rap_publish_ended_event_mock:
-            map_webhook_event(event)
-            _map_rap_publish_ended_event_mock.assert_called_with(
-                event, "rap-publish-ended", "mocked-server"
-            )
-
         got = map_webhook_event(event)
 
         self.assertEqual(got, expected)
@@ -450,45 +398,84 @@ class TestMapping(unittest.TestCase):
             ),
         )
 
-        with mock.patch(
-            "mconf_aggr.webhook.event_mapper._map_rap_publish_event"
-        ) as _map_rap_event_mock:
-            map_webhook_event(event)
-            _map_rap_event_mock.assert_called_with(
-                event, "rap-publish-started", "mocked-server"
-            )
-
         got = map_webhook_event(event)
 
         self.assertEqual(got, expected)
 
-    def test_get_nested(self):
-        d = {}
-        expected = ""
-        got = _get_nested(d, ["key1"], "")
 
-        self.assertEqual(got, expected)
+class TestMappingSpec(unittest.TestCase):
+    def test_every_event_type_is_mapped(self):
+        event_types = [
+            event_type
+            for event_types, _, _ in _MAPPING_SPEC
+            for event_type in event_types
+        ]
 
-        d = {"key1": "value1", "key2": True}
-        expected = "value1"
-        got = _get_nested(d, ["key1"], "")
+        self.assertEqual(sorted(event_types), sorted(_MAPPERS))
 
-        self.assertEqual(got, expected)
+    def test_voice_enabled_is_not_a_user_event(self):
+        event = {
+            "server_url": "mocked-server",
+            "data": {"id": "user-audio-voice-enabled", "attributes": {}},
+        }
 
-        d = {"key1": {"key2": {"key3": "value3"}}, "key4": True}
-        expected = "value3"
-        got = _get_nested(d, ["key1", "key2", "key3"], "")
+        got = map_webhook_event(event)
 
-        self.assertEqual(got, expected)
+        self.assertIsInstance(got.event, UserVoiceEnabledEvent)
+
+    def test_missing_and_invalid_paths_get_defaults(self):
+        extract = _compile(
+            MeetingEndedEvent,
+            {
+                "external_meeting_id": (("data", "meeting", "external"), "e"),
+                "internal_meeting_id": (("data", "meeting", "internal"), "i"),
+                "end_time": (("data", "event", "ts"), 0),
+            },
+        )
 
-        d = {"key1": {"key2": {"key3": "value3"}}, "key4": False}
-        expected = True
-        got = _get_nested(d, ["key1", "key2", "key5"], True)
+        got = extract({"data": {"meeting": "not a dict", "event": {"ts": 5}}}, "")
 
-        self.assertEqual(got, expected)
+        self.assertEqual(got, MeetingEndedEvent("e", "i", 5))
 
-        d = {"key1": {"key2": {"key3": "value3"}}, "key4": False}
-        expected = {"key3": "value3"}
-        got = _get_nested(d, ["key1", "key2"], True)
+    def test_fields_must_match_event(self):
+        with self.assertRaises(ValueError):
+            _compile(MeetingEndedEvent, {"end_time": (("ts",), 0)})
 
-        self.assertEqual(got, expected)
+    def test_event_type_mapped_twice(self):
+        spec = [
+            (["meeting-ended"], MeetingEndedEvent, _MAPPING_SPEC[1][2]),
+            (["meeting-ended"], MeetingEndedEvent, _MAPPING_SPEC[1][2]),
+        ]
+
+        with self.assertRaises(ValueError):
+            _compile_spec(spec)
+
+
+class TestSerialization(unittest.TestCase):
+    def test_encode_decode(self):
+        webhook_event = WebhookEvent(
+            event_type="user-joined",
+            server_url="mocked-server",
+            event=UserJoinedEvent(
+                name="madeup-name",
+                role="MODERATOR",
+                internal_user_id="madeup-internal-user-id",
+                external_user_id="madeup-external-user-id",
+                internal_meeting_id="madeup-internal-meeting-id",
+                external_meeting_id="madeup-external-meeting-id",
+                join_time=1502810164922,
+                is_presenter=False,
+                userdata={"madeup-key": "madeup-value"},
+            ),
+        )
+
+        got = decode_webhook_event(encode_webhook_event(webhook_event))
+
+        self.assertEqual(got, webhook_event)
+
+    def test_decode_invalid(self):
+        with self.assertRaises(InvalidWebhookEventError):
+            decode_webhook_event(b'{"type": "UnknownEvent", "event": {}}')
+
+        with self.assertRaises(InvalidWebhookEventError):
+            decode_webhook_event(b"not json")
@@ -0,0 +1,167 @@
+import json
+import os
+import tempfile
+import unittest
+import unittest.mock as mock
+
+from sqlalchemy.orm import Session
+
+from mconf_aggr.webhook.database import DatabaseConnector
+from mconf_aggr.webhook.database_handler import WebhookDataWriter
+from mconf_aggr.webhook.database_model import MeetingsEvents, Servers, UsersEvents
+from mconf_aggr.webhook.event_mapper import map_webhook_event
+from mconf_aggr.webhook.exceptions import DatabaseNotReadyError
+from mconf_aggr.webhook.local_database import (
+    LOCAL_SEED,
+    LocalDatabase,
+    TemporaryPostgreSQL,
+    load_seed,
+)
+from mconf_aggr.webhook.migrations.migrator import Migrator
+from mconf_aggr.webhook.migrations.versions import MIGRATIONS
+
+
+def received(event_type, ts, user=None):
+    """Webhook event of meeting "local" from the server of the local seed."""
+    attributes = {
+        "meeting": {
+            "internal-meeting-id": "local",
+            "external-meeting-id": "local-e",
+            "create-time": ts,
+            "metadata": {"mconflb-institution-name": "local"},
+        },
+        "event": {"ts": ts},
+    }
+    if user is not None:
+        attributes["user"] = {
+            "internal-user-id": user,
+            "external-user-id": user,
+            "name": user,
+            "role": "VIEWER",
+        }
+
+    return map_webhook_event(
+        {
+            "server_url": "https://localhost",
+            "data": {
+                "type": "event",
+                "id": event_type,
+                "attributes": attributes,
+                "event": {"ts": ts},
+            },
+        }
+    )
+
+
+class LocalDatabaseTestCase(unittest.TestCase):
+    def setUp(self):
+        # Restore the connection of other tests afterwards.
+        for name in ("engine", "Session"):
+            patcher = mock.patch.object(DatabaseConnector, name)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def start(self, local_database):
+        self.addCleanup(local_database.stop)
+        DatabaseConnector.connect(local_database.start())
+        self.addCleanup(DatabaseConnector.engine.dispose)
+        local_database.create(DatabaseConnector.engine)
+
+
+class TestLocalDatabase(LocalDatabaseTestCase):
+    def test_writer_runs_on_memory_database(self):
+        self.start(LocalDatabase())
+        writer = WebhookDataWriter()
+
+        writer.run_batch(
+            [received("meeting-created", 1), received("user-joined", 2, user="user")]
+        )
+        writer.run_batch(
+            [received("user-left", 3, user="user"), received("meeting-ended", 4)]
+        )
+
+        self.assertEqual(writer.stats()["failed_events"], 0)
+        with Session(DatabaseConnector.engine) as session:
+            meeting = session.query(MeetingsEvents).one()
+            self.assertEqual(
+                (meeting.end_time, meeting.unique_users, meeting.server_guid),
+                (4, 1, "local-server"),
+            )
+            self.assertEqual(meeting.shared_secret_guid, "local-shared-secret")
+            self.assertEqual(session.query(UsersEvents.leave_time).scalar(), 3)
+
+    def test_file_database_kept_between_runs(self):
+        url = f"sqlite:///{os.path.join(self.directory, 'local.db')}"
+        self.start(LocalDatabase(url))
+        WebhookDataWriter().run_batch([received("meeting-created", 1)])
+
+        self.start(LocalDatabase(url))
+
+        with Session(DatabaseConnector.engine) as session:
+            self.assertEqual(session.query(MeetingsEvents).count(), 1)
+            self.assertEqual(session.query(Servers).count(), len(LOCAL_SEED["servers"]))
+        self.assertEqual(Migrator(DatabaseConnector.engine, MIGRATIONS).pending(), [])
+
+    def test_seed_file(self):
+        path = os.path.join(self.directory, "seed.json")
+        seed = {"servers": [{"guid": "guid", "name": "https://other", "secret": "s"}]}
+        with open(path, "w") as seed_file:
+            json.dump(seed, seed_file)
+
+        self.start(LocalDatabase(seed=load_seed(path)))
+
+        with Session(DatabaseConnector.engine) as session:
+            self.assertEqual(
+                [server.name for server in session.query(Servers)], ["https://other"]
+            )
+
+
+class TestTemporaryPostgreSQL(unittest.TestCase):
+    def test_not_available(self):
+        with tempfile.TemporaryDirectory() as directory:
+            server = TemporaryPostgreSQL(bin_dir=directory)
+
+            self.assertFalse(server.available())
+            with self.assertRaises(DatabaseNotReadyError):
+                server.start()
+
+    def test_started_and_removed(self):
+        server = TemporaryPostgreSQL()
+        with mock.patch.object(
+            TemporaryPostgreSQL, "available", return_value=True
+        ), mock.patch(
+            "mconf_aggr.webhook.local_database.shutil.which", side_effect=str
+        ), mock.patch(
+            "mconf_aggr.webhook.local_database.subprocess.run"
+        ) as run_mock:
+            url = server.start()
+            directory = server.directory
+            server.stop()
+
+        commands = [args[0][:2] for args, _ in run_mock.call_args_list]
+        self.assertEqual(
+            commands, [["initdb", "-D"], ["pg_ctl", "-D"], ["pg_ctl", "-D"]]
+        )
+        self.assertEqual(url, f"postgresql://postgres@/postgres?host={directory}")
+        self.assertFalse(os.path.exists(directory))
+
+    def test_failed_start_removes_directory(self):
+        server = TemporaryPostgreSQL()
+        with mock.patch.object(
+            TemporaryPostgreSQL, "available", return_value=True
+        ), mock.patch(
+            "mconf_aggr.webhook.local_database.subprocess.run",
+            side_effect=OSError("initdb not found"),
+        ), mock.patch(
+            "mconf_aggr.webhook.local_database.tempfile.mkdtemp",
+            return_value=tempfile.mkdtemp(),
+        ) as mkdtemp_mock:
+            with self.assertRaises(DatabaseNotReadyError):
+                server.start()
+
+        self.assertIsNone(server.directory)
+        self.assertFalse(os.path.exists(mkdtemp_mock.return_value))
@@ -0,0 +1,372 @@
+import unittest
+import unittest.mock as mock
+
+import sqlalchemy
+
+from mconf_aggr.aggregator.aggregator import TransientCallbackError
+from mconf_aggr.webhook.database_handler import (
+    MeetingEndedHandler,
+    UserCamBroadcastStartHandler,
+    UserLeftHandler,
+    WebhookDataWriter,
+)
+from mconf_aggr.webhook.database_model import Meetings
+from mconf_aggr.webhook.event_mapper import (
+    MeetingEndedEvent,
+    UserEvent,
+    UserLeftEvent,
+    WebhookEvent,
+)
+from mconf_aggr.webhook.exceptions import WebhookDatabaseError
+from mconf_aggr.webhook.meeting_cache import MeetingCache
+
+
+def attendee(user_id, role="VIEWER"):
+    return {
+        "internal_user_id": user_id,
+        "role": role,
+        "is_listening_only": False,
+        "has_joined_voice": False,
+        "has_video": False,
+    }
+
+
+def meetings_row():
+    return Meetings(
+        id=1,
+        int_meeting_id="meeting-1",
+        running=True,
+        has_user_joined=True,
+        participant_count=2,
+        listener_count=0,
+        voice_participant_count=0,
+        video_count=0,
+        moderator_count=1,
+        transfer_count=0,
+        attendees=[attendee("user-1", "MODERATOR"), attendee("user-2")],
+    )
+
+
+def user_event(event_type, user_id):
+    return WebhookEvent(
+        event_type,
+        UserEvent(user_id, user_id, "external-meeting-1", "meeting-1", event_type),
+        "server",
+    )
+
+
+class TestMeetingCache(unittest.TestCase):
+    def setUp(self):
+        self.session = mock.MagicMock()
+        self.row = meetings_row()
+        self.session.query().filter().first.return_value = self.row
+        self.session.query.reset_mock()
+        self.cache = MeetingCache()
+
+    def test_loaded_once(self):
+        meeting = self.cache.get(self.session, "meeting-1")
+
+        self.assertIs(self.cache.get(self.session, "meeting-1"), meeting)
+        self.session.query.assert_called_once_with(Meetings)
+        self.assertEqual(meeting.attendees.to_json(), self.row.attendees)
+        self.assertIsNot(meeting.attendees.get("user-1"), self.row.attendees[0])
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_meeting_not_found(self):
+        self.session.query().filter().first.return_value = None
+
+        self.assertIsNone(self.cache.get(self.session, "meeting-1"))
+        self.assertNotIn("meeting-1", self.cache)
+
+    def test_flush_writes_dirty_meetings_once(self):
+        meeting = self.cache.get(self.session, "meeting-1")
+        meeting.video_count = 1
+        self.cache.mark_dirty(meeting)
+        self.cache.mark_dirty(meeting)
+
+        with mock.patch("mconf_aggr.webhook.meeting_cache.session_scope") as scope_mock:
+            self.assertEqual(self.cache.flush(), 1)
+            self.assertEqual(self.cache.flush(), 0)
+
+        session = scope_mock.return_value.__enter__.return_value
+        session.bulk_update_mappings.assert_called_once()
+        table, mappings = session.bulk_update_mappings.call_args[0]
+        self.assertIs(table, Meetings)
+        self.assertEqual(mappings[0]["id"], 1)
+        self.assertEqual(mappings[0]["video_count"], 1)
+
+    def test_flush_error_keeps_meetings_dirty(self):
+        self.cache.mark_dirty(self.cache.get(self.session, "meeting-1"))
+
+        with mock.patch(
+            "mconf_aggr.webhook.meeting_cache.session_scope",
+            side_effect=Exception("connection lost"),
+        ):
+            self.assertEqual(self.cache.flush(), 0)
+
+        self.assertEqual(self.cache.dirty_count(), 1)
+        self.assertEqual(self.cache.stats()["flush_errors"], 1)
+
+    def test_flush_recounts_drifted_counters(self):
+        cache = MeetingCache(recount_interval=0)
+        meeting = cache.get(self.session, "meeting-1")
+        # Changed without going through Attendees.change: counters drift.
+        meeting.attendees.get("user-2")["has_video"] = True
+        cache.mark_dirty(meeting)
+
+        with mock.patch("mconf_aggr.webhook.meeting_cache.session_scope") as scope_mock:
+            self.assertEqual(cache.flush(), 1)
+
+        session = scope_mock.return_value.__enter__.return_value
+        mappings = session.bulk_update_mappings.call_args[0][1]
+        self.assertEqual(mappings[0]["video_count"], 1)
+        self.assertEqual(cache.stats()["recounts"], 1)
+        self.assertEqual(cache.stats()["drifts"], 1)
+
+    def test_evict_discards_changes(self):
+        self.cache.mark_dirty(self.cache.get(self.session, "meeting-1"))
+
+        self.cache.evict("meeting-1")
+
+        self.assertNotIn("meeting-1", self.cache)
+        self.assertEqual(self.cache.dirty_count(), 0)
+
+    def test_savepoint_rollback_undoes_changes(self):
+        meeting = self.cache.get(self.session, "meeting-1")
+        meeting.video_count = 1
+        self.cache.mark_dirty(meeting)
+
+        with self.assertRaises(ValueError), self.cache.savepoint():
+            meeting = self.cache.get(self.session, "meeting-1")
+            meeting.attendees.change(
+                "user-2", lambda attendee: attendee.update(has_video=True)
+            )
+            meeting.video_count = 2
+            raise ValueError()
+
+        meeting = self.cache.get(self.session, "meeting-1")
+        self.assertEqual(meeting.video_count, 1)
+        self.assertFalse(meeting.attendees.get("user-2")["has_video"])
+        self.assertEqual(self.cache.dirty_count(), 1)
+
+    def test_savepoint_rollback_forgets_meetings_loaded(self):
+        with self.assertRaises(ValueError), self.cache.savepoint():
+            self.cache.mark_dirty(self.cache.get(self.session, "meeting-1"))
+            raise ValueError()
+
+        self.assertNotIn("meeting-1", self.cache)
+        self.assertEqual(self.cache.dirty_count(), 0)
+
+    def test_savepoint_rollback_restores_evicted_meeting(self):
+        self.cache.mark_dirty(self.cache.get(self.session, "meeting-1"))
+
+        with self.assertRaises(ValueError), self.cache.savepoint():
+            self.cache.evict("meeting-1")
+            raise ValueError()
+
+        self.assertIn("meeting-1", self.cache)
+        self.assertEqual(self.cache.dirty_count(), 1)
+
+    def test_outer_savepoint_rollback_undoes_inner_changes(self):
+        with self.assertRaises(ValueError), self.cache.savepoint():
+            with self.cache.savepoint():
+                self.cache.mark_dirty(self.cache.get(self.session, "meeting-1"))
+            raise ValueError()
+
+        self.assertNotIn("meeting-1", self.cache)
+        self.assertEqual(self.cache.dirty_count(), 0)
+
+    def test_held_until_flushed(self):
+        with self.cache.savepoint():
+            self.cache.mark_dirty(self.cache.get(self.session, "meeting-1"))
+            self.cache.hold("event-1")
+        with self.cache.savepoint():
+            self.cache.get(self.session, "meeting-2")
+            self.cache.hold("event-2")  # Changed no meeting.
+
+        self.assertEqual(self.cache.held(), ["event-1"])
+
+        with mock.patch(
+            "mconf_aggr.webhook.meeting_cache.session_scope",
+            side_effect=Exception("connection lost"),
+        ):
+            self.cache.flush()
+        self.assertEqual(self.cache.held(), ["event-1"])
+
+        with mock.patch("mconf_aggr.webhook.meeting_cache.session_scope"):
+            self.cache.flush()
+        self.assertEqual(self.cache.held(), [])
+
+    def test_savepoint_rollback_releases_held(self):
+        with self.assertRaises(ValueError), self.cache.savepoint():
+            with self.cache.savepoint():
+                self.cache.mark_dirty(self.cache.get(self.session, "meeting-1"))
+                self.cache.hold("event-1")
+            raise ValueError()
+
+        self.assertEqual(self.cache.held(), [])
+
+    def test_evict_releases_held(self):
+        with self.cache.savepoint():
+            self.cache.mark_dirty(self.cache.get(self.session, "meeting-1"))
+            self.cache.hold("event-1")
+
+        self.cache.evict("meeting-1")
+
+        self.assertEqual(self.cache.held(), [])
+
+    def test_only_clean_meetings_evicted_when_full(self):
+        cache = MeetingCache(max_size=1)
+        cache.mark_dirty(cache.get(self.session, "meeting-1"))
+
+        cache.get(self.session, "meeting-2")
+        self.assertIn("meeting-1", cache)
+        self.assertEqual(len(cache), 2)
+
+        cache.get(self.session, "meeting-3")
+        self.assertNotIn("meeting-2", cache)
+
+
+class TestCachedHandlers(unittest.TestCase):
+    def setUp(self):
+        self.session = mock.MagicMock()
+        self.session.query().filter().first.return_value = meetings_row()
+        self.session.query.reset_mock()
+        self.cache = MeetingCache()
+
+    def test_user_events_change_cached_meeting(self):
+        handler = UserCamBroadcastStartHandler(self.session, meeting_cache=self.cache)
+
+        handler.handle(user_event("user-cam-broadcast-start", "user-1"))
+        handler.handle(user_event("user-cam-broadcast-start", "user-2"))
+
+        meeting = self.cache.get(self.session, "meeting-1")
+        self.assertEqual(meeting.video_count, 2)
+        self.assertEqual(self.cache.dirty_count(), 1)
+        self.session.add.assert_not_called()
+        self.session.query.assert_called_once_with(Meetings)
+
+    def test_user_left_changes_cached_meeting(self):
+        handler = UserLeftHandler(self.session, meeting_cache=self.cache)
+        event = WebhookEvent(
+            "user-left",
+            UserLeftEvent("user-2", "user-2", "meeting-1", "external", 0, {}),
+            "server",
+        )
+
+        handler.handle(event)
+
+        meeting = self.cache.get(self.session, "meeting-1")
+        self.assertEqual(meeting.participant_count, 1)
+        self.assertEqual(self.cache.dirty_count(), 1)
+
+    def test_meeting_ended_evicts_meeting(self):
+        self.cache.mark_dirty(self.cache.get(self.session, "meeting-1"))
+        handler = MeetingEndedHandler(self.session, meeting_cache=self.cache)
+
+        handler.handle(
+            WebhookEvent(
+                "meeting-ended", MeetingEndedEvent("external", "meeting-1", 0), "server"
+            )
+        )
+
+        self.assertNotIn("meeting-1", self.cache)
+        self.assertEqual(self.cache.dirty_count(), 0)
+
+
+class TestWebhookDataWriterMeetingCache(unittest.TestCase):
+    def test_disabled_by_default(self):
+        writer = WebhookDataWriter()
+
+        self.assertIsNone(writer._meeting_cache())
+        self.assertEqual(writer.flush_meetings(), 0)
+
+    def test_flush_meetings_of_all_threads(self):
+        writer = WebhookDataWriter(meeting_cache=True)
+        cache = writer._meeting_cache()
+
+        with mock.patch.object(cache, "flush", return_value=3):
+            self.assertEqual(writer.flush_meetings(), 3)
+
+        self.assertEqual(writer.stats()["meeting_cache"]["meetings"], 0)
+
+    def test_flush_woken_up_by_dirty_count(self):
+        writer = WebhookDataWriter(meeting_cache=True, meeting_cache_flush_size=1)
+        cache = writer._meeting_cache()
+
+        writer._wake_flush(cache)
+        self.assertFalse(writer._flush_wakeup.is_set())
+
+        cache._dirty.add("meeting-1")
+        writer._wake_flush(cache)
+        self.assertTrue(writer._flush_wakeup.is_set())
+
+    def test_failed_event_of_batch_undone_in_cache(self):
+        writer = WebhookDataWriter(meeting_cache=True)
+        session = mock.MagicMock()
+        session.query().filter().first.return_value = meetings_row()
+        session.begin_nested.return_value.is_active = True
+        update_meeting = UserCamBroadcastStartHandler._update_meeting
+
+        def fail_second(handler, meetings_table):
+            update_meeting(handler, meetings_table)
+            if meetings_table.attendees.get("user-2")["has_video"]:
+                raise WebhookDatabaseError()
+
+        with mock.patch(
+            "mconf_aggr.webhook.database_handler.session_scope"
+        ) as scope_mock, mock.patch.object(
+            UserCamBroadcastStartHandler,
+            "_update_meeting",
+            autospec=True,
+            side_effect=fail_second,
+        ):
+            scope_mock.return_value.__enter__.return_value = session
+            writer.run_batch(
+                [
+                    user_event("user-cam-broadcast-start", "user-1"),
+                    user_event("user-cam-broadcast-start", "user-2"),
+                ]
+            )
+
+        meeting = writer._meeting_cache().get(session, "meeting-1")
+        self.assertEqual(meeting.video_count, 1)
+        self.assertTrue(meeting.attendees.get("user-1")["has_video"])
+        self.assertFalse(meeting.attendees.get("user-2")["has_video"])
+        self.assertEqual(writer._meeting_cache().dirty_count(), 1)
+        self.assertEqual(writer.stats()["failed_events"], 1)
+        self.assertEqual(
+            [event.event.internal_user_id for event in writer.held()], ["user-1"]
+        )
+
+    def test_failed_commit_undone_in_cache(self):
+        writer = WebhookDataWriter(meeting_cache=True)
+        cache = writer._meeting_cache()
+        session = mock.MagicMock()
+        session.query().filter().first.return_value = meetings_row()
+        session.begin_nested.return_value.is_active = True
+        session.commit.side_effect = sqlalchemy.exc.OperationalError(None, None, None)
+        events = [
+            user_event("user-cam-broadcast-start", "user-1"),
+            user_event("user-cam-broadcast-start", "user-2"),
+        ]
+
+        with mock.patch(
+            "mconf_aggr.webhook.database_handler.session_scope"
+        ) as scope_mock:
+            scope_mock.return_value.__enter__.return_value = session
+            with self.assertRaises(TransientCallbackError):
+                writer.run_batch(events)
+
+            self.assertNotIn("meeting-1", cache)
+            self.assertEqual(cache.dirty_count(), 0)
+            self.assertEqual(writer.held(), [])
+
+            # The batch retried is applied once.
+            session.commit.side_effect = None
+            writer.run_batch(events)
+
+        meeting = cache.get(session, "meeting-1")
+        self.assertEqual(meeting.video_count, 2)
+        self.assertEqual(cache.dirty_count(), 1)
+        self.assertEqual(writer.held(), events)
@@ -0,0 +1,113 @@
+import unittest
+import unittest.mock as mock
+
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+
+from mconf_aggr.webhook import meeting_end
+from mconf_aggr.webhook.database_handler import MeetingEndedHandler
+from mconf_aggr.webhook.database_model import (
+    Base,
+    Meetings,
+    MeetingsEvents,
+    UsersEvents,
+)
+from mconf_aggr.webhook.event_mapper import MeetingEndedEvent, WebhookEvent
+
+
+def postgresql_session(row=(7, 2, 1)):
+    session = mock.MagicMock()
+    session.get_bind().dialect.name = "postgresql"
+    session.execute().first.return_value = row
+    session.execute.reset_mock()
+    session.identity_map.values.return_value = []
+
+    return session
+
+
+def meeting_ended_event():
+    return WebhookEvent(
+        event_type="meeting-ended",
+        server_url="localhost",
+        event=MeetingEndedEvent(
+            external_meeting_id="mock_e", internal_meeting_id="mock_i", end_time=10
+        ),
+    )
+
+
+class TestEndMeeting(unittest.TestCase):
+    def test_single_statement(self):
+        session = postgresql_session()
+
+        self.assertEqual(
+            meeting_end.end_meeting(session, "mock_i", 10),
+            meeting_end.EndedMeeting(7, 2, True),
+        )
+
+        statement = session.execute.call_args[0][0]
+        sql = str(statement.compile(dialect=postgresql.dialect()))
+        self.assertIn("users_events.leave_time IS NULL", sql)
+        self.assertIn("RETURNING meetings_events.id", sql)
+        self.assertIn("DELETE FROM meetings", sql)
+        session.flush.assert_called_once()
+
+    def test_meeting_not_found(self):
+        session = postgresql_session(row=None)
+
+        self.assertIsNone(meeting_end.end_meeting(session, "mock_i", 10))
+
+    def test_loaded_instances_are_not_stale(self):
+        session = postgresql_session()
+        meeting = Meetings(int_meeting_id="mock_i")
+        other = Meetings(int_meeting_id="other")
+        user = UsersEvents(meeting_event_id=7)
+        session.identity_map.values.return_value = [meeting, other, user]
+
+        meeting_end.end_meeting(session, "mock_i", 10)
+
+        session.expunge.assert_called_once_with(meeting)
+        session.expire.assert_called_once_with(user)
+
+    def test_handler_uses_single_statement(self):
+        session = postgresql_session()
+
+        MeetingEndedHandler(session).handle(meeting_ended_event())
+
+        session.query.assert_not_called()
+        session.commit.assert_not_called()
+
+
+class TestMeetingEndedFallback(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        self.session = Session(engine)
+        self.addCleanup(self.session.close)
+
+        meeting_event = MeetingsEvents(internal_meeting_id="mock_i")
+        self.session.add(meeting_event)
+        self.session.flush()
+        self.session.add_all(
+            [
+                Meetings(int_meeting_id="mock_i", meeting_event_id=meeting_event.id),
+                UsersEvents(meeting_event_id=meeting_event.id, internal_user_id="u1"),
+                UsersEvents(
+                    meeting_event_id=meeting_event.id,
+                    internal_user_id="u2",
+                    leave_time=5,
+                ),
+            ]
+        )
+        self.session.commit()
+
+    def test_closes_open_users(self):
+        MeetingEndedHandler(self.session).handle(meeting_ended_event())
+        self.session.commit()
+
+        leave_times = dict(
+            self.session.query(UsersEvents.internal_user_id, UsersEvents.leave_time)
+        )
+        self.assertEqual(leave_times, {"u1": 10, "u2": 5})
+        self.assertEqual(self.session.query(MeetingsEvents.end_time).scalar(), 10)
+        self.assertEqual(self.session.query(Meetings).count(), 0)
@@ -0,0 +1,120 @@
+import unittest
+import unittest.mock as mock
+
+from sqlalchemy import create_engine, inspect
+
+from mconf_aggr.webhook.database_model import Base
+from mconf_aggr.webhook.migrations import query_plan
+from mconf_aggr.webhook.migrations.migrator import CreateIndex, Migration, Migrator
+from mconf_aggr.webhook.migrations.versions import MIGRATIONS
+
+
+def sqlite_engine(indexes=True):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    if not indexes:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.drop(engine)
+
+    return engine
+
+
+def index_names(engine, table):
+    return {index["name"] for index in inspect(engine).get_indexes(table)}
+
+
+class TestMigrator(unittest.TestCase):
+    def setUp(self):
+        self.engine = sqlite_engine(indexes=False)
+
+    def test_upgrade_creates_indexes_once(self):
+        migrator = Migrator(self.engine, MIGRATIONS)
+
+        self.assertEqual(migrator.upgrade(), [1, 2])
+
+        self.assertIn(
+            "ix_meetings_int_meeting_id", index_names(self.engine, "meetings")
+        )
+        self.assertIn("ix_servers_name", index_names(self.engine, "servers"))
+        self.assertEqual(migrator.applied(), {1, 2})
+        self.assertEqual(migrator.upgrade(), [])
+
+    def test_upgrade_to_target(self):
+        migrator = Migrator(
+            self.engine,
+            [
+                Migration(2, "second", [CreateIndex("servers", "name")]),
+                Migration(1, "first", [CreateIndex("meetings", "int_meeting_id")]),
+            ],
+        )
+
+        self.assertEqual(migrator.upgrade(target=1), [1])
+
+        self.assertEqual([m.version for m in migrator.pending()], [2])
+        self.assertNotIn("ix_servers_name", index_names(self.engine, "servers"))
+
+    def test_indexes_match_model(self):
+        names = {
+            operation.name
+            for migration in MIGRATIONS
+            for operation in migration.operations
+            if isinstance(operation, CreateIndex)
+        }
+
+        self.assertEqual(
+            names,
+            {
+                index.name
+                for table in Base.metadata.sorted_tables
+                for index in table.indexes
+            },
+        )
+
+
+class TestCreateIndex(unittest.TestCase):
+    def test_concurrently_on_postgresql(self):
+        connection = mock.MagicMock()
+        connection.dialect.name = "postgresql"
+        connection.execute().first.return_value = (1,)
+
+        CreateIndex("meetings", "int_meeting_id").apply(connection)
+
+        self.assertEqual(
+            [args[0] for args, _ in connection.exec_driver_sql.call_args_list],
+            [
+                "DROP INDEX CONCURRENTLY IF EXISTS ix_meetings_int_meeting_id",
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_meetings_int_meeting_id "
+                "ON meetings (int_meeting_id)",
+            ],
+        )
+
+
+class TestQueryPlan(unittest.TestCase):
+    def test_indexed_queries(self):
+        checks = query_plan.check(sqlite_engine())
+
+        self.assertEqual(len(checks), len(query_plan.handler_queries()))
+        self.assertEqual([c for c in checks if c.scanned_tables], [])
+
+    def test_sequential_scans_flagged(self):
+        checks = query_plan.check(sqlite_engine(indexes=False))
+
+        flagged = {c.query.description: c.scanned_tables for c in checks}
+        self.assertEqual(flagged["meetings by int_meeting_id"], ["meetings"])
+        self.assertEqual(flagged["servers by name"], ["servers"])
+        self.assertEqual(flagged["users_events by internal_user_id"], [])
+
+    def test_postgresql_plan(self):
+        connection = mock.MagicMock()
+        connection.dialect.name = "postgresql"
+        connection.exec_driver_sql().scalars().all.return_value = [
+            "Nested Loop  (cost=0.29..16.34 rows=1 width=8)",
+            "  ->  Seq Scan on meetings  (cost=0.00..8.02 rows=1 width=8)",
+        ]
+
+        _, scanned_tables = query_plan.explain(
+            connection, query_plan.handler_queries()[0].statement
+        )
+
+        self.assertEqual(scanned_tables, ["meetings"])
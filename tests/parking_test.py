@@ -0,0 +1,69 @@
+import unittest
+import unittest.mock as mock
+
+from mconf_aggr.webhook.parking import ParkingBuffer
+
+
+class TestParkingBuffer(unittest.TestCase):
+    def setUp(self):
+        self.parking = ParkingBuffer(timeout=10, check_interval=1, max_size=3)
+
+    def test_park_and_release_in_order(self):
+        self.parking.park("meeting-1", "event-1")
+        self.parking.park("meeting-1", "event-2")
+        self.parking.park("meeting-2", "event-3")
+
+        self.assertIn("meeting-1", self.parking)
+        self.assertEqual(len(self.parking), 3)
+        self.assertEqual(self.parking.release("meeting-1"), ["event-1", "event-2"])
+        self.assertNotIn("meeting-1", self.parking)
+        self.assertEqual(self.parking.release("meeting-1"), [])
+        self.assertEqual(len(self.parking), 1)
+
+    def test_evicts_meeting_parked_first_when_full(self):
+        self.parking.park("meeting-1", "event-1")
+        self.parking.park("meeting-2", "event-2")
+        self.parking.park("meeting-2", "event-3")
+
+        self.assertEqual(
+            self.parking.park("meeting-2", "event-4"), [("meeting-1", ["event-1"])]
+        )
+        self.assertEqual(len(self.parking), 3)
+        self.assertEqual(self.parking.stats()["evicted"], 1)
+
+    def test_unpark_and_restore(self):
+        self.parking.park("meeting-1", "event-1")
+        self.parking.park("meeting-1", "event-2")
+        released = self.parking.release("meeting-1")
+        self.parking.park("meeting-1", "event-3")
+
+        self.parking.unpark("meeting-1")
+        self.assertNotIn("meeting-1", self.parking)
+
+        self.parking.restore("meeting-1", released)
+        self.assertEqual(self.parking.take_all(), ["event-1", "event-2"])
+        self.assertEqual(len(self.parking), 0)
+
+    def test_due(self):
+        with mock.patch("mconf_aggr.webhook.parking.time.monotonic", return_value=100):
+            self.parking.park("meeting-1", "event-1")
+            self.assertEqual(self.parking.due(), ([], []))
+
+        with mock.patch("mconf_aggr.webhook.parking.time.monotonic", return_value=101):
+            self.assertEqual(self.parking.due(), ([], ["meeting-1"]))
+            self.assertEqual(self.parking.due(), ([], []))
+
+        with mock.patch("mconf_aggr.webhook.parking.time.monotonic", return_value=110):
+            self.assertEqual(self.parking.due(), (["meeting-1"], []))
+
+    def test_known_meetings_are_bounded(self):
+        parking = ParkingBuffer(known_size=2)
+
+        parking.mark_known("meeting-1")
+        parking.mark_known("meeting-2")
+        self.assertTrue(parking.is_known("meeting-1"))
+        parking.mark_known("meeting-3")
+
+        self.assertTrue(parking.is_known("meeting-1"))
+        self.assertFalse(parking.is_known("meeting-2"))
+        self.assertTrue(parking.is_known("meeting-3"))
@@ -0,0 +1,150 @@
+import json
+import unittest
+import unittest.mock as mock
+
+from mconf_aggr.webhook import partial_update
+from mconf_aggr.webhook.database_handler import (
+    UserCamBroadcastStartHandler,
+    UserJoinedHandler,
+    UserLeftHandler,
+)
+from mconf_aggr.webhook.database_model import Meetings
+from mconf_aggr.webhook.event_mapper import (
+    UserEvent,
+    UserJoinedEvent,
+    UserLeftEvent,
+    WebhookEvent,
+)
+from mconf_aggr.webhook.exceptions import WebhookDatabaseError
+
+
+def postgresql_session(rowcount=1):
+    session = mock.MagicMock()
+    session.get_bind().dialect.name = "postgresql"
+    session.execute.return_value.rowcount = rowcount
+    session.identity_map.values.return_value = []
+
+    return session
+
+
+def user_event(event_type, user_id):
+    return WebhookEvent(
+        event_type,
+        UserEvent(user_id, user_id, "external-meeting-1", "meeting-1", event_type),
+        "server",
+    )
+
+
+class TestPartialUpdate(unittest.TestCase):
+    def test_supported_on_postgresql_only(self):
+        session = mock.MagicMock()
+        session.get_bind().dialect.name = "sqlite"
+        self.assertFalse(partial_update.is_supported(session))
+
+        self.assertTrue(partial_update.is_supported(postgresql_session()))
+
+    def test_patch_changes_counters_of_keys_set_only(self):
+        session = postgresql_session()
+
+        self.assertTrue(
+            partial_update.patch_attendee(
+                session, "meeting-1", "user-1", {"has_video": True}
+            )
+        )
+
+        statement, params = session.execute.call_args[0]
+        self.assertIn("jsonb_set", str(statement))
+        self.assertIn("video_count = m.video_count", str(statement))
+        self.assertNotIn("participant_count", str(statement))
+        self.assertEqual(
+            params,
+            {
+                "int_meeting_id": "meeting-1",
+                "user_id": "user-1",
+                "patch": json.dumps({"has_video": True}),
+            },
+        )
+        session.flush.assert_called_once()
+
+    def test_add_and_remove(self):
+        session = postgresql_session(rowcount=0)
+        attendee = {"internal_user_id": "user-1", "role": "VIEWER"}
+
+        self.assertFalse(partial_update.add_attendee(session, "meeting-1", attendee))
+        statement, params = session.execute.call_args[0]
+        self.assertIn("|| CAST(:attendees AS jsonb)", str(statement))
+        self.assertIn("running = true", str(statement))
+        self.assertEqual(params["attendees"], json.dumps([attendee]))
+
+        partial_update.remove_attendee(session, "meeting-1", "user-1")
+        statement, params = session.execute.call_args[0]
+        self.assertIn("- f.idx", str(statement))
+        self.assertIn("has_user_joined = (m.participant_count", str(statement))
+        self.assertEqual(params, {"int_meeting_id": "meeting-1", "user_id": "user-1"})
+
+    def test_loaded_meeting_is_expired(self):
+        session = postgresql_session()
+        meeting = Meetings(int_meeting_id="meeting-1")
+        other = Meetings(int_meeting_id="meeting-2")
+        session.identity_map.values.return_value = [meeting, other]
+
+        partial_update.remove_attendee(session, "meeting-1", "user-1")
+
+        session.expire.assert_called_once_with(meeting)
+
+
+class TestPartialUpdateHandlers(unittest.TestCase):
+    def test_user_event_patches_attendee(self):
+        session = postgresql_session()
+        handler = UserCamBroadcastStartHandler(session, partial_updates=True)
+
+        handler.handle(user_event("user-cam-broadcast-start", "user-1"))
+
+        session.query.assert_not_called()
+        params = session.execute.call_args[0][1]
+        self.assertEqual(params["patch"], json.dumps({"has_video": True}))
+
+    def test_disabled_or_unsupported_uses_orm(self):
+        session = postgresql_session()
+        UserCamBroadcastStartHandler(session).handle(
+            user_event("user-cam-broadcast-start", "user-1")
+        )
+        session.execute.assert_not_called()
+
+        session.get_bind().dialect.name = "sqlite"
+        UserCamBroadcastStartHandler(session, partial_updates=True).handle(
+            user_event("user-cam-broadcast-start", "user-1")
+        )
+        session.execute.assert_not_called()
+        session.query.assert_called_with(Meetings)
+
+    def test_user_left_meeting_not_found(self):
+        session = postgresql_session(rowcount=0)
+        handler = UserLeftHandler(session, partial_updates=True)
+        event = WebhookEvent(
+            "user-left",
+            UserLeftEvent("user-1", "user-1", "meeting-1", "external", 1, {}),
+            "server",
+        )
+
+        with mock.patch.object(handler.logger, "warn") as warn_mock:
+            handler.handle(event)
+
+        self.assertIn("No meeting found", warn_mock.call_args_list[0][0][0])
+
+    def test_user_joined_meeting_not_found(self):
+        session = postgresql_session(rowcount=0)
+        handler = UserJoinedHandler(session, partial_updates=True)
+        event = mock.MagicMock(spec=UserJoinedEvent)
+        event.internal_user_id = event.external_user_id = "user-1"
+        event.internal_meeting_id = "meeting-1"
+        event.name = "User 1"
+        event.role = "VIEWER"
+        event.is_presenter = False
+        event.userdata = {}
+        event._asdict.return_value = {"internal_user_id": "user-1"}
+
+        with self.assertRaises(WebhookDatabaseError):
+            handler.handle(WebhookEvent("user-joined", event, "server"))
+
+        session.add.assert_not_called()
@@ -0,0 +1,111 @@
+import unittest
+import unittest.mock as mock
+
+from mconf_aggr.webhook.database_handler import AuthenticationHandler, RapHandler
+from mconf_aggr.webhook.database_model import Recordings, Servers
+from mconf_aggr.webhook.event_mapper import RapEvent, WebhookEvent
+from mconf_aggr.webhook.reference_cache import (
+    Institution,
+    ReferenceCache,
+    ReferenceSnapshot,
+    Server,
+    SharedSecret,
+)
+
+
+def tables(session):
+    session.query.side_effect = [
+        [(1, "server-guid", "https://server")],
+        [("secret-guid", "secret-name", "institution-guid")],
+        [("institution-guid", "institution")],
+    ]
+
+
+class TestReferenceCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = ReferenceCache(interval=60)
+        patcher = mock.patch("mconf_aggr.webhook.reference_cache.session_scope")
+        self.scope_mock = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.session = self.scope_mock.return_value.__enter__.return_value
+
+    def test_refresh_loads_new_version(self):
+        tables(self.session)
+
+        self.assertIsNone(self.cache.server("https://server"))
+        self.assertTrue(self.cache.refresh())
+
+        self.assertEqual(self.cache.version, 1)
+        self.assertEqual(self.cache.server("https://server").id, 1)
+        self.assertEqual(
+            self.cache.shared_secret("secret-guid").institution_guid,
+            "institution-guid",
+        )
+        self.assertEqual(
+            self.cache.shared_secret_by_name("secret-name").guid, "secret-guid"
+        )
+        self.assertEqual(self.cache.institution("institution-guid").name, "institution")
+        self.assertEqual(self.cache.stats()["hits"], 4)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_refresh_error_keeps_snapshot(self):
+        tables(self.session)
+        self.cache.refresh()
+        self.scope_mock.side_effect = Exception("connection lost")
+
+        self.assertFalse(self.cache.refresh())
+
+        self.assertEqual(self.cache.version, 1)
+        self.assertIsNotNone(self.cache.server("https://server"))
+        self.assertEqual(self.cache.stats()["refresh_errors"], 1)
+
+    def test_disabled(self):
+        cache = ReferenceCache(interval=0)
+
+        cache.start()
+
+        self.scope_mock.assert_not_called()
+        self.assertEqual(cache.version, 0)
+
+
+class TestReferenceCacheLookups(unittest.TestCase):
+    def setUp(self):
+        self.cache = ReferenceCache()
+        self.cache._snapshot = ReferenceSnapshot(
+            1,
+            [Server(1, "server-guid", "https://server")],
+            [SharedSecret("secret-guid", "secret-name", "institution-guid")],
+            [Institution("institution-guid", "institution")],
+        )
+        patcher = mock.patch(
+            "mconf_aggr.webhook.database_handler.reference_cache", self.cache
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_sanity_started_looks_server_up_in_cache(self):
+        session = mock.MagicMock()
+        recording = Recordings(status="processing")
+        session.query().filter().first.side_effect = [recording, None]
+        event = WebhookEvent(
+            "rap-sanity-started",
+            RapEvent("external", "internal", "record-1", "sanity"),
+            "https://server",
+        )
+
+        RapHandler(session).handle(event)
+
+        queried = [args[0] for args, _ in session.query.call_args_list if args]
+        self.assertFalse(any(entity is Servers.id for entity in queried))
+        self.assertEqual(recording.server_id, 1)
+
+    def test_authentication_reads_secret_from_database(self):
+        # The secret was rotated since the cache was loaded.
+        with mock.patch(
+            "mconf_aggr.webhook.database_handler.session_scope"
+        ) as scope_mock:
+            session = scope_mock.return_value.__enter__.return_value
+            session.query().filter().first.return_value = mock.Mock(secret="rotated")
+            self.assertEqual(
+                AuthenticationHandler().secret("https://server"), "rotated"
+            )
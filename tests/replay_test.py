@@ -0,0 +1,247 @@
+import gzip
+import json
+import multiprocessing
+import os
+import tempfile
+import unittest
+import unittest.mock as mock
+
+from sqlalchemy.orm import sessionmaker
+
+from mconf_aggr.aggregator.aggregator import CallbackError, TransientCallbackError
+from mconf_aggr.webhook.database import DatabaseConnector, create_database_engine
+from mconf_aggr.webhook.database_handler import WebhookDataWriter
+from mconf_aggr.webhook.database_model import Base, MeetingsEvents, UsersEvents
+from mconf_aggr.webhook.event_mapper import (
+    MeetingEndedEvent,
+    WebhookEvent,
+    encode_webhook_event,
+)
+from mconf_aggr.webhook.replay import ArchiveReader, MeetingPartitioner, Replayer
+
+
+def received(event_type, meeting, ts, user=None, parent=None):
+    """Webhook event as received, of a meeting created with its server metadata."""
+    attributes = {
+        "meeting": {
+            "internal-meeting-id": meeting,
+            "external-meeting-id": f"{meeting}-e",
+        },
+        "event": {"ts": ts},
+    }
+    if event_type == "meeting-created":
+        attributes["meeting"].update(
+            {
+                "create-time": ts,
+                "parent-id": parent or "bbb-none",
+                "metadata": {
+                    "mconf-shared-secret-guid": "secret-guid",
+                    "mconf-secret-name": "secret",
+                    "mconf-server-guid": "server-guid",
+                    "mconf-server-url": "https://server",
+                    "mconf-institution-guid": "institution-guid",
+                },
+            }
+        )
+    if user is not None:
+        attributes["user"] = {
+            "internal-user-id": user,
+            "external-user-id": user,
+            "name": user,
+            "role": "VIEWER",
+        }
+
+    return {
+        "data": {
+            "type": "event",
+            "id": event_type,
+            "attributes": attributes,
+            "event": {"ts": ts},
+        }
+    }
+
+
+def meeting_history(meeting):
+    return [
+        received("meeting-created", meeting, 1),
+        received("user-joined", meeting, 2, user=f"{meeting}-user"),
+        received("user-left", meeting, 3, user=f"{meeting}-user"),
+        received("meeting-ended", meeting, 4),
+    ]
+
+
+class ArchiveTestCase(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def archive(self, name, lines, opener=open):
+        path = os.path.join(self.directory, name)
+        with opener(path, "wt") as archive:
+            for line in lines:
+                archive.write(line if isinstance(line, str) else json.dumps(line))
+                archive.write("\n")
+
+        return path
+
+
+class TestArchiveReader(ArchiveTestCase):
+    def test_reads_archives_in_order(self):
+        plain = self.archive("plain.jsonl", meeting_history("meeting-1")[:2])
+        gzipped = self.archive(
+            "gzipped.jsonl.gz", meeting_history("meeting-1")[2:], opener=gzip.open
+        )
+
+        reader = ArchiveReader([plain, gzipped], server_url="https://server")
+        events = list(reader)
+
+        self.assertEqual(
+            [event.event_type for event in events],
+            ["meeting-created", "user-joined", "user-left", "meeting-ended"],
+        )
+        self.assertEqual(events[1].server_url, "https://server")
+
+    def test_request_bodies_and_encoded_events(self):
+        ended = WebhookEvent("meeting-ended", MeetingEndedEvent("e", "i", 4), "s")
+        path = self.archive(
+            "mixed.jsonl",
+            [
+                meeting_history("meeting-1")[:2],
+                encode_webhook_event(ended).decode("utf-8"),
+            ],
+        )
+
+        events = list(ArchiveReader([path]))
+
+        self.assertEqual(len(events), 3)
+        self.assertEqual(events[2], ended)
+
+    def test_invalid_lines_skipped(self):
+        path = self.archive(
+            "invalid.jsonl",
+            [
+                "not json",
+                "",
+                received("unknown-event", "meeting-1", 1),
+                received("meeting-ended", "meeting-1", 4),
+            ],
+        )
+
+        reader = ArchiveReader([path])
+        events = list(reader)
+
+        self.assertEqual(len(events), 1)
+        self.assertEqual(reader.lines, 3)
+        self.assertEqual(reader.invalid, 2)
+
+
+class TestMeetingPartitioner(ArchiveTestCase):
+    def test_breakout_rooms_go_with_their_parent(self):
+        path = self.archive(
+            "breakout.jsonl",
+            [
+                received("meeting-created", "breakout", 1, parent="parent"),
+                received("user-joined", "breakout", 2, user="user"),
+                received("meeting-ended", "parent", 3),
+            ],
+        )
+        partitioner = MeetingPartitioner(8)
+
+        keys = [partitioner.key(event) for event in ArchiveReader([path])]
+
+        self.assertEqual(keys, ["parent", "parent", "parent"])
+
+    def test_partition_is_stable(self):
+        event = WebhookEvent("meeting-ended", MeetingEndedEvent("e", "i", 4), "s")
+
+        self.assertEqual(
+            MeetingPartitioner(4).partition(event),
+            MeetingPartitioner(4).partition(event),
+        )
+        self.assertIn(MeetingPartitioner(4).partition(event), range(4))
+
+
+class TestReplayer(ArchiveTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = f"sqlite:///{os.path.join(self.directory, 'replay.db')}"
+        self.engine = create_database_engine(self.url)
+        Base.metadata.create_all(self.engine)
+
+        # Workers connect to the same database, and restore the connection of
+        # other tests afterwards.
+        patcher = mock.patch.object(
+            DatabaseConnector, "_build_uri", return_value=self.url
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(
+            DatabaseConnector, "Session", sessionmaker(bind=self.engine)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def replay(self, meetings, **options):
+        lines = [
+            event
+            for history in zip(*(meeting_history(meeting) for meeting in meetings))
+            for event in history
+        ]
+        reader = ArchiveReader([self.archive("replay.jsonl", lines)])
+
+        return Replayer(batch_size=3, reference_cache_interval=0, **options).run(reader)
+
+    def assertRebuilt(self, meetings):
+        session = sessionmaker(bind=self.engine)()
+        self.addCleanup(session.close)
+
+        self.assertEqual(
+            sorted(
+                session.query(
+                    MeetingsEvents.internal_meeting_id, MeetingsEvents.end_time
+                )
+            ),
+            [(meeting, 4) for meeting in sorted(meetings)],
+        )
+        self.assertEqual(
+            session.query(UsersEvents).filter(UsersEvents.leave_time == 3).count(),
+            len(meetings),
+        )
+
+    def test_replays_in_batches(self):
+        meetings = ["meeting-1", "meeting-2"]
+
+        stats = self.replay(meetings)
+
+        self.assertRebuilt(meetings)
+        self.assertEqual(stats["events"], 8)
+        self.assertEqual(stats["meetings"], 2)
+        self.assertEqual(stats["batches"], 3)
+        self.assertEqual(stats["failed_events"], 0)
+
+    @unittest.skipUnless(
+        multiprocessing.get_start_method() == "fork",
+        "workers inherit the patched configuration only when forked",
+    )
+    def test_replays_meetings_in_parallel(self):
+        meetings = [f"meeting-{i}" for i in range(6)]
+
+        stats = self.replay(meetings, workers=2)
+
+        self.assertRebuilt(meetings)
+        self.assertEqual(stats["events"], 24)
+        self.assertEqual(len(stats["workers"]), 2)
+        self.assertEqual(stats["meetings"], 6)
+
+    def test_transient_errors_retried(self):
+        with mock.patch.object(
+            WebhookDataWriter,
+            "write_batch",
+            side_effect=[TransientCallbackError(), None, CallbackError(), None],
+        ) as write_mock:
+            stats = self.replay(["meeting-1"], retry_delay=0)
+
+        self.assertEqual(write_mock.call_count, 3)
+        self.assertEqual(stats["batches"], 2)
+        self.assertEqual(stats["failed_batches"], 1)
@@ -0,0 +1,153 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import unittest.mock as mock
+
+from mconf_aggr.aggregator.aggregator import Aggregator, AggregatorCallback
+from mconf_aggr.aggregator.retry import DeadLetterStore, RetryPolicy, RetryQueue
+from mconf_aggr.aggregator.spool import DurableChannel
+
+
+def encode(data):
+    return json.dumps(data).encode("utf-8")
+
+
+def decode(data):
+    return json.loads(data)
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def test_delay_is_jittered_exponential_backoff(self):
+        policy = RetryPolicy(base_delay=1, max_delay=10)
+
+        for failures, backoff in [(1, 1), (2, 2), (3, 4), (4, 8), (5, 10), (9, 10)]:
+            for _ in range(20):
+                delay = policy.delay(failures)
+                self.assertGreaterEqual(delay, backoff / 2)
+                self.assertLessEqual(delay, backoff)
+
+
+class TestRetryQueue(unittest.TestCase):
+    def setUp(self):
+        self.policy = RetryPolicy(max_retries=2, base_delay=0, max_delay=0)
+        self.retries = RetryQueue(self.policy, key=lambda data: data[0])
+
+    def test_defer_without_parked_key(self):
+        self.assertFalse(self.retries.defer(("a", 1)))
+        self.assertEqual(len(self.retries), 0)
+
+    def test_data_is_parked_in_order_by_key(self):
+        self.retries.park(("a", 1))
+        self.assertTrue(self.retries.defer(("a", 2)))
+        self.assertFalse(self.retries.defer(("b", 1)))
+        self.retries.park(("a", 3))
+
+        self.assertEqual(len(self.retries), 3)
+        self.assertEqual(self.retries.due(), ["a"])
+        self.assertEqual(self.retries.head("a"), (("a", 1), 1))
+
+        self.retries.pop("a")
+        self.assertEqual(self.retries.head("a"), (("a", 2), 0))
+
+    def test_gives_up_after_max_retries(self):
+        self.retries.park(("a", 1))
+
+        self.assertTrue(self.retries.fail("a"))
+        self.assertFalse(self.retries.fail("a"))
+
+    def test_due_after_delay(self):
+        retries = RetryQueue(RetryPolicy(base_delay=10, max_delay=10))
+
+        with mock.patch("mconf_aggr.aggregator.retry.time.monotonic", return_value=100):
+            retries.park("data")
+            self.assertEqual(retries.due(), [])
+            self.assertGreaterEqual(retries.next_due(), 5)
+
+        with mock.patch("mconf_aggr.aggregator.retry.time.monotonic", return_value=110):
+            self.assertEqual(retries.due(), [None])
+            self.assertIsNone(retries.next_due())
+
+    def test_take_all(self):
+        self.retries.park(("a", 1))
+        self.retries.park(("a", 2))
+        self.retries.park(("b", 1))
+
+        self.assertEqual(
+            self.retries.take_all(), [(("a", 1), 1), (("a", 2), 0), (("b", 1), 1)]
+        )
+        self.assertEqual(len(self.retries), 0)
+        self.assertIsNone(self.retries.next_due())
+
+    def test_full(self):
+        retries = RetryQueue(RetryPolicy(max_pending=2))
+
+        retries.park("data-1")
+        self.assertFalse(retries.full())
+        retries.park("data-2")
+        self.assertTrue(retries.full())
+
+
+class TestDeadLetterStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "dead-letter.jsonl")
+        self.store = DeadLetterStore(self.path, encode, decode)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_append(self):
+        self.store.append("channel", {"id": 1}, "connection lost", 3)
+        self.store.append("channel", {"id": 2})
+
+        with open(self.path) as dead_letter_file:
+            records = [json.loads(line) for line in dead_letter_file]
+
+        self.assertEqual([record["data"] for record in records], [{"id": 1}, {"id": 2}])
+        self.assertEqual(records[0]["error"], "connection lost")
+        self.assertEqual(records[0]["failures"], 3)
+        self.assertEqual(self.store.stats()["appended"], 2)
+
+    def test_reinject(self):
+        aggregator = Aggregator()
+        aggregator.register_callback(AggregatorCallback(), channel="channel")
+        self.store.append("channel", {"id": 1})
+        self.store.append("channel", {"id": 2})
+        self.store.append("unknown", {"id": 3})
+
+        self.assertEqual(self.store.reinject(aggregator), 2)
+
+        channel = aggregator.channels["channel"][0].channel
+        self.assertEqual(channel.take_all(), [{"id": 1}, {"id": 2}])
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_reinject_into_durable_channel(self):
+        spool = os.path.join(self.directory, "spool")
+        options = dict(
+            channel="channel",
+            channel_class=DurableChannel,
+            directory=spool,
+            encode=encode,
+            decode=decode,
+        )
+        aggregator = Aggregator()
+        aggregator.register_callback(AggregatorCallback(), **options)
+        self.store.append("channel", {"id": 1})
+        self.store.append("channel", {"id": 2})
+
+        self.assertEqual(self.store.reinject(aggregator), 2)
+
+        channel = aggregator.channels["channel"][0].channel
+        self.assertEqual(channel.pop(0), {"id": 1})
+        channel.commit()
+
+        # The element not handled survives a restart.
+        aggregator = Aggregator()
+        aggregator.register_callback(AggregatorCallback(), **options)
+        channel = aggregator.channels["channel"][0].channel
+        self.assertEqual(channel.take_all(), [{"id": 2}])
+
+    def test_reinject_without_file(self):
+        self.assertEqual(self.store.reinject(Aggregator()), 0)
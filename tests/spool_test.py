@@ -0,0 +1,354 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from mconf_aggr.aggregator.aggregator import (
+    POLICY_REJECT,
+    Aggregator,
+    AggregatorCallback,
+    ChannelFull,
+    PartitionedChannel,
+)
+from mconf_aggr.aggregator.spool import DurableChannel
+
+
+def encode(data):
+    return str(data).encode("utf-8")
+
+
+def decode(data):
+    return int(data)
+
+
+class HoldingCallback(AggregatorCallback):
+    """Holds the data received until idle (or until torn down, if asked to)."""
+
+    def __init__(self, idle_interval=None, release_on_teardown=False):
+        self.idle_interval = idle_interval
+        self.release_on_teardown = release_on_teardown
+        self.received = []
+        self.handled = []
+        self.idled = threading.Event()
+
+    def setup(self):
+        pass
+
+    def teardown(self):
+        if self.release_on_teardown:
+            self.idle()
+
+    def run(self, data):
+        self.received.append(data)
+
+    def idle(self):
+        self.handled.extend(self.received)
+        self.received = []
+        self.idled.set()
+
+    def held(self):
+        return list(self.received)
+
+
+class TestDurableChannel(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _channel(self, **kwargs):
+        return DurableChannel(
+            "test_durable_channel", self.directory, encode, decode, **kwargs
+        )
+
+    def test_publish_pop(self):
+        channel = self._channel()
+        for i in range(3):
+            channel.publish(i)
+
+        self.assertEqual(channel.pop(), 0)
+        self.assertEqual(channel.pop_many(5, 0), [1, 2])
+
+    def test_recover_not_committed(self):
+        channel = self._channel()
+        for i in range(5):
+            channel.publish(i)
+
+        channel.pop()
+        channel.pop()
+        channel.commit()
+        channel.pop()  # Popped but not committed.
+        channel.sync()
+
+        recovered = self._channel()
+
+        self.assertEqual(recovered.pop_many(10, 0), [2, 3, 4])
+
+    def test_held_is_not_committed(self):
+        channel = self._channel()
+        for i in range(100, 104):
+            channel.publish(i)
+
+        popped = channel.pop_many(4, 0)
+        channel.commit(held=[popped[1]])
+        channel.sync()
+
+        self.assertEqual(self._channel().pop_many(10, 0), [101, 102, 103])
+
+        channel.commit()
+
+        self.assertEqual(self._channel().qsize(), 0)
+
+    def test_corrupted_offset_replays_log(self):
+        channel = self._channel()
+        for i in range(3):
+            channel.publish(i)
+        channel.pop()
+        channel.commit()
+        channel.sync()
+
+        with open(os.path.join(channel.directory, "offset.json"), "w"):
+            pass  # Left empty by a crash.
+
+        recovered = self._channel()
+
+        self.assertEqual(recovered.pop_many(10, 0), [0, 1, 2])
+
+    def test_restored_is_persisted(self):
+        channel = self._channel()
+        channel.publish(0)
+        self.assertEqual(channel.restore([1, 2]), 2)
+
+        self.assertEqual(channel.pop_many(2, 0), [0, 1])
+        channel.commit()
+        self.assertEqual(channel.pop(0), 2)
+
+        recovered = self._channel()
+
+        self.assertEqual(recovered.pop_many(10, 0), [2])
+
+    def test_recover_after_rotation(self):
+        channel = self._channel(segment_size=16)
+        for i in range(10):
+            channel.publish(i)
+
+        self.assertGreater(channel.stats()["segments"], 1)
+
+        channel.pop_many(6, 0)
+        channel.commit()
+
+        recovered = self._channel(segment_size=16)
+
+        self.assertEqual(recovered.pop_many(10, 0), [6, 7, 8, 9])
+
+    def test_commit_deletes_consumed_segments(self):
+        channel = self._channel(segment_size=16)
+        for i in range(10):
+            channel.publish(i)
+
+        channel.pop_many(10, 0)
+        channel.commit()
+
+        self.assertEqual(channel.stats()["segments"], 1)
+
+    def test_torn_record_is_discarded(self):
+        channel = self._channel()
+        channel.publish(1)
+        channel.publish(2)
+        channel.sync()
+
+        segment = os.path.join(channel.directory, "0".zfill(20) + ".seg")
+        with open(segment, "r+b") as segment_file:
+            segment_file.truncate(os.path.getsize(segment) - 1)
+
+        recovered = self._channel()
+        self.assertEqual(recovered.qsize(), 1)
+
+        recovered.publish(3)
+        self.assertEqual(self._channel().pop_many(5, 0), [1, 3])
+
+    def test_rejected_is_not_persisted(self):
+        channel = self._channel(maxsize=1, policy=POLICY_REJECT)
+        channel.publish(1)
+
+        with self.assertRaises(ChannelFull):
+            channel.publish(2)
+
+        channel.sync()
+        self.assertEqual(self._channel().pop_many(5, 0), [1])
+
+    def test_recover_beyond_maxsize(self):
+        channel = self._channel()
+        for i in range(3):
+            channel.publish(i)
+
+        recovered = self._channel(maxsize=1)
+
+        self.assertEqual(recovered.qsize(), 3)
+
+    def test_synced_when_publishing_stops(self):
+        channel = self._channel(fsync_interval=0.2)
+        channel.sync()  # The next publish is not due to sync.
+        channel.publish(1)
+        channel.publish(2)
+
+        time.sleep(0.5)
+
+        self.assertEqual(channel.stats()["fsyncs"], 1)
+
+    def test_blocked_publisher_does_not_hold_the_log(self):
+        channel = self._channel(maxsize=1)
+        channel.publish(0)
+        publisher = threading.Thread(target=channel.publish, args=(1,))
+        publisher.start()
+        self.addCleanup(publisher.join, 1)
+
+        syncer = threading.Thread(target=channel.sync)
+        syncer.start()
+        syncer.join(1)
+
+        self.assertFalse(syncer.is_alive())
+        self.assertEqual(channel.pop(), 0)
+        publisher.join(1)
+        self.assertEqual(channel.pop(0), 1)
+
+
+class TestRerouteDurableChannel(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _channel(self, partitions):
+        options = dict(directory=self.directory, encode=encode, decode=decode)
+        if partitions > 1:
+            channel = PartitionedChannel(
+                "test_reroute",
+                partitions,
+                lambda data: data % 5,
+                DurableChannel,
+                **options,
+            )
+        else:
+            channel = DurableChannel("test_reroute", **options)
+        DurableChannel.reroute(channel, **options)
+
+        return channel
+
+    def _queued(self, channel):
+        return {
+            partition.name: list(partition.queue.queue)
+            for partition in channel.partitions
+        }
+
+    def _assert_routed(self, channel, expected):
+        queued = self._queued(channel)
+        for partition in channel.partitions:
+            for data in queued[partition.name]:
+                self.assertIs(channel.partition(data), partition)
+        self.assertEqual(
+            sorted(data for items in queued.values() for data in items), expected
+        )
+
+    def test_partitions_lowered(self):
+        channel = self._channel(3)
+        for i in range(10):
+            channel.publish(i)
+
+        channel = self._channel(2)
+
+        self._assert_routed(channel, list(range(10)))
+        self.assertEqual(
+            sorted(os.listdir(self.directory)), ["test_reroute-0", "test_reroute-1"]
+        )
+
+        # Nothing is delivered twice after another restart.
+        self._assert_routed(self._channel(2), list(range(10)))
+
+    def test_partitions_raised_keeps_order_of_keys(self):
+        channel = self._channel(2)
+        for i in range(10):
+            channel.publish(i)
+
+        channel = self._channel(4)
+        channel.publish(10)
+
+        self._assert_routed(channel, list(range(11)))
+        queued = self._queued(channel)
+        for items in queued.values():
+            self.assertEqual(items, sorted(items))
+
+    def test_from_single_channel(self):
+        channel = self._channel(1)
+        for i in range(4):
+            channel.publish(i)
+
+        self._assert_routed(self._channel(2), list(range(4)))
+        self.assertNotIn("test_reroute", os.listdir(self.directory))
+
+
+class TestHeldByCallback(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _start(self, callback):
+        aggregator = Aggregator()
+        aggregator.register_callback(
+            callback,
+            channel="held",
+            channel_class=DurableChannel,
+            directory=self.directory,
+            encode=encode,
+            decode=decode,
+        )
+        aggregator.setup()
+        aggregator.start()
+
+        return aggregator
+
+    def _spooled(self):
+        return DurableChannel("held", self.directory, encode, decode).take_all()
+
+    def _publish(self, aggregator, callback, items):
+        for data in items:
+            aggregator.publisher.publish(data, channel="held")
+        deadline = time.monotonic() + 5
+        while len(callback.received) < len(items) and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_held_is_delivered_again(self):
+        callback = HoldingCallback()
+        aggregator = self._start(callback)
+        self._publish(aggregator, callback, [100, 101])
+
+        aggregator.stop()
+
+        self.assertEqual(self._spooled(), [100, 101])
+
+    def test_handled_on_teardown_is_committed(self):
+        callback = HoldingCallback(release_on_teardown=True)
+        aggregator = self._start(callback)
+        self._publish(aggregator, callback, [100, 101])
+
+        aggregator.stop()
+
+        self.assertEqual(callback.handled, [100, 101])
+        self.assertEqual(self._spooled(), [])
+
+    def test_handled_while_idle_is_committed(self):
+        callback = HoldingCallback(idle_interval=0.01)
+        aggregator = self._start(callback)
+        self._publish(aggregator, callback, [100])
+
+        self.assertTrue(callback.idled.wait(5))
+        aggregator.stop()
+
+        self.assertEqual(callback.handled, [100])
+        self.assertEqual(self._spooled(), [])
@@ -0,0 +1,27 @@
+import json
+import unittest
+import unittest.mock as mock
+
+import falcon
+
+from mconf_aggr.webhook.stats_listener import StatsListener
+
+
+class TestStatsListener(unittest.TestCase):
+    def setUp(self):
+        self.listener = StatsListener()
+
+    def test_on_get(self):
+        self.listener.register("cache", lambda: {"hits": 1})
+        resp_mock = mock.Mock()
+
+        self.listener.on_get(mock.Mock(), resp_mock)
+
+        self.assertEqual(json.loads(resp_mock.text), {"cache": {"hits": 1}})
+        self.assertEqual(resp_mock.status, falcon.HTTP_200)
+
+    def test_failing_provider(self):
+        self.listener.register("cache", mock.MagicMock(side_effect=Exception))
+        self.listener.register("channel", lambda: {"size": 0})
+
+        self.assertEqual(self.listener.stats(), {"cache": None, "channel": {"size": 0}})
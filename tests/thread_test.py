@@ -1,7 +1,48 @@
+import threading
 import unittest
 import unittest.mock as mock
 
-from mconf_aggr.aggregator.aggregator import Channel, Subscriber, SubscriberThread
+from mconf_aggr.aggregator.aggregator import (
+    AggregatorCallback,
+    Channel,
+    Subscriber,
+    SubscriberThread,
+    TransientCallbackError,
+)
+from mconf_aggr.aggregator.retry import RetryPolicy
+
+
+class BatchCallback(AggregatorCallback):
+    def __init__(self):
+        self.run = mock.MagicMock()
+        self.batches = []
+
+    def run_batch(self, data):
+        self.batches.append(data)
+
+
+class FlakyCallback(AggregatorCallback):
+    """Fails transiently the number of times given for each element."""
+
+    def __init__(self, failures, expected):
+        self.failures = dict(failures)
+        self.expected = expected
+        self.received = []
+        self.done = threading.Event()
+
+    def run(self, data):
+        if self.failures.get(data, 0) > 0:
+            self.failures[data] -= 1
+            raise TransientCallbackError()
+
+        self.received.append(data)
+        if len(self.received) == self.expected:
+            self.done.set()
+
+
+class FlakyBatchCallback(FlakyCallback):
+    def run_batch(self, data):
+        raise TransientCallbackError()
 
 
 class TestPublisher(unittest.TestCase):
@@ -42,3 +83,122 @@ class TestPublisher(unittest.TestCase):
             raise
         finally:
             self.thread.exit()
+
+    def test_run_batch_callback(self):
+        channel = Channel("channel_2")
+        for data in range(5):
+            channel.publish(data)
+        callback = BatchCallback()
+        thread = SubscriberThread(
+            subscriber=Subscriber(channel, callback, 3, 0), errorevent=None
+        )
+
+        thread.start()
+        thread.exit()
+
+        self.assertEqual(callback.batches, [[0, 1, 2], [3, 4]])
+        callback.run.assert_not_called()
+
+    def test_batch_size_ignored_without_run_batch(self):
+        channel = Channel("channel_3")
+        callback_mock = mock.Mock()
+        thread = SubscriberThread(
+            subscriber=Subscriber(channel, callback_mock, 3, 0), errorevent=None
+        )
+
+        thread.start()
+        channel.publish("data")
+        thread.exit()
+
+        callback_mock.run.assert_called_with("data")
+        callback_mock.run_batch.assert_not_called()
+
+
+class TestRetry(unittest.TestCase):
+    def setUp(self):
+        self.channel = Channel("channel_retry")
+        self.policy = RetryPolicy(max_retries=3, base_delay=0.01, max_delay=0.01)
+        self.dead_letter = mock.Mock()
+
+    def _start(self, callback, batch_size=1):
+        thread = SubscriberThread(
+            subscriber=Subscriber(
+                self.channel,
+                callback,
+                batch_size,
+                0,
+                self.policy,
+                self.dead_letter,
+                lambda data: data[0],
+            ),
+            errorevent=None,
+        )
+        thread.start()
+        self.addCleanup(thread.exit)
+
+        return thread
+
+    def test_retried_in_order_by_key(self):
+        callback = FlakyCallback({"a1": 2}, expected=4)
+        self._start(callback)
+
+        for data in ["a1", "b1", "a2", "b2"]:
+            self.channel.publish(data)
+
+        self.assertTrue(callback.done.wait(5))
+        self.assertEqual([d for d in callback.received if d[0] == "a"], ["a1", "a2"])
+        self.assertEqual(callback.received[:2], ["b1", "b2"])
+        self.assertTrue(self.channel.join(5))
+        self.dead_letter.append.assert_not_called()
+
+    def test_not_committed_while_parked(self):
+        callback = FlakyCallback({"a1": 1}, expected=2)
+        self.policy.base_delay = self.policy.max_delay = 0.5
+        self._start(callback)
+
+        self.channel.publish("a1")
+        self.channel.publish("b1")
+
+        self.assertFalse(self.channel.join(0.1))
+        self.assertTrue(callback.done.wait(5))
+        self.assertTrue(self.channel.join(5))
+
+    def test_given_up_after_max_retries(self):
+        callback = FlakyCallback({"a1": 10}, expected=1)
+        self._start(callback)
+
+        self.channel.publish("a1")
+        self.channel.publish("a2")
+
+        self.assertTrue(callback.done.wait(5))
+        self.assertEqual(callback.received, ["a2"])
+        self.dead_letter.append.assert_called_once_with(
+            "channel_retry", "a1", mock.ANY, 4
+        )
+
+    def test_batch_retried_one_by_one(self):
+        callback = FlakyBatchCallback({}, expected=3)
+        for data in ["a1", "b1", "a2"]:
+            self.channel.publish(data)
+
+        self._start(callback, batch_size=3)
+
+        self.assertTrue(callback.done.wait(5))
+        self.assertEqual(sorted(callback.received), ["a1", "a2", "b1"])
+        self.assertEqual([d for d in callback.received if d[0] == "a"], ["a1", "a2"])
+
+    def test_given_up_on_exit(self):
+        callback = FlakyCallback({"a1": 10}, expected=1)
+        self.policy.base_delay = self.policy.max_delay = 60
+        thread = self._start(callback)
+
+        self.channel.publish("a1")
+        self.channel.publish("a2")
+        self.assertFalse(self.channel.join(0.2))
+
+        thread.exit()
+
+        self.assertEqual(
+            [call.args[1] for call in self.dead_letter.append.call_args_list],
+            ["a1", "a2"],
+        )
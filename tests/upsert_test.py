@@ -0,0 +1,133 @@
+import unittest
+import unittest.mock as mock
+
+from sqlalchemy.dialects import postgresql
+
+from mconf_aggr.webhook import upsert
+from mconf_aggr.webhook.database_handler import (
+    MeetingCreatedHandler,
+    RapHandler,
+    Status,
+)
+from mconf_aggr.webhook.database_model import Meetings, MeetingsEvents, Recordings
+from mconf_aggr.webhook.event_mapper import MeetingCreatedEvent, RapEvent, WebhookEvent
+
+
+def postgresql_session(inserted=(1,)):
+    session = mock.MagicMock()
+    session.get_bind().dialect.name = "postgresql"
+    session.execute().first.return_value = inserted
+    session.execute.reset_mock()
+
+    return session
+
+
+def meeting_created_event():
+    return WebhookEvent(
+        event_type="meeting-created",
+        server_url="localhost",
+        event=MeetingCreatedEvent(
+            server_url="localhost",
+            external_meeting_id="mock_e",
+            internal_meeting_id="mock_i",
+            parent_meeting_id="",
+            name="mock_n",
+            create_time=0,
+            create_date="Mock Date",
+            voice_bridge="",
+            dial_number="000-000-0000",
+            attendee_pw="",
+            moderator_pw="mp",
+            duration=0,
+            recording=False,
+            max_users=0,
+            is_breakout=False,
+            meta_data={
+                "mconf-shared-secret-guid": "secret-guid",
+                "mconf-secret-name": "secret",
+                "mconf-server-guid": "server-guid",
+                "mconf-server-url": "server",
+            },
+        ),
+    )
+
+
+def rap_event():
+    return WebhookEvent(
+        event_type="rap-sanity-ended",
+        server_url="server",
+        event=RapEvent("mock_e", "mock_i", "record-1", "sanity"),
+    )
+
+
+class TestInsertIfNew(unittest.TestCase):
+    def test_insert_on_conflict_do_nothing(self):
+        session = postgresql_session(inserted=(7,))
+
+        self.assertEqual(
+            upsert.insert_if_new(
+                session,
+                MeetingsEvents(internal_meeting_id="mock_i", meta_data={"a": 1}),
+                unique_users=0,
+            ),
+            7,
+        )
+
+        statement = session.execute.call_args[0][0]
+        sql = str(statement.compile(dialect=postgresql.dialect()))
+        self.assertIn("ON CONFLICT DO NOTHING RETURNING meetings_events.id", sql)
+        self.assertIn("metadata", sql)
+        self.assertIn("unique_users", sql)
+        self.assertNotIn("end_time", sql)
+        session.flush.assert_called_once()
+
+    def test_existing_row(self):
+        session = postgresql_session(inserted=None)
+
+        self.assertIsNone(
+            upsert.insert_if_new(session, MeetingsEvents(internal_meeting_id="mock_i"))
+        )
+
+
+class TestUpsertHandlers(unittest.TestCase):
+    def test_meeting_created_inserts_meetings_events_if_new(self):
+        session = postgresql_session(inserted=(7,))
+        session.query().filter().first.return_value = None
+        session.query.reset_mock()
+
+        MeetingCreatedHandler(session).handle(meeting_created_event())
+
+        self.assertNotIn(mock.call(MeetingsEvents), session.query.mock_calls)
+        new_meeting = session.add.call_args[0][0]
+        self.assertIsInstance(new_meeting, Meetings)
+        self.assertEqual(new_meeting.meeting_event_id, 7)
+
+    def test_meeting_created_twice(self):
+        session = postgresql_session(inserted=None)
+        session.query().filter().first.return_value = None
+        handler = MeetingCreatedHandler(session)
+
+        with mock.patch.object(handler.logger, "warn") as warn_mock:
+            handler.handle(meeting_created_event())
+
+        session.add.assert_not_called()
+        self.assertIn("already exists", warn_mock.call_args[0][0])
+
+    def test_recording_created(self):
+        session = postgresql_session(inserted=(1,))
+        recording = Recordings(status=Status.DELETED)
+        session.query().filter().first.side_effect = [recording, None]
+
+        RapHandler(session).handle(rap_event())
+
+        self.assertEqual(recording.status, Status.DELETED)
+        session.add.assert_called_with(recording)
+
+    def test_recording_existing(self):
+        session = postgresql_session(inserted=None)
+        recording = Recordings(status=Status.DELETED)
+        session.query().filter().first.side_effect = [recording, None]
+
+        RapHandler(session).handle(rap_event())
+
+        self.assertEqual(recording.status, Status.PROCESSING)